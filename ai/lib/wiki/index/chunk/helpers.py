@@ -1,13 +1,33 @@
-import json
-import os
+import html
 from bs4 import BeautifulSoup
+from bs4.builder import HTMLParserTreeBuilder
+from bs4.dammit import EntitySubstitution
 import re
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from haystack import Document
 
 
-def html_to_text_chunks(html_str: str) -> List[str]:
+# Patterns of clean_text, compiled once
+RE_WHITESPACE = re.compile(r"\s+")
+RE_SPACE_BETWEEN_DIGITS = re.compile(r"(\d)\s+(\d)")
+
+# Tags that represent nested lists
+NESTED_LIST_TAGS = {"ul", "ol", "dl", "li", "dt", "dd"}
+
+HTML_BACKENDS = ["bs4", "fast"]
+
+
+def clean_text(text: str) -> str:
+    cleaned_text = text.replace("\n", " ").replace(
+        "\xa0", " "
+    )  # Replace newlines and non-breaking spaces with regular spaces
+    cleaned_text = RE_WHITESPACE.sub(" ", cleaned_text)  # Replace multiple spaces with a single space
+    cleaned_text = RE_SPACE_BETWEEN_DIGITS.sub(r"\1\2", cleaned_text)  # Remove spaces between digits
+    return cleaned_text.strip()  # Remove leading and trailing spaces
+
+
+def html_to_text_chunks(html_str: str, backend: str = "bs4") -> List[str]:
     """
     Extracts text chunks from a Wikipedia page HTML string. The chunks are cleaned and returned as a list of strings.
 
@@ -16,31 +36,26 @@ def html_to_text_chunks(html_str: str) -> List[str]:
 
     Args:
         html_str (str): The HTML content of a Wikipedia page as a string.
+        backend (str): "bs4" to parse the page into a BeautifulSoup tree, or "fast" to extract the chunks in a single
+            pass over the markup (see fast_html_to_text_chunks); both return the same chunks.
 
     Returns:
         List[str]: A list of cleaned text chunks extracted from the HTML content.
     """
+    if backend not in HTML_BACKENDS:
+        raise ValueError(f"Unknown HTML backend {backend}, expected one of {HTML_BACKENDS}.")
+    if backend == "fast":
+        chunks = fast_html_to_text_chunks(html_str)
+        if chunks is not None:
+            return chunks
+
     soup = BeautifulSoup(html_str, "html.parser")  # Parse the HTML content
 
     chunks = []
 
-    def clean_text(text):
-        cleaned_text = text.replace("\n", " ").replace(
-            "\xa0", " "
-        )  # Replace newlines and non-breaking spaces with regular spaces
-        cleaned_text = re.sub(
-            r"\s+", " ", cleaned_text
-        )  # Replace multiple spaces with a single space
-        cleaned_text = re.sub(
-            r"(\d)\s+(\d)", r"\1\2", cleaned_text
-        )  # Remove spaces between digits
-        cleaned_text = cleaned_text.strip()  # Remove leading and trailing spaces
-        return cleaned_text
-
     html_soup = (
         soup.body or soup
     )  # Use the body of the HTML if it exists, otherwise use the whole soup
-    nested = ["ul", "ol", "dl", "li", "dt", "dd"]  # Tags that represent nested lists
     for tag in html_soup.find_all(
         recursive=False
     ):  # Iterate over top-level tags in the HTML
@@ -50,7 +65,7 @@ def html_to_text_chunks(html_str: str) -> List[str]:
             )  # Clean and add paragraph text to chunks
         elif tag.name == "link":
             continue  # Skip link tags
-        elif tag.name in nested:
+        elif tag.name in NESTED_LIST_TAGS:
             list_items = tag.find_all("li")  # Find all list items
             for li in list_items:
                 li_text = clean_text(li.get_text(separator=" "))
@@ -64,33 +79,261 @@ def html_to_text_chunks(html_str: str) -> List[str]:
     return chunks
 
 
-def get_documents_and_page_hierarchy(
-    filepath: str, page_title: str, page_filename: str
-) -> Tuple[List[Document], dict]:
+# ------------------------------------------
+# Fast backend
+# ------------------------------------------
+
+# Tree builder used by BeautifulSoup with "html.parser"; the fast backend follows its tables of void elements,
+# multi-valued attributes and whitespace preserving tags
+HTML_PARSER_TREE_BUILDER = HTMLParserTreeBuilder()
+VOID_TAGS = set(HTML_PARSER_TREE_BUILDER.empty_element_tags)
+PRESERVE_WHITESPACE_TAGS = set(HTML_PARSER_TREE_BUILDER.preserve_whitespace_tags)
+CDATA_LIST_ATTRIBUTES = HTML_PARSER_TREE_BUILDER.cdata_list_attributes
+
+# Tags whose content is not parsed as markup, or whose strings are left out of get_text, by some html.parser or bs4
+# version: pages containing them are left to the bs4 backend
+UNSUPPORTED_TAGS = set(HTML_PARSER_TREE_BUILDER.string_containers) | {
+    "script",
+    "style",
+    "textarea",
+    "title",
+    "xmp",
+    "iframe",
+    "noembed",
+    "noframes",
+    "noscript",
+    "plaintext",
+}
+
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+# One token per match: text, start tag, end tag, comment or character reference. A '<' or '&' that does not start one
+# of them (malformed markup, declarations, processing instructions, ...) matches the last alternative.
+RE_HTML_TOKEN = re.compile(
+    r"([^<&]+)"  # text
+    r"|<([a-zA-Z][a-zA-Z0-9]*)"  # start tag name
+    r"((?:\s+[a-zA-Z_:][-a-zA-Z0-9_:.]*(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'=<>`/]+(?!/)))?)*)"  # attributes
+    r"\s*(/?)>"  # self-closing slash
+    r"|</([a-zA-Z][a-zA-Z0-9]*)\s*>"  # end tag name
+    r"|<!--((?:[^-]|-(?!-))*)-->"  # comment without '--' inside
+    r"|&(#[0-9]{1,7}|#[xX][0-9a-fA-F]{1,6}|[a-zA-Z][a-zA-Z0-9]*);"  # character reference
+    r"|[<&]"
+)
+RE_HTML_ATTRIBUTE = re.compile(
+    r"([a-zA-Z_:][-a-zA-Z0-9_:.]*)(?:\s*=\s*(\"[^\"]*\"|'[^']*'|[^\s\"'=<>`/]+))?"
+)
+RE_NON_WHITESPACE = re.compile(r"\S+")
+
+
+def decode_character_reference(reference: str) -> Optional[str]:
     """
-    Extracts the documents and hierarchy of a page from the stored chunks in the .metadata/chunk/{page_filename}.json file.
+    Decodes a character reference ('amp', '#160', '#xA0') the way BeautifulSoup does in text. Returns None for the
+    references it decodes differently across versions (unknown names, C1 controls, invalid code points).
     """
-    page_filename_wo_ext = os.path.splitext(page_filename)[0]   # Remove file extension (*.html)
-    chunk_filepath = os.path.join(
-        filepath, ".metadata/chunk", f"{page_filename_wo_ext}.json"
-    )
-    if not os.path.exists(chunk_filepath):
-        raise FileNotFoundError(f"The file '{chunk_filepath}' does not exist.")
+    if reference[0] != "#":
+        return EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(reference)
+    if reference[1] in "xX":
+        code_point = int(reference[2:], 16)
+    else:
+        code_point = int(reference[1:])
+    if 0 < code_point < 0x80 or 0xA0 <= code_point < 0xD800 or 0xE000 <= code_point <= 0x10FFFF:
+        return chr(code_point)
+    return None
+
+
+def escape_markup(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def format_start_tag(name: str, attributes: str, void: bool) -> str:
+    """
+    Formats a start tag the way str(tag) does: attribute values unescaped by html.parser, later duplicates replacing
+    earlier ones, multi-valued attributes (eg. class) whitespace normalized, attributes sorted, minimal escaping.
+    """
+    attribute_dict = {}
+    for match in RE_HTML_ATTRIBUTE.finditer(attributes):
+        key, value = match.group(1).lower(), match.group(2)
+        if value is None:
+            value = ""
+        else:
+            if value[:1] in "\"'":
+                value = value[1:-1]
+            if value:
+                value = html.unescape(value)
+        attribute_dict[key] = value
+
+    formatted_attributes = []
+    list_attributes = CDATA_LIST_ATTRIBUTES.get("*", set()) | CDATA_LIST_ATTRIBUTES.get(name, set())
+    for key, value in sorted(attribute_dict.items()):
+        if key in list_attributes:
+            value = " ".join(RE_NON_WHITESPACE.findall(value))
+        value = escape_markup(value)
+        quote = '"'
+        if '"' in value:
+            if "'" in value:
+                value = value.replace('"', "&quot;")
+            else:
+                quote = "'"
+        formatted_attributes.append(f" {key}={quote}{value}{quote}")
+    return f"<{name}{''.join(formatted_attributes)}{'/' if void else ''}>"
 
-    with open(chunk_filepath, "r") as file:
-        data = json.load(file)
 
+def fast_html_to_text_chunks(html_str: str) -> Optional[List[str]]:
+    """
+    Extracts the same chunks as the bs4 backend of html_to_text_chunks in a single pass over the markup, without
+    building a tree: the top-level tags are told apart by their depth, their strings collected as they are read and
+    the other tags serialized the way str(tag) does.
+
+    Only markup whose html.parser tree is exactly the nesting of its tags is handled: every end tag must close the
+    last open tag, and comments, character references and tags that html.parser (or bs4) treats specially must be in
+    their plain form. Returns None for any other page, which is then left to the bs4 backend.
+    """
+    if "\r" in html_str or "\x00" in html_str:
+        return None
+
+    chunks = []
+    stack = []  # names of the open tags
+    data = []  # pieces of the string being read
+    top_depth = 0  # depth of the top-level tags: the root, or the first body tag
+    body_seen = False
+    preserve_depth = 0  # number of open pre (whitespace preserving) tags
+    top = None  # kind of the open top-level tag: "p", "nested", "link" or "other"
+    strings = []  # "p": strings of the paragraph
+    list_items = []  # "nested": strings of every li tag, in document order
+    open_list_items = []  # "nested": indexes of the open li tags in list_items
+    output = []  # "other": serialized tag
+
+    def end_string(string: str) -> None:
+        if top is None:
+            return
+        if not preserve_depth and not string.strip(ASCII_SPACES):
+            string = "\n" if "\n" in string else " "  # BeautifulSoup collapses whitespace-only strings
+        if top == "p":
+            strings.append(string)
+        elif top == "nested":
+            for index in open_list_items:
+                list_items[index].append(string)
+        elif top == "other":
+            output.append(escape_markup(string))
+
+    def end_top_tag() -> None:
+        if top == "p":
+            chunks.append(clean_text(" ".join(strings)))
+        elif top == "nested":
+            for li_strings in list_items:
+                li_text = clean_text(" ".join(li_strings))
+                if li_text:
+                    chunks.append("- " + li_text)
+        elif top == "other":
+            chunks.append("".join(output))
+
+    for match in RE_HTML_TOKEN.finditer(html_str):
+        text, start_name, attributes, self_closing, end_name, comment, reference = match.groups()
+
+        if text is not None:
+            data.append(text)
+            continue
+        if reference is not None:
+            character = decode_character_reference(reference)
+            if character is None:
+                return None
+            data.append(character)
+            continue
+
+        if data:
+            end_string("".join(data))
+            data.clear()
+
+        if start_name is not None:
+            name = start_name.lower()
+            if name in UNSUPPORTED_TAGS:
+                return None
+            depth = len(stack)
+            void = name in VOID_TAGS
+            if name == "body" and not body_seen:
+                if void or self_closing:
+                    return None  # html.parser leaves a self-closing body empty, its children are not in it
+                # only the children of the first body tag are chunked
+                body_seen = True
+                chunks.clear()
+                top = None
+                top_depth = depth + 1
+            elif top is None and depth == top_depth:
+                strings, list_items, open_list_items, output = [], [], [], []
+                if name == "p":
+                    top = "p"
+                elif name == "link":
+                    top = "link"
+                elif name in NESTED_LIST_TAGS:
+                    top = "nested"
+                else:
+                    top = "other"
+            if top == "other":
+                output.append(format_start_tag(name, attributes, void))
+            if void or self_closing:
+                if top == "other" and not void:
+                    output.append(f"</{name}>")
+                if top is not None and depth == top_depth:
+                    end_top_tag()
+                    top = None
+                continue
+            if top == "nested" and name == "li" and depth > top_depth:
+                open_list_items.append(len(list_items))
+                list_items.append([])
+            if name in PRESERVE_WHITESPACE_TAGS:
+                preserve_depth += 1
+            stack.append(name)
+
+        elif end_name is not None:
+            name = end_name.lower()
+            if name in VOID_TAGS or not stack or stack[-1] != name:
+                return None
+            stack.pop()
+            depth = len(stack)
+            if name in PRESERVE_WHITESPACE_TAGS:
+                preserve_depth -= 1
+            if top == "other":
+                output.append(f"</{name}>")
+            elif top == "nested" and name == "li" and depth > top_depth:
+                open_list_items.pop()
+            if top is not None and depth == top_depth:
+                end_top_tag()
+                top = None
+            elif body_seen and depth == top_depth - 1 and name == "body":
+                top_depth = -1  # the tags after the body are not chunked
+
+        elif comment is not None:
+            if not comment.strip(ASCII_SPACES) or comment[:1] == ">" or comment[:2] == "->":
+                return None
+            if top == "other":
+                output.append(f"<!--{comment}-->")
+
+        else:
+            return None
+
+    if stack:
+        return None
+    return chunks
+
+
+def get_documents_and_page_hierarchy_from_result(
+    data: dict, page_title: str, source: str
+) -> Tuple[List[Document], dict]:
+    """
+    Extracts the documents and hierarchy of a page from its chunk result (as written by the Chunker). source names
+    where the result was read from, for error messages.
+    """
     if not "splitter" in data:
         raise KeyError(
-            f"The 'splitter' key is missing in the chunk file {chunk_filepath}."
+            f"The 'splitter' key is missing in {source}."
         )
     if not "documents" in data["splitter"]:
         raise KeyError(
-            f"The 'documents' key is missing in the 'splitter' key in the chunk file {chunk_filepath}."
+            f"The 'documents' key is missing in the 'splitter' key in {source}."
         )
     if not "hierarchy" in data["splitter"]:
         raise KeyError(
-            f"The 'hierarchy' key is missing in the 'splitter' key in the chunk file {chunk_filepath}."
+            f"The 'hierarchy' key is missing in the 'splitter' key in {source}."
         )
 
     documents = [
@@ -0,0 +1,288 @@
+import hashlib
+import os
+import re
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from lib.wiki.index.chunk.table_serializer import count_tokens
+
+
+RE_WORD = re.compile(r"\w+")
+
+# Hash functions of MinHash: (a * x + b) mod MERSENNE_PRIME, truncated to 32 bits, as in datasketch
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def get_shingles(text: str, shingle_size: int) -> List[str]:
+    """
+    Returns the word shingles (shingle_size consecutive words) of a text, lowercased. A text with fewer words is a
+    single shingle.
+    """
+    words = RE_WORD.findall(text.lower())
+    if len(words) <= shingle_size:
+        return [" ".join(words)]
+    return [" ".join(words[i : i + shingle_size]) for i in range(len(words) - shingle_size + 1)]
+
+
+def hash_bytes(data: bytes, digest_size: int = 8) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=digest_size).digest(), "little")
+
+
+def hash_text(text: str, digest_size: int = 8) -> int:
+    return hash_bytes(text.encode("utf-8"), digest_size)
+
+
+class NearDuplicateDetector:
+    """
+    Finds chunks whose content is the same as, or nearly the same as, a chunk seen before (navigation lists, taxonomy
+    lists repeated across pages, nested list items extracted twice), so that only one of them (the canonical chunk) is
+    embedded and stored in the vector store.
+
+    Exact duplicates are found by a hash of the normalized content. Near duplicates are found with MinHash signatures
+    of the word shingles of the chunks and locality sensitive hashing (LSH): signatures are cut into bands, chunks
+    sharing a band are candidates, and a candidate is a duplicate if the estimated Jaccard similarity of the shingles
+    is at least threshold.
+
+    The canonical chunks are kept in an SQLite database, so duplicates of chunks indexed in a previous run are found
+    too (in memory only, for the current run, if db_path is None). The duplicates are kept with their canonical chunk,
+    so that one of them can take the place of a canonical chunk that is removed (see get_promotions).
+
+    Args:
+        db_path (Optional[str]): Path of the SQLite database file.
+        threshold (float): Minimum estimated Jaccard similarity of a near duplicate.
+        num_perm (int): Number of hash functions of the MinHash signatures.
+        bands (int): Number of LSH bands; num_perm must be a multiple of it.
+        shingle_size (int): Number of words of a shingle.
+        embedding_price_per_million_tokens (float): Price of embedding, to report the savings in money.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = None,
+        threshold: float = 0.9,
+        num_perm: int = 128,
+        bands: int = 16,
+        shingle_size: int = 3,
+        embedding_price_per_million_tokens: float = 0.0,
+    ):
+        if num_perm % bands != 0:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands}).")
+        if db_path is not None:
+            db_dir = os.path.dirname(db_path)
+            if db_dir and not os.path.exists(db_dir):
+                os.makedirs(db_dir)
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.embedding_price_per_million_tokens = embedding_price_per_million_tokens
+
+        generator = np.random.RandomState(1)
+        self.a = generator.randint(1, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+        self.b = generator.randint(0, int(MERSENNE_PRIME), size=num_perm, dtype=np.uint64)
+
+        self.connection = sqlite3.connect(db_path or ":memory:", timeout=60, check_same_thread=False)
+        if db_path is not None:
+            # shared by the frontier workers
+            self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                content_hash INTEGER NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_content_hash ON chunks (content_hash);
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+            CREATE INDEX IF NOT EXISTS bands_chunk_id ON bands (chunk_id);
+            CREATE TABLE IF NOT EXISTS duplicates (
+                chunk_id TEXT PRIMARY KEY,
+                canonical_chunk_id TEXT NOT NULL,
+                content_hash INTEGER NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS duplicates_canonical_chunk_id ON duplicates (canonical_chunk_id);
+            """
+        )
+        settings = {"num_perm": str(num_perm), "bands": str(bands), "shingle_size": str(shingle_size)}
+        stored_settings = dict(self.connection.execute("SELECT name, value FROM settings").fetchall())
+        if stored_settings and stored_settings != settings:
+            raise ValueError(
+                f"The near duplicate database {db_path} was built with {stored_settings}, not {settings}."
+            )
+        self.connection.executemany("INSERT OR IGNORE INTO settings VALUES (?, ?)", settings.items())
+        self.connection.commit()
+
+        self.num_chunks = 0
+        self.num_duplicates = 0
+        self.num_tokens = 0
+        self.num_duplicate_tokens = 0
+
+    def get_signature(self, text: str) -> np.ndarray:
+        shingle_hashes = np.array(
+            [hash_text(shingle, 4) for shingle in set(get_shingles(text, self.shingle_size))], dtype=np.uint64
+        )
+        # (a * x + b) wraps around in uint64 before the modulo, as in datasketch
+        hashes = np.bitwise_and(
+            (np.outer(shingle_hashes, self.a) + self.b) % MERSENNE_PRIME, MAX_HASH
+        )
+        return hashes.min(axis=0)
+
+    def get_buckets(self, signature: np.ndarray) -> List[int]:
+        # 63-bit bucket hashes, to fit SQLite integers
+        return [
+            hash_bytes(signature[band * self.rows : (band + 1) * self.rows].tobytes()) >> 1
+            for band in range(self.bands)
+        ]
+
+    def find_canonical(self, content_hash: int, signature: np.ndarray, buckets: List[int]) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT chunk_id FROM chunks WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+
+        candidates = set()
+        for band, bucket in enumerate(buckets):
+            candidates.update(
+                chunk_id
+                for chunk_id, in self.connection.execute(
+                    "SELECT chunk_id FROM bands WHERE band = ? AND bucket = ?", (band, bucket)
+                )
+            )
+        best_chunk_id, best_similarity = None, self.threshold
+        for chunk_id in sorted(candidates):
+            (candidate_signature,) = self.connection.execute(
+                "SELECT signature FROM chunks WHERE chunk_id = ?", (chunk_id,)
+            ).fetchone()
+            similarity = float(np.mean(np.frombuffer(candidate_signature, dtype=np.uint64) == signature))
+            if similarity >= best_similarity:
+                best_chunk_id, best_similarity = chunk_id, similarity
+        return best_chunk_id
+
+    def add(self, chunk_id: str, content: str) -> str:
+        """
+        Records a chunk and returns the id of its canonical chunk: the chunk it duplicates, or the chunk itself if it
+        is the first of its kind (it then becomes the canonical chunk of its later duplicates). Adding a canonical
+        chunk again (eg. when a page is indexed again after a failure) returns its own id.
+        """
+        num_tokens = count_tokens(content)
+        self.num_chunks += 1
+        self.num_tokens += num_tokens
+
+        if self.connection.execute("SELECT 1 FROM chunks WHERE chunk_id = ?", (chunk_id,)).fetchone():
+            return chunk_id
+        row = self.connection.execute(
+            "SELECT canonical_chunk_id FROM duplicates WHERE chunk_id = ?", (chunk_id,)
+        ).fetchone()
+        if row is not None:
+            self.num_duplicates += 1
+            self.num_duplicate_tokens += num_tokens
+            return row[0]
+
+        content_hash = hash_text(" ".join(RE_WORD.findall(content.lower()))) >> 1
+        signature = self.get_signature(content)
+        buckets = self.get_buckets(signature)
+        canonical_chunk_id = self.find_canonical(content_hash, signature, buckets)
+        if canonical_chunk_id is not None:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO duplicates VALUES (?, ?, ?, ?)",
+                (chunk_id, canonical_chunk_id, content_hash, signature.tobytes()),
+            )
+            self.connection.commit()
+            self.num_duplicates += 1
+            self.num_duplicate_tokens += num_tokens
+            return canonical_chunk_id
+
+        self.connection.execute(
+            "INSERT INTO chunks VALUES (?, ?, ?)", (chunk_id, content_hash, signature.tobytes())
+        )
+        self.connection.executemany(
+            "INSERT INTO bands VALUES (?, ?, ?)",
+            [(band, bucket, chunk_id) for band, bucket in enumerate(buckets)],
+        )
+        self.connection.commit()
+        return chunk_id
+
+    def get_promotions(self, chunk_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Returns what removing chunks (see remove) does to the duplicates of the canonical chunks among them that are
+        not removed too: the first duplicate recorded of every such canonical chunk is promoted to canonical chunk in
+        its place, and its other duplicates become duplicates of the promoted chunk.
+
+        Returns:
+            Dict[str, Optional[str]]: The new canonical chunk of every duplicate affected, None for a promoted chunk.
+        """
+        removed_chunk_ids = set(chunk_ids)
+        promotions = {}
+        for chunk_id in sorted(removed_chunk_ids):
+            duplicate_ids = [
+                duplicate_id
+                for duplicate_id, in self.connection.execute(
+                    "SELECT chunk_id FROM duplicates WHERE canonical_chunk_id = ? ORDER BY rowid", (chunk_id,)
+                )
+                if duplicate_id not in removed_chunk_ids
+            ]
+            if duplicate_ids:
+                promotions[duplicate_ids[0]] = None
+                promotions.update((duplicate_id, duplicate_ids[0]) for duplicate_id in duplicate_ids[1:])
+        return promotions
+
+    def remove(self, chunk_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Removes chunks (eg. the stale chunks of a refreshed page), so that they are no longer returned as the canonical
+        chunk of a duplicate; a duplicate of a removed canonical chunk takes its place (see get_promotions).
+
+        Returns:
+            Dict[str, Optional[str]]: The new canonical chunk of every duplicate affected, None for a promoted chunk.
+        """
+        chunk_ids = list(chunk_ids)
+        promotions = self.get_promotions(chunk_ids)
+        rows = [(chunk_id,) for chunk_id in chunk_ids]
+        self.connection.executemany("DELETE FROM chunks WHERE chunk_id = ?", rows)
+        self.connection.executemany("DELETE FROM bands WHERE chunk_id = ?", rows)
+        self.connection.executemany("DELETE FROM duplicates WHERE chunk_id = ?", rows)
+        for chunk_id, canonical_chunk_id in promotions.items():
+            if canonical_chunk_id is not None:
+                self.connection.execute(
+                    "UPDATE duplicates SET canonical_chunk_id = ? WHERE chunk_id = ?", (canonical_chunk_id, chunk_id)
+                )
+                continue
+            content_hash, signature = self.connection.execute(
+                "SELECT content_hash, signature FROM duplicates WHERE chunk_id = ?", (chunk_id,)
+            ).fetchone()
+            self.connection.execute("DELETE FROM duplicates WHERE chunk_id = ?", (chunk_id,))
+            self.connection.execute("INSERT INTO chunks VALUES (?, ?, ?)", (chunk_id, content_hash, signature))
+            self.connection.executemany(
+                "INSERT INTO bands VALUES (?, ?, ?)",
+                [
+                    (band, bucket, chunk_id)
+                    for band, bucket in enumerate(self.get_buckets(np.frombuffer(signature, dtype=np.uint64)))
+                ],
+            )
+        self.connection.commit()
+        return promotions
+
+    def get_savings(self) -> Dict[str, float]:
+        """
+        Returns the number of chunks and tokens seen since the detector was created, how many of them were duplicates
+        (not embedded), and the estimated embedding cost saved.
+        """
+        return {
+            "chunks": self.num_chunks,
+            "duplicate_chunks": self.num_duplicates,
+            "tokens": self.num_tokens,
+            "duplicate_tokens": self.num_duplicate_tokens,
+            "saved_cost": self.num_duplicate_tokens / 1_000_000 * self.embedding_price_per_million_tokens,
+        }
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,298 @@
+import math
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from bs4 import BeautifulSoup, Tag
+from lib.wiki.index.chunk.helpers import clean_text
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; token counts are then estimated from the text length
+    tiktoken = None
+
+
+# "html" leaves tables as raw HTML chunks (as returned by html_to_text_chunks)
+TABLE_FORMATS = ["html", "rows", "markdown"]
+
+# Encoding of the OpenAI embedding models (text-embedding-3-*, text-embedding-ada-002)
+TOKEN_ENCODING = "cl100k_base"
+
+# Upper bound of colspan and rowspan, against malformed tables
+MAX_CELL_SPAN = 100
+
+# Cell content left out of the table text: citation markers ([1]), styles and scripts
+NOISE_SELECTORS = ["sup.reference", "style", "script"]
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    return tiktoken.get_encoding(TOKEN_ENCODING)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text with the encoding of the embedding model, or estimates them (about 4 characters per
+    token for English text) if tiktoken is not installed.
+    """
+    if tiktoken is not None:
+        return len(get_encoding().encode(text, disallowed_special=()))
+    return math.ceil(len(text) / 4)
+
+
+def get_cell_span(cell: Tag, attribute: str) -> int:
+    try:
+        return min(max(int(cell.get(attribute, 1)), 1), MAX_CELL_SPAN)
+    except (TypeError, ValueError):
+        return 1
+
+
+def table_to_grid(table: Tag) -> List[List[Tuple[str, bool]]]:
+    """
+    Returns the cells of a table as a grid of rows of (text, is header cell), with cells spanning several rows or
+    columns repeated in each of them. Rows of nested tables are left out; their text is part of the enclosing cell.
+    """
+    grid = []
+    row_spans = {}  # column -> [rows left, text, is header cell] of cells spanning into the next rows
+
+    def take_row_span(row: list, column: int) -> None:
+        span = row_spans[column]
+        row.append((span[1], span[2]))
+        span[0] -= 1
+        if span[0] == 0:
+            del row_spans[column]
+
+    for tr in table.find_all("tr"):
+        if tr.find_parent("table") is not table:
+            continue
+        row = []
+        for cell in tr.find_all(["th", "td"], recursive=False):
+            while len(row) in row_spans:
+                take_row_span(row, len(row))
+            for noise in cell.select(",".join(NOISE_SELECTORS)):
+                noise.decompose()
+            text = clean_text(cell.get_text(separator=" "))
+            is_header = cell.name == "th"
+            rowspan = get_cell_span(cell, "rowspan")
+            for _ in range(get_cell_span(cell, "colspan")):
+                if rowspan > 1:
+                    row_spans[len(row)] = [rowspan - 1, text, is_header]
+                row.append((text, is_header))
+        for column in sorted(row_spans):
+            if column >= len(row):
+                row.extend([("", False)] * (column - len(row)))
+                take_row_span(row, column)
+        if row:
+            grid.append(row)
+
+    width = max((len(row) for row in grid), default=0)
+    return [row + [("", False)] * (width - len(row)) for row in grid]
+
+
+def dedupe_adjacent(texts: List[str]) -> List[str]:
+    """
+    Drops the empty texts and the repetitions of a text in adjacent cells (a cell spanning several columns).
+    """
+    deduped = []
+    for text in texts:
+        if text and (not deduped or deduped[-1] != text):
+            deduped.append(text)
+    return deduped
+
+
+def escape_markdown_cell(text: str) -> str:
+    return text.replace("|", "\\|")
+
+
+def format_markdown_row(texts: List[str]) -> str:
+    return "| " + " | ".join(escape_markdown_cell(text) for text in texts) + " |"
+
+
+def format_text_row(texts: List[str], headers: Optional[List[str]]) -> str:
+    """
+    Formats a data row as "Header: value; Header: value", "Label: value" for a row starting with a header cell (eg. an
+    infobox row), or "value | value" without headers.
+    """
+    if headers:
+        pairs = []
+        for header, text in zip(headers, texts):
+            if not text:
+                continue
+            pairs.append(f"{header}: {text}" if header and header != text else text)
+        return "; ".join(dedupe_adjacent(pairs))
+    return " | ".join(dedupe_adjacent(texts))
+
+
+def table_to_lines(table: Tag, table_format: str) -> Tuple[List[str], List[str]]:
+    """
+    Serializes a table to lines of text.
+
+    Returns:
+        Tuple[List[str], List[str]]: The header lines (caption, title rows and, in markdown, the column header rows),
+        repeated at the top of every chunk of the table, and the lines of the rows.
+    """
+    grid = table_to_grid(table)
+    header_lines = []
+    caption = table.find("caption")
+    if caption is not None and caption.find_parent("table") is table:
+        caption_text = clean_text(caption.get_text(separator=" "))
+        if caption_text:
+            header_lines.append(caption_text)
+
+    # Title rows: rows with a single text across the table (eg. the name and image of an infobox)
+    width = len(grid[0]) if grid else 0
+    start = 0
+    while width > 1 and start < len(grid) and len(dedupe_adjacent([text for text, _ in grid[start]])) <= 1:
+        text = next((text for text, _ in grid[start] if text), "")
+        if text:
+            header_lines.append(text)
+        start += 1
+
+    # Column header rows: rows of header cells only, merged column by column
+    headers = None
+    while (
+        start < len(grid)
+        and all(is_header for _, is_header in grid[start])
+        and len(dedupe_adjacent([text for text, _ in grid[start]])) > 1
+    ):
+        texts = [text for text, _ in grid[start]]
+        headers = texts if headers is None else [
+            " ".join(dedupe_adjacent([header, text])) for header, text in zip(headers, texts)
+        ]
+        start += 1
+
+    lines = []
+    if table_format == "markdown":
+        if headers is None and start < len(grid):
+            headers = [text for text, _ in grid[start]]
+            start += 1
+        if headers is not None:
+            header_lines.append(format_markdown_row(headers))
+            header_lines.append(format_markdown_row(["---"] * len(headers)))
+        for row in grid[start:]:
+            texts = [text for text, _ in row]
+            if width > 1 and len(dedupe_adjacent(texts)) == 1:
+                texts = dedupe_adjacent(texts) + [""] * (width - 1)
+            if any(texts):
+                lines.append(format_markdown_row(texts))
+        return header_lines, lines
+
+    for row in grid[start:]:
+        texts = [text for text, _ in row]
+        if not any(texts):
+            continue
+        if width > 1 and len(dedupe_adjacent(texts)) == 1:
+            # a row with a single text across the table (eg. a section of an infobox)
+            line = dedupe_adjacent(texts)[0]
+        elif (
+            headers is None
+            and texts[0]
+            and (row[0][1] or texts[0].endswith(":"))
+            and not any(is_header for _, is_header in row[1:])
+            and dedupe_adjacent(texts[1:])
+        ):
+            # a label cell followed by its values, as in infoboxes
+            line = f"{texts[0].rstrip(':')}: {', '.join(dedupe_adjacent(texts[1:]))}"
+        else:
+            line = format_text_row(texts, headers)
+        if line:
+            lines.append(line)
+    return header_lines, lines
+
+
+def split_line(line: str, max_tokens: int) -> List[str]:
+    """
+    Splits a line into pieces of at most max_tokens tokens, between words.
+    """
+    pieces = []
+    words = []
+    for word in line.split(" "):
+        if words and count_tokens(" ".join(words + [word])) > max_tokens:
+            pieces.append(" ".join(words))
+            words = []
+        words.append(word)
+    if words:
+        pieces.append(" ".join(words))
+    return pieces
+
+
+def lines_to_chunks(header_lines: List[str], lines: List[str], max_tokens: int) -> List[str]:
+    """
+    Groups the lines of a table into chunks of at most max_tokens tokens (no limit if max_tokens <= 0), each starting
+    with the header lines. A line too long for a chunk of its own is split between words.
+    """
+    header = "\n".join(header_lines)
+    if max_tokens <= 0:
+        return ["\n".join(header_lines + lines)] if lines or header_lines else []
+    if not lines:
+        return [header] if header else []
+
+    header_tokens = count_tokens(header) + 1 if header else 0
+    line_max_tokens = max(max_tokens - header_tokens, max_tokens // 2, 1)
+
+    chunks = []
+    chunk_lines = []
+    chunk_tokens = header_tokens
+    for line in lines:
+        for piece in split_line(line, line_max_tokens) if count_tokens(line) > line_max_tokens else [line]:
+            piece_tokens = count_tokens(piece) + 1
+            if chunk_lines and chunk_tokens + piece_tokens > max_tokens:
+                chunks.append("\n".join(header_lines + chunk_lines))
+                chunk_lines = []
+                chunk_tokens = header_tokens
+            chunk_lines.append(piece)
+            chunk_tokens += piece_tokens
+    chunks.append("\n".join(header_lines + chunk_lines))
+    return chunks
+
+
+def table_to_text_chunks(table: Tag, table_format: str = "rows", max_tokens: int = 256) -> List[str]:
+    """
+    Serializes a table to compact text chunks of at most max_tokens tokens.
+
+    Args:
+        table (Tag): The table.
+        table_format (str): "rows" for one line of "Header: value; Header: value" per row ("Label: value" for infobox
+            rows), or "markdown" for a markdown table.
+        max_tokens (int): Token limit of a chunk; larger tables are split between rows, with the caption, title and
+            column headers repeated in every chunk. 0 for no limit.
+
+    Returns:
+        List[str]: The chunks of the table, none for a table without text.
+    """
+    header_lines, lines = table_to_lines(table, table_format)
+    return lines_to_chunks(header_lines, lines, max_tokens)
+
+
+def serialize_table_chunks(chunks: List[str], table_format: str = "rows", max_tokens: int = 256) -> List[str]:
+    """
+    Replaces the raw HTML chunks containing tables (as returned by html_to_text_chunks) by the compact text chunks of
+    their tables. The text of such a chunk outside its tables, if any, is kept as a chunk of its own. The other chunks
+    are returned as they are.
+
+    Args:
+        chunks (List[str]): The chunks of a page.
+        table_format (str): One of TABLE_FORMATS; "html" returns the chunks unchanged.
+        max_tokens (int): Token limit of a table chunk, 0 for no limit.
+    """
+    if table_format not in TABLE_FORMATS:
+        raise ValueError(f"Unknown table format {table_format}, expected one of {TABLE_FORMATS}.")
+    if table_format == "html":
+        return chunks
+
+    serialized_chunks = []
+    for chunk in chunks:
+        if not chunk.startswith("<") or "<table" not in chunk:
+            serialized_chunks.append(chunk)
+            continue
+        soup = BeautifulSoup(chunk, "html.parser")
+        tables = [table for table in soup.find_all("table") if table.find_parent("table") is None]
+        if not tables:
+            serialized_chunks.append(chunk)
+            continue
+        table_chunks = []
+        for table in tables:
+            table_chunks.extend(table_to_text_chunks(table.extract(), table_format, max_tokens))
+        remaining_text = clean_text(soup.get_text(separator=" "))
+        if remaining_text:
+            serialized_chunks.append(remaining_text)
+        serialized_chunks.extend(table_chunks)
+    return serialized_chunks
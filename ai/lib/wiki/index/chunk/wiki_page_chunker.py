@@ -3,6 +3,7 @@ import uuid
 from haystack import Document
 from haystack import component
 from lib.wiki.index.chunk.helpers import html_to_text_chunks
+from lib.wiki.index.chunk.table_serializer import serialize_table_chunks
 
 
 class Chunk:
@@ -40,8 +41,19 @@ class WikiPageChunker:
     
     This custom haystack component also creates a hierarchical structure of the chunks
     based on title, h2, h3, etc.
+
+    Args:
+        html_backend (str): Backend of html_to_text_chunks, "bs4" or "fast" (same chunks, extracted faster).
+        table_format (str): "html" to keep tables (eg. infoboxes) as raw HTML chunks, or "rows" / "markdown" to
+            serialize them to compact text (see serialize_table_chunks).
+        max_table_tokens (int): Token limit of a serialized table chunk; larger tables are split. 0 for no limit.
     """
 
+    def __init__(self, html_backend: str = "bs4", table_format: str = "html", max_table_tokens: int = 256):
+        self.html_backend = html_backend
+        self.table_format = table_format
+        self.max_table_tokens = max_table_tokens
+
     @component.output_types(documents=List[Document], hierarchy=dict)
     def run(self, documents: List[Document]):
         """
@@ -94,7 +106,9 @@ class WikiPageChunker:
             page = Page(page_title)
 
             html_content = doc.content
-            page_chunks = html_to_text_chunks(html_content)
+            page_chunks = serialize_table_chunks(
+                html_to_text_chunks(html_content, self.html_backend), self.table_format, self.max_table_tokens
+            )
             i = 0
             current_h2 = ""
             current_h3 = ""
@@ -156,6 +170,23 @@ class WikiPageChunker:
 
         return {"documents": chunks, "hierarchy": hierarchy}
 
+    @staticmethod
+    def split_by_page(documents: List[Document], hierarchy: dict) -> Dict[str, Dict[str, Any]]:
+        """
+        Splits the output of a run over the documents of many pages into the output of every page, as if each page had
+        been run on its own.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: {page title: {"documents": [...], "hierarchy": {page title: {...}}}}
+        """
+        page_outputs = {
+            page_title: {"documents": [], "hierarchy": {page_title: page_hierarchy}}
+            for page_title, page_hierarchy in hierarchy.items()
+        }
+        for doc in documents:
+            page_outputs[doc.meta["title"]]["documents"].append(doc)
+        return page_outputs
+
     def page_to_dict(self, page: Page) -> Dict[str, Any]:
         return {
             "title": page.title,
@@ -0,0 +1,278 @@
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+import aiohttp
+
+from lib.wiki.index.download.helpers import (
+    MAX_TITLES_PER_QUERY,
+    build_query_params,
+    merge_query_response,
+    render_extract_html,
+    resolve_query_pages,
+    save_batch_pages,
+)
+
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class PageDownloadError(Exception):
+    pass
+
+
+class RetryableDownloadError(PageDownloadError):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class HostRateLimiter:
+    """
+    Polite per-host rate limiter: requests to the same host are spaced at least 1/requests_per_second seconds apart,
+    irrespective of how many downloads are in flight.
+    """
+
+    def __init__(self, requests_per_second: float):
+        self.min_interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self.next_slot = {}
+        self.locks = {}
+
+    async def acquire(self, host: str) -> None:
+        if self.min_interval == 0.0:
+            return
+        lock = self.locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class AsyncPageDownloader:
+    """
+    Downloads Wikipedia pages concurrently using the MediaWiki 'extracts' query.
+
+    - A single keep-alive aiohttp session (connection pool) is shared by all downloads for the lifetime of the object.
+    - At most 'concurrency' pages are downloaded at the same time.
+    - Requests to a host are rate limited to 'requests_per_second'.
+    - Failed requests (connection errors, timeouts, HTTP 429/5xx) are retried with exponential backoff and full jitter;
+      'Retry-After' is honoured when sent by the server.
+
+    Pages are saved in the same format as download_page (see render_extract_html). download_pages_batch fetches many
+    titles per query instead of one, through the same rate limiter and retries.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        headers: dict,
+        concurrency: int = 4,
+        requests_per_second: float = 5.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        timeout: float = 60.0,
+    ):
+        self.api_url = api_url
+        self.host = urlparse(api_url).netloc
+        self.headers = headers
+        self.concurrency = concurrency
+        self.rate_limiter = HostRateLimiter(requests_per_second)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self.session = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency, limit_per_host=self.concurrency
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        Exponential backoff with full jitter.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def get_json(self, params: dict) -> dict:
+        """
+        Sends a rate limited GET request to the API and returns the JSON response, retrying on transient errors.
+        """
+        session = await self.get_session()
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire(self.host)
+            try:
+                async with session.get(self.api_url, params=params) as response:
+                    if response.status in RETRYABLE_STATUS_CODES:
+                        retry_after = response.headers.get("Retry-After")
+                        raise RetryableDownloadError(
+                            f"HTTP {response.status} from {self.api_url}",
+                            float(retry_after) if retry_after and retry_after.isdigit() else None,
+                        )
+                    if response.status != 200:
+                        raise PageDownloadError(
+                            f"HTTP {response.status} from {self.api_url}"
+                        )
+                    return await response.json(content_type=None)
+            except (
+                RetryableDownloadError,
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                asyncio.TimeoutError,
+            ) as e:
+                if attempt >= self.max_retries:
+                    raise PageDownloadError(
+                        f"Giving up after {attempt + 1} attempts: {e}"
+                    ) from e
+                delay = self.backoff_delay(attempt)
+                if isinstance(e, RetryableDownloadError) and e.retry_after is not None:
+                    delay = max(delay, e.retry_after)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def fetch_page_html(self, page_title: str) -> str:
+        """
+        Fetches the HTML extract of a page and renders it in the download_page format.
+        """
+        params = {
+            "action": "query",
+            "format": "json",
+            "redirects": 1,
+            "prop": "extracts",
+            "titles": page_title,
+        }
+        data = await self.get_json(params)
+        if "query" not in data or "pages" not in data["query"]:
+            raise KeyError(
+                f"'query' or 'pages' keys are not present in the response data for page: {page_title}"
+            )
+        page = next(iter(data["query"]["pages"].values()))
+        if "missing" in page or "extract" not in page:
+            raise PageDownloadError(f"Page {page_title} does not exist.")
+        return render_extract_html(page["extract"])
+
+    async def download_page(
+        self, semaphore: asyncio.Semaphore, page_title: str, page_filename: str, filepath: str
+    ) -> None:
+        async with semaphore:
+            html = await self.fetch_page_html(page_title)
+        with open(os.path.join(filepath, page_filename), "w") as file:
+            file.write(html)
+
+    async def download_pages_async(
+        self, pages: Dict[str, str], filepath: str
+    ) -> Dict[str, Optional[Exception]]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        titles = list(pages.keys())
+        results = await asyncio.gather(
+            *[
+                self.download_page(semaphore, title, pages[title], filepath)
+                for title in titles
+            ],
+            return_exceptions=True,
+        )
+        return {
+            title: result if isinstance(result, Exception) else None
+            for title, result in zip(titles, results)
+        }
+
+    async def query_pages(self, titles: List[str], props: str) -> Dict[str, dict]:
+        """
+        Async counterpart of helpers.query_pages: every request of the query, continuations included, goes through
+        get_json.
+        """
+        params = build_query_params(titles, props)
+
+        pages_by_id = {}
+        title_map = {}
+        continue_params = {}
+        while True:
+            response_data = await self.get_json({**params, **continue_params})
+            merge_query_response(response_data, titles, pages_by_id, title_map)
+
+            if "continue" not in response_data:
+                break
+            continue_params = response_data["continue"]
+
+        return resolve_query_pages(titles, pages_by_id, title_map)
+
+    async def download_batch(
+        self, semaphore: asyncio.Semaphore, pages: Dict[str, str], filepath: str
+    ) -> Dict[str, Optional[Exception]]:
+        titles = list(pages.keys())
+        try:
+            async with semaphore:
+                batch_pages = await self.query_pages(titles, "extracts")
+        except Exception as e:
+            return {title: e for title in titles}
+        return save_batch_pages(batch_pages, pages, filepath)
+
+    async def download_pages_batch_async(
+        self, pages: Dict[str, str], filepath: str, batch_size: int
+    ) -> Dict[str, Optional[Exception]]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        titles = list(pages.keys())
+        batches = [
+            {title: pages[title] for title in titles[i : i + batch_size]}
+            for i in range(0, len(titles), batch_size)
+        ]
+        results = {}
+        for batch_results in await asyncio.gather(
+            *[self.download_batch(semaphore, batch, filepath) for batch in batches]
+        ):
+            results.update(batch_results)
+        return results
+
+    def download_pages(
+        self, pages: Dict[str, str], filepath: str
+    ) -> Dict[str, Optional[Exception]]:
+        """
+        Downloads the pages concurrently and saves each one in the specified directory.
+
+        Args:
+            pages (Dict[str, str]): Map of page title to page file name (as in title_pathname.json).
+            filepath (str): The directory path to save the pages.
+
+        Returns:
+            Dict[str, Optional[Exception]]: Map of page title to None if the page was downloaded, or to the exception
+            raised while downloading it. A failing page never affects the other pages.
+        """
+        if not pages:
+            return {}
+        return self.loop.run_until_complete(self.download_pages_async(pages, filepath))
+
+    def download_pages_batch(
+        self, pages: Dict[str, str], filepath: str, batch_size: int = MAX_TITLES_PER_QUERY
+    ) -> Dict[str, Optional[Exception]]:
+        """
+        Batched alternative to download_pages: fetches the HTML extracts of batch_size pages per API query and splits
+        the response back into one HTML file per page in the specified directory. Batches are fetched concurrently.
+
+        Returns:
+            Dict[str, Optional[Exception]]: Map of page title to None if the page was downloaded, or to the exception
+            raised while downloading it. A failing batch only affects the pages of that batch.
+        """
+        if not pages:
+            return {}
+        return self.loop.run_until_complete(
+            self.download_pages_batch_async(pages, filepath, batch_size)
+        )
+
+    def close(self) -> None:
+        if self.session is not None and not self.session.closed:
+            self.loop.run_until_complete(self.session.close())
+        self.loop.close()
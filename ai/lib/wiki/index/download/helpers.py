@@ -1,38 +1,107 @@
 import json
-from typing import List
+import re
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
 import os
 import requests
 from config import config
 import wikipediaapi
 
 
-def get_wiki_category_members(category: str, filepath: str) -> list:
+# Max number of titles the MediaWiki API accepts in a single query
+MAX_TITLES_PER_QUERY = 50
+
+# Section header pattern used by wikipediaapi to split HTML extracts into sections
+RE_HTML_SECTION = re.compile(
+    r"\n? *<h([1-9])[^>]*?>(<span[^>]*></span>)? *"
+    + r"(<span[^>]*>)? *(<span[^>]*></span>)? *(.*?) *"
+    + r"(</span>)?(<span>Edit</span>)?</h[1-9]>\n?"
+)
+
+
+def get_category_members_page_filepath(metadata_download_path: str, page_index: int) -> str:
     """
-    Returns the list of pages and sub-categories of a given Wikipedia category.
+    Returns the path of the cached API response for the given continuation page of a category member listing. The
+    first page keeps the original 'response.json' name, continuation pages are stored as 'response_<n>.json'.
+    """
+    if page_index == 0:
+        return os.path.join(metadata_download_path, "response.json")
+    return os.path.join(metadata_download_path, f"response_{page_index}.json")
+
+
+def iter_wiki_category_members(category: str, filepath: str) -> Iterator[dict]:
+    """
+    Yields the pages and sub-categories of a given Wikipedia category, following 'cmcontinue' until the listing is
+    complete.
+
+    Each API response (one continuation page of at most 'cmlimit' members) is cached in the .metadata/download
+    directory as soon as it is received, together with its continuation token. An interrupted enumeration of a large
+    category therefore resumes from the last cached page instead of starting over, and only one page of members is
+    held in memory at a time.
     """
     metadata_download_path = os.path.join(filepath, ".metadata/download")
     if not os.path.exists(metadata_download_path):
         os.makedirs(metadata_download_path)
 
-    response_filepath = os.path.join(metadata_download_path, "response.json")
-    if os.path.exists(response_filepath):
-        with open(response_filepath, "r") as file:
-            response_data = json.load(file)
-    else:
-        url = config.get("wiki.category_info_url").format(category=category)
-        headers = config.get("wiki.headers")
-        response = requests.get(url, headers=headers)
-        response_data = response.json()
+    page_index = 0
+    continue_params = {}
+    while True:
+        response_filepath = get_category_members_page_filepath(
+            metadata_download_path, page_index
+        )
+        if os.path.exists(response_filepath):
+            with open(response_filepath, "r") as file:
+                response_data = json.load(file)
+        else:
+            url = config.get("wiki.category_info_url").format(category=category)
+            headers = config.get("wiki.headers")
+            response = requests.get(url, headers=headers, params=continue_params)
+            response_data = response.json()
 
-        with open(response_filepath, "w") as file:
-            json.dump(response_data, file)
+            # Write to a temporary file first so that an interrupted write never leaves a truncated page in the cache
+            tmp_filepath = f"{response_filepath}.tmp"
+            with open(tmp_filepath, "w") as file:
+                json.dump(response_data, file)
+            os.replace(tmp_filepath, response_filepath)
 
-    if "query" not in response_data or "categorymembers" not in response_data["query"]:
-        raise KeyError(
-            f"'query' or 'categorymembers' keys are not present in the response data for category: {category}, filepath: {filepath}"
-        )
+        if (
+            "query" not in response_data
+            or "categorymembers" not in response_data["query"]
+        ):
+            raise KeyError(
+                f"'query' or 'categorymembers' keys are not present in the response data for category: {category}, filepath: {filepath}"
+            )
+
+        yield from response_data["query"]["categorymembers"]
+
+        if "continue" not in response_data:
+            break
+        continue_params = response_data["continue"]
+        page_index += 1
+
+
+def get_wiki_category_members(category: str, filepath: str) -> list:
+    """
+    Returns the list of pages and sub-categories of a given Wikipedia category.
+    """
+    return list(iter_wiki_category_members(category, filepath))
 
-    return response_data["query"]["categorymembers"]
+
+def get_member_pathname(member: dict) -> Optional[Tuple[str, str, str]]:
+    """
+    Returns the title_pathname.json section ('pages' or 'categories'), the title and the file or directory name of a
+    category member, or None if the member is neither a page nor a sub-category.
+    """
+    if member["ns"] == 0:
+        page_title = member["title"]
+        underscored_page_title = page_title.replace(" ", "_")
+        return "pages", page_title, f"{underscored_page_title}.html"
+    if member["ns"] == 14:
+        category_title = member["title"].replace("Category:", "")
+        underscored_category_title = category_title.replace(" ", "_")
+        return "categories", category_title, underscored_category_title
+    return None
 
 
 def get_title_pathname_map(
@@ -81,42 +150,308 @@ def get_title_pathname_map(
         return title_pathname_data
 
     title_pathname = {"pages": {}, "categories": {}}
-    category_members = get_wiki_category_members(category, filepath)
 
-    for member in category_members:
-        if any(
-            keyword.lower() in member["title"].lower() for keyword in inverse_filter
-        ):
-            continue
-
-        if member["ns"] == 0:
-            page_title = member["title"]
-            underscored_page_title = page_title.replace(" ", "_")
-            page_filename = f"{underscored_page_title}.html"
-            title_pathname["pages"][page_title] = page_filename
-        elif member["ns"] == 14:
-            category_title = member["title"].replace("Category:", "")
-            underscored_category_title = category_title.replace(" ", "_")
-            category_dirname = f"{underscored_category_title}"
-            title_pathname["categories"][category_title] = category_dirname
-
-    with open(title_pathname_filepath, "w") as file:
-        json.dump(title_pathname, file)
+    # Members are written to the file as they are read: pages in a first pass over the listing and categories in a
+    # second one, which reads the continuation pages cached by the first pass instead of querying the API again. The
+    # file is written through a temporary file so that an interrupted enumeration never leaves a truncated map.
+    tmp_filepath = f"{title_pathname_filepath}.tmp"
+    with open(tmp_filepath, "w") as file:
+        file.write("{")
+        for i, section in enumerate(("pages", "categories")):
+            if i > 0:
+                file.write(", ")
+            file.write(f"{json.dumps(section)}: {{")
+            separator = ""
+            for member in iter_wiki_category_members(category, filepath):
+                if any(
+                    keyword.lower() in member["title"].lower() for keyword in inverse_filter
+                ):
+                    continue
+
+                member_pathname = get_member_pathname(member)
+                if member_pathname is None or member_pathname[0] != section:
+                    continue
+                _, title, pathname = member_pathname
+                file.write(f"{separator}{json.dumps(title)}: {json.dumps(pathname)}")
+                separator = ", "
+                title_pathname[section][title] = pathname
+            file.write("}")
+        file.write("}")
+    os.replace(tmp_filepath, title_pathname_filepath)
 
     return title_pathname
 
 
-def download_page(page_title: str, page_filename: str, filepath: str) -> None:
+def render_extract_html(extract: str) -> str:
     """
-    Fetches the page content from Wikipedia, saves it in an HTML file in the specified directory, and returns the file name.
+    Renders a raw HTML extract returned by the MediaWiki 'extracts' query the same way wikipediaapi's page.text does:
+    summary first, followed by every section as '<hN>title</hN>' (N being the nesting depth starting at 2) and its text.
+
+    Pages fetched directly from the API are passed through this function so that they are saved in exactly the same
+    format as the pages saved by download_page.
+    """
+    summary = ""
+    page = {"sections": []}
+    section_stack = [page]
+    section = None
+    prev_pos = 0
+
+    for match in RE_HTML_SECTION.finditer(extract):
+        if section is None:
+            summary = extract[0 : match.start()].strip()
+        else:
+            section["text"] = extract[prev_pos : match.start()].strip()
+
+        section = {"title": match.group(5).strip(), "text": "", "sections": []}
+        sec_level = int(match.group(1).strip())
+
+        if sec_level > len(section_stack):
+            section_stack.append(section)
+        elif sec_level == len(section_stack):
+            section_stack.pop()
+            section_stack.append(section)
+        else:
+            for _ in range(len(section_stack) - sec_level + 1):
+                section_stack.pop()
+            section_stack.append(section)
+
+        section_stack[len(section_stack) - 2]["sections"].append(section)
+        prev_pos = match.end()
+
+    # pages without sections have only summary
+    if summary == "":
+        summary = extract.strip()
+
+    if prev_pos > 0 and section is not None:
+        section["text"] = extract[prev_pos:]
+
+    def section_full_text(section: dict, level: int) -> str:
+        text = f"<h{level}>{section['title']}</h{level}>\n"
+        text += section["text"]
+        if len(section["text"]) > 0:
+            text += "\n\n"
+        for sub_section in section["sections"]:
+            text += section_full_text(sub_section, level + 1)
+        return text
+
+    text = summary
+    if len(text) > 0:
+        text += "\n\n"
+    for sec in page["sections"]:
+        text += section_full_text(sec, 2)
+    return text.strip()
+
+
+@lru_cache(maxsize=1)
+def get_wiki_html_client() -> wikipediaapi.Wikipedia:
     """
-    wiki_html = wikipediaapi.Wikipedia(
+    Returns a shared wikipediaapi client (HTML extract format) so that the underlying HTTP session is reused across pages.
+    """
+    return wikipediaapi.Wikipedia(
         user_agent=config.get("wiki.headers.User-Agent"),
         language="en",
         extract_format=wikipediaapi.ExtractFormat.HTML,
     )
 
+
+def download_page(page_title: str, page_filename: str, filepath: str) -> None:
+    """
+    Fetches the page content from Wikipedia, saves it in an HTML file in the specified directory, and returns the file name.
+    """
+    wiki_html = get_wiki_html_client()
+
     p_html = wiki_html.page(page_title)
     file_path = os.path.join(filepath, page_filename)
     with open(file_path, "w") as file:
         file.write(p_html.text)
+
+
+@lru_cache(maxsize=1)
+def get_api_session() -> requests.Session:
+    """
+    Returns a shared keep-alive requests session for direct MediaWiki API queries.
+    """
+    session = requests.Session()
+    session.headers.update(config.get("wiki.headers"))
+    return session
+
+
+def build_query_params(titles: List[str], props: str) -> dict:
+    """
+    Returns the parameters of a MediaWiki API query for a batch of titles (at most MAX_TITLES_PER_QUERY).
+    """
+    if len(titles) > MAX_TITLES_PER_QUERY:
+        raise ValueError(
+            f"At most {MAX_TITLES_PER_QUERY} titles can be queried at once, got {len(titles)}."
+        )
+
+    params = {
+        "action": "query",
+        "format": "json",
+        "redirects": 1,
+        "prop": props,
+        "titles": "|".join(titles),
+    }
+    if "extracts" in props:
+        params["exlimit"] = "max"
+    return params
+
+
+def merge_query_response(
+    response_data: dict,
+    titles: List[str],
+    pages_by_id: Dict[str, dict],
+    title_map: Dict[str, str],
+) -> None:
+    """
+    Merges the partial page entries and the normalized/redirected titles of one API response into pages_by_id and
+    title_map.
+    """
+    if "query" not in response_data:
+        raise KeyError(
+            f"'query' key is not present in the response data for titles: {titles}"
+        )
+
+    query = response_data["query"]
+    for mapping in query.get("normalized", []) + query.get("redirects", []):
+        title_map[mapping["from"]] = mapping["to"]
+    for page_id, page in query.get("pages", {}).items():
+        pages_by_id.setdefault(page_id, {}).update(page)
+
+
+def resolve_query_pages(
+    titles: List[str], pages_by_id: Dict[str, dict], title_map: Dict[str, str]
+) -> Dict[str, dict]:
+    """
+    Returns the merged page entries keyed by the *requested* title, following normalized and redirected titles.
+    Titles that could not be resolved are missing from the returned map.
+    """
+    pages_by_title = {page["title"]: page for page in pages_by_id.values()}
+    result = {}
+    for title in titles:
+        resolved_title = title
+        seen = set()
+        while resolved_title in title_map and resolved_title not in seen:
+            seen.add(resolved_title)
+            resolved_title = title_map[resolved_title]
+        page = pages_by_title.get(resolved_title)
+        if page is not None and "missing" not in page and "invalid" not in page:
+            result[title] = page
+    return result
+
+
+def query_pages(titles: List[str], props: str) -> Dict[str, dict]:
+    """
+    Queries the MediaWiki API for a batch of titles (at most MAX_TITLES_PER_QUERY) and returns the merged page entries
+    keyed by the *requested* title. Normalized and redirected titles are mapped back to the title that was asked for;
+    titles that could not be resolved are missing from the returned map.
+
+    API continuation is followed until the query is complete, merging the partial page entries of every response.
+    This matters for 'extracts': TextExtracts returns the full extract of only one page per response and hands out the
+    rest through 'excontinue'.
+    """
+    params = build_query_params(titles, props)
+
+    pages_by_id = {}
+    title_map = {}
+    continue_params = {}
+    while True:
+        response = get_api_session().get(
+            config.get("wiki.api_url"), params={**params, **continue_params}
+        )
+        response.raise_for_status()
+        response_data = response.json()
+        merge_query_response(response_data, titles, pages_by_id, title_map)
+
+        if "continue" not in response_data:
+            break
+        continue_params = response_data["continue"]
+
+    return resolve_query_pages(titles, pages_by_id, title_map)
+
+
+def save_batch_pages(
+    batch_pages: Dict[str, dict], pages: Dict[str, str], filepath: str
+) -> Dict[str, Optional[Exception]]:
+    """
+    Splits the result of an 'extracts' query (see query_pages) back into one HTML file per page (same format as
+    download_page) in the specified directory.
+
+    Args:
+        batch_pages (Dict[str, dict]): The page entries returned by the query, keyed by requested title.
+        pages (Dict[str, str]): Map of page title to page file name of the queried pages.
+        filepath (str): The directory path to save the pages.
+
+    Returns:
+        Dict[str, Optional[Exception]]: Map of page title to None if the page was saved, or to the exception raised
+        while saving it.
+    """
+    results = {}
+    for page_title, page_filename in pages.items():
+        try:
+            page = batch_pages.get(page_title)
+            if page is None or "extract" not in page:
+                raise KeyError(f"No extract returned for page {page_title}.")
+            file_path = os.path.join(filepath, page_filename)
+            with open(file_path, "w") as file:
+                file.write(render_extract_html(page["extract"]))
+            results[page_title] = None
+        except Exception as e:
+            results[page_title] = e
+    return results
+
+
+def get_latest_revisions(titles: List[str]) -> Dict[str, int]:
+    """
+    Returns the latest revision id ('lastrevid') of every given page, querying MAX_TITLES_PER_QUERY titles per request.
+    Pages that no longer exist are missing from the returned map.
+    """
+    revisions = {}
+    for i in range(0, len(titles), MAX_TITLES_PER_QUERY):
+        batch = titles[i : i + MAX_TITLES_PER_QUERY]
+        for title, page in query_pages(batch, "info").items():
+            if "lastrevid" in page:
+                revisions[title] = page["lastrevid"]
+    return revisions
+
+
+def load_revision_manifest(filepath: str) -> Dict[str, dict]:
+    """
+    Returns the revision manifest of the pages downloaded into the category directory, stored in
+    .metadata/download/revisions.json.
+
+    Example:
+    {
+        "Page1 title": {"lastrevid": 1234567890, "fetched_at": "2024-08-01T10:00:00+00:00"}
+    }
+    """
+    manifest_filepath = os.path.join(filepath, ".metadata/download", "revisions.json")
+    if not os.path.exists(manifest_filepath):
+        return {}
+    with open(manifest_filepath, "r") as file:
+        return json.load(file)
+
+
+def save_revision_manifest(filepath: str, manifest: Dict[str, dict]) -> None:
+    metadata_download_path = os.path.join(filepath, ".metadata/download")
+    if not os.path.exists(metadata_download_path):
+        os.makedirs(metadata_download_path)
+    manifest_filepath = os.path.join(metadata_download_path, "revisions.json")
+    tmp_filepath = f"{manifest_filepath}.tmp"
+    with open(tmp_filepath, "w") as file:
+        json.dump(manifest, file)
+    os.replace(tmp_filepath, manifest_filepath)
+
+
+def update_revision_manifest(
+    manifest: Dict[str, dict], revisions: Dict[str, int], page_titles: List[str]
+) -> None:
+    """
+    Records the revision id and the current time as fetch timestamp for the given (just downloaded) pages.
+    """
+    fetched_at = datetime.now(timezone.utc).isoformat()
+    for page_title in page_titles:
+        manifest[page_title] = {
+            "lastrevid": revisions.get(page_title),
+            "fetched_at": fetched_at,
+        }
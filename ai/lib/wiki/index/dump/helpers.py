@@ -0,0 +1,284 @@
+import bz2
+import gzip
+import html
+import io
+import json
+import lzma
+import re
+import tarfile
+import xml.etree.ElementTree as ET
+from typing import IO, Iterator, List, Tuple
+from bs4 import BeautifulSoup
+
+
+# ------------------------------------------
+# Compressed files
+# ------------------------------------------
+
+
+def open_compressed(path: str) -> IO[str]:
+    """
+    Opens a (possibly bz2, gzip or xz compressed) dump file for streaming text reads.
+    """
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8", errors="replace")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+# ------------------------------------------
+# SQL table dumps (categorylinks, page)
+# ------------------------------------------
+
+RE_SQL_TUPLE = re.compile(r"\(((?:'(?:[^'\\]|\\.)*'|[^'()])*)\)")
+RE_SQL_VALUE = re.compile(r"'((?:[^'\\]|\\.)*)'|(NULL)|([-+0-9.eE]+)")
+RE_SQL_ESCAPE = re.compile(r"\\(.)")
+SQL_ESCAPES = {"0": "\0", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+RE_CREATE_TABLE_COLUMN = re.compile(r"^\s*`(\w+)`\s+\w+")
+
+
+def parse_sql_value(match: re.Match):
+    string, null, number = match.groups()
+    if null is not None:
+        return None
+    if number is not None:
+        return float(number) if any(c in number for c in ".eE") else int(number)
+    return RE_SQL_ESCAPE.sub(lambda m: SQL_ESCAPES.get(m.group(1), m.group(1)), string)
+
+
+def iter_sql_rows(path: str, table: str) -> Iterator[dict]:
+    """
+    Streams the rows of a MySQL table dump (eg. enwiki-latest-categorylinks.sql.gz) as dictionaries keyed by column
+    name. Column names are taken from the CREATE TABLE statement of the dump. Only one INSERT statement (one line) is
+    held in memory at a time.
+    """
+    insert_prefix = f"INSERT INTO `{table}` VALUES "
+    columns: List[str] = []
+    in_create_table = False
+    with open_compressed(path) as file:
+        for line in file:
+            if line.startswith(f"CREATE TABLE `{table}`"):
+                in_create_table = True
+                continue
+            if in_create_table:
+                match = RE_CREATE_TABLE_COLUMN.match(line)
+                if match:
+                    columns.append(match.group(1))
+                elif line.startswith(")"):
+                    in_create_table = False
+                continue
+            if not line.startswith(insert_prefix):
+                continue
+            if not columns:
+                raise ValueError(f"No CREATE TABLE statement found for `{table}` in {path}.")
+            for tuple_match in RE_SQL_TUPLE.finditer(line, len(insert_prefix)):
+                values = [parse_sql_value(m) for m in RE_SQL_VALUE.finditer(tuple_match.group(1))]
+                yield dict(zip(columns, values))
+
+
+# ------------------------------------------
+# Page dumps
+# ------------------------------------------
+
+
+def strip_xml_namespace(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def iter_xml_dump_pages(path: str) -> Iterator[Tuple[int, int, str, str]]:
+    """
+    Streams the pages of a MediaWiki XML export (eg. enwiki-latest-pages-articles.xml.bz2) as
+    (page_id, namespace, title, wikitext) tuples. Redirect pages are skipped. Parsed elements are cleared as soon as
+    a page has been yielded, so memory use does not grow with the size of the dump.
+    """
+    with open_compressed(path) as file:
+        context = ET.iterparse(file, events=("start", "end"))
+        _, root = next(context)
+        for event, elem in context:
+            if event != "end" or strip_xml_namespace(elem.tag) != "page":
+                continue
+
+            page_id, ns, title, text, is_redirect = None, None, None, "", False
+            for child in elem:
+                tag = strip_xml_namespace(child.tag)
+                if tag == "id":
+                    page_id = int(child.text)
+                elif tag == "ns":
+                    ns = int(child.text)
+                elif tag == "title":
+                    title = child.text
+                elif tag == "redirect":
+                    is_redirect = True
+                elif tag == "revision":
+                    for rev_child in child:
+                        if strip_xml_namespace(rev_child.tag) == "text":
+                            text = rev_child.text or ""
+
+            if not is_redirect and page_id is not None:
+                yield page_id, ns, title, text
+            root.clear()
+
+
+def iter_ndjson_lines(path: str) -> Iterator[str]:
+    if ".tar" in path:
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                file = archive.extractfile(member)
+                for line in io.TextIOWrapper(file, encoding="utf-8", errors="replace"):
+                    yield line
+    else:
+        with open_compressed(path) as file:
+            yield from file
+
+
+def iter_html_dump_pages(path: str) -> Iterator[Tuple[int, int, str, str]]:
+    """
+    Streams the pages of a Wikimedia Enterprise HTML dump (NDJSON, optionally inside a .tar.gz archive) as
+    (page_id, namespace, title, html) tuples.
+    """
+    for line in iter_ndjson_lines(path):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        body = record.get("article_body", {}).get("html")
+        if body is None:
+            continue
+        yield (
+            int(record["identifier"]),
+            int(record.get("namespace", {}).get("identifier", 0)),
+            record["name"],
+            body,
+        )
+
+
+# ------------------------------------------
+# Rendering to the downloaded page format
+# ------------------------------------------
+
+RE_WIKI_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+RE_WIKI_REF = re.compile(r"<ref[^>]*/>|<ref[^>]*>.*?</ref>", re.DOTALL | re.IGNORECASE)
+RE_WIKI_TEMPLATE = re.compile(r"\{\{[^{}]*\}\}")
+RE_WIKI_TABLE = re.compile(r"\{\|(?:(?!\{\|).)*?\|\}", re.DOTALL)
+RE_WIKI_FILE_LINK = re.compile(
+    r"\[\[(?:File|Image|Category):[^\[\]]*(?:\[\[[^\[\]]*\]\][^\[\]]*)*\]\]",
+    re.IGNORECASE,
+)
+RE_WIKI_LINK = re.compile(r"\[\[(?:[^|\[\]]*\|)?([^\[\]]*)\]\]")
+RE_WIKI_EXTERNAL_LINK = re.compile(r"\[(?:https?:)?//[^\s\]]+\s*([^\]]*)\]")
+RE_WIKI_BOLD_ITALIC = re.compile(r"'{2,5}")
+RE_HTML_TAG = re.compile(r"</?[a-zA-Z][^>]*>")
+RE_WIKI_HEADING = re.compile(r"^(={2,6})\s*(.*?)\s*\1\s*$")
+
+
+def remove_nested(pattern: re.Pattern, text: str) -> str:
+    """
+    Repeatedly removes innermost matches of the pattern (templates and tables can be nested).
+    """
+    while True:
+        text, num_subs = pattern.subn("", text)
+        if num_subs == 0:
+            return text
+
+
+def wikitext_to_html(wikitext: str) -> str:
+    """
+    Renders wikitext to simple HTML in the layout of the downloaded pages: paragraphs as <p>, lists as <ul>/<li> and
+    headings as '<hN>title</hN>'.
+
+    This is a lossy, best-effort rendering meant for the chunker: templates (infoboxes, citations, navboxes), tables,
+    references, files and categories are dropped and links are replaced by their text. HTML dumps should be preferred
+    when available.
+    """
+    text = RE_WIKI_COMMENT.sub("", wikitext)
+    text = RE_WIKI_REF.sub("", text)
+    text = remove_nested(RE_WIKI_TEMPLATE, text)
+    text = remove_nested(RE_WIKI_TABLE, text)
+    text = remove_nested(RE_WIKI_FILE_LINK, text)
+    text = RE_WIKI_LINK.sub(r"\1", text)
+    text = RE_WIKI_EXTERNAL_LINK.sub(r"\1", text)
+    text = RE_WIKI_BOLD_ITALIC.sub("", text)
+    text = RE_HTML_TAG.sub("", text)
+    text = html.unescape(text)
+
+    blocks = []
+    paragraph: List[str] = []
+    list_items: List[str] = []
+
+    def flush():
+        if paragraph:
+            blocks.append(f"<p>{html.escape(' '.join(paragraph), quote=False)}</p>")
+            paragraph.clear()
+        if list_items:
+            items = "".join(f"<li>{html.escape(item, quote=False)}</li>" for item in list_items)
+            blocks.append(f"<ul>{items}</ul>")
+            list_items.clear()
+
+    for line in text.splitlines():
+        line = line.strip()
+        heading = RE_WIKI_HEADING.match(line)
+        if heading:
+            flush()
+            level = len(heading.group(1))
+            blocks.append(f"<h{level}>{html.escape(heading.group(2), quote=False)}</h{level}>")
+        elif line.startswith(("*", "#")):
+            if paragraph:
+                flush()
+            item = line.lstrip("*#:; ").strip()
+            if item:
+                list_items.append(item)
+        elif line == "":
+            flush()
+        else:
+            if list_items:
+                flush()
+            paragraph.append(line.lstrip(":; "))
+    flush()
+
+    return "\n".join(blocks)
+
+
+HTML_DUMP_REMOVED_SELECTORS = [
+    "table",
+    "figure",
+    "style",
+    "script",
+    "link",
+    "meta",
+    "sup.reference",
+    "span.mw-editsection",
+    "div.reflist",
+    "div.navbox",
+    "div.hatnote",
+    "div.mw-references-wrap",
+    "ol.references",
+]
+HTML_DUMP_BLOCK_TAGS = ["h2", "h3", "h4", "p", "ul", "ol", "dl"]
+
+
+def parsoid_html_to_html(html_str: str) -> str:
+    """
+    Flattens the Parsoid HTML of an HTML dump (nested <section> elements, infoboxes, references, ...) into the layout of
+    the downloaded pages: top level paragraphs, lists and '<hN>title</hN>' headings.
+    """
+    soup = BeautifulSoup(html_str, "html.parser")
+    for selector in HTML_DUMP_REMOVED_SELECTORS:
+        for tag in soup.select(selector):
+            tag.decompose()
+
+    blocks = []
+    body = soup.body or soup
+    for tag in body.find_all(HTML_DUMP_BLOCK_TAGS):
+        if tag.find_parent(HTML_DUMP_BLOCK_TAGS + ["li"]) is not None:
+            continue  # nested in a block that is already emitted
+        if tag.name in ["h2", "h3", "h4"]:
+            title = tag.get_text(separator=" ").strip()
+            blocks.append(f"<{tag.name}>{html.escape(title, quote=False)}</{tag.name}>")
+        else:
+            blocks.append(str(tag))
+
+    return "\n".join(blocks)
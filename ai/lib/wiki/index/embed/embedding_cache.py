@@ -0,0 +1,142 @@
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from haystack import Document
+from haystack.components.embedders import OpenAIDocumentEmbedder
+
+
+def get_text_to_embed(embedder: OpenAIDocumentEmbedder, doc: Document) -> str:
+    """
+    Returns the text the embedder sends for a document: its content, preceded by the meta fields to embed, with the
+    prefix and suffix of the embedder (as OpenAIDocumentEmbedder does).
+    """
+    meta_fields_to_embed = getattr(embedder, "meta_fields_to_embed", None) or []
+    meta_values_to_embed = [
+        str(doc.meta[key]) for key in meta_fields_to_embed if key in doc.meta and doc.meta[key] is not None
+    ]
+    return (
+        getattr(embedder, "prefix", "")
+        + getattr(embedder, "embedding_separator", "\n").join(meta_values_to_embed + [doc.content or ""])
+        + getattr(embedder, "suffix", "")
+    )
+
+
+class EmbeddingCache:
+    """
+    Embeddings keyed by content: a hash of the model, the dimensions and the text embedded. The same text is only
+    embedded once, whatever the page or the chunk id it comes with (chunk ids are new every time a page is chunked).
+
+    Embeddings are stored as float32 in an SQLite database, shared by runs and workers. Once the stored embeddings
+    exceed max_bytes, the least recently used ones are evicted down to 90% of it.
+
+    Args:
+        db_path (str): Path of the SQLite database file.
+        max_bytes (int): Size limit of the stored embeddings, 0 for no limit.
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = 0):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                embedding BLOB NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+            """
+        )
+        self.connection.commit()
+        self.num_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings"
+        ).fetchone()[0]
+        self.num_hits = 0
+        self.num_misses = 0
+
+    @staticmethod
+    def get_key(model: str, dimensions: Optional[int], text: str) -> bytes:
+        return hashlib.sha256(f"{model}\0{dimensions}\0{text}".encode("utf-8")).digest()
+
+    def get_embeddings(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """
+        Returns the stored embeddings of keys (the keys not stored are left out) and marks them as recently used.
+        """
+        embeddings = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # bounded by the SQLite limit on query parameters
+        for i in range(0, len(unique_keys), 500):
+            batch = unique_keys[i : i + 500]
+            rows = self.connection.execute(
+                f"SELECT key, embedding FROM embeddings WHERE key IN ({', '.join('?' * len(batch))})", batch
+            ).fetchall()
+            for key, embedding in rows:
+                embeddings[key] = np.frombuffer(embedding, dtype=np.float32).tolist()
+        if embeddings:
+            now = time.time()
+            self.connection.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in embeddings]
+            )
+            self.connection.commit()
+        self.num_hits += sum(1 for key in keys if key in embeddings)
+        self.num_misses += sum(1 for key in keys if key not in embeddings)
+        return embeddings
+
+    def put_embeddings(self, embeddings: Dict[bytes, List[float]]) -> None:
+        """
+        Stores embeddings by key, then evicts the least recently used ones if the cache is over its size limit.
+        """
+        if not embeddings:
+            return
+        now = time.time()
+        rows = [
+            (key, np.asarray(embedding, dtype=np.float32).tobytes(), now) for key, embedding in embeddings.items()
+        ]
+        existing_bytes = 0
+        keys = list(embeddings)
+        for i in range(0, len(keys), 500):
+            batch = keys[i : i + 500]
+            existing_bytes += self.connection.execute(
+                f"SELECT COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings WHERE key IN ({', '.join('?' * len(batch))})",
+                batch,
+            ).fetchone()[0]
+        self.connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+        self.connection.commit()
+        self.num_bytes += sum(len(embedding) for _, embedding, _ in rows) - existing_bytes
+        if self.max_bytes > 0 and self.num_bytes > self.max_bytes:
+            self.evict(int(self.max_bytes * 0.9))
+
+    def evict(self, target_bytes: int) -> int:
+        """
+        Deletes the least recently used embeddings until the stored embeddings take at most target_bytes.
+
+        Returns:
+            int: The number of embeddings deleted.
+        """
+        # other processes may have added embeddings since
+        self.num_bytes = self.connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(embedding)), 0) FROM embeddings"
+        ).fetchone()[0]
+        keys = []
+        for key, size in self.connection.execute(
+            "SELECT key, LENGTH(embedding) FROM embeddings ORDER BY last_used"
+        ):
+            if self.num_bytes <= target_bytes:
+                break
+            keys.append((key,))
+            self.num_bytes -= size
+        self.connection.executemany("DELETE FROM embeddings WHERE key = ?", keys)
+        self.connection.commit()
+        return len(keys)
+
+    def close(self) -> None:
+        self.connection.close()
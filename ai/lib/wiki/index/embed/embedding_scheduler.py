@@ -0,0 +1,187 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import replace
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+from haystack import Document
+from haystack.components.embedders import OpenAIDocumentEmbedder
+from lib.wiki.index.chunk.table_serializer import count_tokens
+from lib.wiki.index.embed.embedding_cache import EmbeddingCache, get_text_to_embed
+
+
+class EmbeddingError(Exception):
+    pass
+
+
+class EmbeddingScheduler:
+    """
+    Embeds the documents of many pages with as few, and as concurrent, embedding requests as possible:
+
+    - the documents of all pages are packed in order into batches of at most max_batch_documents documents and
+      max_batch_tokens tokens (a document over max_batch_tokens is a batch of its own), so small pages share requests
+      and large pages are spread over several
+    - up to concurrency batches are embedded at the same time, each with one embedder.run call from a thread pool
+    - the embedded documents are routed back to their page, in the original order
+
+    With a cache, documents whose text was embedded before (by the same model, with the same dimensions) get their
+    embedding from it, documents with the same text are embedded once, and new embeddings are added to it.
+
+    The embedder should have a batch_size of at least max_batch_documents, so that every batch is one request.
+
+    Args:
+        embedder (OpenAIDocumentEmbedder): The embedder; its run method is called from several threads.
+        max_batch_tokens (int): Token limit of a batch (estimated from the document content), 0 for no limit.
+        max_batch_documents (int): Document limit of a batch; the batch_size of the embedder by default.
+        concurrency (int): Number of batches embedded at the same time.
+        cache (Optional[EmbeddingCache]): Embeddings by content, shared across pages and runs.
+    """
+
+    def __init__(
+        self,
+        embedder: OpenAIDocumentEmbedder,
+        max_batch_tokens: int = 0,
+        max_batch_documents: Optional[int] = None,
+        concurrency: int = 1,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.embedder = embedder
+        self.cache = cache
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_documents = max(max_batch_documents or getattr(embedder, "batch_size", 32), 1)
+        self.concurrency = max(concurrency, 1)
+        self.executor = None
+
+        self.num_documents = 0
+        self.num_cached_documents = 0
+        self.num_tokens = 0
+        self.num_batches = 0
+        self.seconds = 0.0
+
+    def make_batches(
+        self, documents: Iterable[Tuple[Hashable, int, Document]]
+    ) -> List[List[Tuple[Hashable, int, Document, int]]]:
+        """
+        Packs documents ((key, position in the documents of the key, document)) into batches of (key, position,
+        document, tokens).
+        """
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for key, position, doc in documents:
+            tokens = count_tokens(doc.content or "")
+            if batch and (
+                len(batch) >= self.max_batch_documents
+                or (self.max_batch_tokens > 0 and batch_tokens + tokens > self.max_batch_tokens)
+            ):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append((key, position, doc, tokens))
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def embed_batch(self, batch: List[Tuple[Hashable, int, Document, int]]) -> List[Document]:
+        output = self.embedder.run(documents=[doc for _, _, doc, _ in batch])
+        if "documents" not in output:
+            raise KeyError(
+                "The 'documents' key is missing in the embedded_documents returned from embedder."
+            )
+        embedded_documents = output["documents"]
+        missing = [doc.id for doc in embedded_documents if doc.embedding is None]
+        if len(embedded_documents) != len(batch) or missing:
+            raise EmbeddingError(f"The embedder returned no embedding for documents {missing}.")
+        return embedded_documents
+
+    def embed(self, documents_by_key: Dict[Hashable, List[Document]]) -> Dict[Hashable, List[Document]]:
+        """
+        Embeds the documents of many pages (or any other key) and returns the embedded documents of every key, in the
+        same order. Raises EmbeddingError if a document could not be embedded.
+        """
+        start = time.perf_counter()
+        embedded = {key: [None] * len(documents) for key, documents in documents_by_key.items()}
+        documents = [
+            (key, position, doc)
+            for key, key_documents in documents_by_key.items()
+            for position, doc in enumerate(key_documents)
+        ]
+
+        cache_keys = {}  # (key, position) -> cache key of the documents to embed
+        same_text_documents = {}  # cache key -> the documents to embed with that text, the first one is embedded
+        if self.cache is not None:
+            model, dimensions = self.embedder.model, getattr(self.embedder, "dimensions", None)
+            document_cache_keys = [
+                EmbeddingCache.get_key(model, dimensions, get_text_to_embed(self.embedder, doc))
+                for _, _, doc in documents
+            ]
+            cached_embeddings = self.cache.get_embeddings(document_cache_keys)
+            documents_to_embed = []
+            for (key, position, doc), cache_key in zip(documents, document_cache_keys):
+                if cache_key in cached_embeddings:
+                    embedded[key][position] = replace(doc, embedding=cached_embeddings[cache_key])
+                    self.num_cached_documents += 1
+                    continue
+                if cache_key not in same_text_documents:
+                    same_text_documents[cache_key] = []
+                    documents_to_embed.append((key, position, doc))
+                    cache_keys[(key, position)] = cache_key
+                same_text_documents[cache_key].append((key, position, doc))
+            documents = documents_to_embed
+        batches = self.make_batches(documents)
+
+        def route(batch, embedded_documents):
+            new_embeddings = {}
+            for (key, position, _, _), doc in zip(batch, embedded_documents):
+                embedded[key][position] = doc
+                if self.cache is not None:
+                    cache_key = cache_keys[(key, position)]
+                    new_embeddings[cache_key] = doc.embedding
+                    for same_key, same_position, same_doc in same_text_documents[cache_key][1:]:
+                        embedded[same_key][same_position] = replace(same_doc, embedding=doc.embedding)
+                        self.num_cached_documents += 1
+            if self.cache is not None:
+                self.cache.put_embeddings(new_embeddings)
+
+        if self.concurrency == 1 or len(batches) == 1:
+            for batch in batches:
+                route(batch, self.embed_batch(batch))
+        else:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+            futures = {}
+            next_batch = 0
+            try:
+                while futures or next_batch < len(batches):
+                    while len(futures) < self.concurrency and next_batch < len(batches):
+                        futures[self.executor.submit(self.embed_batch, batches[next_batch])] = batches[next_batch]
+                        next_batch += 1
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        route(futures.pop(future), future.result())
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        self.num_documents += sum(len(batch) for batch in batches)
+        self.num_tokens += sum(tokens for batch in batches for _, _, _, tokens in batch)
+        self.num_batches += len(batches)
+        self.seconds += time.perf_counter() - start
+        return embedded
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        Returns the number of documents, estimated tokens and batches embedded since the scheduler was created, the
+        number of documents that got their embedding from the cache instead, and the time spent embedding.
+        """
+        return {
+            "documents": self.num_documents,
+            "cached_documents": self.num_cached_documents,
+            "tokens": self.num_tokens,
+            "batches": self.num_batches,
+            "seconds": self.seconds,
+        }
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
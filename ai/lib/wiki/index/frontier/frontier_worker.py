@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+import logging
+from typing import Dict, List, Optional
+from lib.wiki.index.download.helpers import get_title_pathname_map
+from lib.wiki.index.frontier.redis_frontier import RedisFrontier, make_item
+
+
+# Later stages first, so that pages flow through to the index instead of piling up behind the category crawl
+STAGES = ["index", "chunk", "download"]
+
+
+class FrontierWorker:
+    """
+    Pulls work items from a RedisFrontier and runs them through the download, chunk and index stages. Any number of
+    workers (on one or several machines) can share the same frontier.
+
+    - download/category: lists the category members, enqueues its pages and (breadth-first) its subcategories
+    - download/page: downloads the page, then enqueues it for chunking
+    - chunk/page: chunks the page, then enqueues it for indexing
+    - index/page: indexes the page in Elasticsearch, Weaviate and Neo4j
+
+    The 'downloaded_pages', 'chunked_pages' and 'indexed_pages' Redis sets are kept up to date exactly as in the
+    recursive Downloader, Chunker and Indexer, so both modes can be mixed and resumed from each other.
+
+    Args:
+        logger: Logger.
+        frontier (RedisFrontier): The shared frontier.
+        downloader (Downloader): Used for the download stage.
+        chunker (Chunker): Used for the chunk stage.
+        indexer (Indexer): Used for the index stage.
+        inverse_filter (list): Words/phrases; categories or pages containing any of these are excluded.
+        stages (List[str]): The stages this worker handles, in order of priority.
+        poll_interval (float): Seconds to wait before polling again when there is nothing to do.
+        reclaim_interval (float): Seconds between two reclaims of expired leases.
+        heartbeat_interval (Optional[float]): Seconds between two extensions of the lease of the item being processed
+            (by default, a third of the frontier's lease_seconds), so that an item that takes longer than its lease is
+            not handed to another worker while this one is still on it.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        frontier: RedisFrontier,
+        downloader,
+        chunker,
+        indexer,
+        inverse_filter: list,
+        stages: List[str] = STAGES,
+        poll_interval: float = 1.0,
+        reclaim_interval: float = 30.0,
+        heartbeat_interval: Optional[float] = None,
+    ):
+        self.logger = logger
+        self.frontier = frontier
+        self.redis = frontier.redis
+        self.downloader = downloader
+        self.chunker = chunker
+        self.indexer = indexer
+        self.inverse_filter = inverse_filter
+        self.stages = stages
+        self.poll_interval = poll_interval
+        self.reclaim_interval = reclaim_interval
+        self.last_reclaim = 0.0
+        self.heartbeat_interval = heartbeat_interval or frontier.lease_seconds / 3
+
+    def seed(self, category: str, filepath: str, depth: int) -> bool:
+        """
+        Enqueues the root category of the crawl.
+        """
+        return self.frontier.enqueue(
+            make_item("download", "category", category, filepath, depth=depth)
+        )
+
+    def handle_download_category(self, item: dict) -> None:
+        filepath = item["filepath"]
+        if not os.path.exists(filepath):
+            os.makedirs(filepath)
+
+        title_pathname = get_title_pathname_map(
+            item["title"], filepath, self.inverse_filter, create=True
+        )
+        self.downloader.record_category(item["title"], filepath, title_pathname)
+
+        items = [
+            make_item("download", "page", page_title, filepath, filename=page_filename)
+            for page_title, page_filename in title_pathname["pages"].items()
+        ]
+        if item["depth"] > 1:
+            items += [
+                make_item(
+                    "download",
+                    "category",
+                    subcategory_title,
+                    os.path.join(filepath, subcategory_path),
+                    depth=item["depth"] - 1,
+                )
+                for subcategory_title, subcategory_path in title_pathname[
+                    "categories"
+                ].items()
+            ]
+        self.frontier.enqueue_many(items)
+        self.redis.sadd("downloaded_categories", item["title"])
+
+    def handle_download_page(self, item: dict) -> None:
+        if not self.redis.sismember("downloaded_pages", item["title"]):
+            downloaded_pages = self.downloader.download_and_record(
+                {item["title"]: item["filename"]}, item["filepath"]
+            )
+            if item["title"] not in downloaded_pages:
+                raise RuntimeError(f"Page {item['title']} could not be downloaded.")
+        self.frontier.enqueue({**item, "stage": "chunk"})
+
+    def handle_chunk_page(self, item: dict) -> None:
+        if not self.redis.sismember("chunked_pages", item["title"]):
+            self.chunker.chunk_page(item["filepath"], item["title"], item["filename"])
+            self.redis.sadd("chunked_pages", item["title"])
+            if self.chunker.manifest is not None:
+                self.chunker.manifest.set_page_status("chunked", [item["title"]])
+        self.frontier.enqueue({**item, "stage": "index"})
+
+    def handle_index_page(self, item: dict) -> None:
+        if not self.redis.sismember("indexed_pages", item["title"]):
+            self.indexer.index_page(item["filepath"], item["title"], item["filename"])
+
+    def process(self, item: dict) -> None:
+        handlers = {
+            ("download", "category"): self.handle_download_category,
+            ("download", "page"): self.handle_download_page,
+            ("chunk", "page"): self.handle_chunk_page,
+            ("index", "page"): self.handle_index_page,
+        }
+        handler = handlers.get((item["stage"], item["type"]))
+        if handler is None:
+            raise ValueError(f"No handler for {item['stage']} {item['type']} items.")
+        handler(item)
+
+    def reclaim_expired(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self.last_reclaim < self.reclaim_interval:
+            return
+        self.last_reclaim = now
+        for stage in self.stages:
+            num_reclaimed = self.frontier.reclaim_expired(stage)
+            if num_reclaimed > 0:
+                self.logger.warning(
+                    f"Reclaimed {num_reclaimed} {stage} items with expired leases."
+                )
+
+    def extend_lease(self, item: dict, done: threading.Event) -> None:
+        """
+        Extends the lease of the item every heartbeat_interval seconds until done is set.
+        """
+        while not done.wait(self.heartbeat_interval):
+            try:
+                if not self.frontier.extend(item):
+                    self.logger.warning(
+                        f"Lease of {item['stage']} {item['type']} {item['title']} was lost before it was processed."
+                    )
+                    return
+            except Exception as e:
+                self.logger.warning(
+                    f"Error extending the lease of {item['stage']} {item['type']} {item['title']}: {e}"
+                )
+
+    def process_with_heartbeat(self, item: dict) -> None:
+        """
+        Processes the item while a heartbeat thread keeps its lease from expiring.
+        """
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=self.extend_lease, args=(item, done), daemon=True
+        )
+        heartbeat.start()
+        try:
+            self.process(item)
+        finally:
+            done.set()
+            heartbeat.join()
+
+    def process_next(self) -> Optional[str]:
+        """
+        Claims and processes one item of the highest priority stage that has work. A failing item is released back to
+        the frontier for a retry.
+
+        Returns:
+            Optional[str]: The stage of the processed item, or None if there was nothing to do.
+        """
+        for stage in self.stages:
+            item = self.frontier.claim(stage)
+            if item is None:
+                continue
+            try:
+                self.process_with_heartbeat(item)
+                self.frontier.ack(item)
+            except Exception as e:
+                will_retry = self.frontier.fail(item, str(e))
+                self.logger.error(
+                    f"Error processing {stage} {item['type']} {item['title']} (will retry: {will_retry}): {e}",
+                    exc_info=True,
+                )
+            return stage
+        return None
+
+    def run(self, exit_when_drained: bool = True) -> Dict[str, int]:
+        """
+        Processes items until the frontier is drained, ie. no stage has pending or leased items left (or forever if
+        exit_when_drained is False).
+
+        Returns:
+            Dict[str, int]: The number of items processed per stage by this worker.
+        """
+        num_processed = {stage: 0 for stage in self.stages}
+        while True:
+            self.reclaim_expired()
+            stage = self.process_next()
+            if stage is not None:
+                num_processed[stage] += 1
+                continue
+            if exit_when_drained and self.frontier.is_drained(STAGES):
+                return num_processed
+            self.reclaim_expired(force=True)
+            time.sleep(self.poll_interval)
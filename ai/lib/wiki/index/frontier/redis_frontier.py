@@ -0,0 +1,260 @@
+import json
+from typing import List, Optional
+import redis
+
+
+# Pops the oldest pending item of a stage and leases it until now + lease_seconds (Redis server time, so that leases
+# are consistent across workers on different machines).
+CLAIM_SCRIPT = """
+local item = redis.call('LPOP', KEYS[1])
+if not item then
+    return nil
+end
+local now = redis.call('TIME')
+local deadline = tonumber(now[1]) + tonumber(ARGV[1])
+redis.call('ZADD', KEYS[2], deadline, item)
+return item
+"""
+
+# Adds every item (ARGV: item id, serialized item, ...) to the seen set of its stage and, if it was not in it yet, to
+# the tail of the pending list of its stage (KEYS: seen set, pending list, ... in the same order), atomically.
+ENQUEUE_SCRIPT = """
+local enqueued = 0
+for i = 1, #ARGV, 2 do
+    if redis.call('SADD', KEYS[i], ARGV[i]) == 1 then
+        redis.call('RPUSH', KEYS[i + 1], ARGV[i + 1])
+        enqueued = enqueued + 1
+    end
+end
+return enqueued
+"""
+
+# Counts an attempt for every item whose lease has expired, then moves it back to the front of the pending list, or to
+# the dead letter list once it has used its max attempts (ARGV[1]).
+RECLAIM_SCRIPT = """
+local now = redis.call('TIME')
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now[1])
+for _, item in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], item)
+    local decoded = cjson.decode(item)
+    local item_id = decoded['type'] .. ':' .. decoded['title']
+    local attempts = redis.call('HINCRBY', KEYS[3], item_id, 1)
+    if attempts < tonumber(ARGV[1]) then
+        redis.call('LPUSH', KEYS[2], item)
+    else
+        redis.call('RPUSH', KEYS[4], cjson.encode({item = decoded, reason = 'lease expired', attempts = attempts}))
+        redis.call('HDEL', KEYS[3], item_id)
+    end
+end
+return #expired
+"""
+
+# Releases a leased item (ARGV[1]) that failed: counts an attempt, then moves it to the tail of the pending list, or to
+# the dead letter list with the reason (ARGV[4]) once it has used its max attempts (ARGV[3]). Nothing is done if the
+# lease was already reclaimed, as the reclaim has counted the attempt and re-queued the item itself.
+FAIL_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+local attempts = redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+if attempts < tonumber(ARGV[3]) then
+    redis.call('RPUSH', KEYS[3], ARGV[1])
+    return 1
+end
+redis.call('RPUSH', KEYS[4], cjson.encode({item = cjson.decode(ARGV[1]), reason = ARGV[4], attempts = attempts}))
+redis.call('HDEL', KEYS[2], ARGV[2])
+return 0
+"""
+
+# Extends the lease of an item that is still held (an acked or reclaimed lease is never re-created).
+EXTEND_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[2]) then
+    return 0
+end
+local now = redis.call('TIME')
+redis.call('ZADD', KEYS[1], tonumber(now[1]) + tonumber(ARGV[1]), ARGV[2])
+return 1
+"""
+
+
+def make_item(stage: str, type: str, title: str, filepath: str, **fields) -> dict:
+    """
+    Creates a frontier work item.
+
+    Args:
+        stage (str): "download", "chunk" or "index".
+        type (str): "category" or "page".
+        title (str): Title of the category or page.
+        filepath (str): Directory of the category (for a page, the directory of the category it is saved in).
+        **fields: Stage specific fields, eg. 'depth' for categories or 'filename' for pages.
+    """
+    return {"stage": stage, "type": type, "title": title, "filepath": filepath, **fields}
+
+
+class RedisFrontier:
+    """
+    Breadth-first crawl frontier shared by any number of worker processes through Redis.
+
+    Every stage has its own FIFO list of pending items ('<prefix>:<stage>:pending'). A worker claims an item by
+    leasing it: the item is atomically moved into the stage's lease sorted set ('<prefix>:<stage>:leases'), scored by
+    its lease deadline. The worker acks the item once it is done. If the worker crashes, the lease expires and
+    reclaim_expired puts the item back in the pending list, so that another worker picks it up.
+
+    An item is enqueued at most once per stage and title ('<prefix>:<stage>:seen'), which also ensures that a page or
+    category belonging to several parent categories is only processed once; it is marked as seen and added to the
+    pending list atomically. Items that keep failing, or whose lease keeps expiring (eg. an item that kills its
+    worker), are moved to the stage's dead letter list ('<prefix>:<stage>:failed') after max_attempts.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        prefix: str = "frontier",
+        lease_seconds: int = 300,
+        max_attempts: int = 3,
+    ):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.enqueue_script = self.redis.register_script(ENQUEUE_SCRIPT)
+        self.claim_script = self.redis.register_script(CLAIM_SCRIPT)
+        self.reclaim_script = self.redis.register_script(RECLAIM_SCRIPT)
+        self.fail_script = self.redis.register_script(FAIL_SCRIPT)
+        self.extend_script = self.redis.register_script(EXTEND_SCRIPT)
+
+    def key(self, stage: str, name: str) -> str:
+        return f"{self.prefix}:{stage}:{name}"
+
+    @staticmethod
+    def serialize(item: dict) -> str:
+        return json.dumps(item, sort_keys=True)
+
+    @staticmethod
+    def item_id(item: dict) -> str:
+        return f"{item['type']}:{item['title']}"
+
+    def enqueue(self, item: dict) -> bool:
+        """
+        Adds an item to the tail of its stage's pending list, unless an item with the same type and title has already
+        been enqueued for that stage.
+
+        Returns:
+            bool: True if the item was enqueued.
+        """
+        return self.enqueue_many([item]) == 1
+
+    def enqueue_many(self, items: List[dict], batch_size: int = 1000) -> int:
+        """
+        Enqueues several items, with one script call (one round trip) per batch_size items. Returns the number of items
+        enqueued.
+        """
+        num_enqueued = 0
+        for start in range(0, len(items), batch_size):
+            keys = []
+            args = []
+            for item in items[start : start + batch_size]:
+                keys += [self.key(item["stage"], "seen"), self.key(item["stage"], "pending")]
+                args += [self.item_id(item), self.serialize(item)]
+            num_enqueued += self.enqueue_script(keys=keys, args=args)
+        return num_enqueued
+
+    def claim(self, stage: str) -> Optional[dict]:
+        """
+        Leases the oldest pending item of the stage. Returns None if there is nothing to do.
+        """
+        raw_item = self.claim_script(
+            keys=[self.key(stage, "pending"), self.key(stage, "leases")],
+            args=[self.lease_seconds],
+        )
+        if raw_item is None:
+            return None
+        return json.loads(raw_item)
+
+    def extend(self, item: dict) -> bool:
+        """
+        Extends the lease of a claimed item (for long running items). Returns False if the lease was already lost.
+        """
+        return bool(
+            self.extend_script(
+                keys=[self.key(item["stage"], "leases")],
+                args=[self.lease_seconds, self.serialize(item)],
+            )
+        )
+
+    def ack(self, item: dict) -> None:
+        """
+        Marks a claimed item as done.
+        """
+        stage = item["stage"]
+        pipeline = self.redis.pipeline(transaction=True)
+        pipeline.zrem(self.key(stage, "leases"), self.serialize(item))
+        pipeline.hdel(self.key(stage, "attempts"), self.item_id(item))
+        pipeline.execute()
+
+    def fail(self, item: dict, reason: str) -> bool:
+        """
+        Releases a claimed item that could not be processed. The item is retried (put back at the tail of the pending
+        list) until it has failed max_attempts times, after which it is moved to the dead letter list with the reason.
+        If its lease had already expired and been reclaimed, the item is left as the reclaim put it.
+
+        Returns:
+            bool: True if the item was put back for a retry by this call.
+        """
+        stage = item["stage"]
+        return bool(
+            self.fail_script(
+                keys=[
+                    self.key(stage, "leases"),
+                    self.key(stage, "attempts"),
+                    self.key(stage, "pending"),
+                    self.key(stage, "failed"),
+                ],
+                args=[self.serialize(item), self.item_id(item), self.max_attempts, reason],
+            )
+        )
+
+    def reclaim_expired(self, stage: str) -> int:
+        """
+        Puts items whose lease has expired (their worker died or stalled) back in front of the pending list. An expired
+        lease counts as a failed attempt (see fail): an item whose lease has expired max_attempts times is moved to the
+        dead letter list instead, so that an item that kills its worker is not retried forever.
+
+        Returns:
+            int: The number of items reclaimed.
+        """
+        return self.reclaim_script(
+            keys=[
+                self.key(stage, "leases"),
+                self.key(stage, "pending"),
+                self.key(stage, "attempts"),
+                self.key(stage, "failed"),
+            ],
+            args=[self.max_attempts],
+        )
+
+    def pending_count(self, stage: str) -> int:
+        return self.redis.llen(self.key(stage, "pending"))
+
+    def leased_count(self, stage: str) -> int:
+        return self.redis.zcard(self.key(stage, "leases"))
+
+    def is_drained(self, stages: List[str]) -> bool:
+        """
+        True if no stage has pending or leased items left.
+        """
+        return all(
+            self.pending_count(stage) == 0 and self.leased_count(stage) == 0
+            for stage in stages
+        )
+
+    def reset(self, stages: List[str]) -> None:
+        """
+        Deletes all frontier state of the given stages.
+        """
+        keys = [
+            self.key(stage, name)
+            for stage in stages
+            for name in ["pending", "leases", "seen", "attempts", "failed"]
+        ]
+        self.redis.delete(*keys)
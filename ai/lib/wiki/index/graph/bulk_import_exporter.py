@@ -0,0 +1,158 @@
+import csv
+import os
+import uuid
+from typing import Dict, List
+from lib.wiki.index.graph.page_graph_creator import Neo4jPageGraphCreator
+from lib.wiki.index.graph.category_graph_creator import Neo4jCategoryGraphCreator
+
+
+# CSV files written, with their header in the neo4j-admin import format. Nodes are identified by their uuid property
+# (chunk ids for chunks), all in the same id space; sections get the label of their type too (eg. Section;h2).
+CSV_HEADERS = {
+    "pages": ["uuid:ID", "title", ":LABEL"],
+    "sections": ["uuid:ID", "name", "parent_uuid", ":LABEL"],
+    "chunks": ["uuid:ID", ":LABEL"],
+    "categories": ["uuid:ID", "title", ":LABEL"],
+    "relationships": [":START_ID", ":END_ID", ":TYPE"],
+}
+
+
+class Neo4jBulkImportExporter:
+    """
+    Writes the graph that Neo4jPageGraphCreator and Neo4jCategoryGraphCreator build (pages with their sections and
+    chunks, categories with their pages and subcategories) as CSV files for neo4j-admin database import, and the index
+    definitions of both creators as schema.cypher, to run once the import is done.
+
+    Every page is exported once (the first time its title is added). A category is linked to a page only if the page is
+    exported, as build_category_graph only links pages already in the graph.
+
+    Args:
+        output_dir (str): Directory of the CSV files and schema.cypher.
+    """
+
+    def __init__(self, output_dir: str):
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.output_dir = output_dir
+        self.files = {}
+        self.writers = {}
+        for name, header in CSV_HEADERS.items():
+            self.files[name] = open(self.csv_filepath(name), "w", newline="", encoding="utf-8")
+            self.writers[name] = csv.writer(self.files[name])
+            self.writers[name].writerow(header)
+        self.page_uuids = {}  # page title -> uuid
+        self.category_uuids = {}  # category title -> uuid
+        self.category_pages = {}  # (category title, page title) -> None, written once the pages are all exported
+        self.subcategories = set()
+        self.num_nodes = 0
+        self.num_relationships = 0
+
+    def csv_filepath(self, name: str) -> str:
+        return os.path.join(self.output_dir, f"{name}.csv")
+
+    def write_node(self, name: str, row: list) -> None:
+        self.writers[name].writerow(row)
+        self.num_nodes += 1
+
+    def write_relationship(self, start_uuid: str, end_uuid: str, relationship: str) -> None:
+        self.writers["relationships"].writerow([start_uuid, end_uuid, relationship])
+        self.num_relationships += 1
+
+    def add_page(self, page_dict: dict) -> bool:
+        """
+        Exports the graph of a page (its hierarchy, as for Neo4jPageGraphCreator.create_graph).
+
+        Returns:
+            bool: False if a page with the same title was exported before.
+        """
+        if page_dict["title"] in self.page_uuids:
+            return False
+        page_uuid = str(uuid.uuid4())
+        self.page_uuids[page_dict["title"]] = page_uuid
+        self.write_node("pages", [page_uuid, page_dict["title"], "Page"])
+
+        nodes = [(page_uuid, page_dict)]
+        while nodes:
+            node_uuid, node = nodes.pop()
+            section_uuids = []
+            for section in node["sections"]:
+                section_uuid = str(uuid.uuid4())
+                self.write_node("sections", [section_uuid, section["name"], node_uuid, f"Section;{section['type']}"])
+                self.write_relationship(node_uuid, section_uuid, "HAS_SECTION")
+                section_uuids.append(section_uuid)
+                nodes.append((section_uuid, section))
+            chunk_uuids = [chunk["id"] for chunk in node["chunks"]]
+            for chunk_uuid in chunk_uuids:
+                self.write_node("chunks", [chunk_uuid, "Chunk"])
+                self.write_relationship(node_uuid, chunk_uuid, "HAS_CHUNK")
+            if section_uuids:
+                self.write_relationship(node_uuid, section_uuids[0], "FIRST_SECTION")
+            if chunk_uuids:
+                self.write_relationship(node_uuid, chunk_uuids[0], "FIRST_CHUNK")
+            for relationship, child_uuids in [("NEXT_SECTION", section_uuids), ("NEXT_CHUNK", chunk_uuids)]:
+                for uuid1, uuid2 in zip(child_uuids, child_uuids[1:]):
+                    self.write_relationship(uuid1, uuid2, relationship)
+        return True
+
+    def get_category_uuid(self, category: str) -> str:
+        if category not in self.category_uuids:
+            self.category_uuids[category] = str(uuid.uuid4())
+            self.write_node("categories", [self.category_uuids[category], category, "Category"])
+        return self.category_uuids[category]
+
+    def add_category_page(self, category: str, page: str) -> None:
+        """
+        Exports the relationship between a category and a page (Category: HAS_PAGE -> Page), and the category node.
+        """
+        self.get_category_uuid(category)
+        self.category_pages[(category, page)] = None
+
+    def add_subcategory(self, category: str, subcategory: str) -> None:
+        """
+        Exports the relationship between a category and a subcategory (Category: HAS_SUBCATEGORY -> Category), and both
+        category nodes.
+        """
+        if (category, subcategory) in self.subcategories:
+            return
+        self.subcategories.add((category, subcategory))
+        self.write_relationship(
+            self.get_category_uuid(category), self.get_category_uuid(subcategory), "HAS_SUBCATEGORY"
+        )
+
+    def get_schema_queries(self) -> List[str]:
+        return Neo4jPageGraphCreator.INDEX_QUERIES + Neo4jCategoryGraphCreator.INDEX_QUERIES
+
+    def get_import_command(self, database: str = "neo4j") -> str:
+        """
+        Returns the neo4j-admin command importing the exported files into a database (which must not be running).
+        A chunk id found in several pages is one node, as with MERGE: duplicate nodes are skipped.
+        """
+        nodes = " ".join(f"--nodes={self.csv_filepath(name)}" for name in CSV_HEADERS if name != "relationships")
+        return (
+            f"neo4j-admin database import full --id-type=string --skip-duplicate-nodes=true {nodes} "
+            f"--relationships={self.csv_filepath('relationships')} {database}"
+        )
+
+    def close(self) -> Dict[str, int]:
+        """
+        Writes the relationships of categories to their exported pages, closes the CSV files and writes schema.cypher.
+
+        Returns:
+            Dict[str, int]: The number of pages, categories, nodes and relationships exported.
+        """
+        if self.files:
+            for category, page in self.category_pages:
+                if page in self.page_uuids:
+                    self.write_relationship(self.category_uuids[category], self.page_uuids[page], "HAS_PAGE")
+            self.category_pages = {}
+            for file in self.files.values():
+                file.close()
+            self.files = {}
+            with open(os.path.join(self.output_dir, "schema.cypher"), "w", encoding="utf-8") as file:
+                file.write("\n".join(self.get_schema_queries()) + "\n")
+        return {
+            "pages": len(self.page_uuids),
+            "categories": len(self.category_uuids),
+            "nodes": self.num_nodes,
+            "relationships": self.num_relationships,
+        }
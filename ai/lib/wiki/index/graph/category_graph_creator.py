@@ -1,21 +1,32 @@
+from typing import Iterable, Tuple
 from neo4j import GraphDatabase
+from lib.wiki.index.graph.schema import drop_property_index
 import uuid
 
 class Neo4jCategoryGraphCreator:
     """
     Creates a graph in Neo4j representing a category and its pages and subcategories. Creates the relevant indexes for efficient lookups.
+
+    Category and Page titles are unique (constraints), so the MERGE of a category and the MATCH of a page are index
+    lookups. create_relationships writes the relationships of a whole category tree in transactions of batch_size rows.
     """
-    def __init__(self, driver: GraphDatabase.driver):
+    INDEX_QUERIES = [
+        "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Category) REQUIRE n.title IS UNIQUE;",
+        "CREATE INDEX IF NOT EXISTS FOR (n:Category) ON (n.uuid);"
+    ]
+    # (label, property) of the plain indexes replaced by a uniqueness constraint
+    REPLACED_INDEXES = [("Category", "title")]
+
+    def __init__(self, driver: GraphDatabase.driver, batch_size: int = 5000):
         self.driver = driver
+        self.batch_size = max(batch_size, 1)
         self.create_indexes()
 
     def create_indexes(self):
-        index_queries = [
-            "CREATE INDEX IF NOT EXISTS FOR (n:Category) ON (n.title);",
-            "CREATE INDEX IF NOT EXISTS FOR (n:Category) ON (n.uuid);"
-        ]
         with self.driver.session() as session:
-            for query in index_queries:
+            for label, property_name in self.REPLACED_INDEXES:
+                drop_property_index(session, label, property_name)
+            for query in self.INDEX_QUERIES:
                 session.run(query)
 
     def close(self):
@@ -62,3 +73,53 @@ class Neo4jCategoryGraphCreator:
                 category_uuid=str(uuid.uuid4()),
                 subcategory_uuid=str(uuid.uuid4()),
             )
+
+    def create_relationships(
+        self, category_pages: Iterable[Tuple[str, str]], subcategories: Iterable[Tuple[str, str]]
+    ) -> None:
+        """
+        Creates the relationships of many categories (as create_category_to_page_relationship and
+        create_category_to_subcategory_relationship do) with UNWIND queries: the category nodes first, each merged
+        once, then the (category, page) and (category, subcategory) relationships, batch_size rows per write transaction.
+        """
+        category_pages = list(dict.fromkeys(category_pages))
+        subcategories = list(dict.fromkeys(subcategories))
+        categories = list(
+            dict.fromkeys(
+                [category for category, _ in category_pages]
+                + [title for category_subcategory in subcategories for title in category_subcategory]
+            )
+        )
+        category_query = """
+        UNWIND $rows AS row
+        MERGE (c:Category {title: row.title})
+        ON CREATE SET c.uuid = row.uuid
+        """
+        page_query = """
+        UNWIND $rows AS row
+        MATCH (c:Category {title: row.category})
+        MATCH (p:Page {title: row.page})
+        WHERE p.uuid IS NOT NULL
+        MERGE (c)-[:HAS_PAGE]->(p)
+        """
+        subcategory_query = """
+        UNWIND $rows AS row
+        MATCH (c:Category {title: row.category})
+        MATCH (sc:Category {title: row.subcategory})
+        MERGE (c)-[:HAS_SUBCATEGORY]->(sc)
+        """
+        with self.driver.session() as session:
+            for query, rows in [
+                (category_query, [{"title": title, "uuid": str(uuid.uuid4())} for title in categories]),
+                (page_query, [{"category": category, "page": page} for category, page in category_pages]),
+                (
+                    subcategory_query,
+                    [{"category": category, "subcategory": subcategory} for category, subcategory in subcategories],
+                ),
+            ]:
+                for i in range(0, len(rows), self.batch_size):
+                    session.execute_write(self.run_query, query, rows[i : i + self.batch_size])
+
+    @staticmethod
+    def run_query(tx, query, rows):
+        tx.run(query, rows=rows).consume()
@@ -1,27 +1,48 @@
-from neo4j import GraphDatabase
+import threading
 import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from neo4j import GraphDatabase
+from lib.wiki.index.graph.schema import drop_property_index
 
 class Neo4jPageGraphCreator:
     """
     Creates a graph in Neo4j representing a page and its sections and chunks. Creates the relevant indexes for efficient lookups.
+
+    With a concurrency over 1, the pages of create_graphs are written by a pool of writers, each with its own session.
+    Pages are sharded by title, and the nodes a page graph merges (its Page node, the Sections keyed by the uuid of
+    their parent, its Chunks) belong to that page only, so two writers never merge the same node. Category nodes are
+    not written here (see Neo4jCategoryGraphCreator).
     """
-    def __init__(self, driver: GraphDatabase.driver):
+    INDEX_QUERIES = [
+        "CREATE INDEX IF NOT EXISTS FOR (n:Chunk) ON (n.uuid);",
+        "CREATE INDEX IF NOT EXISTS FOR (n:Page) ON (n.uuid);",
+        "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Page) REQUIRE n.title IS UNIQUE;",
+        "CREATE INDEX IF NOT EXISTS FOR (n:Section) ON (n.uuid);",
+        "CREATE INDEX IF NOT EXISTS FOR (n:Section) ON (n.parent_uuid, n.name);"
+    ]
+
+    def __init__(self, driver: GraphDatabase.driver, pages_per_transaction: int = 1, concurrency: int = 1):
         self.driver = driver
+        self.pages_per_transaction = max(pages_per_transaction, 1)
+        self.concurrency = max(concurrency, 1)
+        self.executor = None
         self.create_indexes()
 
+    # (label, property) of the plain indexes replaced by a uniqueness constraint
+    REPLACED_INDEXES = [("Page", "title")]
+
     def create_indexes(self):
-        index_queries = [
-            "CREATE INDEX IF NOT EXISTS FOR (n:Chunk) ON (n.uuid);",
-            "CREATE INDEX IF NOT EXISTS FOR (n:Page) ON (n.uuid);",
-            "CREATE INDEX IF NOT EXISTS FOR (n:Page) ON (n.title);",
-            "CREATE INDEX IF NOT EXISTS FOR (n:Section) ON (n.uuid);",
-            "CREATE INDEX IF NOT EXISTS FOR (n:Section) ON (n.parent_uuid, n.name);"
-        ]
         with self.driver.session() as session:
-            for query in index_queries:
+            for label, property_name in self.REPLACED_INDEXES:
+                drop_property_index(session, label, property_name)
+            for query in self.INDEX_QUERIES:
                 session.run(query)
 
     def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
         self.driver.close()
 
     def create_graph(self, page_dict):
@@ -33,138 +54,186 @@ class Neo4jPageGraphCreator:
         - Section: HAS_CHUNK -> Chunk, FIRST_CHUNK -> Chunk, NEXT_SECTION -> Section, HAS_SECTION -> Section
         - Chunk: NEXT_CHUNK -> Chunk
         """
+        self.create_graphs([page_dict])
+
+    def create_graphs(self, page_dicts, written=None):
+        """
+        Creates the graphs of several pages (as create_graph does), pages_per_transaction pages per write transaction.
+        Every transaction writes the nodes and relationships of its pages with a few UNWIND queries: one for the pages,
+        one per section level and type, and one per kind of relationship.
+
+        The pages are split into concurrency shards, written at the same time. Transactions are managed (execute_write):
+        one failing with a transient error, such as a deadlock with another writer, is rolled back and retried with
+        backoff by the driver (up to its max_transaction_retry_time). If a shard still fails, the other shards stop after
+        their current transaction and the error is raised. The titles of the pages of every committed transaction are
+        appended to written (a list) if given, so that a caller can tell which pages were written before the error.
+        """
+        shards = self.get_shards(page_dicts)
+        if len(shards) <= 1:
+            for shard in shards:
+                self.write_shard(shard, written=written)
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="graph-writer")
+        failed = threading.Event()
+        futures = [self.executor.submit(self.write_shard, shard, failed, written) for shard in shards]
+        wait(futures)
+        for future in futures:
+            future.result()
+
+    def get_shards(self, page_dicts):
+        """
+        Splits pages into at most concurrency shards by a hash of their title, in their order within every shard.
+        """
+        shards = [[] for _ in range(self.concurrency)]
+        for page_dict in page_dicts:
+            shards[zlib.crc32(page_dict["title"].encode("utf-8")) % self.concurrency].append(page_dict)
+        return [shard for shard in shards if shard]
+
+    def write_shard(self, page_dicts, failed=None, written=None):
+        """
+        Writes the graphs of pages in one session, pages_per_transaction pages per transaction, and appends the titles
+        of the pages of every committed transaction to written. Stops before the next transaction once failed is set (by
+        another shard).
+        """
         with self.driver.session() as session:
-            # Create Page node with UUID
-            page_uuid = str(uuid.uuid4())
-            page_query = """
-            MERGE (p:Page {title: $title})
-            ON CREATE SET p.uuid = $uuid
-            RETURN p.uuid AS page_uuid
-            """
-            result = session.run(page_query, title=page_dict["title"], uuid=page_uuid)
-            record = result.single()
-
-            if record:
-                page_uuid = record["page_uuid"]
-            else:
-                raise RuntimeError("Failed to retrieve page_uuid; transaction may be closed unexpectedly.")
-
-            # Create sections and chunks
-            self.create_sections_and_chunks(session, page_uuid, page_dict["sections"], "Page")
-            self.create_chunks(session, page_uuid, page_dict["chunks"], "Page")
-
-    def create_sections_and_chunks(self, session, parent_uuid, sections, parent_type):
-        first_section_created = False
-        section_uuids = []
-
-        for i, section in enumerate(sections):
-            section_uuid = str(uuid.uuid4())
-            section_labels = f":Section:{section['type']}"
-            section_query = f"""
-            MATCH (parent:{parent_type} {{uuid: $parent_uuid}})
-            MERGE (s{section_labels} {{name: $name, parent_uuid: $parent_uuid}})
-            ON CREATE SET s.uuid = $uuid
-            MERGE (parent)-[:HAS_SECTION]->(s)
-            RETURN s.uuid AS section_uuid
-            """
-            result = session.run(
-                section_query,
-                parent_uuid=parent_uuid,
-                name=section["name"],
-                uuid=section_uuid,
-            )
-            record = result.single()
-            if record:
-                section_uuid = record["section_uuid"]
-                section_uuids.append(section_uuid)
-            else:
-                raise RuntimeError("Failed to retrieve section_uuid; transaction may be closed unexpectedly.")
-
-            # Create the FIRST_SECTION relationship if first_section not yet created
-            if not first_section_created and i == 0:
-                first_section_query = f"""
-                MATCH (parent:{parent_type} {{uuid: $parent_uuid}})
-                OPTIONAL MATCH (parent)-[r:FIRST_SECTION]->()
-                DELETE r
-                WITH parent
-                MATCH (s:Section {{uuid: $section_uuid}})
-                MERGE (parent)-[:FIRST_SECTION]->(s)
-                RETURN parent, s
+            for i in range(0, len(page_dicts), self.pages_per_transaction):
+                if failed is not None and failed.is_set():
+                    return
+                transaction_page_dicts = page_dicts[i : i + self.pages_per_transaction]
+                try:
+                    session.execute_write(self.write_graphs, transaction_page_dicts)
+                except Exception:
+                    if failed is not None:
+                        failed.set()
+                    raise
+                if written is not None:
+                    written.extend(page_dict["title"] for page_dict in transaction_page_dicts)
+
+    def write_graphs(self, tx, page_dicts):
+        """
+        Writes the graphs of pages in a transaction. The nodes are merged level by level (pages, then top-level
+        sections, then their subsections, ...), since a section is merged by the uuid of its parent; the relationships
+        are then written in bulk.
+        """
+        page_rows = [
+            {"key": key, "title": page_dict["title"], "uuid": str(uuid.uuid4())}
+            for key, page_dict in enumerate(page_dicts)
+        ]
+        query = """
+        UNWIND $rows AS row
+        MERGE (p:Page {title: row.title})
+        ON CREATE SET p.uuid = row.uuid
+        RETURN row.key AS key, p.uuid AS uuid
+        """
+        uuids = self.run_keyed_query(tx, query, page_rows, "page_uuid")
+
+        # nodes whose sections and chunks are to be written: (key, label, page or section dict)
+        parents = [(key, "Page", page_dict) for key, page_dict in enumerate(page_dicts)]
+        nodes = []
+        section_keys = {}  # key of a node -> keys of its sections, in order
+        next_key = len(page_dicts)
+        while parents:
+            nodes.extend(parents)
+            section_rows = {}  # (parent label, section type) -> rows
+            children = []
+            for parent_key, parent_label, node in parents:
+                for section in node["sections"]:
+                    section_rows.setdefault((parent_label, section["type"]), []).append(
+                        {"key": next_key, "parent_uuid": uuids[parent_key], "name": section["name"], "uuid": str(uuid.uuid4())}
+                    )
+                    children.append((next_key, "Section", section))
+                    section_keys.setdefault(parent_key, []).append(next_key)
+                    next_key += 1
+            for (parent_label, section_type), rows in section_rows.items():
+                query = f"""
+                UNWIND $rows AS row
+                MATCH (parent:{parent_label} {{uuid: row.parent_uuid}})
+                MERGE (s:Section:{section_type} {{name: row.name, parent_uuid: row.parent_uuid}})
+                ON CREATE SET s.uuid = row.uuid
+                MERGE (parent)-[:HAS_SECTION]->(s)
+                RETURN row.key AS key, s.uuid AS uuid
                 """
-                session.run(
-                    first_section_query,
-                    parent_uuid=parent_uuid,
-                    section_uuid=section_uuid,
+                uuids.update(self.run_keyed_query(tx, query, rows, "section_uuid"))
+            parents = children
+
+        chunk_rows = {}  # parent label -> rows
+        first_rows = {}  # (parent label, relationship, child label) -> rows
+        next_rows = {}  # (relationship, label) -> rows
+        for node_key, label, node in nodes:
+            node_uuid = uuids[node_key]
+            section_uuids = [uuids[section_key] for section_key in section_keys.get(node_key, [])]
+            chunk_uuids = [chunk["id"] for chunk in node["chunks"]]
+            for chunk_uuid in chunk_uuids:
+                chunk_rows.setdefault(label, []).append({"parent_uuid": node_uuid, "uuid": chunk_uuid})
+            if section_uuids:
+                first_rows.setdefault((label, "FIRST_SECTION", "Section"), []).append(
+                    {"parent_uuid": node_uuid, "uuid": section_uuids[0]}
                 )
-                first_section_created = True
-
-            self.create_sections_and_chunks(session, section_uuid, section["sections"], "Section")
-            self.create_chunks(session, section_uuid, section["chunks"], "Section")
-
-        # Create NEXT_SECTION relationships between sections once all sections are created
-        for i, section_uuid in enumerate(section_uuids):
-            if i < len(section_uuids) - 1:
-                next_section_query = """
-                MATCH (s1:Section {uuid: $uuid1})
-                OPTIONAL MATCH (s1)-[r:NEXT_SECTION]->()
-                DELETE r
-                WITH s1
-                MATCH (s2:Section {uuid: $uuid2})
-                MERGE (s1)-[:NEXT_SECTION]->(s2)
-                RETURN s1, s2
-                """
-                session.run(
-                    next_section_query,
-                    uuid1=section_uuids[i],
-                    uuid2=section_uuids[i + 1],
+            if chunk_uuids:
+                first_rows.setdefault((label, "FIRST_CHUNK", "Chunk"), []).append(
+                    {"parent_uuid": node_uuid, "uuid": chunk_uuids[0]}
+                )
+            for relationship, child_label, child_uuids in [
+                ("NEXT_SECTION", "Section", section_uuids),
+                ("NEXT_CHUNK", "Chunk", chunk_uuids),
+            ]:
+                next_rows.setdefault((relationship, child_label), []).extend(
+                    {"uuid1": uuid1, "uuid2": uuid2} for uuid1, uuid2 in zip(child_uuids, child_uuids[1:])
                 )
 
-    def create_chunks(self, session, parent_uuid, chunks, parent_type):
-        first_chunk_created = False
-
-        for i, chunk in enumerate(chunks):
-            chunk_uuid = chunk["id"]
-            chunk_query = f"""
-            MATCH (parent:{parent_type} {{uuid: $parent_uuid}})
-            MERGE (c:Chunk {{uuid: $uuid}})
+        for label, rows in chunk_rows.items():
+            query = f"""
+            UNWIND $rows AS row
+            MATCH (parent:{label} {{uuid: row.parent_uuid}})
+            MERGE (c:Chunk {{uuid: row.uuid}})
             MERGE (parent)-[:HAS_CHUNK]->(c)
-            RETURN c
             """
-            session.run(chunk_query, parent_uuid=parent_uuid, uuid=chunk_uuid)
-
-            # Create the FIRST_CHUNK relationship if first_chunk not yet created
-            if not first_chunk_created and i == 0:
-                first_chunk_query = f"""
-                MATCH (parent:{parent_type} {{uuid: $parent_uuid}})
-                OPTIONAL MATCH (parent)-[r:FIRST_CHUNK]->()
-                DELETE r
-                WITH parent
-                MATCH (c:Chunk {{uuid: $chunk_uuid}})
-                MERGE (parent)-[:FIRST_CHUNK]->(c)
-                RETURN parent, c
-                """
-                session.run(
-                    first_chunk_query,
-                    parent_uuid=parent_uuid,
-                    chunk_uuid=chunk["id"],
-                )
-                first_chunk_created = True
-
-        # Create NEXT_CHUNK relationships between chunks once all chunks are created
-        for i, chunk in enumerate(chunks):
-            if i < len(chunks) - 1:
-                next_chunk_query = """
-                MATCH (c1:Chunk {uuid: $uuid1})
-                OPTIONAL MATCH (c1)-[r:NEXT_CHUNK]->()
-                DELETE r
-                WITH c1
-                MATCH (c2:Chunk {uuid: $uuid2})
-                MERGE (c1)-[:NEXT_CHUNK]->(c2)
-                RETURN c1, c2
-                """
-                session.run(
-                    next_chunk_query,
-                    uuid1=chunk["id"],
-                    uuid2=chunks[i + 1]["id"],
-                )
+            tx.run(query, rows=rows).consume()
+        for (label, relationship, child_label), rows in first_rows.items():
+            query = f"""
+            UNWIND $rows AS row
+            MATCH (parent:{label} {{uuid: row.parent_uuid}})
+            OPTIONAL MATCH (parent)-[r:{relationship}]->()
+            DELETE r
+            WITH DISTINCT parent, row
+            MATCH (child:{child_label} {{uuid: row.uuid}})
+            MERGE (parent)-[:{relationship}]->(child)
+            """
+            tx.run(query, rows=rows).consume()
+        for (relationship, label), rows in next_rows.items():
+            if not rows:
+                continue
+            query = f"""
+            UNWIND $rows AS row
+            MATCH (n1:{label} {{uuid: row.uuid1}})
+            OPTIONAL MATCH (n1)-[r:{relationship}]->()
+            DELETE r
+            WITH DISTINCT n1, row
+            MATCH (n2:{label} {{uuid: row.uuid2}})
+            MERGE (n1)-[:{relationship}]->(n2)
+            """
+            tx.run(query, rows=rows).consume()
+
+    @staticmethod
+    def run_keyed_query(tx, query, rows, name):
+        """
+        Runs a query returning (key, uuid) for every row, and returns the uuids by key.
+        """
+        uuids = {record["key"]: record["uuid"] for record in tx.run(query, rows=rows)}
+        if len(uuids) != len({row["key"] for row in rows}):
+            raise RuntimeError(f"Failed to retrieve {name}; transaction may be closed unexpectedly.")
+        return uuids
 
+    def delete_chunks(self, chunk_uuids):
+        """
+        Deletes the given Chunk nodes and all their relationships (used to remove the chunks of a page's previous
+        revision once the page has been re-chunked).
+        """
+        query = """
+        MATCH (c:Chunk)
+        WHERE c.uuid IN $uuids
+        DETACH DELETE c
+        """
+        with self.driver.session() as session:
+            session.run(query, uuids=chunk_uuids)
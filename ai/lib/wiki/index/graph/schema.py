@@ -0,0 +1,17 @@
+def drop_property_index(session, label: str, property_name: str) -> bool:
+    """
+    Drops the plain (range) index on a single property of a label, if there is one, so that a uniqueness constraint
+    (which comes with its own index) can be created on that property.
+
+    Returns:
+        bool: False if there was no such index.
+    """
+    query = """
+    SHOW INDEXES YIELD name, type, labelsOrTypes, properties, owningConstraint
+    WHERE type = 'RANGE' AND owningConstraint IS NULL AND labelsOrTypes = [$label] AND properties = [$property_name]
+    RETURN name
+    """
+    names = [record["name"] for record in session.run(query, label=label, property_name=property_name)]
+    for name in names:
+        session.run(f"DROP INDEX `{name}` IF EXISTS")
+    return bool(names)
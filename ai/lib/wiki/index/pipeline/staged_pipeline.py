@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+
+# Marks the end of the items in a stage queue
+END = object()
+
+
+class PipelineError(Exception):
+    pass
+
+
+class StagedPipeline:
+    """
+    Runs items through a sequence of stages, each in its own thread, connected by bounded queues: while a stage works
+    on an item, the previous stage already works on the next one. A stage that is ahead blocks once the queue of the
+    next stage is full (backpressure), so the total time approaches the time of the slowest stage instead of the sum of
+    all of them.
+
+    Every stage handles its items one at a time, in the order they were put, and the outputs of the last stage are
+    returned by get_outputs in that order.
+
+    If a stage raises, the pipeline stops: the items queued in front of that stage and the stages before it are dropped
+    (the items past it still go through), and put, get_outputs and check raise a PipelineError with the exception of
+    the stage as its cause.
+
+    Args:
+        stages (List[Tuple[str, Callable]]): (name, function) of every stage; a function takes the output of the
+            previous stage (or the item put) and returns its output.
+        queue_size (int): Number of items that can wait in front of every stage.
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[Any], Any]]], queue_size: int = 2):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=max(queue_size, 1)) for _ in stages]
+        self.outputs = queue.Queue()
+        self.threads = []
+        self.error = None
+        self.cancelled = threading.Event()
+        self.stats = {
+            name: {"items": 0, "size": 0, "busy_seconds": 0.0, "idle_seconds": 0.0, "blocked_seconds": 0.0}
+            for name, _ in stages
+        }
+
+    def start(self) -> None:
+        for index, (name, function) in enumerate(self.stages):
+            thread = threading.Thread(
+                target=self.run_stage, args=(index, name, function), name=f"pipeline-{name}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def run_stage(self, index: int, name: str, function: Callable[[Any], Any]) -> None:
+        input_queue = self.queues[index]
+        output_queue = self.queues[index + 1] if index + 1 < len(self.queues) else self.outputs
+        stats = self.stats[name]
+        while True:
+            start = time.perf_counter()
+            entry = input_queue.get()
+            stats["idle_seconds"] += time.perf_counter() - start
+            if entry is END:
+                output_queue.put(END)
+                return
+            if (index == 0 and self.cancelled.is_set()) or (self.error is not None and index <= self.error[0]):
+                continue
+            item, size = entry
+            start = time.perf_counter()
+            try:
+                output = function(item)
+            except Exception as e:
+                if self.error is None or index > self.error[0]:
+                    self.error = (index, name, e)
+                continue
+            stats["busy_seconds"] += time.perf_counter() - start
+            stats["items"] += 1
+            stats["size"] += size
+
+            start = time.perf_counter()
+            output_queue.put((output, size))
+            stats["blocked_seconds"] += time.perf_counter() - start
+
+    def check(self) -> None:
+        if self.error is not None:
+            _, name, e = self.error
+            raise PipelineError(f"Stage {name} failed: {e}") from e
+
+    def put(self, item: Any, size: int = 1) -> None:
+        """
+        Puts an item into the first stage, waiting while its queue is full. size (eg. the number of pages of the item)
+        is added to the stats of every stage.
+        """
+        while True:
+            self.check()
+            try:
+                self.queues[0].put((item, size), timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get_outputs(self) -> List[Any]:
+        """
+        Returns the outputs of the last stage since the last call, without waiting.
+        """
+        # before taking any output, so that close still returns them
+        self.check()
+        outputs = []
+        while True:
+            try:
+                entry = self.outputs.get_nowait()
+            except queue.Empty:
+                break
+            if entry is END:
+                # put back for close
+                self.outputs.put(END)
+                break
+            outputs.append(entry[0])
+        return outputs
+
+    def close(self, cancel: bool = False) -> List[Any]:
+        """
+        Waits until every item put has gone through all the stages (or, with cancel, drops the items the first stage has
+        not started; the others still go through), stops the stage threads, and returns the outputs not returned yet:
+        the outputs of the items that went through all the stages, even if a stage failed since (see check).
+        """
+        if cancel:
+            self.cancelled.set()
+        if self.threads:
+            self.queues[0].put(END)
+            for thread in self.threads:
+                thread.join()
+            self.threads = []
+        outputs = []
+        while not self.outputs.empty():
+            entry = self.outputs.get_nowait()
+            if entry is not END:
+                outputs.append(entry[0])
+        return outputs
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns, for every stage, the number of items and their total size handled, the time spent handling them
+        (busy), waiting for an item (idle) and waiting for room in the queue of the next stage (blocked).
+        """
+        return {name: dict(stats) for name, stats in self.stats.items()}
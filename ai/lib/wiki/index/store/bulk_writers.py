@@ -0,0 +1,153 @@
+from typing import List
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import parallel_bulk
+from haystack import Document
+from haystack_integrations.document_stores.elasticsearch import (
+    ElasticsearchDocumentStore,
+)
+from haystack_integrations.document_stores.weaviate.document_store import (
+    WeaviateDocumentStore,
+)
+from weaviate.util import generate_uuid5
+
+
+class BulkWriteError(Exception):
+    pass
+
+
+class ElasticsearchBulkWriter:
+    """
+    Writes documents to Elasticsearch with the parallel bulk helper: batch_size documents per bulk request,
+    concurrency requests at a time, and one index refresh once all of them are acknowledged.
+
+    Documents are created, not overwritten: a document whose id is already in the index is skipped, as with
+    DuplicatePolicy.SKIP, but without checking every id first.
+
+    Args:
+        e_store (ElasticsearchDocumentStore): The document store, whose client is used.
+        index (str): Name of the index of the document store.
+        batch_size (int): Number of documents per bulk request.
+        concurrency (int): Number of bulk requests in flight.
+    """
+
+    def __init__(
+        self,
+        e_store: ElasticsearchDocumentStore,
+        index: str = "default",
+        batch_size: int = 500,
+        concurrency: int = 4,
+    ):
+        self.e_store = e_store
+        self.index = index
+        self.batch_size = batch_size
+        self.concurrency = max(concurrency, 1)
+
+    @property
+    def client(self) -> Elasticsearch:
+        return self.e_store.client
+
+    @staticmethod
+    def to_action(doc: Document) -> dict:
+        source = doc.to_dict()
+        # Elasticsearch rejects null for typed fields, a missing field is no value
+        for field in ["embedding", "sparse_embedding", "blob", "score"]:
+            if source.get(field) is None:
+                source.pop(field, None)
+        return {"_op_type": "create", "_id": doc.id, "_source": source}
+
+    def write_documents(self, documents: List[Document]) -> int:
+        """
+        Writes documents and returns once all of them are stored (or were already).
+
+        Returns:
+            int: The number of documents created.
+
+        Raises:
+            BulkWriteError: If a document could not be written.
+        """
+        if not documents:
+            return 0
+        num_created = 0
+        errors = []
+        for ok, item in parallel_bulk(
+            self.client,
+            (self.to_action(doc) for doc in documents),
+            thread_count=self.concurrency,
+            chunk_size=self.batch_size,
+            index=self.index,
+            raise_on_error=False,
+            raise_on_exception=True,
+        ):
+            if ok:
+                num_created += 1
+                continue
+            error = item["create"].get("error", {})
+            if error.get("type") != "version_conflict_engine_exception":
+                errors.append(f"'{item['create'].get('_id')}': {error}")
+        if errors:
+            raise BulkWriteError(f"Failed to write {len(errors)} documents to Elasticsearch: {'; '.join(errors[:10])}")
+        self.client.indices.refresh(index=self.index)
+        return num_created
+
+
+class WeaviateBulkWriter:
+    """
+    Writes documents to Weaviate with the batch import of the client (gRPC): batch_size objects per request,
+    concurrency requests at a time. Objects get the same uuid as with WeaviateDocumentStore (uuid5 of the document id),
+    so a document written again is overwritten, not duplicated, and no existence check is needed.
+
+    Args:
+        w_store (WeaviateDocumentStore): The document store, whose client and collection are used.
+        batch_size (int): Number of objects per batch request.
+        concurrency (int): Number of batch requests in flight.
+    """
+
+    def __init__(self, w_store: WeaviateDocumentStore, batch_size: int = 1000, concurrency: int = 2):
+        self.w_store = w_store
+        self.batch_size = batch_size
+        self.concurrency = max(concurrency, 1)
+
+    @staticmethod
+    def to_properties(doc: Document) -> dict:
+        """
+        Returns the properties of a document, as WeaviateDocumentStore stores them; the embedding is the vector of the
+        object.
+        """
+        properties = doc.to_dict()
+        properties["_original_id"] = properties.pop("id")
+        for field in ["embedding", "sparse_embedding", "blob"]:
+            properties.pop(field, None)
+        return properties
+
+    def write_documents(self, documents: List[Document]) -> int:
+        """
+        Writes documents and returns once every batch is acknowledged.
+
+        Returns:
+            int: The number of documents written.
+
+        Raises:
+            BulkWriteError: If an object could not be written.
+        """
+        if not documents:
+            return 0
+        client = self.w_store.client
+        collection_name = self.w_store.collection.name
+        with client.batch.fixed_size(batch_size=self.batch_size, concurrent_requests=self.concurrency) as batch:
+            for doc in documents:
+                batch.add_object(
+                    properties=self.to_properties(doc),
+                    collection=collection_name,
+                    uuid=generate_uuid5(doc.id),
+                    vector=doc.embedding,
+                )
+        failed_objects = client.batch.failed_objects
+        if failed_objects:
+            errors = [
+                f"'{(obj.object_.properties or {}).get('_original_id', obj.object_.uuid)}': {obj.message}"
+                for obj in failed_objects[:10]
+            ]
+            raise BulkWriteError(
+                f"Failed to write {len(failed_objects)} documents to Weaviate: {'; '.join(errors)}"
+            )
+        return len(documents)
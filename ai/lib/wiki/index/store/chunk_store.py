@@ -0,0 +1,283 @@
+import os
+import json
+import fcntl
+import sqlite3
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; chunk results are then serialized with json
+    orjson = None
+
+
+def dumps(data: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FileChunkStore:
+    """
+    Chunk results stored as one JSON file per page in the .metadata/chunk directory of its category, as written by
+    the Chunker.
+    """
+
+    @staticmethod
+    def chunk_filepath(filepath: str, page_filename: str) -> str:
+        page_filename_wo_ext = os.path.splitext(page_filename)[0]
+        return os.path.join(filepath, ".metadata/chunk", f"{page_filename_wo_ext}.json")
+
+    def write_results(self, records: List[Tuple[str, str, str, dict]]) -> None:
+        """
+        Writes chunk results ([(filepath, page title, page filename, result)]).
+        """
+        for filepath, page_title, page_filename, result in records:
+            metadata_chunk_path = os.path.join(filepath, ".metadata/chunk")
+            if not os.path.exists(metadata_chunk_path):
+                os.makedirs(metadata_chunk_path)
+            with open(self.chunk_filepath(filepath, page_filename), "wb") as file:
+                file.write(dumps(result))
+
+    def write_result(self, filepath: str, page_title: str, page_filename: str, result: dict) -> None:
+        self.write_results([(filepath, page_title, page_filename, result)])
+
+    def has_result(self, filepath: str, page_title: str, page_filename: str) -> bool:
+        return os.path.exists(self.chunk_filepath(filepath, page_filename))
+
+    def read_result(self, filepath: str, page_title: str, page_filename: str) -> dict:
+        chunk_filepath = self.chunk_filepath(filepath, page_filename)
+        if not os.path.exists(chunk_filepath):
+            raise FileNotFoundError(f"The file '{chunk_filepath}' does not exist.")
+        with open(chunk_filepath, "rb") as file:
+            return loads(file.read())
+
+    def iter_results(
+        self, filepath: str, pages: Dict[str, str], errors: Optional[Dict[str, Exception]] = None
+    ) -> Iterator[Tuple[str, str, dict]]:
+        """
+        Yields (page title, page filename, result) for the pages ({title: filename}) of the category directory. With
+        errors, a page whose result is missing or cannot be read is skipped and its error added to errors (page title ->
+        exception) instead of being raised.
+        """
+        for page_title, page_filename in pages.items():
+            try:
+                result = self.read_result(filepath, page_title, page_filename)
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors[page_title] = e
+                continue
+            yield page_title, page_filename, result
+
+    def delete_result(self, filepath: str, page_title: str, page_filename: str) -> Optional[dict]:
+        """
+        Deletes the chunk result of a page.
+
+        Returns:
+            Optional[dict]: The deleted result, None if the page had none.
+        """
+        if not self.has_result(filepath, page_title, page_filename):
+            return None
+        result = self.read_result(filepath, page_title, page_filename)
+        os.remove(self.chunk_filepath(filepath, page_filename))
+        return result
+
+    def close(self) -> None:
+        pass
+
+
+class ShardedChunkStore:
+    """
+    Chunk results of many pages stored as JSON lines in append-only shard files ('shard_<n>.jsonl'), with an SQLite
+    index keyed by page title (title -> category directory, filename, shard, offset, length). Lines are serialized
+    with orjson (json if it is not installed).
+
+    Compared to one JSON file per page this avoids a file (and its open, stat and directory entry) per page, and the
+    results of a category can be streamed in storage order with iter_results: one pass over the shards with sequential
+    reads instead of opening every chunk file.
+
+    Writes are serialized across processes with a lock file. A page whose result is written again (eg. after a
+    refresh) gets a new line; the previous one stays in its shard unreferenced.
+
+    Args:
+        store_dir (str): Directory of the shards and index.
+        max_shard_bytes (int): A new shard is started once the current one exceeds this size.
+    """
+
+    def __init__(self, store_dir: str, max_shard_bytes: int = 128 * 1024 * 1024):
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+        self.store_dir = store_dir
+        self.max_shard_bytes = max_shard_bytes
+        self.lock_filepath = os.path.join(store_dir, ".lock")
+        self.connection = sqlite3.connect(
+            os.path.join(store_dir, "index.sqlite"), timeout=60, check_same_thread=False
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                title TEXT PRIMARY KEY,
+                filepath TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS chunks_filepath ON chunks (filepath)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def normalize_filepath(filepath: str) -> str:
+        return os.path.normpath(filepath)
+
+    def shard_filepath(self, shard: int) -> str:
+        return os.path.join(self.store_dir, f"shard_{shard:05d}.jsonl")
+
+    def current_shard(self) -> int:
+        shard = 0
+        while os.path.exists(self.shard_filepath(shard + 1)):
+            shard += 1
+        return shard
+
+    def write_results(self, records: List[Tuple[str, str, str, dict]]) -> None:
+        """
+        Appends chunk results ([(filepath, page title, page filename, result)]) to the current shard and indexes them,
+        under the store's write lock.
+        """
+        if not records:
+            return
+        lines = [
+            dumps(
+                {"title": page_title, "filepath": filepath, "filename": page_filename, "result": result}
+            )
+            + b"\n"
+            for filepath, page_title, page_filename, result in records
+        ]
+        with open(self.lock_filepath, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                shard = self.current_shard()
+                if (
+                    os.path.exists(self.shard_filepath(shard))
+                    and os.path.getsize(self.shard_filepath(shard)) >= self.max_shard_bytes
+                ):
+                    shard += 1
+
+                index_rows = []
+                with open(self.shard_filepath(shard), "ab") as shard_file:
+                    offset = shard_file.seek(0, os.SEEK_END)
+                    shard_file.write(b"".join(lines))
+                    shard_file.flush()
+                    os.fsync(shard_file.fileno())
+                for (filepath, page_title, page_filename, _), line in zip(records, lines):
+                    index_rows.append(
+                        (page_title, self.normalize_filepath(filepath), page_filename, shard, offset, len(line))
+                    )
+                    offset += len(line)
+
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)", index_rows
+                )
+                self.connection.commit()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write_result(self, filepath: str, page_title: str, page_filename: str, result: dict) -> None:
+        self.write_results([(filepath, page_title, page_filename, result)])
+
+    def get_location(self, page_title: str) -> Optional[tuple]:
+        return self.connection.execute(
+            "SELECT shard, offset, length FROM chunks WHERE title = ?", (page_title,)
+        ).fetchone()
+
+    def has_result(self, filepath: str, page_title: str, page_filename: str) -> bool:
+        return self.get_location(page_title) is not None
+
+    def read_line(self, shard: int, offset: int, length: int) -> dict:
+        with open(self.shard_filepath(shard), "rb") as shard_file:
+            shard_file.seek(offset)
+            return loads(shard_file.read(length))
+
+    def read_result(self, filepath: str, page_title: str, page_filename: str) -> dict:
+        location = self.get_location(page_title)
+        if location is None:
+            raise FileNotFoundError(f"The chunks of page {page_title} are not in the chunk store {self.store_dir}.")
+        return self.read_line(*location)["result"]
+
+    def iter_results(
+        self, filepath: str, pages: Dict[str, str], errors: Optional[Dict[str, Exception]] = None
+    ) -> Iterator[Tuple[str, str, dict]]:
+        """
+        Yields (page title, page filename, result) for the pages ({title: filename}) of the category directory, in
+        storage order: every shard is opened once and read forward. Raises FileNotFoundError once the stored pages are
+        done if some of the pages have no result. With errors, a page whose result is missing or cannot be read is
+        skipped and its error added to errors (page title -> exception) instead.
+        """
+        rows = self.connection.execute(
+            "SELECT title, filename, shard, offset, length FROM chunks WHERE filepath = ? ORDER BY shard, offset",
+            (self.normalize_filepath(filepath),),
+        ).fetchall()
+        missing_titles = set(pages)
+        shard_file = None
+        current_shard = None
+        try:
+            for page_title, page_filename, shard, offset, length in rows:
+                if page_title not in missing_titles:
+                    continue
+                missing_titles.discard(page_title)
+                try:
+                    if shard != current_shard:
+                        if shard_file is not None:
+                            shard_file.close()
+                            shard_file = None
+                        shard_file = open(self.shard_filepath(shard), "rb")
+                        current_shard = shard
+                    if shard_file.tell() != offset:
+                        shard_file.seek(offset)
+                    result = loads(shard_file.read(length))["result"]
+                except Exception as e:
+                    if errors is None:
+                        raise
+                    errors[page_title] = e
+                    continue
+                yield page_title, page_filename, result
+        finally:
+            if shard_file is not None:
+                shard_file.close()
+        if missing_titles and errors is not None:
+            for page_title in missing_titles:
+                errors[page_title] = FileNotFoundError(
+                    f"The chunks of page {page_title} are not in the chunk store {self.store_dir}."
+                )
+        elif missing_titles:
+            raise FileNotFoundError(
+                f"The chunks of pages {sorted(missing_titles)} are not in the chunk store {self.store_dir}."
+            )
+
+    def delete_result(self, filepath: str, page_title: str, page_filename: str) -> Optional[dict]:
+        """
+        Removes the chunk result of a page from the index (its line stays in the shard unreferenced).
+
+        Returns:
+            Optional[dict]: The deleted result, None if the page had none.
+        """
+        location = self.get_location(page_title)
+        if location is None:
+            return None
+        result = self.read_line(*location)["result"]
+        self.connection.execute("DELETE FROM chunks WHERE title = ?", (page_title,))
+        self.connection.commit()
+        return result
+
+    def close(self) -> None:
+        self.connection.close()
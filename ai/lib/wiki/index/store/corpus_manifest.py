@@ -0,0 +1,298 @@
+import os
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import redis
+
+from lib.wiki.index.download.helpers import get_title_pathname_map
+from lib.wiki.index.store.page_store import FilePageStore, PageStore
+
+
+# Status columns of the pages and categories tables, named after the Redis sets of the stages
+STAGES = ["downloaded", "chunked", "indexed"]
+
+
+class CorpusManifest:
+    """
+    One SQLite database describing the whole downloaded corpus, so that the stages can walk the category tree without
+    opening a title_pathname.json and listing the directory of every category:
+
+    - categories: every category directory (title, filepath, parent category) and its per-stage status
+    - category_members: the pages and subcategories listed under each category (the content of its
+      title_pathname.json, after filtering)
+    - pages: where every downloaded page is stored (category directory and filename) and its per-stage status
+
+    The manifest is built by the Downloader (or DumpIngester) as categories are listed and pages downloaded. A corpus
+    downloaded before the manifest existed can be imported once with import_directory_tree and sync_status.
+
+    Args:
+        db_path (str): Path of the SQLite database file.
+    """
+
+    def __init__(self, db_path: str):
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS categories (
+                title TEXT PRIMARY KEY,
+                filepath TEXT NOT NULL,
+                parent TEXT,
+                downloaded INTEGER NOT NULL DEFAULT 0,
+                chunked INTEGER NOT NULL DEFAULT 0,
+                indexed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS categories_filepath ON categories (filepath);
+            CREATE INDEX IF NOT EXISTS categories_parent ON categories (parent);
+            CREATE TABLE IF NOT EXISTS category_members (
+                category TEXT NOT NULL,
+                type TEXT NOT NULL,
+                title TEXT NOT NULL,
+                pathname TEXT NOT NULL,
+                PRIMARY KEY (category, type, title)
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                title TEXT PRIMARY KEY,
+                filepath TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                downloaded INTEGER NOT NULL DEFAULT 0,
+                chunked INTEGER NOT NULL DEFAULT 0,
+                indexed INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS pages_filepath ON pages (filepath);
+            """
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def normalize_filepath(filepath: str) -> str:
+        return os.path.normpath(filepath)
+
+    @staticmethod
+    def check_stage(stage: str) -> None:
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage {stage}, expected one of {STAGES}.")
+
+    # ------------------------------------------
+    # Building
+    # ------------------------------------------
+
+    def record_category(self, category: str, filepath: str, title_pathname: dict) -> None:
+        """
+        Records a category directory and its members. The parent category is the one whose directory contains it.
+        """
+        filepath = self.normalize_filepath(filepath)
+        parent = self.connection.execute(
+            "SELECT title FROM categories WHERE filepath = ?", (os.path.dirname(filepath),)
+        ).fetchone()
+        self.connection.execute(
+            """
+            INSERT INTO categories (title, filepath, parent) VALUES (?, ?, ?)
+            ON CONFLICT (title) DO UPDATE SET filepath = excluded.filepath, parent = excluded.parent
+            """,
+            (category, filepath, parent[0] if parent else None),
+        )
+        self.connection.execute("DELETE FROM category_members WHERE category = ?", (category,))
+        self.connection.executemany(
+            "INSERT INTO category_members VALUES (?, ?, ?, ?)",
+            [
+                (category, "page", page_title, page_filename)
+                for page_title, page_filename in title_pathname["pages"].items()
+            ]
+            + [
+                (category, "category", subcategory_title, subcategory_path)
+                for subcategory_title, subcategory_path in title_pathname["categories"].items()
+            ],
+        )
+        self.connection.commit()
+
+    def record_pages(self, filepath: str, pages: Dict[str, str]) -> None:
+        """
+        Records where downloaded pages ({title: filename}) are stored and marks them downloaded.
+        """
+        filepath = self.normalize_filepath(filepath)
+        self.connection.executemany(
+            """
+            INSERT INTO pages (title, filepath, filename, downloaded) VALUES (?, ?, ?, 1)
+            ON CONFLICT (title) DO UPDATE SET
+                filepath = excluded.filepath, filename = excluded.filename, downloaded = 1
+            """,
+            [(page_title, filepath, page_filename) for page_title, page_filename in pages.items()],
+        )
+        self.connection.commit()
+
+    def set_page_status(self, stage: str, page_titles: Iterable[str], done: bool = True) -> None:
+        self.check_stage(stage)
+        self.connection.executemany(
+            f"UPDATE pages SET {stage} = ? WHERE title = ?",
+            [(int(done), page_title) for page_title in page_titles],
+        )
+        self.connection.commit()
+
+    def set_category_status(self, stage: str, category_titles: Iterable[str], done: bool = True) -> None:
+        self.check_stage(stage)
+        self.connection.executemany(
+            f"UPDATE categories SET {stage} = ? WHERE title = ?",
+            [(int(done), category_title) for category_title in category_titles],
+        )
+        self.connection.commit()
+
+    def import_directory_tree(
+        self, category: str, filepath: str, page_store: Optional[PageStore] = None
+    ) -> int:
+        """
+        Imports an existing category tree from its title_pathname.json files and stored pages (one directory scan per
+        category, once).
+
+        Returns:
+            int: The number of categories imported.
+        """
+        page_store = page_store or FilePageStore()
+        title_pathname = get_title_pathname_map(category, filepath, create=False)
+        self.record_category(category, filepath, title_pathname)
+        pages_filename_set = page_store.list_pages(filepath)
+        self.record_pages(
+            filepath,
+            {
+                page_title: page_filename
+                for page_title, page_filename in title_pathname["pages"].items()
+                if page_filename in pages_filename_set
+            },
+        )
+
+        num_categories = 1
+        for subcategory_title, subcategory_path in title_pathname["categories"].items():
+            subcategory_path = os.path.join(filepath, subcategory_path)
+            if not os.path.isdir(subcategory_path):
+                continue
+            # a subcategory with several parents is stored under the first one only
+            if self.get_category_filepath(subcategory_title) is not None:
+                continue
+            num_categories += self.import_directory_tree(
+                subcategory_title, subcategory_path, page_store
+            )
+        return num_categories
+
+    def sync_status(self, redis_client: redis.Redis) -> None:
+        """
+        Sets the per-stage status of pages and categories from the Redis sets of the stages ('downloaded_pages',
+        'chunked_categories', ...).
+        """
+        for stage in STAGES:
+            for table, kind in [("pages", "pages"), ("categories", "categories")]:
+                titles = [
+                    title.decode() if isinstance(title, bytes) else title
+                    for title in redis_client.smembers(f"{stage}_{kind}")
+                ]
+                self.connection.execute(f"UPDATE {table} SET {stage} = 0")
+                self.connection.executemany(
+                    f"UPDATE {table} SET {stage} = 1 WHERE title = ?",
+                    [(title,) for title in titles],
+                )
+        self.connection.commit()
+
+    # ------------------------------------------
+    # Queries
+    # ------------------------------------------
+
+    def get_category_filepath(self, category: str) -> Optional[str]:
+        row = self.connection.execute(
+            "SELECT filepath FROM categories WHERE title = ?", (category,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_title_pathname(self, category: str) -> dict:
+        """
+        Returns the members of a category in the format of title_pathname.json.
+        """
+        if self.get_category_filepath(category) is None:
+            raise KeyError(f"Category {category} is not in the corpus manifest {self.db_path}.")
+        title_pathname = {"pages": {}, "categories": {}}
+        rows = self.connection.execute(
+            "SELECT type, title, pathname FROM category_members WHERE category = ? ORDER BY rowid",
+            (category,),
+        ).fetchall()
+        for member_type, title, pathname in rows:
+            title_pathname["pages" if member_type == "page" else "categories"][title] = pathname
+        return title_pathname
+
+    def list_stored_pages(self, category: str) -> Set[str]:
+        """
+        Returns the filenames of the pages stored in the directory of the category.
+        """
+        rows = self.connection.execute(
+            """
+            SELECT p.filename FROM pages p JOIN categories c ON p.filepath = c.filepath
+            WHERE c.title = ? AND p.downloaded = 1
+            """,
+            (category,),
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def list_subcategory_dirnames(self, category: str) -> Set[str]:
+        """
+        Returns the directory names of the subcategories stored under the directory of the category.
+        """
+        rows = self.connection.execute(
+            "SELECT filepath FROM categories WHERE parent = ?", (category,)
+        ).fetchall()
+        return {os.path.basename(row[0]) for row in rows}
+
+    def get_category_layout(self, category: str) -> Tuple[dict, Set[str], Set[str]]:
+        """
+        Returns the category members (as in title_pathname.json), the filenames of the pages stored in the category
+        directory and the names of its subcategory directories.
+        """
+        return (
+            self.get_title_pathname(category),
+            self.list_stored_pages(category),
+            self.list_subcategory_dirnames(category),
+        )
+
+    def get_pages(self, stage: str, done: bool) -> List[Tuple[str, str, str]]:
+        """
+        Returns (title, filepath, filename) of the stored pages whose status for the stage is done (or not done).
+        """
+        self.check_stage(stage)
+        return self.connection.execute(
+            f"SELECT title, filepath, filename FROM pages WHERE downloaded = 1 AND {stage} = ? ORDER BY rowid",
+            (int(done),),
+        ).fetchall()
+
+    def count_pages(self) -> Dict[str, int]:
+        """
+        Returns the number of stored pages done per stage.
+        """
+        row = self.connection.execute(
+            "SELECT COUNT(*), SUM(chunked), SUM(indexed) FROM pages WHERE downloaded = 1"
+        ).fetchone()
+        return {stage: count or 0 for stage, count in zip(STAGES, row)}
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def get_category_layout(
+    category: str, filepath: str, page_store: PageStore, manifest: Optional[CorpusManifest] = None
+) -> Tuple[dict, Set[str], Set[str]]:
+    """
+    Returns the category members (as in title_pathname.json), the filenames of the pages stored in the category
+    directory and the names of its subcategory directories; from the corpus manifest if there is one, from
+    title_pathname.json, the page store and the category directory otherwise.
+    """
+    if manifest is not None:
+        return manifest.get_category_layout(category)
+
+    title_pathname = get_title_pathname_map(category, filepath, create=False)
+    pages_filename_set = page_store.list_pages(filepath)
+    categories_dirname_set = {
+        dir.name
+        for dir in Path(filepath).iterdir()
+        if dir.is_dir() and dir.name != ".metadata"
+    }
+    return title_pathname, pages_filename_set, categories_dirname_set
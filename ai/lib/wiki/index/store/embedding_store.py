@@ -0,0 +1,110 @@
+import os
+import json
+from typing import List, Optional
+import numpy as np
+from haystack import Document
+from lib.wiki.index.store.chunk_store import dumps, loads
+
+
+EMBEDDING_DTYPES = ["float32", "float16"]
+
+
+class FileEmbeddingStore:
+    """
+    Embedded documents stored per page in the .metadata/index/embeddings directory of its category:
+
+    - <page>.npy: the embeddings, a float32 (or float16) matrix with one row per document
+    - <page>.index.json: the documents without their embedding, in the order of the rows (the id index of the matrix)
+
+    The matrix is memory-mapped when read: the embedding of every read document is a read-only row of it, not a list of
+    floats parsed from JSON, and it is only converted when the document is written to a store.
+
+    Pages embedded before are stored as <page>.json (the documents with their embedding as JSON lists); they are still
+    read, and deleted with the page.
+
+    Args:
+        dtype (str): "float32" or "float16" (half the size; about 3 significant digits per component).
+    """
+
+    def __init__(self, dtype: str = "float32"):
+        if dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"Unknown embedding dtype '{dtype}', expected one of {EMBEDDING_DTYPES}.")
+        self.dtype = dtype
+
+    @staticmethod
+    def embeddings_filepath(filepath: str, page_filename: str, ext: str = ".npy") -> str:
+        page_filename_wo_ext = os.path.splitext(page_filename)[0]
+        return os.path.join(filepath, ".metadata/index/embeddings", f"{page_filename_wo_ext}{ext}")
+
+    def has_documents(self, filepath: str, page_filename: str) -> bool:
+        return os.path.exists(self.embeddings_filepath(filepath, page_filename, ".index.json")) or os.path.exists(
+            self.embeddings_filepath(filepath, page_filename, ".json")
+        )
+
+    def write_documents(self, filepath: str, page_filename: str, documents: List[Document]) -> None:
+        """
+        Writes the embedded documents of a page. The index is written last, so that a page is only read once both files
+        are complete.
+        """
+        metadata_embeddings_path = os.path.join(filepath, ".metadata/index/embeddings")
+        if not os.path.exists(metadata_embeddings_path):
+            os.makedirs(metadata_embeddings_path)
+
+        documents_data = []
+        for doc in documents:
+            data = doc.to_dict()
+            data.pop("embedding", None)
+            documents_data.append(data)
+        if documents:
+            matrix = np.asarray([doc.embedding for doc in documents], dtype=self.dtype)
+            matrix_filepath = self.embeddings_filepath(filepath, page_filename)
+            with open(f"{matrix_filepath}.tmp", "wb") as file:
+                np.save(file, matrix)
+            os.replace(f"{matrix_filepath}.tmp", matrix_filepath)
+
+        index_filepath = self.embeddings_filepath(filepath, page_filename, ".index.json")
+        with open(f"{index_filepath}.tmp", "wb") as file:
+            file.write(dumps({"dtype": self.dtype, "documents": documents_data}))
+        os.replace(f"{index_filepath}.tmp", index_filepath)
+
+    def read_documents(self, filepath: str, page_filename: str) -> Optional[List[Document]]:
+        """
+        Reads the embedded documents of a page, None if the page has not been embedded yet.
+        """
+        index_filepath = self.embeddings_filepath(filepath, page_filename, ".index.json")
+        if not os.path.exists(index_filepath):
+            legacy_filepath = self.embeddings_filepath(filepath, page_filename, ".json")
+            if not os.path.exists(legacy_filepath):
+                return None
+            with open(legacy_filepath, "r") as file:
+                return [Document.from_dict(doc) for doc in json.load(file)["documents"]]
+
+        with open(index_filepath, "rb") as file:
+            documents = [Document.from_dict(doc) for doc in loads(file.read())["documents"]]
+        if documents:
+            matrix = np.load(self.embeddings_filepath(filepath, page_filename), mmap_mode="r")
+            if len(matrix) != len(documents):
+                raise ValueError(
+                    f"The embeddings of page {page_filename} in {filepath} have {len(matrix)} rows for "
+                    f"{len(documents)} documents."
+                )
+            for doc, embedding in zip(documents, matrix):
+                # Document turns an ndarray embedding passed to it into a list (and warns when a field is set on a
+                # document that may be shared); these documents are new, so the row is set as is
+                object.__setattr__(doc, "embedding", embedding)
+        return documents
+
+    def delete_documents(self, filepath: str, page_filename: str) -> bool:
+        """
+        Deletes the embedded documents of a page.
+
+        Returns:
+            bool: False if the page had none.
+        """
+        deleted = False
+        for ext in [".index.json", ".npy", ".json"]:
+            embeddings_filepath = self.embeddings_filepath(filepath, page_filename, ext)
+            if os.path.exists(embeddings_filepath):
+                os.remove(embeddings_filepath)
+                deleted = True
+        return deleted
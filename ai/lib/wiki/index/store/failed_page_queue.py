@@ -0,0 +1,55 @@
+import json
+import time
+from typing import Dict
+import redis
+
+
+class FailedPageQueue:
+    """
+    Pages that could not be indexed, in a Redis hash (page title -> JSON): where the page is stored, the step that
+    failed, the reason and the number of attempts so far. The Indexer retries them at the start of the next runs, until
+    they are indexed (and removed) or have failed max_attempts times; they are then kept for inspection but no longer
+    retried, until removed (eg. with HDEL).
+
+    Args:
+        redis_client: Redis client.
+        name (str): Name of the Redis hash.
+        max_attempts (int): Number of attempts after which a page is no longer retried.
+    """
+
+    def __init__(self, redis_client: redis.Redis, name: str = "failed_pages", max_attempts: int = 3):
+        self.redis = redis_client
+        self.name = name
+        self.max_attempts = max(max_attempts, 1)
+
+    def add(self, page_title: str, filepath: str, page_filename: str, stage: str, reason: str) -> int:
+        """
+        Records a failed attempt to index a page.
+
+        Returns:
+            int: The number of failed attempts of the page.
+        """
+        previous = self.redis.hget(self.name, page_title)
+        attempts = (json.loads(previous)["attempts"] if previous else 0) + 1
+        entry = {
+            "filepath": filepath,
+            "filename": page_filename,
+            "stage": stage,
+            "reason": reason,
+            "attempts": attempts,
+            "failed_at": time.time(),
+        }
+        self.redis.hset(self.name, page_title, json.dumps(entry))
+        return attempts
+
+    def remove(self, page_title: str) -> None:
+        self.redis.hdel(self.name, page_title)
+
+    def get_pages(self) -> Dict[str, dict]:
+        """
+        Returns the entries of all the failed pages by title.
+        """
+        return {
+            (page_title.decode() if isinstance(page_title, bytes) else page_title): json.loads(entry)
+            for page_title, entry in self.redis.hgetall(self.name).items()
+        }
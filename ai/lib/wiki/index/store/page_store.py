@@ -0,0 +1,271 @@
+import os
+import fcntl
+import sqlite3
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, Optional, Protocol, Set
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; records are then compressed with zlib
+    zstandard = None
+
+
+CODEC_ZSTD = b"z"
+CODEC_ZLIB = b"d"
+
+# Record layout: codec (1 byte), title length (2 bytes), payload length (4 bytes), title (utf-8), compressed payload
+RECORD_HEADER = struct.Struct("<cHI")
+
+
+class PageStore(Protocol):
+    """
+    Common page reader and writer API of FilePageStore and PackedPageStore. Pages are addressed by the category
+    directory they belong to, their title and their filename (as in title_pathname.json), whatever the storage.
+    """
+
+    def list_pages(self, filepath: str) -> Set[str]:
+        """
+        Returns the filenames of the pages stored for the category directory.
+        """
+        ...
+
+    def has_page(self, filepath: str, page_title: str, page_filename: str) -> bool:
+        ...
+
+    def read_page(self, filepath: str, page_title: str, page_filename: str) -> str:
+        ...
+
+    def write_page(self, filepath: str, page_title: str, page_filename: str, page_html: str) -> None:
+        ...
+
+    def pack_files(self, filepath: str, pages: Dict[str, str]) -> int:
+        """
+        Moves downloaded page files ({title: filename}) of a category directory into the store. Returns the number of
+        pages moved.
+        """
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class FilePageStore:
+    """
+    Pages stored as one HTML file per page in the category directories, as written by the Downloader.
+    """
+
+    def list_pages(self, filepath: str) -> Set[str]:
+        """
+        Returns the filenames of the pages stored for the category directory.
+        """
+        return {file.name for file in Path(filepath).glob("*.html")}
+
+    def has_page(self, filepath: str, page_title: str, page_filename: str) -> bool:
+        return os.path.exists(os.path.join(filepath, page_filename))
+
+    def read_page(self, filepath: str, page_title: str, page_filename: str) -> str:
+        page_filepath = os.path.join(filepath, page_filename)
+        if not os.path.exists(page_filepath):
+            raise FileNotFoundError(f"File {page_filepath} does not exist.")
+        with open(page_filepath, "r") as file:
+            return file.read()
+
+    def write_page(self, filepath: str, page_title: str, page_filename: str, page_html: str) -> None:
+        with open(os.path.join(filepath, page_filename), "w") as file:
+            file.write(page_html)
+
+    def pack_files(self, filepath: str, pages: Dict[str, str]) -> int:
+        """
+        Downloaded page files are already in their final place.
+        """
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+class PackedPageStore:
+    """
+    Pages stored as compressed records in append-only segment files ('segment_<n>.pack'), with an SQLite index keyed
+    by page title (title -> category directory, filename, segment, offset, length).
+
+    Compared to one HTML file per page this cuts the disk footprint (pages are zstd compressed, or zlib compressed if
+    the zstandard package is not installed), the number of small files and the directory scans over them: listing the
+    pages of a category is one indexed query instead of a glob.
+
+    Writes are serialized across processes with a lock file, so frontier workers can share a store on a local disk. A
+    page that is written again (eg. on refresh) gets a new record; the previous one stays in its segment unreferenced.
+
+    Args:
+        store_dir (str): Directory of the segments and index.
+        max_segment_bytes (int): A new segment is started once the current one exceeds this size.
+        compression_level (int): zstd (or zlib) compression level.
+    """
+
+    def __init__(
+        self,
+        store_dir: str,
+        max_segment_bytes: int = 256 * 1024 * 1024,
+        compression_level: int = 3,
+    ):
+        if not os.path.exists(store_dir):
+            os.makedirs(store_dir)
+        self.store_dir = store_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.compression_level = compression_level
+        self.codec = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+        self.lock_filepath = os.path.join(store_dir, ".lock")
+        self.connection = sqlite3.connect(
+            os.path.join(store_dir, "index.sqlite"), timeout=60, check_same_thread=False
+        )
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                title TEXT PRIMARY KEY,
+                filepath TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                codec TEXT NOT NULL
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS pages_filepath ON pages (filepath)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def normalize_filepath(filepath: str) -> str:
+        return os.path.normpath(filepath)
+
+    def segment_filepath(self, segment: int) -> str:
+        return os.path.join(self.store_dir, f"segment_{segment:05d}.pack")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.codec == CODEC_ZSTD:
+            return zstandard.ZstdCompressor(level=self.compression_level).compress(data)
+        return zlib.compress(data, self.compression_level)
+
+    @staticmethod
+    def decompress(codec: bytes, data: bytes) -> bytes:
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("The zstandard package is required to read zstd compressed pages.")
+            return zstandard.ZstdDecompressor().decompress(data)
+        if codec == CODEC_ZLIB:
+            return zlib.decompress(data)
+        raise ValueError(f"Unknown page record codec {codec!r}.")
+
+    def current_segment(self) -> int:
+        segment = 0
+        while os.path.exists(self.segment_filepath(segment + 1)):
+            segment += 1
+        return segment
+
+    def append_records(self, records: Dict[str, tuple]) -> None:
+        """
+        Appends records ({title: (filepath, filename, page_html)}) to the current segment and indexes them, under the
+        store's write lock.
+        """
+        with open(self.lock_filepath, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                segment = self.current_segment()
+                if (
+                    os.path.exists(self.segment_filepath(segment))
+                    and os.path.getsize(self.segment_filepath(segment)) >= self.max_segment_bytes
+                ):
+                    segment += 1
+
+                index_rows = []
+                with open(self.segment_filepath(segment), "ab") as segment_file:
+                    offset = segment_file.seek(0, os.SEEK_END)
+                    for title, (filepath, filename, page_html) in records.items():
+                        title_bytes = title.encode("utf-8")
+                        payload = self.compress(page_html.encode("utf-8"))
+                        segment_file.write(RECORD_HEADER.pack(self.codec, len(title_bytes), len(payload)))
+                        segment_file.write(title_bytes)
+                        payload_offset = offset + RECORD_HEADER.size + len(title_bytes)
+                        segment_file.write(payload)
+                        index_rows.append(
+                            (
+                                title,
+                                self.normalize_filepath(filepath),
+                                filename,
+                                segment,
+                                payload_offset,
+                                len(payload),
+                                self.codec.decode(),
+                            )
+                        )
+                        offset = payload_offset + len(payload)
+                    segment_file.flush()
+                    os.fsync(segment_file.fileno())
+
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)", index_rows
+                )
+                self.connection.commit()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def write_page(self, filepath: str, page_title: str, page_filename: str, page_html: str) -> None:
+        self.append_records({page_title: (filepath, page_filename, page_html)})
+
+    def pack_files(self, filepath: str, pages: Dict[str, str]) -> int:
+        """
+        Moves downloaded page files ({title: filename}) of a category directory into the store, in one append.
+
+        Returns:
+            int: The number of pages packed.
+        """
+        records = {}
+        for page_title, page_filename in pages.items():
+            page_filepath = os.path.join(filepath, page_filename)
+            if not os.path.exists(page_filepath):
+                continue
+            with open(page_filepath, "r") as file:
+                records[page_title] = (filepath, page_filename, file.read())
+        if not records:
+            return 0
+
+        self.append_records(records)
+        for _, page_filename, _ in records.values():
+            os.remove(os.path.join(filepath, page_filename))
+        return len(records)
+
+    def get_location(self, page_title: str) -> Optional[tuple]:
+        return self.connection.execute(
+            "SELECT filepath, filename, segment, offset, length, codec FROM pages WHERE title = ?",
+            (page_title,),
+        ).fetchone()
+
+    def list_pages(self, filepath: str) -> Set[str]:
+        """
+        Returns the filenames of the pages stored for the category directory.
+        """
+        rows = self.connection.execute(
+            "SELECT filename FROM pages WHERE filepath = ?",
+            (self.normalize_filepath(filepath),),
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def has_page(self, filepath: str, page_title: str, page_filename: str) -> bool:
+        return self.get_location(page_title) is not None
+
+    def read_page(self, filepath: str, page_title: str, page_filename: str) -> str:
+        location = self.get_location(page_title)
+        if location is None:
+            raise FileNotFoundError(f"Page {page_title} is not in the page store {self.store_dir}.")
+        _, _, segment, offset, length, codec = location
+        with open(self.segment_filepath(segment), "rb") as segment_file:
+            segment_file.seek(offset)
+            payload = segment_file.read(length)
+        return self.decompress(codec.encode(), payload).decode("utf-8")
+
+    def close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,150 @@
+from typing import Dict, Iterable, List, Set
+import redis
+
+
+DURABILITY_MODES = ["immediate", "batched", "deferred"]
+
+# Sets of the pages written to each store by the Indexer, recorded as every store is written and cleared once the page
+# is in 'indexed_pages', so that a page that failed (or whose run was stopped) is not written to them again
+STORE_CHECKPOINT_SETS = {
+    "elasticsearch": "elasticsearch_pages",
+    "weaviate": "weaviate_pages",
+    "neo4j": "neo4j_pages",
+}
+
+
+class RedisSetLedger:
+    """
+    Progress ledger without a local view: every check is an SISMEMBER and every completion an SADD round trip to the
+    Redis set of the stage (eg. 'chunked_pages').
+    """
+
+    def __init__(self, redis_client: redis.Redis):
+        self.redis = redis_client
+
+    def contains(self, name: str, member: str) -> bool:
+        return bool(self.redis.sismember(name, member))
+
+    def contains_many(self, name: str, members: Iterable[str]) -> List[bool]:
+        members = list(members)
+        if not members:
+            return []
+        return [bool(contained) for contained in self.redis.smismember(name, members)]
+
+    def add(self, name: str, member: str) -> None:
+        self.redis.sadd(name, member)
+
+    def add_many(self, name: str, members: Iterable[str]) -> None:
+        members = list(members)
+        if members:
+            self.redis.sadd(name, *members)
+
+    def remove(self, name: str, member: str) -> None:
+        self.redis.srem(name, member)
+
+    def remove_many(self, name: str, members: Iterable[str]) -> None:
+        members = list(members)
+        if members:
+            self.redis.srem(name, *members)
+
+    def flush(self) -> None:
+        pass
+
+
+class ProgressLedger:
+    """
+    Progress ledger over the Redis sets of the stages ('downloaded_pages', 'chunked_categories', ...) that keeps a
+    local view of them, so that checking whether an item is done costs no round trip.
+
+    A set is bulk loaded with one SMEMBERS the first time it is checked. Completions update the local view at once and
+    are written to Redis according to durability:
+    - "immediate": one SADD per completion (only the checks are saved)
+    - "batched": buffered and written in pipelined batches of batch_size; at most batch_size completions are lost if
+      the process dies, and those items are simply redone by the next run
+    - "deferred": buffered until flush() is called (eg. at the end of a stage)
+
+    Removals (pages flagged for reprocessing) are always written through. The local view is not refreshed from Redis,
+    so a ledger should not be shared by processes working on the same sets concurrently (frontier workers use the
+    sets directly).
+
+    Args:
+        redis_client: Redis client.
+        durability (str): "immediate", "batched" or "deferred".
+        batch_size (int): Number of buffered completions written per pipeline.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        durability: str = "batched",
+        batch_size: int = 500,
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(
+                f"Unknown durability {durability}, expected one of {DURABILITY_MODES}."
+            )
+        self.redis = redis_client
+        self.durability = durability
+        self.batch_size = batch_size
+        self.members: Dict[str, Set[str]] = {}
+        self.pending: Dict[str, List[str]] = {}
+        self.num_pending = 0
+
+    def load(self, name: str) -> Set[str]:
+        if name not in self.members:
+            self.members[name] = {
+                member.decode() if isinstance(member, bytes) else member
+                for member in self.redis.smembers(name)
+            }
+        return self.members[name]
+
+    def contains(self, name: str, member: str) -> bool:
+        return member in self.load(name)
+
+    def contains_many(self, name: str, members: Iterable[str]) -> List[bool]:
+        loaded_members = self.load(name)
+        return [member in loaded_members for member in members]
+
+    def add(self, name: str, member: str) -> None:
+        self.load(name).add(member)
+        if self.durability == "immediate":
+            self.redis.sadd(name, member)
+            return
+        self.pending.setdefault(name, []).append(member)
+        self.num_pending += 1
+        if self.durability == "batched" and self.num_pending >= self.batch_size:
+            self.flush()
+
+    def add_many(self, name: str, members: Iterable[str]) -> None:
+        for member in members:
+            self.add(name, member)
+
+    def remove(self, name: str, member: str) -> None:
+        self.remove_many(name, [member])
+
+    def remove_many(self, name: str, members: Iterable[str]) -> None:
+        """
+        Removes members from a set, with one SREM; their buffered completions are dropped.
+        """
+        members = set(members)
+        if not members:
+            return
+        self.load(name).difference_update(members)
+        if members.intersection(self.pending.get(name, [])):
+            self.pending[name] = [m for m in self.pending[name] if m not in members]
+            self.num_pending = sum(len(pending_members) for pending_members in self.pending.values())
+        self.redis.srem(name, *members)
+
+    def flush(self) -> None:
+        """
+        Writes the buffered completions to Redis with pipelined SADDs.
+        """
+        if self.num_pending == 0:
+            return
+        pipeline = self.redis.pipeline(transaction=False)
+        for name, members in self.pending.items():
+            for start in range(0, len(members), self.batch_size):
+                pipeline.sadd(name, *members[start : start + self.batch_size])
+        pipeline.execute()
+        self.pending.clear()
+        self.num_pending = 0
@@ -1,5 +1,69 @@
 import unittest
-from lib.wiki.index.chunk.helpers import html_to_text_chunks
+from lib.wiki.index.chunk.helpers import html_to_text_chunks, fast_html_to_text_chunks
+
+
+# Pages in the format saved by the Downloader, and markup edge cases, that the fast backend extracts on its own
+EQUIVALENCE_CORPUS = {
+    "extract": """<p class="mw-empty-elt">
+</p>
+<p><b>Stegosaurus</b> (<span><span>/ˌstɛɡəˈsɔːrəs/</span></span>; lit. '<i>roof-lizard</i>') is a genus of herbivorous, four-legged, armored dinosaur from the Late Jurassic, characterized by the distinctive kite-shaped upright plates along its back and spikes on its tail. Fossils of the genus have been found in the western United States and in Portugal, where they are found in Kimmeridgian- to Tithonian-aged strata, dating to between 155 and 145 million years ago.</p>
+<p>It weighed up to 5&#160;000 kg &amp; measured 6.5&nbsp;m (21&#xa0;ft).</p>
+
+<h2>History of discovery</h2>
+<link rel="mw-deduplicated-inline-style" href="mw-data:TemplateStyles:r1033289096">
+<p>The first known <i>Stegosaurus</i> remains were collected by Arthur Lakes &amp; described by Othniel Charles Marsh in 1877.</p>
+<ul><li><i>S. stenops</i>
+<ul><li>Holotype USNM 4934</li>
+<li>Referred specimens</li></ul></li>
+<li><i>S. ungulatus</i></li>
+<li><span class="mwe-math-element"><img src="x.svg" alt="x"></span></li>
+</ul>
+<dl><dt>Note</dt><dd>Species names are disputed.</dd></dl>
+
+<h3>Species</h3>
+<p>See <span class="mwe-math-element"><math xmlns="http://www.w3.org/1998/Math/MathML" alttext="{\\displaystyle x^{2}}"><semantics><mrow class="MJX-TeXAtom-ORD"><msup><mi>x</mi><mn>2</mn></msup></mrow><annotation encoding="application/x-tex">{\\displaystyle x^{2}}</annotation></semantics></math></span> below.</p>
+
+<h2>Description</h2>
+<table class="wikitable"><tr><th>Length</th><td>9 m</td></tr>
+<tr><th  headers=" a  b ">Mass</th><td>5 t</td></tr></table>
+<pre>  plates
+    and   spikes  </pre>
+<h4 id="Tail" data-x>Tail &amp; &lt;thagomizer&gt;</h4>""",
+    "full document": """<!-- saved page -->
+<html lang="en"><head><meta charset="utf-8"></head>
+<body class=" mw-body ">
+    <p>In the body.</p>
+    <ol><li>One</li><li></li><li>Two</li></ol>
+</body></html>
+<p>After the body.</p>""",
+    "comments": "<p>a<!-- note -->b</p><div>c <!--x-y--> d</div><ul><li>e<!-- f --></li></ul>",
+    "whitespace": "<p> \n </p><div> <span>\n\t</span> <b> </b>\n</div><pre> <b> </b>\n</pre><p>1 <i>2</i>\n3</p>",
+    "attributes": """<div id=x CLASS="a\tb  c" title='say "hi"' data-q="it's &quot;so&quot;" data-e="" data-b data-x="1" data-x="2"><P>Upper</P><IMG SRC="a.png"/><br /></div>""",
+    "void and self-closing tags": "<br><hr/><p/><link rel=x><img src=a.png><span/><p>x<br>y</p>",
+    "character references": "<p>&copy; &#169; &#xA9; &amp;amp; &lt;p&gt; &#65;&#x42; &hellip; &#x1F600;</p><h2>A &amp; B &gt; C</h2>",
+    "top-level text": "Text before <p>para</p> text between <h2>H</h2> text after",
+    "top-level list items": "<li>alone</li><li><ul><li>nested</li></ul></li><dd><li>in dd</li></dd>",
+}
+
+# Markup the fast backend leaves to the bs4 backend
+FALLBACK_CORPUS = {
+    "unclosed tag": "<p>a<p>b",
+    "misnested tags": "<p><b>a<i>b</b>c</i></p>",
+    "stray end tag": "<p>a</span></p>",
+    "end tag of a void element": "<p>a<br></br>b</p>",
+    "script": "<p>a</p><script>var x = '<p>';</script>",
+    "style": "<style>p { color: red; }</style><p>a</p>",
+    "doctype": "<!DOCTYPE html><p>a</p>",
+    "bare ampersand": "<p>AT&T</p>",
+    "unknown entity": "<p>&notanentity;</p>",
+    "C1 character reference": "<p>&#150;</p>",
+    "less-than sign in text": "<p>1 < 2</p>",
+    "carriage return": "<p>a\r\nb</p>",
+    "empty comment": "<p>a<!---->b</p>",
+    "unquoted value before slash": "<div><img src=a.png/></div>",
+    "self-closing body": '<body data-x/><b><b title="a>b"/>x</b>',
+}
+
 
 class TestHtmlToTextChunks(unittest.TestCase):
     def test_generic(self):
@@ -71,5 +135,29 @@ class TestHtmlToTextChunks(unittest.TestCase):
         ]
         self.assertEqual(html_to_text_chunks(html_str), expected_output)
 
+
+class TestHtmlToTextChunksFastBackend(unittest.TestCase):
+    def test_equivalence_corpus(self):
+        for name, html_str in EQUIVALENCE_CORPUS.items():
+            with self.subTest(name):
+                chunks = fast_html_to_text_chunks(html_str)
+                self.assertIsNotNone(chunks)
+                self.assertEqual(chunks, html_to_text_chunks(html_str, "bs4"))
+                self.assertEqual(html_to_text_chunks(html_str, "fast"), chunks)
+
+    def test_fallback_corpus(self):
+        for name, html_str in FALLBACK_CORPUS.items():
+            with self.subTest(name):
+                self.assertIsNone(fast_html_to_text_chunks(html_str))
+                self.assertEqual(
+                    html_to_text_chunks(html_str, "fast"),
+                    html_to_text_chunks(html_str, "bs4"),
+                )
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            html_to_text_chunks("<p>a</p>", "lxml")
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+from lib.wiki.index.chunk.near_duplicates import NearDuplicateDetector
+
+
+TEXT = (
+    "Stegosaurus is a genus of herbivorous four-legged armored dinosaur from the Late Jurassic, characterized by the "
+    "distinctive kite-shaped upright plates along its back and spikes on its tail. Fossils of the genus have been "
+    "found in the western United States and in Portugal."
+)
+
+
+class TestNearDuplicateDetector(unittest.TestCase):
+    def test_exact_and_near_duplicates(self):
+        detector = NearDuplicateDetector()
+
+        self.assertEqual(detector.add("a", TEXT), "a")
+        # same words, different case, spacing and punctuation
+        self.assertEqual(detector.add("b", "  " + TEXT.upper().replace(",", "") + "\n"), "a")
+        # one word changed at the end
+        self.assertEqual(detector.add("c", TEXT.replace("Portugal", "Spain")), "a")
+        # a different part of the text
+        self.assertEqual(detector.add("d", TEXT[60:]), "d")
+        self.assertEqual(detector.add("e", "Late Jurassic"), "e")
+        self.assertEqual(detector.add("f", "Early Jurassic"), "f")
+        # canonical chunks added again are their own canonical chunk
+        self.assertEqual(detector.add("a", TEXT), "a")
+
+        savings = detector.get_savings()
+        self.assertEqual(savings["chunks"], 7)
+        self.assertEqual(savings["duplicate_chunks"], 2)
+        self.assertGreater(savings["duplicate_tokens"], 0)
+        detector.close()
+
+    def test_persistence_and_remove(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            db_path = os.path.join(tmpdir, "near_duplicates", "near_duplicates.sqlite")
+            detector = NearDuplicateDetector(db_path, embedding_price_per_million_tokens=0.02)
+            detector.add("a", TEXT)
+            detector.close()
+
+            detector = NearDuplicateDetector(db_path, embedding_price_per_million_tokens=0.02)
+            self.assertEqual(detector.add("b", TEXT), "a")
+            savings = detector.get_savings()
+            self.assertAlmostEqual(savings["saved_cost"], savings["duplicate_tokens"] / 1_000_000 * 0.02)
+
+            # the duplicate recorded in the previous run takes the place of the removed chunk
+            self.assertEqual(detector.remove(["a"]), {"b": None})
+            self.assertEqual(detector.add("c", TEXT), "b")
+            self.assertEqual(detector.remove(["b", "c"]), {})
+            self.assertEqual(detector.add("d", TEXT), "d")
+            detector.close()
+
+            with self.assertRaises(ValueError):
+                NearDuplicateDetector(db_path, num_perm=64)
+
+    def test_remove_promotes_duplicate(self):
+        detector = NearDuplicateDetector()
+        detector.add("a", TEXT)
+        detector.add("b", TEXT.upper())
+        detector.add("c", TEXT.replace("Portugal", "Spain"))
+        detector.add("d", "Late Jurassic")
+        detector.add("e", "late jurassic")
+
+        # d is removed with its duplicate e, so nothing is promoted in its place
+        self.assertEqual(detector.get_promotions(["a", "d", "e"]), {"b": None, "c": "b"})
+        self.assertEqual(detector.remove(["a", "d", "e"]), {"b": None, "c": "b"})
+
+        self.assertEqual(detector.add("b", TEXT.upper()), "b")
+        self.assertEqual(detector.add("c", TEXT.replace("Portugal", "Spain")), "b")
+        self.assertEqual(detector.add("f", TEXT), "b")
+        self.assertEqual(detector.add("g", "Late Jurassic"), "g")
+        self.assertEqual(detector.remove(["x"]), {})
+        detector.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
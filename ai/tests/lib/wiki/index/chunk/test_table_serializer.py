@@ -0,0 +1,99 @@
+import unittest
+from lib.wiki.index.chunk.table_serializer import count_tokens, serialize_table_chunks
+
+
+INFOBOX = """<table class="infobox biota"><tbody>
+<tr><th colspan="2">Stegosaurus<br/><small>Temporal range: Late Jurassic</small></th></tr>
+<tr><td colspan="2"><img src="Stegosaurus.jpg"/></td></tr>
+<tr><th colspan="2">Scientific classification</th></tr>
+<tr><td>Kingdom:</td><td><a href="/wiki/Animal">Animalia</a></td></tr>
+<tr><th>Clade:</th><td>Dinosauria<sup class="reference"><a href="#cite">[1]</a></sup></td></tr>
+<tr><th>Order:</th><td>Ornithischia</td></tr>
+</tbody></table>"""
+
+SPECIES_TABLE = """<table class="wikitable"><caption>Species</caption>
+<tr><th rowspan="2">Name</th><th colspan="2">Size</th></tr>
+<tr><th>Length</th><th>Mass</th></tr>
+<tr><td>S. stenops</td><td>6.5 m</td><td rowspan="2">3.5 t</td></tr>
+<tr><td>S. ungulatus</td><td>7 m</td></tr>
+</table>"""
+
+
+class TestSerializeTableChunks(unittest.TestCase):
+    def test_rows(self):
+        chunks = serialize_table_chunks(["<h2>Description</h2>", "A paragraph.", INFOBOX, SPECIES_TABLE], "rows", 0)
+        self.assertEqual(
+            chunks,
+            [
+                "<h2>Description</h2>",
+                "A paragraph.",
+                "Stegosaurus Temporal range: Late Jurassic\n"
+                "Scientific classification\n"
+                "Kingdom: Animalia\n"
+                "Clade: Dinosauria\n"
+                "Order: Ornithischia",
+                "Species\n"
+                "Name: S. stenops; Size Length: 6.5 m; Size Mass: 3.5 t\n"
+                "Name: S. ungulatus; Size Length: 7 m; Size Mass: 3.5 t",
+            ],
+        )
+
+    def test_markdown(self):
+        self.assertEqual(
+            serialize_table_chunks([SPECIES_TABLE], "markdown", 0),
+            [
+                "Species\n"
+                "| Name | Size Length | Size Mass |\n"
+                "| --- | --- | --- |\n"
+                "| S. stenops | 6.5 m | 3.5 t |\n"
+                "| S. ungulatus | 7 m | 3.5 t |"
+            ],
+        )
+
+    def test_html_and_wrapped_tables(self):
+        chunks = ["A paragraph.", SPECIES_TABLE, '<div class="figure">Figure</div>']
+        self.assertIs(serialize_table_chunks(chunks, "html"), chunks)
+        self.assertEqual(
+            serialize_table_chunks(
+                ['<div class="note">Note <table><tr><td>a</td><td>b|c</td></tr></table></div>', "<table></table>"],
+                "markdown",
+                0,
+            ),
+            ["Note", "| a | b\\|c |\n| --- | --- |"],
+        )
+        with self.assertRaises(ValueError):
+            serialize_table_chunks(chunks, "csv")
+
+    def test_split_oversized_table(self):
+        rows = "".join(
+            f"<tr><td>Specimen {i}</td><td>{i * 10} cm</td><td>Found in the Morrison Formation</td></tr>"
+            for i in range(40)
+        )
+        table = f"<table><caption>Specimens</caption><tr><th>Name</th><th>Length</th><th>Site</th></tr>{rows}</table>"
+        max_tokens = 64
+
+        chunks = serialize_table_chunks([table], "rows", max_tokens)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk), max_tokens)
+            self.assertTrue(chunk.startswith("Specimens\n"))
+        lines = [line for chunk in chunks for line in chunk.split("\n")[1:]]
+        self.assertEqual(
+            lines,
+            [f"Name: Specimen {i}; Length: {i * 10} cm; Site: Found in the Morrison Formation" for i in range(40)],
+        )
+
+    def test_split_oversized_row(self):
+        table = f"<table><tr><th>Notes</th><td>{' '.join(['word'] * 200)}</td></tr></table>"
+
+        chunks = serialize_table_chunks([table], "rows", 32)
+
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk), 32)
+        self.assertEqual(" ".join(chunks), "Notes: " + " ".join(["word"] * 200))
+
+
+if __name__ == "__main__":
+    unittest.main()
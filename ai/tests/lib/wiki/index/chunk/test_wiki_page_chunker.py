@@ -60,6 +60,54 @@ class TestWikiPageChunker(unittest.TestCase):
         self.assertEqual(section_2["type"], "h2")
         self.assertEqual(len(section_2["chunks"]), 1)
 
+    def test_split_by_page(self):
+        docs = [
+            Document(
+                id=str(i),
+                content=f"<h2>Section</h2>\n<p>Paragraph of page {i}.</p>",
+                meta={"page_title": f"Page {i}", "file_path": f"/path/to/page{i}"},
+            )
+            for i in range(3)
+        ] + [Document(id="3", content="<h2>Empty</h2>", meta={"page_title": "Page 3", "file_path": "/path/to/page3"})]
+        chunker = WikiPageChunker()
+
+        result = chunker.run(docs)
+        page_outputs = WikiPageChunker.split_by_page(result["documents"], result["hierarchy"])
+
+        self.assertEqual(list(page_outputs), ["Page 0", "Page 1", "Page 2", "Page 3"])
+        self.assertEqual(page_outputs["Page 3"]["documents"], [])
+        for i in range(3):
+            page_result = chunker.run([docs[i]])
+            page_output = page_outputs[f"Page {i}"]
+            self.assertEqual(
+                [doc.content for doc in page_output["documents"]],
+                [doc.content for doc in page_result["documents"]],
+            )
+            self.assertEqual(page_output["documents"][0].meta["split_id"], 0)
+            self.assertEqual(
+                page_output["hierarchy"][f"Page {i}"]["sections"][0]["chunks"],
+                [{"id": doc.id} for doc in page_output["documents"]],
+            )
+
+    def test_table_format(self):
+        html_content = (
+            "<h2>Species</h2>\n<p>Two species are known.</p>\n"
+            '<table class="wikitable"><tr><th>Name</th><th>Length</th></tr>'
+            "<tr><td>S. stenops</td><td>6.5 m</td></tr></table>"
+        )
+        doc = Document(id="1", content=html_content, meta={"page_title": "Stegosaurus", "file_path": "/path/to/file"})
+
+        html_result = WikiPageChunker().run([doc])
+        rows_result = WikiPageChunker(table_format="rows").run([doc])
+
+        self.assertTrue(html_result["documents"][1].content.startswith("<table"))
+        self.assertEqual(
+            [doc.content for doc in rows_result["documents"]],
+            ["Two species are known.", "Name: S. stenops; Length: 6.5 m"],
+        )
+        self.assertEqual(rows_result["documents"][1].meta["h2"], "Species")
+        self.assertEqual(len(rows_result["hierarchy"]["Stegosaurus"]["sections"][0]["chunks"]), 2)
+
 
 if __name__ == "__main__":
     unittest.main()
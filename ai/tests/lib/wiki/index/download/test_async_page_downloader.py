@@ -0,0 +1,130 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from lib.wiki.index.download.async_page_downloader import AsyncPageDownloader
+
+
+class StubWikiHandler(BaseHTTPRequestHandler):
+    """
+    Minimal stand-in for the MediaWiki 'extracts' query. A query for 'Flaky' fails once with 503 before succeeding
+    and 'Missing' is reported as a missing page. Request counts are kept per 'titles' parameter.
+    """
+
+    extracts = {
+        "Stegosaurus": "<p>Stegosaurus is a genus.</p>\n<h2><span>Description</span></h2>\n<p>Large.</p>",
+        "Flaky": "<p>Flaky page.</p>",
+    }
+    request_counts = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        titles = params["titles"][0]
+        with self.lock:
+            count = self.request_counts.get(titles, 0) + 1
+            self.request_counts[titles] = count
+
+        if "Flaky" in titles.split("|") and count == 1:
+            self.send_response(503)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+
+        pages = {}
+        for i, title in enumerate(titles.split("|")):
+            if title in self.extracts:
+                pages[str(i + 1)] = {"pageid": i + 1, "ns": 0, "title": title, "extract": self.extracts[title]}
+            else:
+                pages[str(-i - 1)] = {"ns": 0, "title": title, "missing": ""}
+        body = json.dumps({"query": {"pages": pages}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestAsyncPageDownloader(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubWikiHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.api_url = f"http://127.0.0.1:{cls.server.server_address[1]}/w/api.php"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubWikiHandler.request_counts.clear()
+        self.page_downloader = AsyncPageDownloader(
+            self.api_url,
+            {"User-Agent": "test-agent"},
+            concurrency=2,
+            requests_per_second=0,
+            max_retries=2,
+            backoff_base=0,
+        )
+
+    def tearDown(self):
+        self.page_downloader.close()
+
+    def test_download_pages(self):
+        with tempfile.TemporaryDirectory() as filepath:
+            results = self.page_downloader.download_pages(
+                {"Stegosaurus": "Stegosaurus.html", "Flaky": "Flaky.html"}, filepath
+            )
+
+            self.assertEqual(results, {"Stegosaurus": None, "Flaky": None})
+            with open(os.path.join(filepath, "Stegosaurus.html")) as file:
+                self.assertEqual(
+                    file.read(),
+                    "<p>Stegosaurus is a genus.</p>\n\n<h2>Description</h2>\n<p>Large.</p>",
+                )
+            with open(os.path.join(filepath, "Flaky.html")) as file:
+                self.assertEqual(file.read(), "<p>Flaky page.</p>")
+            self.assertEqual(StubWikiHandler.request_counts["Flaky"], 2)
+
+    def test_failed_page_is_isolated(self):
+        with tempfile.TemporaryDirectory() as filepath:
+            results = self.page_downloader.download_pages(
+                {"Stegosaurus": "Stegosaurus.html", "Missing": "Missing.html"}, filepath
+            )
+
+            self.assertIsNone(results["Stegosaurus"])
+            self.assertIsInstance(results["Missing"], Exception)
+            self.assertTrue(os.path.exists(os.path.join(filepath, "Stegosaurus.html")))
+            self.assertFalse(os.path.exists(os.path.join(filepath, "Missing.html")))
+
+    def test_download_pages_batch(self):
+        pages = {
+            "Stegosaurus": "Stegosaurus.html",
+            "Flaky": "Flaky.html",
+            "Missing": "Missing.html",
+        }
+        with tempfile.TemporaryDirectory() as filepath:
+            results = self.page_downloader.download_pages_batch(pages, filepath, batch_size=2)
+
+            self.assertIsNone(results["Stegosaurus"])
+            self.assertIsNone(results["Flaky"])
+            self.assertIsInstance(results["Missing"], KeyError)
+            with open(os.path.join(filepath, "Flaky.html")) as file:
+                self.assertEqual(file.read(), "<p>Flaky page.</p>")
+            self.assertFalse(os.path.exists(os.path.join(filepath, "Missing.html")))
+
+        # The batch containing 'Flaky' was retried after the 503, the other batch was sent once
+        self.assertEqual(StubWikiHandler.request_counts["Stegosaurus|Flaky"], 2)
+        self.assertEqual(StubWikiHandler.request_counts["Missing"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
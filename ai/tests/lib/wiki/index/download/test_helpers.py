@@ -1,7 +1,15 @@
 import unittest
-from unittest.mock import patch, mock_open
+from unittest.mock import patch, mock_open, MagicMock
+import json
 import os
-from lib.wiki.index.download.helpers import get_wiki_category_members, get_title_pathname_map
+import tempfile
+from lib.wiki.index.download.helpers import (
+    get_wiki_category_members,
+    get_title_pathname_map,
+    render_extract_html,
+    query_pages,
+    save_batch_pages,
+)
 
 
 class TestHelpers(unittest.TestCase):
@@ -70,6 +78,54 @@ class TestHelpers(unittest.TestCase):
 
         with self.assertRaises(KeyError):
             get_wiki_category_members(category, filepath)
+
+    @patch("lib.wiki.index.download.helpers.requests.get")
+    def test_get_wiki_category_members_follows_cmcontinue_and_resumes(self, mock_requests_get):
+        responses = [
+            {
+                "continue": {"cmcontinue": "page|B|2", "continue": "-||"},
+                "query": {"categorymembers": [{"title": "Page1", "ns": 0}]},
+            },
+            {
+                "continue": {"cmcontinue": "page|C|3", "continue": "-||"},
+                "query": {"categorymembers": [{"title": "Page2", "ns": 0}]},
+            },
+            {
+                "batchcomplete": "",
+                "query": {"categorymembers": [{"title": "Category:Sub", "ns": 14}]},
+            },
+        ]
+
+        with tempfile.TemporaryDirectory() as filepath:
+            # Interrupted enumeration: the first page is already cached, the second request fails
+            mock_requests_get.return_value.json.side_effect = [responses[1], RuntimeError("interrupted")]
+            os.makedirs(os.path.join(filepath, ".metadata/download"))
+            with open(os.path.join(filepath, ".metadata/download/response.json"), "w") as file:
+                json.dump(responses[0], file)
+            with self.assertRaises(RuntimeError):
+                get_wiki_category_members("TestCategory", filepath)
+
+            # Resumed enumeration only requests the page that was not cached yet
+            mock_requests_get.reset_mock()
+            mock_requests_get.return_value.json.side_effect = [responses[2]]
+            result = get_wiki_category_members("TestCategory", filepath)
+
+            self.assertEqual(
+                result,
+                [
+                    {"title": "Page1", "ns": 0},
+                    {"title": "Page2", "ns": 0},
+                    {"title": "Category:Sub", "ns": 14},
+                ],
+            )
+            mock_requests_get.assert_called_once()
+            self.assertEqual(
+                mock_requests_get.call_args.kwargs["params"],
+                {"cmcontinue": "page|C|3", "continue": "-||"},
+            )
+            self.assertTrue(
+                os.path.exists(os.path.join(filepath, ".metadata/download/response_2.json"))
+            )
             
     
     
@@ -117,11 +173,12 @@ class TestHelpers(unittest.TestCase):
         with self.assertRaises(FileNotFoundError):
             get_title_pathname_map(category, filepath, inverse_filter, create=False)
 
+    @patch("lib.wiki.index.download.helpers.os.replace")
     @patch("lib.wiki.index.download.helpers.os.path.exists")
     @patch("lib.wiki.index.download.helpers.os.makedirs")
     @patch("lib.wiki.index.download.helpers.open", new_callable=mock_open)
-    @patch("lib.wiki.index.download.helpers.get_wiki_category_members")
-    def test_get_title_pathname_map_file_not_exists_create_true(self, mock_get_wiki_category_members, mock_open, mock_makedirs, mock_path_exists):
+    @patch("lib.wiki.index.download.helpers.iter_wiki_category_members")
+    def test_get_title_pathname_map_file_not_exists_create_true(self, mock_get_wiki_category_members, mock_open, mock_makedirs, mock_path_exists, mock_replace):
         # Mock the os.path.exists method
         def path_exists_side_effect(path):
             if path.endswith("title_pathname.json"):
@@ -147,14 +204,21 @@ class TestHelpers(unittest.TestCase):
         }
 
         self.assertEqual(result, expected_result)
-        mock_get_wiki_category_members.assert_called_once_with(category, filepath)
-        mock_open.assert_called_once_with(os.path.join(filepath, ".metadata/download", "title_pathname.json"), "w")
-
+        # One pass over the listing for the pages and one for the categories
+        self.assertEqual(mock_get_wiki_category_members.call_count, 2)
+        mock_get_wiki_category_members.assert_called_with(category, filepath)
+        title_pathname_filepath = os.path.join(filepath, ".metadata/download", "title_pathname.json")
+        mock_open.assert_called_once_with(f"{title_pathname_filepath}.tmp", "w")
+        mock_replace.assert_called_once_with(f"{title_pathname_filepath}.tmp", title_pathname_filepath)
+        written = "".join(call.args[0] for call in mock_open().write.call_args_list)
+        self.assertEqual(json.loads(written), expected_result)
+
+    @patch("lib.wiki.index.download.helpers.os.replace")
     @patch("lib.wiki.index.download.helpers.os.path.exists")
     @patch("lib.wiki.index.download.helpers.os.makedirs")
     @patch("lib.wiki.index.download.helpers.open", new_callable=mock_open)
-    @patch("lib.wiki.index.download.helpers.get_wiki_category_members")
-    def test_get_title_pathname_map_inverse_filter(self, mock_get_wiki_category_members, mock_open, mock_makedirs, mock_path_exists):
+    @patch("lib.wiki.index.download.helpers.iter_wiki_category_members")
+    def test_get_title_pathname_map_inverse_filter(self, mock_get_wiki_category_members, mock_open, mock_makedirs, mock_path_exists, mock_replace):
         # Mock the os.path.exists method
         def path_exists_side_effect(path):
             if path.endswith("title_pathname.json"):
@@ -182,8 +246,99 @@ class TestHelpers(unittest.TestCase):
         }
 
         self.assertEqual(result, expected_result)
-        mock_get_wiki_category_members.assert_called_once_with(category, filepath)
-        mock_open.assert_called_once_with(os.path.join(filepath, ".metadata/download", "title_pathname.json"), "w")
+        # One pass over the listing for the pages and one for the categories
+        self.assertEqual(mock_get_wiki_category_members.call_count, 2)
+        mock_get_wiki_category_members.assert_called_with(category, filepath)
+        title_pathname_filepath = os.path.join(filepath, ".metadata/download", "title_pathname.json")
+        mock_open.assert_called_once_with(f"{title_pathname_filepath}.tmp", "w")
+        mock_replace.assert_called_once_with(f"{title_pathname_filepath}.tmp", title_pathname_filepath)
+        written = "".join(call.args[0] for call in mock_open().write.call_args_list)
+        self.assertEqual(json.loads(written), expected_result)
+
+
+    # ------------------------------------------
+    # Test Cases for render_extract_html
+    # ------------------------------------------
+
+    def test_render_extract_html_nested_sections(self):
+        extract = (
+            "<p>Intro.</p>\n"
+            '<h2><span id="Description">Description</span></h2>\n<p>Body.</p>\n'
+            '<h3><span id="Size">Size</span></h3>\n<p>Large.</p>\n'
+            '<h2><span id="History">History</span></h2>\n'
+        )
+
+        expected_result = (
+            "<p>Intro.</p>\n\n"
+            "<h2>Description</h2>\n<p>Body.</p>\n\n"
+            "<h3>Size</h3>\n<p>Large.</p>\n\n"
+            "<h2>History</h2>"
+        )
+
+        self.assertEqual(render_extract_html(extract), expected_result)
+
+    def test_render_extract_html_without_sections(self):
+        self.assertEqual(render_extract_html("\n<p>Only a summary.</p>\n"), "<p>Only a summary.</p>")
+
+
+    # ------------------------------------------
+    # Test Cases for query_pages and save_batch_pages
+    # ------------------------------------------
+
+    @patch("lib.wiki.index.download.helpers.get_api_session")
+    def test_query_pages_and_save_batch_pages(self, mock_get_api_session):
+        # First response carries one extract and a continuation, second response the other extract
+        responses = [
+            {
+                "continue": {"excontinue": 1, "continue": "||"},
+                "query": {
+                    "normalized": [{"from": "stegosaurus", "to": "Stegosaurus"}],
+                    "redirects": [{"from": "T. rex", "to": "Tyrannosaurus"}],
+                    "pages": {
+                        "1": {"pageid": 1, "ns": 0, "title": "Stegosaurus", "extract": "<p>Plates.</p>"},
+                        "2": {"pageid": 2, "ns": 0, "title": "Tyrannosaurus"},
+                        "-1": {"ns": 0, "title": "Nopage", "missing": ""},
+                    },
+                },
+            },
+            {
+                "batchcomplete": "",
+                "query": {
+                    "pages": {
+                        "1": {"pageid": 1, "ns": 0, "title": "Stegosaurus"},
+                        "2": {"pageid": 2, "ns": 0, "title": "Tyrannosaurus", "extract": "<p>Teeth.</p>"},
+                        "-1": {"ns": 0, "title": "Nopage", "missing": ""},
+                    }
+                },
+            },
+        ]
+        mock_session = MagicMock()
+        mock_session.get.return_value.json.side_effect = responses
+        mock_get_api_session.return_value = mock_session
+
+        pages = {
+            "stegosaurus": "stegosaurus.html",
+            "T. rex": "T._rex.html",
+            "Nopage": "Nopage.html",
+        }
+        with tempfile.TemporaryDirectory() as filepath:
+            batch_pages = query_pages(list(pages.keys()), "extracts")
+            results = save_batch_pages(batch_pages, pages, filepath)
+
+            self.assertIsNone(results["stegosaurus"])
+            self.assertIsNone(results["T. rex"])
+            self.assertIsInstance(results["Nopage"], KeyError)
+            with open(os.path.join(filepath, "stegosaurus.html")) as file:
+                self.assertEqual(file.read(), "<p>Plates.</p>")
+            with open(os.path.join(filepath, "T._rex.html")) as file:
+                self.assertEqual(file.read(), "<p>Teeth.</p>")
+            self.assertFalse(os.path.exists(os.path.join(filepath, "Nopage.html")))
+
+        self.assertEqual(mock_session.get.call_count, 2)
+        first_params = mock_session.get.call_args_list[0].kwargs["params"]
+        self.assertEqual(first_params["titles"], "stegosaurus|T. rex|Nopage")
+        second_params = mock_session.get.call_args_list[1].kwargs["params"]
+        self.assertEqual(second_params["excontinue"], 1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+import bz2
+import gzip
+import os
+import tempfile
+import unittest
+from lib.wiki.index.dump.helpers import (
+    iter_sql_rows,
+    iter_xml_dump_pages,
+    wikitext_to_html,
+    parsoid_html_to_html,
+)
+
+
+CATEGORYLINKS_SQL = """-- MySQL dump
+CREATE TABLE `categorylinks` (
+  `cl_from` int(8) unsigned NOT NULL DEFAULT 0,
+  `cl_to` varbinary(255) NOT NULL DEFAULT '',
+  `cl_sortkey` varbinary(230) NOT NULL DEFAULT '',
+  `cl_type` enum('page','subcat','file') NOT NULL DEFAULT 'page',
+  PRIMARY KEY (`cl_from`,`cl_to`)
+) ENGINE=InnoDB;
+INSERT INTO `categorylinks` VALUES (1,'Dinosaurs','STEGO','page'),(2,'Dinosaurs','O\\'BRIEN (1,2)','page'),(3,'Dinosaurs',NULL,'subcat');
+"""
+
+XML_DUMP = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/">
+  <siteinfo><sitename>Wikipedia</sitename></siteinfo>
+  <page>
+    <title>Stegosaurus</title>
+    <ns>0</ns>
+    <id>1</id>
+    <revision><id>10</id><text>'''Stegosaurus''' is a [[genus]].</text></revision>
+  </page>
+  <page>
+    <title>Stego</title>
+    <ns>0</ns>
+    <id>2</id>
+    <redirect title="Stegosaurus" />
+    <revision><id>11</id><text>#REDIRECT [[Stegosaurus]]</text></revision>
+  </page>
+  <page>
+    <title>Category:Ornithischians</title>
+    <ns>14</ns>
+    <id>3</id>
+    <revision><id>12</id><text /></revision>
+  </page>
+</mediawiki>
+"""
+
+
+class TestDumpHelpers(unittest.TestCase):
+    def test_iter_sql_rows(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "categorylinks.sql.gz")
+            with gzip.open(path, "wt", encoding="utf-8") as file:
+                file.write(CATEGORYLINKS_SQL)
+
+            rows = list(iter_sql_rows(path, "categorylinks"))
+
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(
+            rows[0],
+            {"cl_from": 1, "cl_to": "Dinosaurs", "cl_sortkey": "STEGO", "cl_type": "page"},
+        )
+        self.assertEqual(rows[1]["cl_sortkey"], "O'BRIEN (1,2)")
+        self.assertIsNone(rows[2]["cl_sortkey"])
+        self.assertEqual(rows[2]["cl_type"], "subcat")
+
+    def test_iter_xml_dump_pages(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "pages-articles.xml.bz2")
+            with bz2.open(path, "wt", encoding="utf-8") as file:
+                file.write(XML_DUMP)
+
+            pages = list(iter_xml_dump_pages(path))
+
+        self.assertEqual(
+            pages,
+            [
+                (1, 0, "Stegosaurus", "'''Stegosaurus''' is a [[genus]]."),
+                (3, 14, "Category:Ornithischians", ""),
+            ],
+        )
+
+    def test_wikitext_to_html(self):
+        wikitext = """{{Infobox dinosaur|name={{nowrap|Stegosaurus}}}}
+'''Stegosaurus''' is a [[genus]] of [[Thyreophora|thyreophoran]] dinosaur.<ref>Marsh 1877</ref>
+It lived in the [[Late Jurassic]].
+
+== Description ==
+[[File:Stego.jpg|thumb|A [[skeleton]]]]
+* Plates
+* Spikes & tail
+{| class="wikitable"
+| cell
+|}
+[[Category:Stegosaurs]]"""
+
+        self.assertEqual(
+            wikitext_to_html(wikitext),
+            "<p>Stegosaurus is a genus of thyreophoran dinosaur. It lived in the Late Jurassic.</p>\n"
+            "<h2>Description</h2>\n"
+            "<ul><li>Plates</li><li>Spikes &amp; tail</li></ul>",
+        )
+
+    def test_parsoid_html_to_html(self):
+        parsoid_html = """<html><body>
+<section><p>Stegosaurus is a genus.<sup class="reference">[1]</sup></p>
+<table class="infobox"><tr><td>Infobox</td></tr></table></section>
+<section><h2 id="Description">Description<span class="mw-editsection">edit</span></h2>
+<p>Large.</p><ul><li>Plates<p>nested</p></li></ul></section>
+</body></html>"""
+
+        self.assertEqual(
+            parsoid_html_to_html(parsoid_html),
+            "<p>Stegosaurus is a genus.</p>\n"
+            "<h2>Description</h2>\n"
+            "<p>Large.</p>\n"
+            "<ul><li>Plates<p>nested</p></li></ul>",
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+from haystack import Document
+from lib.wiki.index.embed.embedding_cache import EmbeddingCache, get_text_to_embed
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "cache", "embedding_cache.sqlite")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_keys(self):
+        key = EmbeddingCache.get_key("text-embedding-3-small", None, "Stegosaurus")
+        self.assertEqual(key, EmbeddingCache.get_key("text-embedding-3-small", None, "Stegosaurus"))
+        self.assertNotEqual(key, EmbeddingCache.get_key("text-embedding-3-small", 256, "Stegosaurus"))
+        self.assertNotEqual(key, EmbeddingCache.get_key("text-embedding-3-large", None, "Stegosaurus"))
+        self.assertNotEqual(key, EmbeddingCache.get_key("text-embedding-3-small", None, "Triceratops"))
+
+    def test_text_to_embed(self):
+        class Embedder:
+            prefix = "passage: "
+            suffix = ""
+            embedding_separator = "\n"
+            meta_fields_to_embed = ["title", "h2"]
+
+        doc = Document(content="Plates.", meta={"title": "Stegosaurus", "split_id": 0})
+        self.assertEqual(get_text_to_embed(Embedder(), doc), "passage: Stegosaurus\nPlates.")
+
+    def test_put_get_and_persist(self):
+        cache = EmbeddingCache(self.db_path)
+        keys = [EmbeddingCache.get_key("model", None, text) for text in ["a", "b", "c"]]
+        cache.put_embeddings({keys[0]: [0.5, 1.0], keys[1]: [0.25, -2.0]})
+        self.assertEqual(cache.get_embeddings(keys), {keys[0]: [0.5, 1.0], keys[1]: [0.25, -2.0]})
+        self.assertEqual((cache.num_hits, cache.num_misses), (2, 1))
+        cache.close()
+
+        cache = EmbeddingCache(self.db_path)
+        self.assertEqual(cache.num_bytes, 16)
+        self.assertEqual(cache.get_embeddings([keys[1]]), {keys[1]: [0.25, -2.0]})
+        # replacing an embedding does not count its size twice
+        cache.put_embeddings({keys[1]: [1.0, 1.0]})
+        self.assertEqual(cache.num_bytes, 16)
+        cache.close()
+
+    def test_eviction(self):
+        # room for 4 embeddings of 2 float32
+        cache = EmbeddingCache(self.db_path, max_bytes=32)
+        keys = [EmbeddingCache.get_key("model", None, str(i)) for i in range(5)]
+        for key in keys[:4]:
+            cache.put_embeddings({key: [1.0, 2.0]})
+        # the first one is used again, the second one is now the least recently used
+        cache.get_embeddings([keys[0]])
+
+        cache.put_embeddings({keys[4]: [1.0, 2.0]})
+
+        # evicted down to 90% of max_bytes: 3 embeddings
+        self.assertEqual(cache.num_bytes, 24)
+        self.assertEqual(set(cache.get_embeddings(keys)), {keys[0], keys[3], keys[4]})
+        cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from dataclasses import replace
+from haystack import Document
+from lib.wiki.index.chunk.table_serializer import count_tokens
+from lib.wiki.index.embed.embedding_cache import EmbeddingCache
+from lib.wiki.index.embed.embedding_scheduler import EmbeddingError, EmbeddingScheduler
+
+
+class FakeEmbedder:
+    """
+    Embeds a document as [its position in the batch, its content length], slowly enough for batches to overlap.
+    """
+
+    model = "fake-embedding-model"
+
+    def __init__(self, batch_size: int = 32, delay: float = 0.05, fail_on: str = None):
+        self.batch_size = batch_size
+        self.delay = delay
+        self.fail_on = fail_on
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def run(self, documents):
+        with self.lock:
+            self.batches.append([doc.id for doc in documents])
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return {
+            "documents": [
+                replace(doc, embedding=None if doc.id == self.fail_on else [float(i), float(len(doc.content))])
+                for i, doc in enumerate(documents)
+            ],
+            "meta": {},
+        }
+
+
+def page_documents(page: str, num_documents: int, content_length: int = 40):
+    return [Document(id=f"{page}-{i}", content="x" * content_length) for i in range(num_documents)]
+
+
+class TestEmbeddingScheduler(unittest.TestCase):
+    def test_batches_across_pages(self):
+        embedder = FakeEmbedder(delay=0)
+        scheduler = EmbeddingScheduler(embedder, max_batch_tokens=0, max_batch_documents=4)
+        documents_by_page = {"A": page_documents("A", 1), "B": page_documents("B", 2), "C": page_documents("C", 3)}
+
+        embedded = scheduler.embed(documents_by_page)
+
+        self.assertEqual(embedder.batches, [["A-0", "B-0", "B-1", "C-0"], ["C-1", "C-2"]])
+        for page, documents in documents_by_page.items():
+            self.assertEqual([doc.id for doc in embedded[page]], [doc.id for doc in documents])
+            self.assertTrue(all(doc.embedding is not None for doc in embedded[page]))
+        # routed back from the position of every document in its batch
+        self.assertEqual(embedded["C"][0].embedding[0], 3.0)
+        self.assertEqual(embedded["C"][1].embedding[0], 0.0)
+        self.assertEqual(scheduler.get_stats()["batches"], 2)
+        self.assertEqual(scheduler.get_stats()["documents"], 6)
+
+    def test_token_limit(self):
+        embedder = FakeEmbedder(delay=0)
+        # two small documents per batch; a document over the limit is a batch of its own
+        scheduler = EmbeddingScheduler(embedder, max_batch_tokens=2 * count_tokens("x" * 40), max_batch_documents=100)
+        documents = page_documents("A", 5)
+        documents.insert(2, Document(id="A-large", content="word " * 100))
+
+        scheduler.embed({"A": documents})
+
+        batched_ids = [doc_id for batch in embedder.batches for doc_id in batch]
+        self.assertEqual(batched_ids, [doc.id for doc in documents])
+        self.assertIn(["A-large"], embedder.batches)
+        self.assertTrue(all(len(batch) <= 2 for batch in embedder.batches))
+
+    def test_concurrency(self):
+        embedder = FakeEmbedder(delay=0.05)
+        scheduler = EmbeddingScheduler(embedder, max_batch_documents=1, concurrency=4)
+
+        start = time.perf_counter()
+        embedded = scheduler.embed({"A": page_documents("A", 8)})
+        seconds = time.perf_counter() - start
+        scheduler.close()
+
+        self.assertEqual(len(embedder.batches), 8)
+        self.assertEqual(embedder.max_in_flight, 4)
+        self.assertLess(seconds, 8 * 0.05)
+        self.assertEqual([doc.id for doc in embedded["A"]], [f"A-{i}" for i in range(8)])
+
+    def test_missing_embedding(self):
+        scheduler = EmbeddingScheduler(FakeEmbedder(delay=0, fail_on="B-1"), max_batch_documents=2, concurrency=2)
+        with self.assertRaises(EmbeddingError):
+            scheduler.embed({"A": page_documents("A", 3), "B": page_documents("B", 2)})
+        scheduler.close()
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = EmbeddingCache(os.path.join(tmpdir, "embedding_cache.sqlite"))
+            embedder = FakeEmbedder(delay=0)
+            scheduler = EmbeddingScheduler(embedder, max_batch_documents=2, cache=cache)
+            documents_by_page = {
+                "A": [Document(id="A-0", content="Stegosaurus"), Document(id="A-1", content="Triceratops")],
+                # the same text in another page
+                "B": [Document(id="B-0", content="Stegosaurus"), Document(id="B-1", content="Allosaurus")],
+            }
+
+            embedded = scheduler.embed(documents_by_page)
+
+            self.assertEqual(embedder.batches, [["A-0", "A-1"], ["B-1"]])
+            self.assertEqual(embedded["B"][0].id, "B-0")
+            self.assertEqual(embedded["B"][0].embedding, embedded["A"][0].embedding)
+
+            # the page chunked again, with new chunk ids
+            embedder.batches.clear()
+            embedded = scheduler.embed(
+                {"A": [Document(id="A-2", content="Stegosaurus"), Document(id="A-3", content="Ankylosaurus")]}
+            )
+            self.assertEqual(embedder.batches, [["A-3"]])
+            self.assertEqual([doc.id for doc in embedded["A"]], ["A-2", "A-3"])
+            self.assertEqual(embedded["A"][0].embedding, [0.0, 11.0])
+            self.assertEqual(scheduler.get_stats()["cached_documents"], 2)
+            cache.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+from lib.wiki.index.frontier.redis_frontier import RedisFrontier, make_item
+from lib.wiki.index.frontier.frontier_worker import FrontierWorker
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipUnless(fakeredis, "fakeredis[lua] is required for the frontier tests")
+class TestFrontierWorker(unittest.TestCase):
+    @patch("lib.wiki.index.frontier.frontier_worker.os.makedirs")
+    @patch("lib.wiki.index.frontier.frontier_worker.os.path.exists")
+    @patch("lib.wiki.index.frontier.frontier_worker.get_title_pathname_map")
+    def test_run_crawls_breadth_first_through_all_stages(
+        self, mock_get_title_pathname_map, mock_exists, mock_makedirs
+    ):
+        mock_exists.return_value = True
+        title_pathnames = {
+            "TestCategory": {
+                "pages": {"Page1": "Page1.html"},
+                "categories": {"SubCategory1": "SubCategory1", "SubCategory2": "SubCategory2"},
+            },
+            "SubCategory1": {"pages": {"Page1": "Page1.html", "SubPage1": "SubPage1.html"}, "categories": {}},
+            "SubCategory2": {"pages": {"SubPage2": "SubPage2.html"}, "categories": {}},
+        }
+        mock_get_title_pathname_map.side_effect = lambda category, *args, **kwargs: title_pathnames[category]
+
+        redis_client = fakeredis.FakeRedis()
+        frontier = RedisFrontier(redis_client)
+        downloader = MagicMock()
+        downloader.download_and_record.side_effect = lambda pages, filepath: list(pages.keys())
+        chunker = MagicMock()
+        indexer = MagicMock()
+        indexer.index_page.side_effect = lambda filepath, title, filename: redis_client.sadd("indexed_pages", title)
+
+        worker = FrontierWorker(MagicMock(), frontier, downloader, chunker, indexer, [], poll_interval=0)
+        worker.seed("TestCategory", "/test/path", 2)
+        num_processed = worker.run()
+
+        self.assertEqual(num_processed, {"index": 3, "chunk": 3, "download": 6})
+        downloader.download_and_record.assert_any_call({"Page1": "Page1.html"}, "/test/path")
+        downloader.download_and_record.assert_any_call({"SubPage2": "SubPage2.html"}, "/test/path/SubCategory2")
+        chunker.chunk_page.assert_any_call("/test/path/SubCategory1", "SubPage1", "SubPage1.html")
+        self.assertEqual(indexer.index_page.call_count, 3)
+        self.assertEqual(
+            redis_client.smembers("chunked_pages"), {b"Page1", b"SubPage1", b"SubPage2"}
+        )
+        self.assertEqual(
+            redis_client.smembers("downloaded_categories"),
+            {b"TestCategory", b"SubCategory1", b"SubCategory2"},
+        )
+        self.assertTrue(frontier.is_drained(["index", "chunk", "download"]))
+
+    def test_lease_is_extended_while_item_is_processed(self):
+        redis_client = fakeredis.FakeRedis()
+        frontier = RedisFrontier(redis_client, lease_seconds=60)
+        indexer = MagicMock()
+        indexer.index_page.side_effect = lambda filepath, title, filename: time.sleep(0.2)
+
+        worker = FrontierWorker(
+            MagicMock(), frontier, MagicMock(), MagicMock(), indexer, [], heartbeat_interval=0.02
+        )
+        frontier.enqueue(make_item("index", "page", "Page1", "/test/path", filename="Page1.html"))
+        with patch.object(frontier, "extend", wraps=frontier.extend) as mock_extend:
+            self.assertEqual(worker.process_next(), "index")
+
+            self.assertGreater(mock_extend.call_count, 1)
+            call_count = mock_extend.call_count
+            time.sleep(0.1)
+            # The heartbeat stops once the item is done
+            self.assertEqual(mock_extend.call_count, call_count)
+        self.assertTrue(frontier.is_drained(["index"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
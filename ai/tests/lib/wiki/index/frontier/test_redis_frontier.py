@@ -0,0 +1,117 @@
+import json
+import unittest
+from lib.wiki.index.frontier.redis_frontier import RedisFrontier, make_item
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipUnless(fakeredis, "fakeredis[lua] is required for the frontier tests")
+class TestRedisFrontier(unittest.TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.frontier = RedisFrontier(self.redis, lease_seconds=60, max_attempts=2)
+
+    def test_items_are_claimed_in_fifo_order_and_deduplicated(self):
+        page1 = make_item("download", "page", "Page1", "/test/path", filename="Page1.html")
+        page2 = make_item("download", "page", "Page2", "/test/path", filename="Page2.html")
+        duplicate = make_item("download", "page", "Page1", "/test/path/other", filename="Page1.html")
+
+        self.assertTrue(self.frontier.enqueue(page1))
+        self.assertEqual(self.frontier.enqueue_many([page2, duplicate]), 1)
+
+        self.assertEqual(self.frontier.claim("download"), page1)
+        self.assertEqual(self.frontier.claim("download"), page2)
+        self.assertIsNone(self.frontier.claim("download"))
+        self.assertEqual(self.frontier.leased_count("download"), 2)
+
+        self.frontier.ack(page1)
+        self.frontier.ack(page2)
+        self.assertTrue(self.frontier.is_drained(["download"]))
+
+    def test_expired_lease_is_reclaimed(self):
+        page = make_item("chunk", "page", "Page1", "/test/path", filename="Page1.html")
+        self.frontier.enqueue(page)
+        self.assertEqual(self.frontier.claim("chunk"), page)
+
+        # Lease still valid
+        self.assertEqual(self.frontier.reclaim_expired("chunk"), 0)
+
+        # Worker died: expire the lease
+        self.redis.zadd("frontier:chunk:leases", {RedisFrontier.serialize(page): 0})
+        self.assertEqual(self.frontier.reclaim_expired("chunk"), 1)
+        self.assertFalse(self.frontier.extend(page))
+        self.assertEqual(self.frontier.claim("chunk"), page)
+        self.assertTrue(self.frontier.extend(page))
+
+    def test_failed_item_is_retried_then_dead_lettered(self):
+        page = make_item("index", "page", "Page1", "/test/path", filename="Page1.html")
+        self.frontier.enqueue(page)
+
+        self.assertTrue(self.frontier.fail(self.frontier.claim("index"), "boom"))
+        self.assertFalse(self.frontier.fail(self.frontier.claim("index"), "boom"))
+
+        self.assertIsNone(self.frontier.claim("index"))
+        self.assertTrue(self.frontier.is_drained(["index"]))
+        dead_letter = json.loads(self.redis.lindex("frontier:index:failed", 0))
+        self.assertEqual(dead_letter, {"item": page, "reason": "boom", "attempts": 2})
+
+    def test_fail_after_lease_was_reclaimed(self):
+        page = make_item("index", "page", "Page1", "/test/path", filename="Page1.html")
+        self.frontier.enqueue(page)
+        self.assertEqual(self.frontier.claim("index"), page)
+
+        # The lease expires and is reclaimed while the worker is still on the item, which then fails
+        self.redis.zadd("frontier:index:leases", {RedisFrontier.serialize(page): 0})
+        self.assertEqual(self.frontier.reclaim_expired("index"), 1)
+        self.assertFalse(self.frontier.fail(page, "boom"))
+
+        # The item is pending once, with the attempt counted by the reclaim only
+        self.assertEqual(self.frontier.pending_count("index"), 1)
+        self.assertEqual(int(self.redis.hget("frontier:index:attempts", "page:Page1")), 1)
+        self.assertEqual(self.redis.llen("frontier:index:failed"), 0)
+
+    def test_enqueue_many_in_batches(self):
+        items = [make_item("download", "page", f"Page{i}", "/test/path", filename=f"Page{i}.html") for i in range(5)]
+        items.append(make_item("chunk", "page", "Page0", "/test/path", filename="Page0.html"))
+
+        self.assertEqual(self.frontier.enqueue_many(items + items[:2], batch_size=2), 6)
+        self.assertFalse(self.frontier.enqueue(items[0]))
+
+        self.assertEqual(self.frontier.pending_count("download"), 5)
+        self.assertEqual(self.frontier.pending_count("chunk"), 1)
+        self.assertEqual(self.redis.scard("frontier:download:seen"), 5)
+        self.assertEqual([self.frontier.claim("download") for _ in range(5)], items[:5])
+
+    def test_expired_leases_count_as_attempts(self):
+        page = make_item("index", "page", "Page1", "/test/path", filename="Page1.html", depth=1)
+        self.frontier.enqueue(page)
+
+        # the item kills its worker every time
+        for _ in range(2):
+            self.assertEqual(self.frontier.claim("index"), page)
+            self.redis.zadd("frontier:index:leases", {RedisFrontier.serialize(page): 0})
+            self.assertEqual(self.frontier.reclaim_expired("index"), 1)
+
+        self.assertIsNone(self.frontier.claim("index"))
+        self.assertTrue(self.frontier.is_drained(["index"]))
+        dead_letter = json.loads(self.redis.lindex("frontier:index:failed", 0))
+        self.assertEqual(dead_letter, {"item": page, "reason": "lease expired", "attempts": 2})
+        self.assertFalse(self.redis.hexists("frontier:index:attempts", "page:Page1"))
+
+    def test_reset_allows_enqueuing_again(self):
+        page = make_item("download", "page", "Page1", "/test/path", filename="Page1.html")
+        self.frontier.enqueue(page)
+        self.frontier.ack(self.frontier.claim("download"))
+        self.assertFalse(self.frontier.enqueue(page))
+
+        self.frontier.reset(["download"])
+
+        self.assertTrue(self.frontier.enqueue(page))
+        self.assertEqual(self.frontier.claim("download"), page)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import csv
+import os
+import tempfile
+import unittest
+from lib.wiki.index.graph.bulk_import_exporter import CSV_HEADERS, Neo4jBulkImportExporter
+from lib.wiki.index.graph.page_graph_creator import Neo4jPageGraphCreator
+from tests.lib.wiki.index.graph.test_page_graph_creator import page
+
+
+class TestNeo4jBulkImportExporter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.output_dir = os.path.join(self.tmpdir.name, "import")
+        self.exporter = Neo4jBulkImportExporter(self.output_dir)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_csv(self, name):
+        with open(self.exporter.csv_filepath(name), newline="") as file:
+            return list(csv.reader(file))
+
+    def test_export(self):
+        self.assertTrue(self.exporter.add_page(page("Stegosaurus")))
+        self.assertFalse(self.exporter.add_page(page("Stegosaurus")))
+        self.exporter.add_category_page("Dinosaurs", "Stegosaurus")
+        self.exporter.add_category_page("Dinosaurs", "Not exported")
+        self.exporter.add_subcategory("Dinosaurs", "Theropods")
+        self.exporter.add_subcategory("Dinosaurs", "Theropods")
+        stats = self.exporter.close()
+
+        for name, header in CSV_HEADERS.items():
+            self.assertEqual(self.read_csv(name)[0], header)
+        pages = self.read_csv("pages")[1:]
+        self.assertEqual([(title, label) for _, title, label in pages], [("Stegosaurus", "Page")])
+        page_uuid = pages[0][0]
+        sections = {name: (section_uuid, parent_uuid, label) for section_uuid, name, parent_uuid, label in self.read_csv("sections")[1:]}
+        self.assertEqual(sections["Description"][1:], (page_uuid, "Section;h2"))
+        self.assertEqual(sections["Plates"][1:], (sections["Description"][0], "Section;h3"))
+        self.assertEqual(len(self.read_csv("chunks")), 1 + 4)
+        self.assertEqual(sorted(title for _, title, _ in self.read_csv("categories")[1:]), ["Dinosaurs", "Theropods"])
+
+        relationships = self.read_csv("relationships")[1:]
+        self.assertIn([page_uuid, "Stegosaurus-intro-0", "FIRST_CHUNK"], relationships)
+        self.assertIn(["Stegosaurus-intro-0", "Stegosaurus-intro-1", "NEXT_CHUNK"], relationships)
+        self.assertIn([page_uuid, sections["Description"][0], "FIRST_SECTION"], relationships)
+        self.assertIn([sections["Description"][0], sections["History"][0], "NEXT_SECTION"], relationships)
+        self.assertIn([sections["Plates"][0], sections["Tail"][0], "NEXT_SECTION"], relationships)
+        self.assertEqual([relationship for *_, relationship in relationships].count("HAS_PAGE"), 1)
+        self.assertEqual([relationship for *_, relationship in relationships].count("HAS_SUBCATEGORY"), 1)
+        self.assertEqual(stats, {"pages": 1, "categories": 2, "nodes": 1 + 4 + 4 + 2, "relationships": len(relationships)})
+
+        with open(os.path.join(self.output_dir, "schema.cypher")) as file:
+            schema_queries = file.read().splitlines()
+        self.assertTrue(set(Neo4jPageGraphCreator.INDEX_QUERIES) <= set(schema_queries))
+
+    def test_import_command(self):
+        command = self.exporter.get_import_command("wiki")
+        self.exporter.close()
+
+        self.assertTrue(command.startswith("neo4j-admin database import full"))
+        self.assertIn(f"--nodes={self.exporter.csv_filepath('chunks')}", command)
+        self.assertIn(f"--relationships={self.exporter.csv_filepath('relationships')}", command)
+        self.assertTrue(command.endswith(" wiki"))
+
+
+if __name__ == "__main__":
+    unittest.main()
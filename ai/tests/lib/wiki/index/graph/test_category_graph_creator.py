@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import MagicMock
+from lib.wiki.index.graph.category_graph_creator import Neo4jCategoryGraphCreator
+
+
+class TestNeo4jCategoryGraphCreator(unittest.TestCase):
+    def setUp(self):
+        self.driver = MagicMock()
+        self.session = self.driver.session.return_value.__enter__.return_value
+        self.session.run.return_value = iter([{"name": "index_category_title"}])
+        self.transactions = []
+
+        def execute_write(work, query, rows):
+            tx = MagicMock()
+            work(tx, query, rows)
+            self.transactions.append((" ".join(query.split()), rows))
+
+        self.session.execute_write.side_effect = execute_write
+
+    def test_create_indexes(self):
+        Neo4jCategoryGraphCreator(self.driver)
+
+        queries = [call.args[0] for call in self.session.run.call_args_list]
+        # the plain index on Category.title is dropped before the constraint is created
+        self.assertIn("SHOW INDEXES", queries[0])
+        self.assertEqual(queries[1], "DROP INDEX `index_category_title` IF EXISTS")
+        self.assertEqual(queries[2], "CREATE CONSTRAINT IF NOT EXISTS FOR (n:Category) REQUIRE n.title IS UNIQUE;")
+
+    def test_create_relationships(self):
+        creator = Neo4jCategoryGraphCreator(self.driver, batch_size=2)
+
+        creator.create_relationships(
+            [("Dinosaurs", "Stegosaurus"), ("Dinosaurs", "Triceratops"), ("Theropods", "Allosaurus"),
+             ("Dinosaurs", "Stegosaurus")],
+            [("Dinosaurs", "Theropods")],
+        )
+
+        categories = [row for query, rows in self.transactions if "MERGE (c:Category" in query for row in rows]
+        self.assertEqual([row["title"] for row in categories], ["Dinosaurs", "Theropods"])
+        self.assertTrue(all(row["uuid"] for row in categories))
+        page_transactions = [rows for query, rows in self.transactions if "HAS_PAGE" in query]
+        self.assertEqual(
+            page_transactions,
+            [
+                [{"category": "Dinosaurs", "page": "Stegosaurus"}, {"category": "Dinosaurs", "page": "Triceratops"}],
+                [{"category": "Theropods", "page": "Allosaurus"}],
+            ],
+        )
+        self.assertEqual(
+            [rows for query, rows in self.transactions if "HAS_SUBCATEGORY" in query],
+            [[{"category": "Dinosaurs", "subcategory": "Theropods"}]],
+        )
+        self.assertEqual(len(self.transactions), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+import threading
+import unittest
+from unittest.mock import MagicMock
+from lib.wiki.index.graph.page_graph_creator import Neo4jPageGraphCreator
+
+
+def page(title, num_chunks=2):
+    return {
+        "title": title,
+        "chunks": [{"id": f"{title}-intro-{i}"} for i in range(num_chunks)],
+        "sections": [
+            {
+                "name": "Description",
+                "type": "h2",
+                "chunks": [{"id": f"{title}-description-0"}],
+                "sections": [
+                    {"name": "Plates", "type": "h3", "chunks": [{"id": f"{title}-plates-0"}], "sections": []},
+                    {"name": "Tail", "type": "h3", "chunks": [], "sections": []},
+                ],
+            },
+            {"name": "History", "type": "h2", "chunks": [], "sections": []},
+        ],
+    }
+
+
+class FakeTransaction:
+    """
+    Records the queries run, and returns (key, uuid) records for the queries merging nodes: the uuid of the row, or
+    the uuid of an existing node.
+    """
+
+    def __init__(self, existing_uuids):
+        self.existing_uuids = existing_uuids
+        self.queries = []
+
+    def run(self, query, rows):
+        self.queries.append((" ".join(query.split()), rows))
+        result = MagicMock()
+        records = [
+            {"key": row["key"], "uuid": self.existing_uuids.get(row.get("title") or row.get("name"), row["uuid"])}
+            for row in rows
+            if "key" in row
+        ]
+        result.__iter__.return_value = iter(records)
+        return result
+
+    def get_rows(self, *fragments):
+        return [
+            row for query, rows in self.queries if all(fragment in query for fragment in fragments) for row in rows
+        ]
+
+
+class TestNeo4jPageGraphCreator(unittest.TestCase):
+    def setUp(self):
+        self.driver = MagicMock()
+        self.transactions = []
+
+        def execute_write(work, page_dicts):
+            tx = FakeTransaction({"Stegosaurus": "existing-page-uuid"})
+            tx.thread_name = threading.current_thread().name
+            self.transactions.append(tx)
+            return work(tx, page_dicts)
+
+        self.driver.session.return_value.__enter__.return_value.execute_write.side_effect = execute_write
+
+    def test_create_graphs(self):
+        creator = Neo4jPageGraphCreator(self.driver, pages_per_transaction=10)
+
+        creator.create_graphs([page("Stegosaurus"), page("Triceratops", num_chunks=1)])
+
+        self.assertEqual(len(self.transactions), 1)
+        tx = self.transactions[0]
+        # pages, h2 sections, h3 sections, chunks of pages and of sections, 4 FIRST_* and 2 NEXT_* queries
+        self.assertEqual(len(tx.queries), 11)
+
+        self.assertEqual(
+            [(row["parent_uuid"], row["name"]) for row in tx.get_rows("MERGE (s:Section:h2")],
+            [
+                ("existing-page-uuid", "Description"),
+                ("existing-page-uuid", "History"),
+                (tx.queries[0][1][1]["uuid"], "Description"),
+                (tx.queries[0][1][1]["uuid"], "History"),
+            ],
+        )
+        description_uuid = tx.get_rows("MERGE (s:Section:h2")[0]["uuid"]
+        self.assertEqual(
+            [(row["parent_uuid"], row["name"]) for row in tx.get_rows("MERGE (s:Section:h3")][:2],
+            [(description_uuid, "Plates"), (description_uuid, "Tail")],
+        )
+        self.assertEqual(
+            tx.get_rows("MATCH (parent:Page", "HAS_CHUNK"),
+            [
+                {"parent_uuid": "existing-page-uuid", "uuid": "Stegosaurus-intro-0"},
+                {"parent_uuid": "existing-page-uuid", "uuid": "Stegosaurus-intro-1"},
+                {"parent_uuid": tx.queries[0][1][1]["uuid"], "uuid": "Triceratops-intro-0"},
+            ],
+        )
+        self.assertEqual(len(tx.get_rows("MATCH (parent:Section", "HAS_CHUNK")), 4)
+        self.assertEqual(
+            [row["uuid"] for row in tx.get_rows("MATCH (parent:Page", "FIRST_CHUNK")],
+            ["Stegosaurus-intro-0", "Triceratops-intro-0"],
+        )
+        self.assertEqual(
+            tx.get_rows("NEXT_CHUNK"), [{"uuid1": "Stegosaurus-intro-0", "uuid2": "Stegosaurus-intro-1"}]
+        )
+        # Description -> History and Plates -> Tail, in both pages
+        self.assertEqual(len(tx.get_rows("NEXT_SECTION")), 4)
+
+    def test_pages_per_transaction(self):
+        creator = Neo4jPageGraphCreator(self.driver, pages_per_transaction=2)
+
+        creator.create_graphs([page(f"Page {i}") for i in range(5)])
+        creator.create_graph(page("Stegosaurus"))
+
+        self.assertEqual(
+            [[row["title"] for row in tx.queries[0][1]] for tx in self.transactions],
+            [["Page 0", "Page 1"], ["Page 2", "Page 3"], ["Page 4"], ["Stegosaurus"]],
+        )
+
+    def test_concurrent_shards(self):
+        creator = Neo4jPageGraphCreator(self.driver, pages_per_transaction=2, concurrency=3)
+        page_dicts = [page(f"Page {i}") for i in range(20)]
+
+        creator.create_graphs(page_dicts)
+        creator.create_graphs(page_dicts)
+        creator.close()
+
+        titles = [[row["title"] for row in tx.queries[0][1]] for tx in self.transactions]
+        self.assertEqual(sorted(title for tx_titles in titles for title in tx_titles), sorted(
+            [page_dict["title"] for page_dict in page_dicts] * 2
+        ))
+        self.assertTrue(all(tx.thread_name.startswith("graph-writer") for tx in self.transactions))
+        # every page always goes to the same shard, in order
+        shards = creator.get_shards(page_dicts)
+        self.assertEqual(len(shards), 3)
+        shard_of_title = {page_dict["title"]: i for i, shard in enumerate(shards) for page_dict in shard}
+        for tx_titles in titles:
+            self.assertEqual(len({shard_of_title[title] for title in tx_titles}), 1)
+        for index, shard in enumerate(shards):
+            self.assertEqual(
+                [title for tx_titles in titles for title in tx_titles if shard_of_title[title] == index],
+                [page_dict["title"] for page_dict in shard] * 2,
+            )
+        self.driver.close.assert_called_once()
+
+    def test_shard_failure(self):
+        creator = Neo4jPageGraphCreator(self.driver, pages_per_transaction=1, concurrency=2)
+        session = self.driver.session.return_value.__enter__.return_value
+        execute_write = session.execute_write.side_effect
+
+        def failing_execute_write(work, page_dicts):
+            if page_dicts[0]["title"] == "Page 3":
+                raise RuntimeError("Deadlock retries exhausted")
+            return execute_write(work, page_dicts)
+
+        session.execute_write.side_effect = failing_execute_write
+
+        page_dicts = [page(f"Page {i}") for i in range(40)]
+        written = []
+        with self.assertRaises(RuntimeError):
+            creator.create_graphs(page_dicts, written)
+
+        written_titles = {tx.queries[0][1][0]["title"] for tx in self.transactions}
+        # the pages of the committed transactions are reported
+        self.assertEqual(sorted(written), sorted(written_titles))
+        failed_shard = next(shard for shard in creator.get_shards(page_dicts) if page_dicts[3] in shard)
+        failed_position = failed_shard.index(page_dicts[3])
+        self.assertTrue({page_dict["title"] for page_dict in failed_shard[:failed_position]} <= written_titles)
+        self.assertFalse({page_dict["title"] for page_dict in failed_shard[failed_position:]} & written_titles)
+        creator.close()
+
+    def test_missing_parent(self):
+        creator = Neo4jPageGraphCreator(self.driver)
+        tx = FakeTransaction({})
+        tx.run = MagicMock(return_value=iter([]))
+
+        with self.assertRaises(RuntimeError):
+            creator.write_graphs(tx, [page("Stegosaurus")])
+
+
+if __name__ == "__main__":
+    unittest.main()
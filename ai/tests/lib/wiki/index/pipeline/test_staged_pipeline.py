@@ -0,0 +1,71 @@
+import time
+import unittest
+from lib.wiki.index.pipeline.staged_pipeline import PipelineError, StagedPipeline
+
+
+def sleeping(seconds, function):
+    def stage(item):
+        time.sleep(seconds)
+        return function(item)
+
+    return stage
+
+
+class TestStagedPipeline(unittest.TestCase):
+    def test_stages_overlap_in_order(self):
+        pipeline = StagedPipeline(
+            [
+                ("double", sleeping(0.02, lambda x: x * 2)),
+                ("increment", sleeping(0.02, lambda x: x + 1)),
+                ("text", sleeping(0.02, str)),
+            ],
+            queue_size=2,
+        )
+        start = time.perf_counter()
+        pipeline.start()
+        outputs = []
+        for i in range(10):
+            pipeline.put(i, size=3)
+            outputs.extend(pipeline.get_outputs())
+        outputs.extend(pipeline.close())
+        seconds = time.perf_counter() - start
+
+        self.assertEqual(outputs, [str(i * 2 + 1) for i in range(10)])
+        # 12 steps of 0.02s instead of 30
+        self.assertLess(seconds, 0.5)
+        stats = pipeline.get_stats()
+        self.assertEqual(list(stats), ["double", "increment", "text"])
+        self.assertEqual((stats["text"]["items"], stats["text"]["size"]), (10, 30))
+        self.assertGreater(stats["text"]["busy_seconds"], 0.15)
+
+    def test_backpressure(self):
+        pipeline = StagedPipeline([("fast", lambda x: x), ("slow", sleeping(0.05, lambda x: x))], queue_size=1)
+        pipeline.start()
+        for i in range(5):
+            pipeline.put(i)
+        self.assertEqual(pipeline.close(), list(range(5)))
+        # the fast stage waited for room in front of the slow one
+        self.assertGreater(pipeline.get_stats()["fast"]["blocked_seconds"], 0.05)
+
+    def test_failed_stage(self):
+        def fail_on_3(x):
+            if x == 3:
+                raise ValueError("bad item")
+            return x
+
+        pipeline = StagedPipeline([("check", fail_on_3), ("identity", lambda x: x)], queue_size=1)
+        pipeline.start()
+        with self.assertRaises(PipelineError) as context:
+            for i in range(100):
+                pipeline.put(i)
+                time.sleep(0.005)
+        self.assertIsInstance(context.exception.__cause__, ValueError)
+
+        # the items before the failed one went through
+        self.assertEqual(pipeline.close(cancel=True), [0, 1, 2])
+        with self.assertRaises(PipelineError):
+            pipeline.check()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from haystack import Document
+from lib.wiki.index.store.bulk_writers import BulkWriteError, ElasticsearchBulkWriter, WeaviateBulkWriter
+
+
+def documents():
+    return [
+        Document(id="a", content="Stegosaurus", meta={"title": "Stegosaurus"}),
+        Document(id="b", content="Plates", meta={"title": "Stegosaurus"}, embedding=[0.5, 1.0]),
+    ]
+
+
+class TestElasticsearchBulkWriter(unittest.TestCase):
+    @patch("lib.wiki.index.store.bulk_writers.parallel_bulk")
+    def test_write_documents(self, parallel_bulk):
+        e_store = MagicMock()
+        actions = []
+
+        def bulk(client, actions_iter, **kwargs):
+            actions.extend(actions_iter)
+            yield True, {"create": {"_id": "a", "status": 201}}
+            yield False, {"create": {"_id": "b", "status": 409, "error": {"type": "version_conflict_engine_exception"}}}
+
+        parallel_bulk.side_effect = bulk
+        writer = ElasticsearchBulkWriter(e_store, batch_size=100, concurrency=3)
+
+        # b already exists and is skipped
+        self.assertEqual(writer.write_documents(documents()), 1)
+
+        self.assertEqual(
+            actions[0],
+            {"_op_type": "create", "_id": "a", "_source": {"id": "a", "content": "Stegosaurus", "title": "Stegosaurus"}},
+        )
+        self.assertEqual(actions[1]["_source"]["embedding"], [0.5, 1.0])
+        kwargs = parallel_bulk.call_args.kwargs
+        self.assertEqual((kwargs["chunk_size"], kwargs["thread_count"], kwargs["index"]), (100, 3, "default"))
+        e_store.client.indices.refresh.assert_called_once_with(index="default")
+
+    @patch("lib.wiki.index.store.bulk_writers.parallel_bulk")
+    def test_failed_documents(self, parallel_bulk):
+        parallel_bulk.return_value = iter(
+            [(False, {"create": {"_id": "a", "status": 400, "error": {"type": "mapper_parsing_exception"}}})]
+        )
+        e_store = MagicMock()
+
+        with self.assertRaises(BulkWriteError):
+            ElasticsearchBulkWriter(e_store).write_documents(documents())
+        e_store.client.indices.refresh.assert_not_called()
+
+
+class TestWeaviateBulkWriter(unittest.TestCase):
+    def test_write_documents(self):
+        w_store = MagicMock()
+        w_store.collection.name = "Default"
+        w_store.client.batch.failed_objects = []
+        batch = w_store.client.batch.fixed_size.return_value.__enter__.return_value
+        writer = WeaviateBulkWriter(w_store, batch_size=200, concurrency=2)
+
+        self.assertEqual(writer.write_documents(documents()), 2)
+
+        w_store.client.batch.fixed_size.assert_called_once_with(batch_size=200, concurrent_requests=2)
+        first, second = [call.kwargs for call in batch.add_object.call_args_list]
+        self.assertEqual(
+            first["properties"], {"_original_id": "a", "content": "Stegosaurus", "title": "Stegosaurus", "score": None}
+        )
+        self.assertEqual(first["collection"], "Default")
+        self.assertEqual(second["vector"], [0.5, 1.0])
+        self.assertNotEqual(first["uuid"], second["uuid"])
+
+    def test_failed_objects(self):
+        w_store = MagicMock()
+        failed_object = MagicMock(message="vector lengths don't match")
+        failed_object.object_.properties = {"_original_id": "b"}
+        w_store.client.batch.failed_objects = [failed_object]
+
+        with self.assertRaisesRegex(BulkWriteError, "'b': vector lengths"):
+            WeaviateBulkWriter(w_store).write_documents(documents())
+
+
+if __name__ == "__main__":
+    unittest.main()
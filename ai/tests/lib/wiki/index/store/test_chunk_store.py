@@ -0,0 +1,147 @@
+import os
+import tempfile
+import unittest
+from lib.wiki.index.store.chunk_store import FileChunkStore, ShardedChunkStore
+
+
+def chunk_result(page_title, contents):
+    documents = [
+        {"id": f"{page_title}-{i}", "content": content, "title": page_title, "split_id": i}
+        for i, content in enumerate(contents)
+    ]
+    return {
+        "splitter": {
+            "documents": documents,
+            "hierarchy": {
+                page_title: {"title": page_title, "sections": [], "chunks": [{"id": doc["id"]} for doc in documents]}
+            },
+        }
+    }
+
+
+class TestChunkStores(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.category_path = os.path.join(self.tmpdir.name, "Dinosaurs")
+        self.subcategory_path = os.path.join(self.category_path, "Theropods")
+        os.makedirs(self.subcategory_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def create_stores(self):
+        return [FileChunkStore(), ShardedChunkStore(os.path.join(self.tmpdir.name, "chunk_store"))]
+
+    def test_write_read_and_iterate(self):
+        for store in self.create_stores():
+            with self.subTest(store=type(store).__name__):
+                store.write_results(
+                    [
+                        (self.category_path, "Stegosaurus", "Stegosaurus.html", chunk_result("Stegosaurus", ["é", "b"])),
+                        (self.category_path, "Triceratops", "Triceratops.html", chunk_result("Triceratops", ["c"])),
+                    ]
+                )
+                store.write_result(
+                    self.subcategory_path, "Allosaurus", "Allosaurus.html", chunk_result("Allosaurus", ["d"])
+                )
+
+                self.assertEqual(
+                    store.read_result(self.category_path, "Stegosaurus", "Stegosaurus.html"),
+                    chunk_result("Stegosaurus", ["é", "b"]),
+                )
+                self.assertTrue(store.has_result(self.subcategory_path, "Allosaurus", "Allosaurus.html"))
+                self.assertFalse(store.has_result(self.category_path, "Ankylosaurus", "Ankylosaurus.html"))
+                with self.assertRaises(FileNotFoundError):
+                    store.read_result(self.category_path, "Ankylosaurus", "Ankylosaurus.html")
+
+                pages = {"Triceratops": "Triceratops.html", "Stegosaurus": "Stegosaurus.html"}
+                self.assertEqual(
+                    sorted(store.iter_results(self.category_path, pages)),
+                    [
+                        ("Stegosaurus", "Stegosaurus.html", chunk_result("Stegosaurus", ["é", "b"])),
+                        ("Triceratops", "Triceratops.html", chunk_result("Triceratops", ["c"])),
+                    ],
+                )
+                with self.assertRaises(FileNotFoundError):
+                    list(store.iter_results(self.category_path, {"Ankylosaurus": "Ankylosaurus.html"}))
+
+                # with errors, the pages that cannot be read are skipped
+                errors = {}
+                self.assertEqual(
+                    [page_title for page_title, _, _ in store.iter_results(
+                        self.category_path, {"Ankylosaurus": "Ankylosaurus.html", **pages}, errors
+                    )],
+                    ["Stegosaurus", "Triceratops"] if isinstance(store, ShardedChunkStore)
+                    else ["Triceratops", "Stegosaurus"],
+                )
+                self.assertEqual(list(errors), ["Ankylosaurus"])
+                self.assertIsInstance(errors["Ankylosaurus"], FileNotFoundError)
+                store.close()
+
+    def test_rewrite_and_delete(self):
+        for store in self.create_stores():
+            with self.subTest(store=type(store).__name__):
+                store.write_result(
+                    self.category_path, "Stegosaurus", "Stegosaurus.html", chunk_result("Stegosaurus", ["old"])
+                )
+                store.write_result(
+                    self.category_path, "Stegosaurus", "Stegosaurus.html", chunk_result("Stegosaurus", ["new"])
+                )
+                self.assertEqual(
+                    store.read_result(self.category_path, "Stegosaurus", "Stegosaurus.html"),
+                    chunk_result("Stegosaurus", ["new"]),
+                )
+
+                self.assertEqual(
+                    store.delete_result(self.category_path, "Stegosaurus", "Stegosaurus.html"),
+                    chunk_result("Stegosaurus", ["new"]),
+                )
+                self.assertIsNone(store.delete_result(self.category_path, "Stegosaurus", "Stegosaurus.html"))
+                self.assertFalse(store.has_result(self.category_path, "Stegosaurus", "Stegosaurus.html"))
+                store.close()
+
+
+class TestFileChunkStore(unittest.TestCase):
+    def test_iter_results_corrupt_result(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = FileChunkStore()
+            store.write_result(tmpdir, "Stegosaurus", "Stegosaurus.html", chunk_result("Stegosaurus", ["a"]))
+            store.write_result(tmpdir, "Triceratops", "Triceratops.html", chunk_result("Triceratops", ["b"]))
+            with open(FileChunkStore.chunk_filepath(tmpdir, "Stegosaurus.html"), "wb") as file:
+                file.write(b'{"splitter": ')
+
+            errors = {}
+            pages = {"Stegosaurus": "Stegosaurus.html", "Triceratops": "Triceratops.html"}
+            self.assertEqual(
+                [page_title for page_title, _, _ in store.iter_results(tmpdir, pages, errors)], ["Triceratops"]
+            )
+            self.assertEqual(list(errors), ["Stegosaurus"])
+
+
+class TestShardedChunkStore(unittest.TestCase):
+    def test_shards_rotate_and_stream_in_storage_order(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store_dir = os.path.join(tmpdir, "chunk_store")
+            category_path = os.path.join(tmpdir, "Dinosaurs")
+            store = ShardedChunkStore(store_dir, max_shard_bytes=1)
+            for i in range(3):
+                store.write_result(category_path, f"Page{i}", f"Page{i}.html", chunk_result(f"Page{i}", ["x" * i]))
+            store.close()
+
+            self.assertEqual(
+                sorted(name for name in os.listdir(store_dir) if name.endswith(".jsonl")),
+                ["shard_00000.jsonl", "shard_00001.jsonl", "shard_00002.jsonl"],
+            )
+
+            # the index and shards persist across instances
+            store = ShardedChunkStore(store_dir)
+            pages = {f"Page{i}": f"Page{i}.html" for i in reversed(range(3))}
+            self.assertEqual(
+                [page_title for page_title, _, _ in store.iter_results(category_path + "/", pages)],
+                ["Page0", "Page1", "Page2"],
+            )
+            store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
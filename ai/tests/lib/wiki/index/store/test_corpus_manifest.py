@@ -0,0 +1,92 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from lib.wiki.index.store.corpus_manifest import CorpusManifest
+
+
+class TestCorpusManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root_path = os.path.join(self.tmpdir.name, "Dinosaurs")
+        self.manifest = CorpusManifest(os.path.join(self.tmpdir.name, "manifest", "corpus.sqlite"))
+
+    def tearDown(self):
+        self.manifest.close()
+        self.tmpdir.cleanup()
+
+    def write_category(self, filepath, title_pathname, page_filenames):
+        os.makedirs(os.path.join(filepath, ".metadata/download"))
+        with open(os.path.join(filepath, ".metadata/download/title_pathname.json"), "w") as file:
+            json.dump(title_pathname, file)
+        for page_filename in page_filenames:
+            with open(os.path.join(filepath, page_filename), "w") as file:
+                file.write("<p>page</p>")
+
+    def test_record_and_query(self):
+        root_members = {
+            "pages": {"Stegosaurus": "Stegosaurus.html", "Missing": "Missing.html"},
+            "categories": {"Ornithischians": "Ornithischians", "Theropods": "Theropods"},
+        }
+        self.manifest.record_category("Dinosaurs", self.root_path, root_members)
+        self.manifest.record_category(
+            "Ornithischians",
+            os.path.join(self.root_path, "Ornithischians"),
+            {"pages": {"Stegosaurus": "Stegosaurus.html"}, "categories": {}},
+        )
+        self.manifest.record_pages(self.root_path, {"Stegosaurus": "Stegosaurus.html"})
+        self.manifest.set_page_status("chunked", ["Stegosaurus"])
+
+        title_pathname, pages_filename_set, categories_dirname_set = (
+            self.manifest.get_category_layout("Dinosaurs")
+        )
+        self.assertEqual(title_pathname, root_members)
+        self.assertEqual(pages_filename_set, {"Stegosaurus.html"})
+        self.assertEqual(categories_dirname_set, {"Ornithischians"})
+        self.assertEqual(self.manifest.list_stored_pages("Ornithischians"), set())
+        self.assertEqual(self.manifest.get_pages("chunked", done=True), [("Stegosaurus", self.root_path, "Stegosaurus.html")])
+        self.assertEqual(self.manifest.get_pages("indexed", done=False), [("Stegosaurus", self.root_path, "Stegosaurus.html")])
+        self.assertEqual(self.manifest.count_pages(), {"downloaded": 1, "chunked": 1, "indexed": 0})
+        with self.assertRaises(KeyError):
+            self.manifest.get_title_pathname("Theropods")
+        with self.assertRaises(ValueError):
+            self.manifest.set_page_status("embedded", ["Stegosaurus"])
+
+    def test_import_directory_tree(self):
+        ornithischians_path = os.path.join(self.root_path, "Ornithischians")
+        self.write_category(
+            self.root_path,
+            {
+                "pages": {"Stegosaurus": "Stegosaurus.html", "Triceratops": "Triceratops.html"},
+                "categories": {"Ornithischians": "Ornithischians", "Theropods": "Theropods"},
+            },
+            ["Stegosaurus.html"],
+        )
+        self.write_category(
+            ornithischians_path,
+            {"pages": {"Iguanodon": "Iguanodon.html"}, "categories": {}},
+            ["Iguanodon.html"],
+        )
+        redis_client = MagicMock()
+        redis_client.smembers.side_effect = lambda key: {
+            "downloaded_pages": {b"Stegosaurus", b"Iguanodon"},
+            "chunked_pages": {b"Iguanodon"},
+            "chunked_categories": {b"Ornithischians"},
+        }.get(key, set())
+
+        num_categories = self.manifest.import_directory_tree("Dinosaurs", self.root_path)
+        self.manifest.sync_status(redis_client)
+
+        self.assertEqual(num_categories, 2)
+        self.assertEqual(self.manifest.list_stored_pages("Dinosaurs"), {"Stegosaurus.html"})
+        self.assertEqual(self.manifest.list_subcategory_dirnames("Dinosaurs"), {"Ornithischians"})
+        self.assertEqual(
+            self.manifest.get_title_pathname("Ornithischians"),
+            {"pages": {"Iguanodon": "Iguanodon.html"}, "categories": {}},
+        )
+        self.assertEqual(self.manifest.count_pages(), {"downloaded": 2, "chunked": 1, "indexed": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
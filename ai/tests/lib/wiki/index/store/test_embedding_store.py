@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from haystack import Document
+from lib.wiki.index.store.embedding_store import FileEmbeddingStore
+
+
+def embedded_documents():
+    return [
+        Document(id="a", content="Stegosaurus", meta={"title": "Stegosaurus", "h2": "Description"}, embedding=[0.1, 0.2, 0.3]),
+        Document(id="b", content="Plates", meta={"title": "Stegosaurus"}, embedding=[-1.5, 0.0, 2.25]),
+    ]
+
+
+class TestFileEmbeddingStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filepath = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write_read_delete(self):
+        store = FileEmbeddingStore()
+        self.assertIsNone(store.read_documents(self.filepath, "Stegosaurus.html"))
+
+        store.write_documents(self.filepath, "Stegosaurus.html", embedded_documents())
+
+        self.assertTrue(store.has_documents(self.filepath, "Stegosaurus.html"))
+        matrix = np.load(os.path.join(self.filepath, ".metadata/index/embeddings/Stegosaurus.npy"))
+        self.assertEqual((matrix.shape, matrix.dtype), ((2, 3), np.float32))
+        documents = store.read_documents(self.filepath, "Stegosaurus.html")
+        self.assertEqual([doc.id for doc in documents], ["a", "b"])
+        self.assertEqual(documents[0].meta, {"title": "Stegosaurus", "h2": "Description"})
+        # rows of the memory-mapped matrix
+        self.assertIsInstance(documents[1].embedding, np.memmap)
+        np.testing.assert_array_equal(documents[1].embedding, np.float32([-1.5, 0.0, 2.25]))
+
+        self.assertTrue(store.delete_documents(self.filepath, "Stegosaurus.html"))
+        self.assertFalse(store.has_documents(self.filepath, "Stegosaurus.html"))
+        self.assertFalse(store.delete_documents(self.filepath, "Stegosaurus.html"))
+
+    def test_float16_and_empty(self):
+        store = FileEmbeddingStore("float16")
+        store.write_documents(self.filepath, "Stegosaurus.html", embedded_documents())
+        store.write_documents(self.filepath, "Empty.html", [])
+
+        documents = store.read_documents(self.filepath, "Stegosaurus.html")
+        self.assertEqual(documents[0].embedding.dtype, np.float16)
+        np.testing.assert_allclose(documents[0].embedding, [0.1, 0.2, 0.3], rtol=1e-3)
+        self.assertEqual(store.read_documents(self.filepath, "Empty.html"), [])
+        with self.assertRaises(ValueError):
+            FileEmbeddingStore("float64")
+
+    def test_legacy_json(self):
+        embeddings_path = os.path.join(self.filepath, ".metadata/index/embeddings")
+        os.makedirs(embeddings_path)
+        with open(os.path.join(embeddings_path, "Stegosaurus.json"), "w") as file:
+            json.dump({"documents": [doc.to_dict() for doc in embedded_documents()], "meta": {}}, file)
+        store = FileEmbeddingStore()
+
+        documents = store.read_documents(self.filepath, "Stegosaurus.html")
+
+        self.assertEqual([doc.embedding for doc in documents], [[0.1, 0.2, 0.3], [-1.5, 0.0, 2.25]])
+        self.assertTrue(store.delete_documents(self.filepath, "Stegosaurus.html"))
+        self.assertFalse(os.listdir(embeddings_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
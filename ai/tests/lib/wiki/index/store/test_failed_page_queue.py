@@ -0,0 +1,39 @@
+import json
+import unittest
+from unittest.mock import MagicMock
+from lib.wiki.index.store.failed_page_queue import FailedPageQueue
+
+
+class TestFailedPageQueue(unittest.TestCase):
+    def setUp(self):
+        self.hash = {}
+        self.redis = MagicMock()
+        self.redis.hget.side_effect = lambda name, key: self.hash.get(key)
+        self.redis.hset.side_effect = lambda name, key, value: self.hash.__setitem__(key, value)
+        self.redis.hdel.side_effect = lambda name, key: self.hash.pop(key, None)
+        self.redis.hgetall.side_effect = lambda name: {key.encode(): value for key, value in self.hash.items()}
+        self.queue = FailedPageQueue(self.redis, max_attempts=2)
+
+    def test_add(self):
+        self.assertEqual(self.queue.add("Stegosaurus", "/data/Dinosaurs", "Stegosaurus.html", "weaviate", "timeout"), 1)
+        self.assertEqual(self.queue.add("Stegosaurus", "/data/Dinosaurs", "Stegosaurus.html", "neo4j", "deadlock"), 2)
+
+        entry = self.queue.get_pages()["Stegosaurus"]
+        self.assertEqual(
+            {key: entry[key] for key in ["filepath", "filename", "stage", "reason", "attempts"]},
+            {"filepath": "/data/Dinosaurs", "filename": "Stegosaurus.html", "stage": "neo4j", "reason": "deadlock",
+             "attempts": 2},
+        )
+        self.assertEqual(self.redis.hset.call_args.args[0], "failed_pages")
+        self.assertEqual(json.loads(self.hash["Stegosaurus"])["attempts"], 2)
+
+    def test_remove(self):
+        self.queue.add("Stegosaurus", "/data/Dinosaurs", "Stegosaurus.html", "weaviate", "timeout")
+
+        self.queue.remove("Stegosaurus")
+
+        self.assertEqual(self.queue.get_pages(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
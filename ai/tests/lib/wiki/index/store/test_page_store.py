@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from lib.wiki.index.store.page_store import PackedPageStore
+
+
+class TestPackedPageStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store_dir = os.path.join(self.tmpdir.name, "page_store")
+        self.category_path = os.path.join(self.tmpdir.name, "Dinosaurs")
+        os.makedirs(self.category_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_write_and_read_page(self):
+        store = PackedPageStore(self.store_dir)
+        store.write_page(self.category_path, "Stegosaurus", "Stegosaurus.html", "<p>Stegosaurus é</p>")
+        store.write_page(self.category_path + "/", "Triceratops", "Triceratops.html", "<p>Triceratops</p>")
+        store.write_page(
+            os.path.join(self.category_path, "Ornithischians"), "Iguanodon", "Iguanodon.html", "<p>Iguanodon</p>"
+        )
+
+        self.assertEqual(
+            store.read_page(self.category_path, "Stegosaurus", "Stegosaurus.html"), "<p>Stegosaurus é</p>"
+        )
+        self.assertEqual(store.list_pages(self.category_path), {"Stegosaurus.html", "Triceratops.html"})
+        self.assertTrue(store.has_page(self.category_path, "Triceratops", "Triceratops.html"))
+        self.assertFalse(store.has_page(self.category_path, "Ankylosaurus", "Ankylosaurus.html"))
+        with self.assertRaises(FileNotFoundError):
+            store.read_page(self.category_path, "Ankylosaurus", "Ankylosaurus.html")
+        store.close()
+
+        # the index and segments persist across instances
+        store = PackedPageStore(self.store_dir)
+        self.assertEqual(
+            store.read_page(self.category_path, "Triceratops", "Triceratops.html"), "<p>Triceratops</p>"
+        )
+        store.close()
+
+    def test_rewrite_page(self):
+        store = PackedPageStore(self.store_dir)
+        store.write_page(self.category_path, "Stegosaurus", "Stegosaurus.html", "<p>old</p>")
+        store.write_page(self.category_path, "Stegosaurus", "Stegosaurus.html", "<p>new</p>")
+
+        self.assertEqual(store.read_page(self.category_path, "Stegosaurus", "Stegosaurus.html"), "<p>new</p>")
+        self.assertEqual(store.list_pages(self.category_path), {"Stegosaurus.html"})
+        store.close()
+
+    def test_segment_rotation(self):
+        store = PackedPageStore(self.store_dir, max_segment_bytes=1)
+        pages = {f"Page{i}": f"<p>{'dinosaur ' * i}</p>" for i in range(3)}
+        for page_title, page_html in pages.items():
+            store.write_page(self.category_path, page_title, f"{page_title}.html", page_html)
+
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.store_dir) if name.endswith(".pack")),
+            ["segment_00000.pack", "segment_00001.pack", "segment_00002.pack"],
+        )
+        for page_title, page_html in pages.items():
+            self.assertEqual(store.read_page(self.category_path, page_title, f"{page_title}.html"), page_html)
+        store.close()
+
+    def test_pack_files(self):
+        for page_title in ["Stegosaurus", "Triceratops"]:
+            with open(os.path.join(self.category_path, f"{page_title}.html"), "w") as file:
+                file.write(f"<p>{page_title}</p>")
+
+        store = PackedPageStore(self.store_dir)
+        num_packed = store.pack_files(
+            self.category_path,
+            {"Stegosaurus": "Stegosaurus.html", "Triceratops": "Triceratops.html", "Missing": "Missing.html"},
+        )
+
+        self.assertEqual(num_packed, 2)
+        self.assertEqual(os.listdir(self.category_path), [])
+        self.assertEqual(
+            store.read_page(self.category_path, "Triceratops", "Triceratops.html"), "<p>Triceratops</p>"
+        )
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
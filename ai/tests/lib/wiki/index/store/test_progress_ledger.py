@@ -0,0 +1,99 @@
+import unittest
+from unittest.mock import patch
+from lib.wiki.index.store.progress_ledger import ProgressLedger, RedisSetLedger
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@unittest.skipUnless(fakeredis, "fakeredis is required for the progress ledger tests")
+class TestProgressLedger(unittest.TestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.redis.sadd("chunked_pages", "Page1", "Page2")
+
+    def test_set_is_loaded_once(self):
+        ledger = ProgressLedger(self.redis)
+        with patch.object(self.redis, "smembers", wraps=self.redis.smembers) as mock_smembers, patch.object(
+            self.redis, "sismember"
+        ) as mock_sismember:
+            self.assertTrue(ledger.contains("chunked_pages", "Page1"))
+            self.assertFalse(ledger.contains("chunked_pages", "Page3"))
+            self.assertEqual(ledger.contains_many("chunked_pages", ["Page2", "Page3"]), [True, False])
+
+        mock_smembers.assert_called_once_with("chunked_pages")
+        mock_sismember.assert_not_called()
+
+    def test_batched_durability(self):
+        ledger = ProgressLedger(self.redis, durability="batched", batch_size=2)
+
+        ledger.add("chunked_pages", "Page3")
+        self.assertTrue(ledger.contains("chunked_pages", "Page3"))
+        self.assertFalse(self.redis.sismember("chunked_pages", "Page3"))
+
+        ledger.add("chunked_categories", "Category1")
+        self.assertTrue(self.redis.sismember("chunked_pages", "Page3"))
+        self.assertTrue(self.redis.sismember("chunked_categories", "Category1"))
+
+    def test_immediate_and_deferred_durability(self):
+        immediate_ledger = ProgressLedger(self.redis, durability="immediate")
+        immediate_ledger.add("chunked_pages", "Page3")
+        self.assertTrue(self.redis.sismember("chunked_pages", "Page3"))
+
+        deferred_ledger = ProgressLedger(self.redis, durability="deferred", batch_size=1)
+        deferred_ledger.add("chunked_pages", "Page4")
+        deferred_ledger.add("chunked_pages", "Page5")
+        self.assertFalse(self.redis.sismember("chunked_pages", "Page4"))
+        deferred_ledger.flush()
+        self.assertEqual(
+            self.redis.smembers("chunked_pages"),
+            {b"Page1", b"Page2", b"Page3", b"Page4", b"Page5"},
+        )
+
+        with self.assertRaises(ValueError):
+            ProgressLedger(self.redis, durability="never")
+
+    def test_remove_drops_pending_completion(self):
+        ledger = ProgressLedger(self.redis, durability="deferred")
+        ledger.add("chunked_pages", "Page3")
+        ledger.remove("chunked_pages", "Page3")
+        ledger.remove("chunked_pages", "Page1")
+        ledger.flush()
+
+        self.assertFalse(ledger.contains("chunked_pages", "Page1"))
+        self.assertEqual(self.redis.smembers("chunked_pages"), {b"Page2"})
+
+    def test_add_and_remove_many(self):
+        ledger = ProgressLedger(self.redis, durability="deferred")
+        ledger.add_many("neo4j_pages", ["Page1", "Page2", "Page3"])
+        ledger.flush()
+        ledger.add_many("neo4j_pages", ["Page4", "Page5"])
+
+        with patch.object(self.redis, "srem", wraps=self.redis.srem) as mock_srem:
+            ledger.remove_many("neo4j_pages", ["Page1", "Page2", "Page4"])
+        ledger.flush()
+
+        mock_srem.assert_called_once()
+        self.assertEqual(ledger.contains_many("neo4j_pages", ["Page1", "Page3", "Page4"]), [False, True, False])
+        self.assertEqual(self.redis.smembers("neo4j_pages"), {b"Page3", b"Page5"})
+
+
+@unittest.skipUnless(fakeredis, "fakeredis is required for the progress ledger tests")
+class TestRedisSetLedger(unittest.TestCase):
+    def test_many(self):
+        redis_client = fakeredis.FakeRedis()
+        ledger = RedisSetLedger(redis_client)
+
+        ledger.add_many("neo4j_pages", ["Page1", "Page2", "Page3"])
+        ledger.remove_many("neo4j_pages", ["Page2"])
+        ledger.add_many("neo4j_pages", [])
+
+        self.assertEqual(ledger.contains_many("neo4j_pages", ["Page1", "Page2", "Page3"]), [True, False, True])
+        self.assertEqual(ledger.contains_many("neo4j_pages", []), [])
+        self.assertEqual(redis_client.smembers("neo4j_pages"), {b"Page1", b"Page3"})
+
+
+if __name__ == "__main__":
+    unittest.main()
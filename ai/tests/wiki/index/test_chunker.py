@@ -1,13 +1,19 @@
+import json
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 from wiki.index.chunker import Chunker
+from lib.wiki.index.store.page_store import PackedPageStore
+from lib.wiki.index.store.chunk_store import FileChunkStore, ShardedChunkStore
+from lib.wiki.index.store.corpus_manifest import CorpusManifest
 from pathlib import Path
-@patch("wiki.index.chunker.Path.glob")
-@patch("wiki.index.chunker.Path.iterdir")
+@patch("lib.wiki.index.store.corpus_manifest.Path.glob")
+@patch("lib.wiki.index.store.corpus_manifest.Path.iterdir")
 class TestChunker(unittest.TestCase):
     @patch("wiki.index.chunker.os.path.exists")
     @patch("wiki.index.chunker.os.makedirs")
-    @patch("wiki.index.chunker.get_title_pathname_map")
+    @patch("lib.wiki.index.store.corpus_manifest.get_title_pathname_map")
     @patch("wiki.index.chunker.Chunker.chunk_page")
     @patch("wiki.index.chunker.redis.Redis")
     def test_chunk_wiki_data(
@@ -71,5 +77,182 @@ class TestChunker(unittest.TestCase):
         mock_redis_instance.sadd.assert_any_call("chunked_categories", "SubCategory1")
 
 
+class TestChunkPage(unittest.TestCase):
+    def test_packed_page_store_chunks_match_files(self):
+        page_html = "<p>Stegosaurus is a genus.</p>\n<h2>Description</h2>\n<p>Large.</p>\n<ul><li>Plates</li></ul>"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            files_path = os.path.join(tmpdir, "files", "Dinosaurs")
+            packed_path = os.path.join(tmpdir, "packed", "Dinosaurs")
+            os.makedirs(files_path)
+            os.makedirs(packed_path)
+            with open(os.path.join(files_path, "Stegosaurus.html"), "w") as file:
+                file.write(page_html)
+            page_store = PackedPageStore(os.path.join(tmpdir, "page_store"))
+            page_store.write_page(packed_path, "Stegosaurus", "Stegosaurus.html", page_html)
+
+            Chunker(MagicMock(), MagicMock()).chunk_page(files_path, "Stegosaurus", "Stegosaurus.html")
+            Chunker(MagicMock(), MagicMock(), page_store).chunk_page(
+                packed_path, "Stegosaurus", "Stegosaurus.html"
+            )
+            page_store.close()
+
+            results = []
+            for filepath in [files_path, packed_path]:
+                with open(os.path.join(filepath, ".metadata/chunk/Stegosaurus.json")) as file:
+                    results.append(json.load(file))
+
+        # chunk ids are random, everything else must match
+        documents = [
+            [
+                {key: value for key, value in doc.items() if key != "id"}
+                for doc in result["splitter"]["documents"]
+            ]
+            for result in results
+        ]
+        self.assertEqual(len(documents[0]), 3)
+        self.assertEqual(documents[0], documents[1])
+
+class TestChunkWikiDataFromManifest(unittest.TestCase):
+    @patch("lib.wiki.index.store.corpus_manifest.get_title_pathname_map")
+    @patch("wiki.index.chunker.Chunker.chunk_page")
+    def test_chunk_wiki_data_from_manifest(self, mock_chunk_page, mock_get_title_pathname_map):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manifest = CorpusManifest(os.path.join(tmpdir, "corpus.sqlite"))
+            manifest.record_category(
+                "TestCategory",
+                "/test/path",
+                {
+                    "pages": {"Page1": "page1.html", "Page2": "page2.html"},
+                    "categories": {"SubCategory1": "subcategory1", "SubCategory2": "subcategory2"},
+                },
+            )
+            manifest.record_category(
+                "SubCategory1", "/test/path/subcategory1", {"pages": {"SubPage1": "subpage1.html"}, "categories": {}}
+            )
+            manifest.record_pages("/test/path", {"Page1": "page1.html"})
+            manifest.record_pages("/test/path/subcategory1", {"SubPage1": "subpage1.html"})
+            redis_client = MagicMock()
+            redis_client.sismember.return_value = False
+
+            chunker = Chunker(MagicMock(), redis_client, manifest=manifest)
+            category_pages_chunked = {}
+            num_pages_chunked = chunker.chunk_wiki_data("TestCategory", "/test/path", category_pages_chunked)
+
+            self.assertEqual(num_pages_chunked, 2)
+            self.assertEqual(category_pages_chunked, {"TestCategory": 1, "SubCategory1": 1})
+            mock_chunk_page.assert_any_call("/test/path", "Page1", "page1.html")
+            mock_chunk_page.assert_any_call("/test/path/subcategory1", "SubPage1", "subpage1.html")
+            mock_get_title_pathname_map.assert_not_called()
+            self.assertEqual(manifest.count_pages(), {"downloaded": 2, "chunked": 2, "indexed": 0})
+            manifest.close()
+
+
+class TestChunkWikiDataParallel(unittest.TestCase):
+    def write_category(self, filepath, title_pathname):
+        os.makedirs(os.path.join(filepath, ".metadata/download"))
+        with open(os.path.join(filepath, ".metadata/download/title_pathname.json"), "w") as file:
+            json.dump(title_pathname, file)
+        for page_title, page_filename in title_pathname["pages"].items():
+            with open(os.path.join(filepath, page_filename), "w") as file:
+                file.write(f"<p>{page_title} is a dinosaur.</p>\n<h2>Description</h2>\n<p>{page_title} was large.</p>")
+
+    def read_chunks(self, filepath, page_filename):
+        with open(os.path.join(filepath, ".metadata/chunk", page_filename.replace(".html", ".json"))) as file:
+            result = json.load(file)
+        return [
+            {key: value for key, value in doc.items() if key != "id"}
+            for doc in result["splitter"]["documents"]
+        ]
+
+    def test_parallel_matches_serial(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = []
+            for processes, batch_size in [(1, 1), (2, 1), (1, 8), (2, 8)]:
+                root_path = os.path.join(tmpdir, f"{processes}_{batch_size}", "Dinosaurs")
+                self.write_category(
+                    root_path,
+                    {
+                        "pages": {"Stegosaurus": "Stegosaurus.html", "Triceratops": "Triceratops.html"},
+                        "categories": {"Theropods": "Theropods", "Sauropods": "Sauropods"},
+                    },
+                )
+                self.write_category(
+                    os.path.join(root_path, "Theropods"),
+                    {"pages": {"Allosaurus": "Allosaurus.html", "Stegosaurus": "Stegosaurus.html"}, "categories": {}},
+                )
+                redis_sets = {"chunked_pages": {"Triceratops"}}
+                redis_client = MagicMock()
+                redis_client.sismember.side_effect = lambda key, title: title in redis_sets.get(key, set())
+                redis_client.sadd.side_effect = lambda key, title: redis_sets.setdefault(key, set()).add(title)
+
+                category_pages_chunked = {}
+                chunker = Chunker(MagicMock(), redis_client, processes=processes, batch_size=batch_size)
+                num_pages_chunked = chunker.chunk_wiki_data("Dinosaurs", root_path, category_pages_chunked)
+
+                self.assertEqual(num_pages_chunked, 2)
+                self.assertEqual(category_pages_chunked, {"Dinosaurs": 1, "Theropods": 1})
+                redis_client.sadd.assert_any_call("chunked_pages", "Allosaurus")
+                redis_client.sadd.assert_any_call("chunked_categories", "Theropods")
+                self.assertFalse(
+                    os.path.exists(os.path.join(root_path, ".metadata/chunk/Triceratops.json"))
+                )
+                results.append(
+                    [
+                        self.read_chunks(root_path, "Stegosaurus.html"),
+                        self.read_chunks(os.path.join(root_path, "Theropods"), "Allosaurus.html"),
+                    ]
+                )
+
+        for result in results[1:]:
+            self.assertEqual(result, results[0])
+
+
+class TestChunkWikiDataShardedChunkStore(unittest.TestCase):
+    def test_sharded_chunk_store_matches_files(self):
+        title_pathname = {
+            "pages": {"Stegosaurus": "Stegosaurus.html", "Triceratops": "Triceratops.html"},
+            "categories": {},
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            results = []
+            for chunk_store in [FileChunkStore(), ShardedChunkStore(os.path.join(tmpdir, "chunk_store"))]:
+                root_path = os.path.join(tmpdir, type(chunk_store).__name__, "Dinosaurs")
+                os.makedirs(os.path.join(root_path, ".metadata/download"))
+                with open(os.path.join(root_path, ".metadata/download/title_pathname.json"), "w") as file:
+                    json.dump(title_pathname, file)
+                for page_title, page_filename in title_pathname["pages"].items():
+                    with open(os.path.join(root_path, page_filename), "w") as file:
+                        file.write(f"<p>{page_title} is a dinosaur.</p>\n<h2>Description</h2>\n<p>It was large.</p>")
+
+                redis_client = MagicMock()
+                redis_client.sismember.return_value = False
+                chunker = Chunker(MagicMock(), redis_client, batch_size=8, chunk_store=chunk_store)
+                self.assertEqual(chunker.chunk_wiki_data("Dinosaurs", root_path, {}), 2)
+
+                results.append(
+                    [
+                        (
+                            page_title,
+                            [
+                                {key: value for key, value in doc.items() if key != "id"}
+                                for doc in result["splitter"]["documents"]
+                            ],
+                        )
+                        for page_title, _, result in sorted(
+                            chunk_store.iter_results(root_path, title_pathname["pages"])
+                        )
+                    ]
+                )
+                chunk_store.close()
+
+            # the sharded store writes no chunk files
+            self.assertFalse(
+                os.path.exists(os.path.join(tmpdir, "ShardedChunkStore", "Dinosaurs", ".metadata/chunk"))
+            )
+
+        self.assertEqual(len(results[0][0][1]), 2)
+        self.assertEqual(results[0], results[1])
+
+
 if __name__ == "__main__":
     unittest.main()
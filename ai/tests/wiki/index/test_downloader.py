@@ -1,3 +1,6 @@
+import json
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
 from wiki.index.downloader import Downloader
@@ -51,6 +54,129 @@ class TestDownloader(unittest.TestCase):
         mock_redis_instance.sadd.assert_any_call("downloaded_pages", "SubPage1")
         mock_redis_instance.sadd.assert_any_call("downloaded_categories", "SubCategory1")
 
+    @patch("wiki.index.downloader.os.path.exists")
+    @patch("wiki.index.downloader.get_title_pathname_map")
+    @patch("wiki.index.downloader.redis.Redis")
+    def test_fetch_wiki_data_with_page_downloader(
+        self,
+        mock_redis_class,
+        mock_get_title_pathname_map,
+        mock_exists,
+    ):
+        mock_exists.return_value = True
+        mock_get_title_pathname_map.return_value = {
+            "pages": {"Page1": "page1.html", "Page2": "page2.html", "Page3": "page3.html"},
+            "categories": {},
+        }
+        mock_redis_instance = MagicMock()
+        mock_redis_class.return_value = mock_redis_instance
+        mock_redis_instance.sismember.side_effect = lambda key, title: title == "Page3"
+
+        page_downloader = MagicMock()
+        page_downloader.download_pages.return_value = {
+            "Page1": None,
+            "Page2": Exception("boom"),
+        }
+
+        logger = MagicMock()
+        downloader = Downloader(logger, mock_redis_instance, page_downloader)
+        category_pages_downloaded = {}
+        num_pages_downloaded = downloader.fetch_wiki_data(
+            "TestCategory", "/test/path", [], category_pages_downloaded, 1
+        )
+
+        self.assertEqual(num_pages_downloaded, 1)
+        self.assertEqual(category_pages_downloaded, {"TestCategory": 1})
+        page_downloader.download_pages.assert_called_once_with(
+            {"Page1": "page1.html", "Page2": "page2.html"}, "/test/path"
+        )
+        mock_redis_instance.sadd.assert_called_once_with("downloaded_pages", "Page1")
+        logger.error.assert_called_once()
+
+
+    @patch("wiki.index.downloader.get_latest_revisions")
+    @patch("wiki.index.downloader.download_page")
+    def test_refresh_wiki_data(self, mock_download_page, mock_get_latest_revisions):
+        with tempfile.TemporaryDirectory() as filepath:
+            subcategory_path = os.path.join(filepath, "subcategory1")
+            for path, title_pathname, manifest in [
+                (
+                    filepath,
+                    {"pages": {"Page1": "page1.html"}, "categories": {"SubCategory1": "subcategory1"}},
+                    {"Page1": {"lastrevid": 10, "fetched_at": "2024-01-01T00:00:00+00:00"}},
+                ),
+                (
+                    subcategory_path,
+                    {"pages": {"SubPage1": "subpage1.html", "SubPage2": "subpage2.html"}, "categories": {}},
+                    {
+                        "SubPage1": {"lastrevid": 20, "fetched_at": "2024-01-01T00:00:00+00:00"},
+                        "SubPage2": {"lastrevid": 30, "fetched_at": "2024-01-01T00:00:00+00:00"},
+                    },
+                ),
+            ]:
+                os.makedirs(os.path.join(path, ".metadata/download"))
+                os.makedirs(os.path.join(path, ".metadata/chunk"))
+                with open(os.path.join(path, ".metadata/download/title_pathname.json"), "w") as file:
+                    json.dump(title_pathname, file)
+                with open(os.path.join(path, ".metadata/download/revisions.json"), "w") as file:
+                    json.dump(manifest, file)
+                for page_filename in title_pathname["pages"].values():
+                    open(os.path.join(path, page_filename), "w").close()
+            with open(os.path.join(subcategory_path, ".metadata/chunk/subpage2.json"), "w") as file:
+                json.dump({"splitter": {"documents": [{"id": "c1"}, {"id": "c2"}], "hierarchy": {}}}, file)
+
+            # Only SubPage2 has a new revision
+            mock_get_latest_revisions.side_effect = [
+                {"Page1": 10},
+                {"SubPage1": 20, "SubPage2": 31},
+            ]
+            mock_redis_instance = MagicMock()
+
+            failed_pages = MagicMock()
+
+            downloader = Downloader(MagicMock(), mock_redis_instance, track_revisions=True, failed_pages=failed_pages)
+            category_pages_refreshed = {}
+            num_pages_refreshed = downloader.refresh_wiki_data(
+                "TestCategory", filepath, category_pages_refreshed, 2
+            )
+
+            self.assertEqual(num_pages_refreshed, 1)
+            self.assertEqual(category_pages_refreshed, {"SubCategory1": 1})
+            mock_download_page.assert_called_once_with("SubPage2", "subpage2.html", subcategory_path)
+            mock_redis_instance.sadd.assert_any_call("stale_chunks", "c1", "c2")
+            mock_redis_instance.srem.assert_any_call("chunked_pages", "SubPage2")
+            mock_redis_instance.srem.assert_any_call("indexed_pages", "SubPage2")
+            mock_redis_instance.srem.assert_any_call("chunked_categories", "SubCategory1")
+            mock_redis_instance.srem.assert_any_call("indexed_categories", "SubCategory1")
+            failed_pages.remove.assert_called_once_with("SubPage2")
+            self.assertFalse(os.path.exists(os.path.join(subcategory_path, ".metadata/chunk/subpage2.json")))
+            with open(os.path.join(subcategory_path, ".metadata/download/revisions.json")) as file:
+                self.assertEqual(json.load(file)["SubPage2"]["lastrevid"], 31)
+
+    @patch("wiki.index.downloader.get_latest_revisions")
+    @patch("wiki.index.downloader.download_page")
+    def test_refresh_wiki_data_stopped_before_flagging(self, mock_download_page, mock_get_latest_revisions):
+        with tempfile.TemporaryDirectory() as filepath:
+            os.makedirs(os.path.join(filepath, ".metadata/download"))
+            with open(os.path.join(filepath, ".metadata/download/title_pathname.json"), "w") as file:
+                json.dump({"pages": {"Page1": "page1.html"}, "categories": {}}, file)
+            with open(os.path.join(filepath, ".metadata/download/revisions.json"), "w") as file:
+                json.dump({"Page1": {"lastrevid": 10, "fetched_at": "2024-01-01T00:00:00+00:00"}}, file)
+            open(os.path.join(filepath, "page1.html"), "w").close()
+
+            mock_get_latest_revisions.return_value = {"Page1": 11}
+            failed_pages = MagicMock()
+            failed_pages.remove.side_effect = Exception("Connection lost")
+
+            downloader = Downloader(MagicMock(), MagicMock(), track_revisions=True, failed_pages=failed_pages)
+            with self.assertRaises(Exception):
+                downloader.refresh_wiki_data("TestCategory", filepath, {}, 1)
+
+            # The page was not fully flagged, so its old revision is kept and the next refresh downloads it again
+            mock_download_page.assert_called_once()
+            with open(os.path.join(filepath, ".metadata/download/revisions.json")) as file:
+                self.assertEqual(json.load(file)["Page1"]["lastrevid"], 10)
+
 
 if __name__ == "__main__":
     unittest.main()
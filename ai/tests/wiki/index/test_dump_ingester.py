@@ -0,0 +1,129 @@
+import bz2
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from wiki.index.dump_ingester import DumpIngester, DumpIngesterException
+
+
+CATEGORYLINKS_SQL = """CREATE TABLE `categorylinks` (
+  `cl_from` int(8) unsigned NOT NULL DEFAULT 0,
+  `cl_to` varbinary(255) NOT NULL DEFAULT '',
+  `cl_type` enum('page','subcat','file') NOT NULL DEFAULT 'page',
+  PRIMARY KEY (`cl_from`,`cl_to`)
+) ENGINE=InnoDB;
+INSERT INTO `categorylinks` VALUES (1,'Dinosaurs','page'),(2,'Dinosaurs','page'),(10,'Dinosaurs','subcat'),(11,'Dinosaurs','subcat');
+INSERT INTO `categorylinks` VALUES (3,'Ornithischians','page'),(1,'Ornithischians','page'),(12,'Ornithischians','subcat'),(4,'Early_birds','page');
+"""
+
+XML_PAGES = [
+    (1, 0, "Stegosaurus", "'''Stegosaurus''' is a genus."),
+    (2, 0, "List of dinosaurs", "* Stegosaurus"),
+    (3, 0, "Triceratops", "== Description ==\nThree horns."),
+    (4, 0, "Archaeopteryx", "An early bird."),
+    (5, 0, "Python", "Not a dinosaur."),
+    (10, 14, "Category:Ornithischians", ""),
+    (11, 14, "Category:Early birds", ""),
+    (12, 14, "Category:Ankylosaurs", ""),
+]
+
+
+def write_xml_dump(path):
+    pages = "".join(
+        f"<page><title>{title}</title><ns>{ns}</ns><id>{page_id}</id><revision><text>{text}</text></revision></page>"
+        for page_id, ns, title, text in XML_PAGES
+    )
+    with bz2.open(path, "wt", encoding="utf-8") as file:
+        file.write(f"<mediawiki>{pages}</mediawiki>")
+
+
+class TestDumpIngester(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pages_path = os.path.join(self.tmpdir.name, "pages-articles.xml.bz2")
+        self.categorylinks_path = os.path.join(self.tmpdir.name, "categorylinks.sql.gz")
+        self.filepath = os.path.join(self.tmpdir.name, "Dinosaurs")
+        write_xml_dump(self.pages_path)
+        with gzip.open(self.categorylinks_path, "wt", encoding="utf-8") as file:
+            file.write(CATEGORYLINKS_SQL)
+
+        self.redis = MagicMock()
+        self.redis.sismember.return_value = False
+        self.ingester = DumpIngester(
+            MagicMock(),
+            self.redis,
+            pages_path=self.pages_path,
+            categorylinks_path=self.categorylinks_path,
+            work_dir=os.path.join(self.tmpdir.name, "work"),
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_title_pathname(self, filepath):
+        with open(os.path.join(filepath, ".metadata/download/title_pathname.json")) as file:
+            return json.load(file)
+
+    def test_ingest_wiki_data(self):
+        category_pages_downloaded = {}
+        num_pages = self.ingester.ingest_wiki_data(
+            "Dinosaurs", self.filepath, ["list of", "bird"], category_pages_downloaded, 2
+        )
+
+        self.assertEqual(num_pages, 2)
+        self.assertEqual(category_pages_downloaded, {"Dinosaurs": 1, "Ornithischians": 1})
+        self.assertEqual(
+            self.read_title_pathname(self.filepath),
+            {
+                "pages": {"Stegosaurus": "Stegosaurus.html"},
+                "categories": {"Ornithischians": "Ornithischians"},
+            },
+        )
+        subcategory_path = os.path.join(self.filepath, "Ornithischians")
+        self.assertEqual(
+            self.read_title_pathname(subcategory_path),
+            {
+                "pages": {"Stegosaurus": "Stegosaurus.html", "Triceratops": "Triceratops.html"},
+                "categories": {"Ankylosaurs": "Ankylosaurs"},
+            },
+        )
+        # depth 2: the Ankylosaurs directory is listed but not expanded
+        self.assertFalse(os.path.exists(os.path.join(subcategory_path, "Ankylosaurs")))
+
+        with open(os.path.join(self.filepath, "Stegosaurus.html")) as file:
+            self.assertEqual(file.read(), "<p>Stegosaurus is a genus.</p>")
+        with open(os.path.join(subcategory_path, "Triceratops.html")) as file:
+            self.assertEqual(file.read(), "<h2>Description</h2>\n<p>Three horns.</p>")
+        # a page in several categories is only written to the first one
+        self.assertFalse(os.path.exists(os.path.join(subcategory_path, "Stegosaurus.html")))
+
+        self.redis.sadd.assert_any_call("downloaded_pages", "Stegosaurus")
+        self.redis.sadd.assert_any_call("downloaded_pages", "Triceratops")
+        self.redis.sadd.assert_any_call("downloaded_categories", "Dinosaurs")
+        self.redis.sadd.assert_any_call("downloaded_categories", "Ornithischians")
+
+    def test_ingest_skips_downloaded_pages(self):
+        self.redis.sismember.side_effect = lambda key, title: title == "Stegosaurus"
+
+        num_pages = self.ingester.ingest_wiki_data(
+            "Dinosaurs", self.filepath, ["list of", "bird"], {}, 2
+        )
+
+        self.assertEqual(num_pages, 1)
+        self.assertFalse(os.path.exists(os.path.join(self.filepath, "Stegosaurus.html")))
+
+    def test_linktarget_schema_is_rejected(self):
+        with gzip.open(self.categorylinks_path, "wt", encoding="utf-8") as file:
+            file.write(
+                "CREATE TABLE `categorylinks` (\n  `cl_from` int(8) NOT NULL,\n  `cl_target_id` bigint(20) NOT NULL\n);\n"
+                "INSERT INTO `categorylinks` VALUES (1,7);\n"
+            )
+
+        with self.assertRaises(DumpIngesterException):
+            self.ingester.ingest_wiki_data("Dinosaurs", self.filepath, [], {}, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,515 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from haystack import Document
+from haystack.document_stores.types import DuplicatePolicy
+from lib.wiki.index.chunk.near_duplicates import NearDuplicateDetector
+from lib.wiki.index.embed.embedding_scheduler import EmbeddingScheduler
+from lib.wiki.index.graph.bulk_import_exporter import Neo4jBulkImportExporter
+from lib.wiki.index.store.chunk_store import FileChunkStore
+from lib.wiki.index.store.progress_ledger import STORE_CHECKPOINT_SETS, ProgressLedger
+from tests.lib.wiki.index.embed.test_embedding_scheduler import FakeEmbedder
+from wiki.index.indexer import Indexer
+
+
+def chunk_result(page_title, contents):
+    documents = [
+        {"id": f"{page_title}-{i}", "content": content, "title": page_title, "split_id": i}
+        for i, content in enumerate(contents)
+    ]
+    return {
+        "splitter": {
+            "documents": documents,
+            "hierarchy": {
+                page_title: {"title": page_title, "sections": [], "chunks": [{"id": doc["id"]} for doc in documents]}
+            },
+        }
+    }
+
+
+class TestIndexer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmpdir.name, "Dinosaurs")
+        subcategory_path = os.path.join(self.filepath, "Theropods")
+        chunk_store = FileChunkStore()
+        for path, title_pathname in [
+            (
+                self.filepath,
+                {"pages": {"Stegosaurus": "Stegosaurus.html", "Triceratops": "Triceratops.html"},
+                 "categories": {"Theropods": "Theropods"}},
+            ),
+            (subcategory_path, {"pages": {"Allosaurus": "Allosaurus.html"}, "categories": {}}),
+        ]:
+            os.makedirs(os.path.join(path, ".metadata/download"))
+            with open(os.path.join(path, ".metadata/download/title_pathname.json"), "w") as file:
+                json.dump(title_pathname, file)
+            for page_title, page_filename in title_pathname["pages"].items():
+                with open(os.path.join(path, page_filename), "w") as file:
+                    file.write("<p>page</p>")
+                chunk_store.write_result(
+                    path, page_title, page_filename, chunk_result(page_title, [f"{page_title} chunk {i}" for i in range(3)])
+                )
+
+        # the Redis sets, updated by SADD and SREM
+        self.redis_sets = {}
+        self.redis = MagicMock()
+        self.redis.sismember.side_effect = lambda name, member: member in self.redis_sets.get(name, set())
+        self.redis.smismember.side_effect = lambda name, members: [self.redis.sismember(name, m) for m in members]
+        self.redis.sadd.side_effect = lambda name, *members: self.redis_sets.setdefault(name, set()).update(members)
+        self.redis.srem.side_effect = lambda name, *members: self.redis_sets.get(name, set()).difference_update(members)
+        self.redis.smembers.return_value = set()
+        self.redis.hget.return_value = None
+        self.redis.hgetall.return_value = {}
+        self.w_store = MagicMock()
+        self.e_store = MagicMock()
+        self.page_graph_creator = MagicMock()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def create_indexer(
+        self,
+        embedder,
+        embedding_scheduler=None,
+        e_bulk_writer=None,
+        w_bulk_writer=None,
+        pipelined=False,
+        write_graphs=True,
+        near_duplicate_detector=None,
+        ledger=None,
+    ):
+        return Indexer(
+            MagicMock(),
+            self.redis,
+            embedder,
+            self.w_store,
+            self.e_store,
+            self.page_graph_creator,
+            MagicMock(),
+            ledger=ledger,
+            near_duplicate_detector=near_duplicate_detector,
+            embedding_scheduler=embedding_scheduler,
+            e_bulk_writer=e_bulk_writer,
+            w_bulk_writer=w_bulk_writer,
+            pipelined=pipelined,
+            pipeline_queue_size=1,
+            write_graphs=write_graphs,
+        )
+
+    def get_weaviate_documents(self):
+        return {
+            doc.id: doc
+            for call in self.w_store.write_documents.call_args_list
+            for doc in call.kwargs.get("documents", call.args[0] if call.args else [])
+        }
+
+    def get_marked(self):
+        """
+        Returns the pages and categories marked as indexed, in order.
+        """
+        return [
+            (name, member)
+            for call in self.redis.sadd.call_args_list
+            for name, member in [(call.args[0], member) for member in call.args[1:]]
+            if name in ["indexed_pages", "indexed_categories"]
+        ]
+
+    def get_checkpoints(self):
+        return {name: self.redis_sets.get(name, set()) for name in STORE_CHECKPOINT_SETS.values()}
+
+    def get_graph_titles(self):
+        return [
+            hierarchy["title"]
+            for call in self.page_graph_creator.create_graphs.call_args_list
+            for hierarchy in call.args[0]
+        ]
+
+    def test_export_graph(self):
+        # pages and categories chunked
+        self.redis.sismember.side_effect = lambda name, member: name in ["chunked_pages", "chunked_categories"]
+        indexer = self.create_indexer(FakeEmbedder(delay=0), write_graphs=False)
+        exporter = Neo4jBulkImportExporter(os.path.join(self.tmpdir.name, "import"))
+
+        self.assertEqual(indexer.export_graph("Dinosaurs", self.filepath, exporter), 3)
+        stats = exporter.close()
+
+        self.assertEqual(stats["pages"], 3)
+        self.assertEqual(stats["categories"], 2)
+        with open(exporter.csv_filepath("relationships")) as file:
+            relationship_types = [line.strip().split(",")[-1] for line in file.readlines()[1:]]
+        self.assertEqual(relationship_types.count("HAS_PAGE"), 3)
+        self.assertEqual(relationship_types.count("HAS_SUBCATEGORY"), 1)
+        self.assertEqual(relationship_types.count("HAS_CHUNK"), 9)
+
+        # the graph is then imported, not written
+        self.redis.sismember.side_effect = lambda name, member: member in self.redis_sets.get(name, set())
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, {}), 3)
+        self.page_graph_creator.create_graphs.assert_not_called()
+        indexer.category_graph_creator.create_relationships.assert_not_called()
+
+    def test_build_category_graph(self):
+        self.redis.sismember.side_effect = lambda name, member: name in ["indexed_pages", "indexed_categories"]
+        indexer = self.create_indexer(FakeEmbedder(delay=0))
+
+        self.assertEqual(indexer.build_category_graph("Dinosaurs", self.filepath), 4)
+
+        indexer.category_graph_creator.create_relationships.assert_called_once_with(
+            [("Dinosaurs", "Stegosaurus"), ("Dinosaurs", "Triceratops"), ("Theropods", "Allosaurus")],
+            [("Dinosaurs", "Theropods")],
+        )
+
+    def test_purge_stale_chunks_promotes_duplicates(self):
+        detector = NearDuplicateDetector()
+        content = "Late Jurassic dinosaurs of North America"
+        for chunk_id in ["Stegosaurus-0", "Triceratops-0", "Allosaurus-0"]:
+            detector.add(chunk_id, content)
+        self.redis.smembers.return_value = {b"Stegosaurus-0"}
+        self.e_store.filter_documents.return_value = [
+            Document(id=chunk_id, content=content, meta={"duplicate_of": "Stegosaurus-0"})
+            for chunk_id in ["Triceratops-0", "Allosaurus-0"]
+        ]
+        indexer = self.create_indexer(FakeEmbedder(delay=0), near_duplicate_detector=detector)
+
+        self.assertEqual(indexer.purge_stale_chunks(), 1)
+
+        # Triceratops-0 takes the place of the stale canonical chunk, in Weaviate and as canonical chunk of Allosaurus-0
+        self.e_store.delete_documents.assert_called_once_with(["Stegosaurus-0"])
+        self.assertEqual(list(self.get_weaviate_documents()), ["Triceratops-0"])
+        self.assertIsNotNone(self.get_weaviate_documents()["Triceratops-0"].embedding)
+        documents = self.e_store.write_documents.call_args.args[0]
+        self.assertEqual(
+            {doc.id: doc.meta.get("duplicate_of") for doc in documents},
+            {"Triceratops-0": None, "Allosaurus-0": "Triceratops-0"},
+        )
+        self.assertEqual(self.e_store.write_documents.call_args.kwargs["policy"], DuplicatePolicy.OVERWRITE)
+        self.assertEqual(detector.add("Allosaurus-0", content), "Triceratops-0")
+        self.redis.srem.assert_called_once_with("stale_chunks", "Stegosaurus-0")
+
+    def test_index_wiki_data_page_by_page(self):
+        embedder = FakeEmbedder(delay=0)
+        indexer = self.create_indexer(embedder)
+
+        category_pages_indexed = {}
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, category_pages_indexed), 3)
+
+        self.assertEqual(len(embedder.batches), 3)
+        self.assertEqual(category_pages_indexed, {"Dinosaurs": 2, "Theropods": 1})
+        self.assertEqual(len(self.get_weaviate_documents()), 9)
+
+    def test_index_wiki_data_with_embedding_scheduler(self):
+        embedder = FakeEmbedder(delay=0)
+        scheduler = EmbeddingScheduler(embedder, max_batch_tokens=10000, max_batch_documents=4, concurrency=2)
+        indexer = self.create_indexer(embedder, scheduler)
+
+        category_pages_indexed = {}
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, category_pages_indexed), 3)
+        scheduler.close()
+
+        # the chunks of the three pages, across categories, share 4-document batches
+        self.assertEqual(sorted(len(batch) for batch in embedder.batches), [1, 4, 4])
+        self.assertEqual(category_pages_indexed, {"Dinosaurs": 2, "Theropods": 1})
+        weaviate_documents = self.get_weaviate_documents()
+        self.assertEqual(len(weaviate_documents), 9)
+        self.assertTrue(all(doc.embedding is not None for doc in weaviate_documents.values()))
+        self.assertEqual(self.get_graph_titles(), ["Stegosaurus", "Triceratops", "Allosaurus"])
+
+        # the category tree is linked with one call, once its pages are marked
+        indexer.category_graph_creator.create_relationships.assert_called_once_with(
+            [("Dinosaurs", "Stegosaurus"), ("Dinosaurs", "Triceratops"), ("Theropods", "Allosaurus")],
+            [("Dinosaurs", "Theropods")],
+        )
+
+        # pages are marked before their category, and the embeddings of every page are stored
+        marked = self.get_marked()
+        self.assertEqual(marked[-1], ("indexed_categories", "Theropods"))
+        self.assertEqual(
+            sorted(member for name, member in marked if name == "indexed_pages"),
+            ["Allosaurus", "Stegosaurus", "Triceratops"],
+        )
+        embedded_documents = indexer.read_embedded_documents(os.path.join(self.filepath, "Theropods"), "Allosaurus.html")
+        self.assertEqual([doc.id for doc in embedded_documents], ["Allosaurus-0", "Allosaurus-1", "Allosaurus-2"])
+        self.assertTrue(all(doc.embedding is not None for doc in embedded_documents))
+
+    def test_index_wiki_data_with_bulk_writers(self):
+        writes = []
+
+        def bulk_writer(store):
+            writer = MagicMock(batch_size=4, concurrency=2)
+            # the pages marked as indexed and checkpointed in Elasticsearch when the documents are written
+            writer.write_documents.side_effect = lambda documents: writes.append(
+                (
+                    store,
+                    [doc.id for doc in documents],
+                    len(self.get_marked()),
+                    len(self.redis_sets.get("elasticsearch_pages", set())),
+                )
+            )
+            return writer
+
+        embedder = FakeEmbedder(delay=0)
+        indexer = self.create_indexer(embedder, e_bulk_writer=bulk_writer("es"), w_bulk_writer=bulk_writer("weaviate"))
+
+        category_pages_indexed = {}
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, category_pages_indexed), 3)
+
+        # the three pages fill 4 * 2 documents, and are written together, before any page is marked; they are
+        # checkpointed in Elasticsearch once written to it
+        self.assertEqual(
+            [(store, len(ids), num_marked, num_checkpointed) for store, ids, num_marked, num_checkpointed in writes],
+            [("es", 9, 0, 0), ("weaviate", 9, 0, 3)],
+        )
+        self.assertEqual(
+            self.get_marked(),
+            [
+                ("indexed_pages", "Stegosaurus"),
+                ("indexed_pages", "Triceratops"),
+                ("indexed_pages", "Allosaurus"),
+                ("indexed_categories", "Theropods"),
+            ],
+        )
+        self.e_store.write_documents.assert_not_called()
+        self.w_store.write_documents.assert_not_called()
+
+    def test_index_wiki_data_pipelined(self):
+        embedder = FakeEmbedder(delay=0.01)
+        indexer = self.create_indexer(embedder, pipelined=True)
+
+        category_pages_indexed = {}
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, category_pages_indexed), 3)
+
+        self.assertIsNone(indexer.pipeline)
+        self.assertEqual(category_pages_indexed, {"Dinosaurs": 2, "Theropods": 1})
+        self.assertEqual(len(self.get_weaviate_documents()), 9)
+        self.assertEqual(self.get_graph_titles(), ["Stegosaurus", "Triceratops", "Allosaurus"])
+        # pages are marked in order, and the category once its page is; their checkpoints are cleared
+        self.assertEqual(
+            self.get_marked(),
+            [
+                ("indexed_pages", "Stegosaurus"),
+                ("indexed_pages", "Triceratops"),
+                ("indexed_pages", "Allosaurus"),
+                ("indexed_categories", "Theropods"),
+            ],
+        )
+        self.assertEqual(
+            self.get_checkpoints(), {"elasticsearch_pages": set(), "weaviate_pages": set(), "neo4j_pages": set()}
+        )
+
+    def test_index_wiki_data_pipelined_failed_page(self):
+        embedder = FakeEmbedder(delay=0, fail_on="Triceratops-0")
+        indexer = self.create_indexer(embedder, pipelined=True)
+
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, {}), 3)
+
+        self.assertIsNone(indexer.pipeline)
+        # the failed page is not marked, but the store it was written to is, and the other pages go on
+        self.assertEqual(
+            self.get_marked(),
+            [
+                ("indexed_pages", "Stegosaurus"),
+                ("indexed_pages", "Allosaurus"),
+                ("indexed_categories", "Theropods"),
+            ],
+        )
+        self.assertEqual(
+            self.get_checkpoints(),
+            {"elasticsearch_pages": {"Triceratops"}, "weaviate_pages": set(), "neo4j_pages": set()},
+        )
+        self.assertEqual(self.get_graph_titles(), ["Stegosaurus", "Allosaurus"])
+        self.redis.hset.assert_called_once()
+        name, page_title, entry = self.redis.hset.call_args.args
+        entry = json.loads(entry)
+        self.assertEqual((name, page_title), ("failed_pages", "Triceratops"))
+        self.assertEqual(
+            (entry["filepath"], entry["filename"], entry["stage"], entry["attempts"]),
+            (self.filepath, "Triceratops.html", "embedding", 1),
+        )
+        self.assertIn("EmbeddingError", entry["reason"])
+
+    def test_page_in_pipeline_is_not_queued_again(self):
+        indexer = self.create_indexer(FakeEmbedder(delay=0), pipelined=True)
+        # the graph step holds the first group in the pipeline until released
+        released = threading.Event()
+        self.page_graph_creator.create_graphs.side_effect = lambda hierarchies, written=None: released.wait(5)
+        result = chunk_result("Stegosaurus", ["Stegosaurus chunk 0"])
+
+        indexer.start_pipeline()
+        self.assertTrue(indexer.queue_page_result(self.filepath, "Stegosaurus", "Stegosaurus.html", result))
+        self.assertEqual(indexer.in_flight_pages, {"Stegosaurus"})
+        # the same page, listed in another category, while its group is in the pipeline
+        self.assertFalse(
+            indexer.queue_page_result(
+                os.path.join(self.filepath, "Theropods"), "Stegosaurus", "Stegosaurus.html", result
+            )
+        )
+        released.set()
+        indexer.finish_pipeline()
+
+        self.assertEqual(self.get_graph_titles(), ["Stegosaurus"])
+        self.assertEqual(self.get_marked(), [("indexed_pages", "Stegosaurus")])
+        self.assertEqual(indexer.in_flight_pages, set())
+
+    def test_retry_failed_pages(self):
+        self.redis.hgetall.return_value = {
+            b"Triceratops": json.dumps(
+                {"filepath": self.filepath, "filename": "Triceratops.html", "stage": "embedding",
+                 "reason": "EmbeddingError: no embedding", "attempts": 1}
+            )
+        }
+        self.redis_sets.update(
+            {
+                "elasticsearch_pages": {"Triceratops"},
+                "indexed_pages": {"Stegosaurus", "Allosaurus"},
+                "indexed_categories": {"Theropods"},
+            }
+        )
+        indexer = self.create_indexer(FakeEmbedder(delay=0))
+
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, {}), 0)
+
+        # only the missing stores are written
+        self.e_store.write_documents.assert_not_called()
+        self.assertEqual(sorted(self.get_weaviate_documents()), ["Triceratops-0", "Triceratops-1", "Triceratops-2"])
+        self.assertEqual(self.get_graph_titles(), ["Triceratops"])
+        self.assertEqual(self.get_marked(), [("indexed_pages", "Triceratops")])
+        self.assertEqual(
+            self.get_checkpoints(), {"elasticsearch_pages": set(), "weaviate_pages": set(), "neo4j_pages": set()}
+        )
+        self.redis.hdel.assert_called_once_with("failed_pages", "Triceratops")
+
+    def test_retry_failed_pages_skips_dead_pages(self):
+        self.redis.hgetall.return_value = {
+            b"Triceratops": json.dumps(
+                {"filepath": self.filepath, "filename": "Triceratops.html", "stage": "embedding",
+                 "reason": "EmbeddingError: no embedding", "attempts": 3}
+            )
+        }
+        indexer = self.create_indexer(FakeEmbedder(delay=0))
+
+        self.assertEqual(indexer.retry_failed_pages(), 0)
+
+        self.w_store.write_documents.assert_not_called()
+        self.assertEqual(indexer.failed_page_titles, {"Triceratops"})
+        self.assertIn("1 pages failed 3 times", indexer.logger.warning.call_args.args[0])
+
+    def test_index_wiki_data_after_stopped_run(self):
+        # a run stopped after writing Stegosaurus to Elasticsearch and Weaviate
+        self.redis_sets.update({"elasticsearch_pages": {"Stegosaurus"}, "weaviate_pages": {"Stegosaurus"}})
+        embedder = FakeEmbedder(delay=0)
+        indexer = self.create_indexer(embedder)
+
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, {}), 3)
+
+        # Stegosaurus is only written to Neo4j, and not embedded
+        for store in [self.e_store, self.w_store]:
+            written_ids = [
+                doc.id
+                for call in store.write_documents.call_args_list
+                for doc in call.kwargs.get("documents", call.args[0] if call.args else [])
+            ]
+            self.assertEqual(len(written_ids), 6)
+            self.assertFalse(any(doc_id.startswith("Stegosaurus") for doc_id in written_ids))
+        self.assertEqual(len(embedder.batches), 2)
+        self.assertEqual(self.get_graph_titles(), ["Stegosaurus", "Triceratops", "Allosaurus"])
+        self.assertEqual(
+            self.get_checkpoints(), {"elasticsearch_pages": set(), "weaviate_pages": set(), "neo4j_pages": set()}
+        )
+
+    def test_index_wiki_data_with_batched_ledger(self):
+        # the pipelined SADDs of the ledger update the Redis sets too
+        self.redis.pipeline.return_value = self.redis
+        ledger = ProgressLedger(self.redis, durability="batched", batch_size=500)
+        # the pages checkpointed in Elasticsearch (in Redis) when the documents are written to Weaviate
+        elasticsearch_checkpoints = []
+        self.w_store.write_documents.side_effect = lambda *args, **kwargs: elasticsearch_checkpoints.append(
+            set(self.redis_sets.get("elasticsearch_pages", set()))
+        )
+        # whether the pages were in 'indexed_pages' (in Redis) when their checkpoints were cleared
+        cleared_indexed = []
+        srem = self.redis.srem.side_effect
+
+        def srem_checkpoints(name, *members):
+            if name in STORE_CHECKPOINT_SETS.values():
+                cleared_indexed.append(set(members) <= self.redis_sets.get("indexed_pages", set()))
+            srem(name, *members)
+
+        self.redis.srem.side_effect = srem_checkpoints
+        indexer = self.create_indexer(FakeEmbedder(delay=0), ledger=ledger)
+
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, {}), 3)
+
+        # checkpoints are written through, although the ledger batches completions
+        self.assertEqual(elasticsearch_checkpoints, [{"Stegosaurus"}, {"Triceratops"}, {"Allosaurus"}])
+        self.assertTrue(cleared_indexed)
+        self.assertTrue(all(cleared_indexed))
+        self.assertEqual(
+            self.get_checkpoints(), {"elasticsearch_pages": set(), "weaviate_pages": set(), "neo4j_pages": set()}
+        )
+
+    def test_index_wiki_data_partial_graph_write(self):
+        def create_graphs(hierarchies, written):
+            for hierarchy in hierarchies:
+                if hierarchy["title"] == "Triceratops":
+                    raise RuntimeError("graph write failed")
+                written.append(hierarchy["title"])
+
+        self.page_graph_creator.create_graphs.side_effect = create_graphs
+        embedder = FakeEmbedder(delay=0)
+        scheduler = EmbeddingScheduler(embedder, max_batch_tokens=10000, max_batch_documents=4, concurrency=2)
+        indexer = self.create_indexer(embedder, scheduler)
+
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, {}), 3)
+        scheduler.close()
+
+        # the page written before the failure is not written again
+        self.assertEqual(
+            [
+                [hierarchy["title"] for hierarchy in call.args[0]]
+                for call in self.page_graph_creator.create_graphs.call_args_list
+            ],
+            [["Stegosaurus", "Triceratops", "Allosaurus"], ["Triceratops"], ["Allosaurus"]],
+        )
+        self.assertEqual(
+            self.get_marked(),
+            [("indexed_pages", "Stegosaurus"), ("indexed_pages", "Allosaurus"), ("indexed_categories", "Theropods")],
+        )
+        self.assertEqual(
+            self.get_checkpoints(),
+            {"elasticsearch_pages": {"Triceratops"}, "weaviate_pages": {"Triceratops"}, "neo4j_pages": set()},
+        )
+        self.assertEqual(json.loads(self.redis.hset.call_args.args[2])["stage"], "neo4j")
+
+    def test_index_wiki_data_unreadable_chunks(self):
+        os.remove(FileChunkStore.chunk_filepath(self.filepath, "Triceratops.html"))
+        indexer = self.create_indexer(FakeEmbedder(delay=0), pipelined=True)
+
+        self.assertEqual(indexer.index_wiki_data("Dinosaurs", self.filepath, {}), 2)
+
+        self.assertIsNone(indexer.pipeline)
+        # the page without chunks goes to the failed page queue, the others are indexed
+        self.assertEqual(
+            self.get_marked(),
+            [
+                ("indexed_pages", "Stegosaurus"),
+                ("indexed_pages", "Allosaurus"),
+                ("indexed_categories", "Theropods"),
+            ],
+        )
+        self.assertEqual(self.get_graph_titles(), ["Stegosaurus", "Allosaurus"])
+        self.redis.hset.assert_called_once()
+        name, page_title, entry = self.redis.hset.call_args.args
+        entry = json.loads(entry)
+        self.assertEqual((name, page_title), ("failed_pages", "Triceratops"))
+        self.assertEqual(
+            (entry["filepath"], entry["filename"], entry["stage"], entry["attempts"]),
+            (self.filepath, "Triceratops.html", "chunks", 1),
+        )
+        self.assertIn("FileNotFoundError", entry["reason"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from config import config
+from lib.wiki.index.chunk.helpers import html_to_text_chunks, fast_html_to_text_chunks
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compares the bs4 and fast backends of html_to_text_chunks on downloaded Wikipedia pages: checks that they return the same chunks and reports the per-page speedup."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        help="Page files or directories searched recursively for *.html (default: index.filepath).",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Runs per page and backend; the fastest run is kept (default: 5).",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=0,
+        help="Benchmark at most this many pages (default: all).",
+    )
+    return parser.parse_args()
+
+
+def find_pages(paths: list) -> list:
+    page_filepaths = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            page_filepaths.extend(sorted(path.rglob("*.html")))
+        elif path.is_file():
+            page_filepaths.append(path)
+    return page_filepaths
+
+
+def time_backend(page_html: str, backend: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        html_to_text_chunks(page_html, backend)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    args = parse_args()
+    paths = args.paths or [config.get("index.filepath", "/aux/data/wiki/v100/Dinosaurs")]
+    page_filepaths = find_pages(paths)
+    if args.limit > 0:
+        page_filepaths = page_filepaths[: args.limit]
+    if not page_filepaths:
+        print(f"No pages found in {paths}.")
+        return 1
+
+    # the first call loads the entity tables of bs4
+    html_to_text_chunks("<p>&amp;</p>", "fast")
+
+    num_bytes = 0
+    num_fallbacks = 0
+    mismatches = []
+    bs4_seconds = []
+    fast_seconds = []
+    for page_filepath in page_filepaths:
+        with open(page_filepath, "r") as file:
+            page_html = file.read()
+        num_bytes += len(page_html.encode("utf-8"))
+        if html_to_text_chunks(page_html, "bs4") != html_to_text_chunks(page_html, "fast"):
+            mismatches.append(str(page_filepath))
+        if fast_html_to_text_chunks(page_html) is None:
+            num_fallbacks += 1
+        bs4_seconds.append(time_backend(page_html, "bs4", args.repeat))
+        fast_seconds.append(time_backend(page_html, "fast", args.repeat))
+
+    speedups = sorted(bs4 / fast for bs4, fast in zip(bs4_seconds, fast_seconds))
+    num_pages = len(page_filepaths)
+    print(f"Pages: {num_pages} ({num_bytes / num_pages / 1024:.1f} KiB on average)")
+    print(f"Pages left to the bs4 backend by the fast backend: {num_fallbacks}")
+    print(f"Pages with different chunks: {len(mismatches)}")
+    for page_filepath in mismatches[:10]:
+        print(f"  {page_filepath}")
+    for backend, seconds in [("bs4", bs4_seconds), ("fast", fast_seconds)]:
+        print(
+            f"{backend:>5}: {sum(seconds) / num_pages * 1000:.2f} ms/page on average, "
+            f"{statistics.median(seconds) * 1000:.2f} ms median, {num_pages / sum(seconds):.0f} pages/s"
+        )
+    print(
+        f"Per-page speedup: median {statistics.median(speedups):.1f}x, "
+        f"min {speedups[0]:.1f}x, p10 {speedups[num_pages // 10]:.1f}x, max {speedups[-1]:.1f}x"
+    )
+    print(f"Overall speedup: {sum(bs4_seconds) / sum(fast_seconds):.1f}x")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
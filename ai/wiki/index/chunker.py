@@ -1,71 +1,313 @@
 import os
-import json
 import logging
-from pathlib import Path
-from typing import Dict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Optional, Tuple
 import redis
 from haystack.components.converters import TextFileToDocument
+from haystack.dataclasses import ByteStream
 from haystack import Pipeline
 from lib.wiki.index.chunk.wiki_page_chunker import WikiPageChunker
-from lib.wiki.index.download.helpers import get_title_pathname_map
+from lib.wiki.index.store.page_store import FilePageStore, PageStore
+from lib.wiki.index.store.chunk_store import FileChunkStore
+from lib.wiki.index.store.corpus_manifest import CorpusManifest, get_category_layout
+from lib.wiki.index.store.progress_ledger import ProgressLedger, RedisSetLedger
 
 
 class ChunkerException(Exception):
     pass
 
 
+# Chunk pipelines built in this process, by HTML backend and table serialization. Building a pipeline (components,
+# validation, graph setup) costs more than running it on a short page, so it is built once and reused for every page.
+CHUNK_PIPELINES: Dict[Tuple[str, str, int], Pipeline] = {}
+
+
+def get_chunk_pipeline(
+    html_backend: str = "bs4", table_format: str = "html", max_table_tokens: int = 256
+) -> Pipeline:
+    key = (html_backend, table_format, max_table_tokens)
+    if key not in CHUNK_PIPELINES:
+        converter = TextFileToDocument()
+        splitter = WikiPageChunker(
+            html_backend=html_backend, table_format=table_format, max_table_tokens=max_table_tokens
+        )
+
+        chunk_pipeline = Pipeline()
+
+        chunk_pipeline.add_component("converter", converter)
+        chunk_pipeline.add_component("splitter", splitter)
+
+        chunk_pipeline.connect("converter", "splitter")
+        CHUNK_PIPELINES[key] = chunk_pipeline
+    return CHUNK_PIPELINES[key]
+
+
+def run_chunk_pipeline_batch(
+    pages: List[Tuple[str, str, str]],
+    html_backend: str = "bs4",
+    table_format: str = "html",
+    max_table_tokens: int = 256,
+) -> Dict[str, dict]:
+    """
+    Runs the chunk pipeline once on the HTML of many pages ([(page_html, page_filepath, page_title)]) and returns the
+    result of every page by title, the same as run_chunk_pipeline would for the page on its own.
+    """
+    page_titles = [page_title for _, _, page_title in pages]
+    if len(set(page_titles)) != len(page_titles):
+        raise ValueError("A batch of pages to chunk must not contain the same page title twice.")
+
+    result = get_chunk_pipeline(html_backend, table_format, max_table_tokens).run(
+        data={
+            "converter": {
+                "sources": [
+                    ByteStream(
+                        data=page_html.encode("utf-8"),
+                        meta={"file_path": page_filepath},
+                    )
+                    for page_html, page_filepath, _ in pages
+                ],
+                "meta": [{"page_title": page_title} for page_title in page_titles],
+            }
+        }
+    )
+
+    page_outputs = WikiPageChunker.split_by_page(
+        result["splitter"]["documents"], result["splitter"]["hierarchy"]
+    )
+    return {
+        page_title: {
+            "splitter": {
+                "documents": [doc.to_dict() for doc in page_output["documents"]],
+                "hierarchy": page_output["hierarchy"],
+            }
+        }
+        for page_title, page_output in page_outputs.items()
+    }
+
+
+def run_chunk_pipeline(
+    page_html: str,
+    page_filepath: str,
+    page_title: str,
+    html_backend: str = "bs4",
+    table_format: str = "html",
+    max_table_tokens: int = 256,
+) -> dict:
+    """
+    Runs the chunk pipeline on the HTML of a page and returns the result, with the Haystack 'Document' objects
+    flattened to dictionaries so that it can be serialized to JSON (and returned from a worker process).
+    """
+    return run_chunk_pipeline_batch(
+        [(page_html, page_filepath, page_title)], html_backend, table_format, max_table_tokens
+    )[page_title]
+
+
 class Chunker:
-    def __init__(self, logger: logging.Logger, redis_client: redis.Redis):
+    def __init__(
+        self,
+        logger: logging.Logger,
+        redis_client: redis.Redis,
+        page_store: Optional[PageStore] = None,
+        manifest: Optional[CorpusManifest] = None,
+        ledger: Optional[ProgressLedger] = None,
+        processes: int = 1,
+        html_backend: str = "bs4",
+        batch_size: int = 1,
+        chunk_store: Optional[FileChunkStore] = None,
+        table_format: str = "html",
+        max_table_tokens: int = 256,
+    ):
+        """
+        Pages are read through page_store (FilePageStore or PackedPageStore); by default, one HTML file per page.
+        Chunk results are written to chunk_store (FileChunkStore or ShardedChunkStore); by default, one JSON file per
+        page in the .metadata/chunk directory of its category.
+
+        If a corpus manifest is provided, the category tree is walked from it instead of the title_pathname.json files
+        and directory listings, and the 'chunked' status of pages and categories is recorded in it.
+
+        Progress ('chunked_pages' and 'chunked_categories' sets) is tracked through ledger; by default, with one Redis
+        round trip per check and per completion.
+
+        With processes > 1 (0 for one process per CPU), chunk_wiki_data runs the chunk pipeline of the pages in a
+        process pool; reading pages, writing results and the progress bookkeeping stay in this process.
+
+        html_backend selects how chunks are extracted from the page HTML ("bs4" or "fast", see html_to_text_chunks).
+
+        table_format selects how tables (eg. infoboxes) are chunked: "html" keeps them as raw HTML, "rows" and
+        "markdown" serialize them to compact text, split into chunks of at most max_table_tokens tokens (see
+        serialize_table_chunks).
+
+        With batch_size > 1, pages are chunked batch_size at a time, with one run of the chunk pipeline per batch; the
+        result of every page is still written to its own chunk file.
+        """
         self.logger = logger
         self.redis = redis_client
+        self.page_store = page_store or FilePageStore()
+        self.manifest = manifest
+        self.ledger = ledger or RedisSetLedger(redis_client)
+        self.processes = processes if processes > 0 else os.cpu_count() or 1
+        self.html_backend = html_backend
+        self.batch_size = max(batch_size, 1)
+        self.chunk_store = chunk_store or FileChunkStore()
+        self.table_format = table_format
+        self.max_table_tokens = max_table_tokens
 
-    def make_result_serializable(self, result: dict) -> None:
+    def write_chunk_result(self, filepath: str, page_title: str, page_filename: str, result: dict) -> None:
         """
-        The result dictionary has objects of type 'Document' dataclass which is specific to Haystack. Those objects should be
-        flattened to a dictionary so that result dict can be serialized to JSON.
+        Writes the chunk result of a page to the chunk store.
         """
-        documents = result["splitter"]["documents"]
-        result["splitter"]["documents"] = [doc.to_dict() for doc in documents]
+        self.chunk_store.write_result(filepath, page_title, page_filename, result)
 
     def chunk_page(self, filepath: str, page_title: str, page_filename: str) -> None:
         """
-        Chunk the page and store chunks in .metadata/chunks folder
+        Chunk the page and store its chunks in the chunk store
         """
         page_filepath = os.path.join(filepath, page_filename)
-        if not os.path.exists(page_filepath):
-            raise FileNotFoundError(f"File {page_filepath} does not exist.")
-
-        # Run chunk pipeline
-        converter = TextFileToDocument()
-        splitter = WikiPageChunker()
+        page_html = self.page_store.read_page(filepath, page_title, page_filename)
+        result = run_chunk_pipeline(
+            page_html, page_filepath, page_title, self.html_backend, self.table_format, self.max_table_tokens
+        )
+        self.write_chunk_result(filepath, page_title, page_filename, result)
 
-        chunk_pipeline = Pipeline()
+    def chunk_pages(self, pages: List[Tuple[str, str, str]]) -> None:
+        """
+        Chunks pages ([(filepath, page title, page filename)]) with one run of the chunk pipeline and stores the chunks
+        of each page in the chunk store.
+        """
+        if len(pages) == 1:
+            self.chunk_page(*pages[0])
+            return
+        results = run_chunk_pipeline_batch(
+            [
+                (
+                    self.page_store.read_page(filepath, page_title, page_filename),
+                    os.path.join(filepath, page_filename),
+                    page_title,
+                )
+                for filepath, page_title, page_filename in pages
+            ],
+            self.html_backend,
+            self.table_format,
+            self.max_table_tokens,
+        )
+        self.chunk_store.write_results(
+            [
+                (filepath, page_title, page_filename, results[page_title])
+                for filepath, page_title, page_filename in pages
+            ]
+        )
 
-        chunk_pipeline.add_component("converter", converter)
-        chunk_pipeline.add_component("splitter", splitter)
+    def mark_page_chunked(self, page_title: str) -> None:
+        self.ledger.add("chunked_pages", page_title)
+        if self.manifest is not None:
+            self.manifest.set_page_status("chunked", [page_title])
 
-        chunk_pipeline.connect("converter", "splitter")
+    def mark_category_chunked(self, category: str) -> None:
+        self.ledger.add("chunked_categories", category)
+        if self.manifest is not None:
+            self.manifest.set_category_status("chunked", [category])
 
-        result = chunk_pipeline.run(
-            data={
-                "converter": {
-                    "sources": [Path(page_filepath)],
-                    "meta": {"page_title": page_title},
-                }
-            }
+    def collect_pending_pages(
+        self,
+        category: str,
+        filepath: str,
+        pending_pages: Dict[str, Tuple[str, str, str, str]],
+        pending_categories: List[str],
+    ) -> None:
+        """
+        Walks the category tree like chunk_wiki_data and collects the pages to chunk as {page title: (category,
+        filepath, page title, page filename)}, and the subcategories to mark as chunked once their pages are done (children
+        before parents). A page listed in several categories is collected once.
+        """
+        title_pathname, pages_filename_set, categories_dirname_set = (
+            get_category_layout(category, filepath, self.page_store, self.manifest)
         )
 
-        self.make_result_serializable(result)
+        for page_title, page_filename in title_pathname["pages"].items():
+            if self.ledger.contains("chunked_pages", page_title):
+                continue
+            if page_filename not in pages_filename_set:
+                continue
+            if page_title in pending_pages:
+                continue
+            pending_pages[page_title] = (category, filepath, page_title, page_filename)
 
-        # Write chunk results to file
-        metadata_chunk_path = os.path.join(filepath, ".metadata/chunk")
-        if not os.path.exists(metadata_chunk_path):
-            os.makedirs(metadata_chunk_path)
-        page_chunk_filepath = os.path.join(
-            metadata_chunk_path, f"{page_filename.replace('.html', '')}.json"
-        )
-        with open(page_chunk_filepath, "w") as file:
-            json.dump(result, file)
+        for subcategory_title, subcategory_path in title_pathname["categories"].items():
+            if self.ledger.contains("chunked_categories", subcategory_title):
+                continue
+            if subcategory_path not in categories_dirname_set:
+                continue
+            self.collect_pending_pages(
+                subcategory_title,
+                os.path.join(filepath, subcategory_path),
+                pending_pages,
+                pending_categories,
+            )
+            pending_categories.append(subcategory_title)
+
+    def chunk_wiki_data_parallel(
+        self, category: str, filepath: str, category_pages_chunked: Dict[str, int]
+    ) -> int:
+        """
+        Same as chunk_wiki_data, with the chunk pipeline of the pages run in a pool of worker processes, batch_size pages
+        per task. Batches are read and submitted as workers free up (at most two batches per process in flight), and the
+        results of a batch are written and recorded by this process as soon as it is returned.
+        """
+        try:
+            pending_pages = {}
+            pending_categories = []
+            self.collect_pending_pages(category, filepath, pending_pages, pending_categories)
+            pending_pages = list(pending_pages.values())
+
+            num_total_pages_chunked = 0
+            max_in_flight = self.processes * 2
+            next_page = 0
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                futures = {}
+                while futures or next_page < len(pending_pages):
+                    while len(futures) < max_in_flight and next_page < len(pending_pages):
+                        batch = pending_pages[next_page : next_page + self.batch_size]
+                        future = executor.submit(
+                            run_chunk_pipeline_batch,
+                            [
+                                (
+                                    self.page_store.read_page(page_filepath, page_title, page_filename),
+                                    os.path.join(page_filepath, page_filename),
+                                    page_title,
+                                )
+                                for _, page_filepath, page_title, page_filename in batch
+                            ],
+                            self.html_backend,
+                            self.table_format,
+                            self.max_table_tokens,
+                        )
+                        futures[future] = batch
+                        next_page += len(batch)
+
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results = future.result()
+                        batch = futures.pop(future)
+                        self.chunk_store.write_results(
+                            [
+                                (page_filepath, page_title, page_filename, results[page_title])
+                                for _, page_filepath, page_title, page_filename in batch
+                            ]
+                        )
+                        for page_category, _, page_title, _ in batch:
+                            self.mark_page_chunked(page_title)
+                            category_pages_chunked[page_category] = (
+                                category_pages_chunked.get(page_category, 0) + 1
+                            )
+                            num_total_pages_chunked += 1
+
+            for subcategory_title in pending_categories:
+                self.mark_category_chunked(subcategory_title)
+
+            return num_total_pages_chunked
+
+        except Exception as e:
+            raise ChunkerException(f"Error chunking data for category {category}: {e}")
 
     def chunk_wiki_data(
         self, category: str, filepath: str, category_pages_chunked: Dict[str, int]
@@ -74,35 +316,36 @@ class Chunker:
         Chunks wiki data for all pages in a category and its subcategories.
 
         Downloaded wiki data is accessed from the .metadata/download directory in the category filepath.
-        Chunks and hierarchy information is stored in the .metadata/chunk directory.
+        Chunks and hierarchy information is stored in the chunk store (by default, the .metadata/chunk directory).
         """
+        if self.processes > 1:
+            return self.chunk_wiki_data_parallel(category, filepath, category_pages_chunked)
+
         try:
             num_total_pages_chunked = 0
-            title_pathname = get_title_pathname_map(category, filepath, create=False)
+            title_pathname, pages_filename_set, categories_dirname_set = (
+                get_category_layout(category, filepath, self.page_store, self.manifest)
+            )
 
-            pages_filename_set = {file.name for file in Path(filepath).glob("*.html")}
-            categories_dirname_set = {
-                dir.name
-                for dir in Path(filepath).iterdir()
-                if dir.is_dir() and dir.name != ".metadata"
-            }
-
-            pages = title_pathname["pages"]
-            for page_title, page_filename in pages.items():
-                if self.redis.sismember("chunked_pages", page_title):
-                    continue
-                if page_filename not in pages_filename_set:
-                    continue
-                self.chunk_page(filepath, page_title, page_filename)
-                num_total_pages_chunked += 1
-                self.redis.sadd("chunked_pages", page_title)
+            pages = [
+                (filepath, page_title, page_filename)
+                for page_title, page_filename in title_pathname["pages"].items()
+                if not self.ledger.contains("chunked_pages", page_title)
+                and page_filename in pages_filename_set
+            ]
+            for start in range(0, len(pages), self.batch_size):
+                batch = pages[start : start + self.batch_size]
+                self.chunk_pages(batch)
+                for _, page_title, _ in batch:
+                    num_total_pages_chunked += 1
+                    self.mark_page_chunked(page_title)
 
             if num_total_pages_chunked > 0:
                 category_pages_chunked[category] = num_total_pages_chunked
 
             subcategories = title_pathname["categories"]
             for subcategory_title, subcategory_path in subcategories.items():
-                if self.redis.sismember("chunked_categories", subcategory_title):
+                if self.ledger.contains("chunked_categories", subcategory_title):
                     continue
                 if subcategory_path not in categories_dirname_set:
                     continue
@@ -111,7 +354,7 @@ class Chunker:
                     subcategory_title, subcategory_path, category_pages_chunked
                 )
                 num_total_pages_chunked += subcategory_total_pages_chunked
-                self.redis.sadd("chunked_categories", subcategory_title)
+                self.mark_category_chunked(subcategory_title)
 
             return num_total_pages_chunked
 
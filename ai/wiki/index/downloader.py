@@ -1,12 +1,23 @@
 import os
 import logging
-from typing import List
+from typing import Dict, List, Optional
 import redis
 
 from lib.wiki.index.download.helpers import (
     get_title_pathname_map,
     download_page,
+    get_latest_revisions,
+    load_revision_manifest,
+    save_revision_manifest,
+    update_revision_manifest,
 )
+from lib.wiki.index.download.async_page_downloader import AsyncPageDownloader
+from lib.wiki.index.store.page_store import FilePageStore, PageStore
+from lib.wiki.index.store.chunk_store import FileChunkStore
+from lib.wiki.index.store.embedding_store import FileEmbeddingStore
+from lib.wiki.index.store.corpus_manifest import CorpusManifest
+from lib.wiki.index.store.failed_page_queue import FailedPageQueue
+from lib.wiki.index.store.progress_ledger import STORE_CHECKPOINT_SETS, ProgressLedger, RedisSetLedger
 
 
 class DownloaderException(Exception):
@@ -14,9 +25,271 @@ class DownloaderException(Exception):
 
 
 class Downloader:
-    def __init__(self, logger: logging.Logger, redis_client: redis.Redis):
+    def __init__(
+        self,
+        logger: logging.Logger,
+        redis_client: redis.Redis,
+        page_downloader: Optional[AsyncPageDownloader] = None,
+        batch_download: bool = False,
+        track_revisions: bool = False,
+        page_store: Optional[PageStore] = None,
+        manifest: Optional[CorpusManifest] = None,
+        ledger: Optional[ProgressLedger] = None,
+        chunk_store: Optional[FileChunkStore] = None,
+        embedding_store: Optional[FileEmbeddingStore] = None,
+        failed_pages: Optional[FailedPageQueue] = None,
+    ):
+        """
+        If page_downloader is provided, pages of a category are downloaded concurrently with it, many titles per API
+        query if batch_download is set (see AsyncPageDownloader.download_pages_batch). Otherwise pages are downloaded
+        one at a time with download_page.
+
+        If track_revisions is set, the revision id and fetch timestamp of every downloaded page is recorded in the
+        revision manifest of its category directory (required by refresh_wiki_data).
+
+        Pages are downloaded as HTML files into their category directory; with a PackedPageStore as page_store, the
+        files of every downloaded batch are then moved into the store.
+
+        If a corpus manifest is provided, every listed category and downloaded page is recorded in it.
+
+        Progress ('downloaded_pages' and 'downloaded_categories' sets) is tracked through ledger, which is also used to
+        reset the progress of refreshed pages in the later stages. The chunks of refreshed pages are deleted from
+        chunk_store (by default, the .metadata/chunk directory) and their embeddings from embedding_store, and they are
+        removed from failed_pages (by default, the 'failed_pages' Redis hash), the failed page queue of the Indexer.
+        """
         self.logger = logger
         self.redis = redis_client
+        self.page_downloader = page_downloader
+        self.batch_download = batch_download
+        self.track_revisions = track_revisions
+        self.page_store = page_store or FilePageStore()
+        self.manifest = manifest
+        self.ledger = ledger or RedisSetLedger(redis_client)
+        self.chunk_store = chunk_store or FileChunkStore()
+        self.embedding_store = embedding_store or FileEmbeddingStore()
+        self.failed_pages = failed_pages or FailedPageQueue(redis_client)
+
+    def record_category(self, category: str, filepath: str, title_pathname: dict) -> None:
+        if self.manifest is not None:
+            self.manifest.record_category(category, filepath, title_pathname)
+
+    def run_downloads(
+        self, pages: Dict[str, str], filepath: str
+    ) -> Dict[str, Optional[Exception]]:
+        if self.page_downloader is not None:
+            if self.batch_download:
+                return self.page_downloader.download_pages_batch(pages, filepath)
+            return self.page_downloader.download_pages(pages, filepath)
+
+        results = {}
+        for page_title, page_filename in pages.items():
+            try:
+                download_page(page_title, page_filename, filepath)
+                results[page_title] = None
+            except Exception as e:
+                results[page_title] = e
+        return results
+
+    def download_and_record(
+        self,
+        pages: Dict[str, str],
+        filepath: str,
+        revisions: Optional[Dict[str, int]] = None,
+        record_revisions: bool = True,
+    ) -> List[str]:
+        """
+        Downloads the given pages, marks them in the 'downloaded_pages' set and, if revisions are tracked and
+        record_revisions is set, records them in the revision manifest. A page that fails to download is logged and
+        skipped.
+
+        Revision ids are looked up before the download, so a page edited in between is simply re-downloaded by the
+        next refresh instead of being missed.
+
+        Returns:
+            List[str]: The titles of the pages downloaded.
+        """
+        if not pages:
+            return []
+
+        if self.track_revisions and revisions is None:
+            try:
+                revisions = get_latest_revisions(list(pages.keys()))
+            except Exception as e:
+                self.logger.warning(
+                    f"Error fetching revisions for pages in {filepath}: {e}"
+                )
+                revisions = {}
+
+        results = self.run_downloads(pages, filepath)
+
+        downloaded_pages = []
+        for page_title, error in results.items():
+            if error is not None:
+                self.logger.error(
+                    f"Error downloading page {page_title}: {error}", exc_info=error
+                )
+                continue
+            downloaded_pages.append(page_title)
+
+        self.page_store.pack_files(
+            filepath, {page_title: pages[page_title] for page_title in downloaded_pages}
+        )
+        for page_title in downloaded_pages:
+            self.ledger.add("downloaded_pages", page_title)
+        if self.manifest is not None:
+            self.manifest.record_pages(
+                filepath, {page_title: pages[page_title] for page_title in downloaded_pages}
+            )
+
+        if record_revisions:
+            self.record_revisions(filepath, revisions, downloaded_pages)
+
+        return downloaded_pages
+
+    def record_revisions(
+        self, filepath: str, revisions: Optional[Dict[str, int]], page_titles: List[str]
+    ) -> None:
+        if self.track_revisions and page_titles:
+            manifest = load_revision_manifest(filepath)
+            update_revision_manifest(manifest, revisions or {}, page_titles)
+            save_revision_manifest(filepath, manifest)
+
+    def download_pages(self, pages: Dict[str, str], filepath: str) -> int:
+        """
+        Downloads the pages not yet downloaded.
+
+        Returns:
+            int: The number of pages downloaded.
+        """
+        pending_pages = {
+            page_title: page_filename
+            for page_title, page_filename in pages.items()
+            if not self.ledger.contains("downloaded_pages", page_title)
+        }
+        return len(self.download_and_record(pending_pages, filepath))
+
+    def flag_page_for_reprocessing(
+        self, filepath: str, page_title: str, page_filename: str
+    ) -> None:
+        """
+        Flags a re-downloaded page for re-chunking and re-indexing: the page is removed from the 'chunked_pages' and
+        'indexed_pages' sets and from the failed page queue, and its cached chunks and embeddings are deleted. The ids
+        of its previous chunks are added to the 'stale_chunks' set, so that the Indexer can remove them from the
+        document stores and the graph.
+        """
+        data = self.chunk_store.delete_result(filepath, page_title, page_filename)
+        if data is not None:
+            stale_chunk_ids = [
+                doc["id"] for doc in data.get("splitter", {}).get("documents", [])
+            ]
+            if stale_chunk_ids:
+                self.redis.sadd("stale_chunks", *stale_chunk_ids)
+
+        self.embedding_store.delete_documents(filepath, page_filename)
+
+        self.ledger.remove("chunked_pages", page_title)
+        self.ledger.remove("indexed_pages", page_title)
+        # the stores the page was written to before it was indexed, and its failures, were for its previous chunks
+        for name in STORE_CHECKPOINT_SETS.values():
+            self.ledger.remove(name, page_title)
+        self.failed_pages.remove(page_title)
+        if self.manifest is not None:
+            self.manifest.set_page_status("chunked", [page_title], done=False)
+            self.manifest.set_page_status("indexed", [page_title], done=False)
+
+    def refresh_wiki_data(
+        self,
+        category: str,
+        filepath: str,
+        category_pages_refreshed: dict,
+        depth: int,
+    ) -> int:
+        """
+        Incrementally refreshes already downloaded Wikipedia data for a given category and its subcategories.
+
+        The latest revision ids of the downloaded pages are fetched in bulk (one 'info' query per 50 pages) and
+        compared with the revision manifest. Only pages whose revision changed are re-downloaded; pages without a
+        manifest entry (downloaded before revisions were tracked) are treated as changed. The MediaWiki action API does
+        not support HTTP validators, so this bulk revision check plays the part of a conditional request.
+
+        Refreshed pages are flagged for re-chunking and re-indexing (see flag_page_for_reprocessing), and every
+        category on the path to a refreshed page is removed from the 'chunked_categories' and 'indexed_categories'
+        sets so that the Chunker and Indexer descend into it again.
+
+        Args:
+            category (str): The Wikipedia category to refresh data for.
+            filepath (str): The directory path where the data of the category is saved.
+            category_pages_refreshed (dict): A dictionary to track the number of pages refreshed per category.
+            depth (int): The current remaining depth for the recursive refresh.
+
+        Returns:
+            int: The total number of pages refreshed.
+        """
+        try:
+            if depth < 1:
+                return 0
+
+            title_pathname = get_title_pathname_map(category, filepath, create=False)
+
+            pages_filename_set = self.page_store.list_pages(filepath)
+            downloaded_pages = {
+                page_title: page_filename
+                for page_title, page_filename in title_pathname["pages"].items()
+                if page_filename in pages_filename_set
+            }
+
+            num_total_pages_refreshed = 0
+            if downloaded_pages:
+                manifest = load_revision_manifest(filepath)
+                latest_revisions = get_latest_revisions(list(downloaded_pages.keys()))
+                changed_pages = {
+                    page_title: page_filename
+                    for page_title, page_filename in downloaded_pages.items()
+                    if page_title in latest_revisions
+                    and manifest.get(page_title, {}).get("lastrevid")
+                    != latest_revisions[page_title]
+                }
+
+                # The new revisions are recorded only once the pages are flagged: a run stopped in between leaves
+                # the old revisions in the manifest, so the next refresh downloads and flags the pages again
+                refreshed_pages = self.download_and_record(
+                    changed_pages, filepath, latest_revisions, record_revisions=False
+                )
+                for page_title in refreshed_pages:
+                    self.flag_page_for_reprocessing(
+                        filepath, page_title, changed_pages[page_title]
+                    )
+                self.record_revisions(filepath, latest_revisions, refreshed_pages)
+                num_total_pages_refreshed = len(refreshed_pages)
+
+            if num_total_pages_refreshed > 0:
+                category_pages_refreshed[category] = num_total_pages_refreshed
+
+            subcategories = title_pathname["categories"]
+            for subcategory_title, subcategory_path in subcategories.items():
+                subcategory_path = os.path.join(filepath, subcategory_path)
+                if not os.path.isdir(subcategory_path):
+                    continue
+                subcategory_total_pages_refreshed = self.refresh_wiki_data(
+                    subcategory_title,
+                    subcategory_path,
+                    category_pages_refreshed,
+                    depth - 1,
+                )
+                if subcategory_total_pages_refreshed > 0:
+                    self.ledger.remove("chunked_categories", subcategory_title)
+                    self.ledger.remove("indexed_categories", subcategory_title)
+                    if self.manifest is not None:
+                        self.manifest.set_category_status("chunked", [subcategory_title], done=False)
+                        self.manifest.set_category_status("indexed", [subcategory_title], done=False)
+                num_total_pages_refreshed += subcategory_total_pages_refreshed
+
+            return num_total_pages_refreshed
+
+        except Exception as e:
+            raise DownloaderException(
+                f"Error refreshing data for category {category}: {e}"
+            )
 
     def fetch_wiki_data(
         self,
@@ -46,30 +319,21 @@ class Downloader:
             if not os.path.exists(filepath):
                 os.makedirs(filepath)
 
-            num_total_pages_downloaded = 0
             title_pathname = get_title_pathname_map(
                 category, filepath, inverse_filter, create=True
             )
+            self.record_category(category, filepath, title_pathname)
 
-            pages = title_pathname["pages"]
-            for page_title, page_filename in pages.items():
-                try:
-                    if self.redis.sismember("downloaded_pages", page_title):
-                        continue
-                    download_page(page_title, page_filename, filepath)
-                    num_total_pages_downloaded += 1
-                    self.redis.sadd("downloaded_pages", page_title)
-                except Exception as e:
-                    self.logger.error(
-                        f"Error downloading page {page_title}: {e}", exc_info=True
-                    )
+            num_total_pages_downloaded = self.download_pages(
+                title_pathname["pages"], filepath
+            )
 
             if num_total_pages_downloaded > 0:
                 category_pages_downloaded[category] = num_total_pages_downloaded
 
             subcategories = title_pathname["categories"]
             for subcategory_title, subcategory_path in subcategories.items():
-                if self.redis.sismember("downloaded_categories", subcategory_title):
+                if self.ledger.contains("downloaded_categories", subcategory_title):
                     continue
                 subcategory_path = os.path.join(filepath, subcategory_path)
                 subcategory_total_pages_downloaded = self.fetch_wiki_data(
@@ -80,7 +344,9 @@ class Downloader:
                     depth - 1,
                 )
                 num_total_pages_downloaded += subcategory_total_pages_downloaded
-                self.redis.sadd("downloaded_categories", subcategory_title)
+                self.ledger.add("downloaded_categories", subcategory_title)
+                if self.manifest is not None:
+                    self.manifest.set_category_status("downloaded", [subcategory_title])
 
             return num_total_pages_downloaded
 
@@ -0,0 +1,317 @@
+import os
+import json
+import logging
+import sqlite3
+from collections import deque
+from typing import Iterator, List, Optional, Tuple
+import redis
+
+from lib.wiki.index.dump.helpers import (
+    iter_sql_rows,
+    iter_xml_dump_pages,
+    iter_html_dump_pages,
+    wikitext_to_html,
+    parsoid_html_to_html,
+)
+from lib.wiki.index.store.page_store import FilePageStore, PageStore
+from lib.wiki.index.store.corpus_manifest import CorpusManifest
+from lib.wiki.index.store.progress_ledger import ProgressLedger, RedisSetLedger
+
+
+CATEGORY_NAMESPACE = 14
+CATEGORY_PREFIX = "Category:"
+
+
+class DumpIngesterException(Exception):
+    pass
+
+
+class DumpIngester:
+    """
+    Offline alternative to the Downloader: builds the category tree and the downloaded pages from local Wikipedia dumps
+    instead of the live API.
+
+    Inputs:
+    - a pages dump: either the XML export ('xml', eg. enwiki-latest-pages-articles.xml.bz2; wikitext is rendered to
+      simple HTML) or a Wikimedia Enterprise HTML dump ('html', NDJSON or .tar.gz of NDJSON files)
+    - the categorylinks table dump (eg. enwiki-latest-categorylinks.sql.gz)
+    - optionally the page table dump (eg. enwiki-latest-page.sql.gz) to resolve page ids to titles; required for HTML
+      dumps, which do not contain category pages. Without it, the XML dump is read once more for that purpose.
+
+    The output is exactly the on-disk layout of the Downloader (category directories, title_pathname.json and the pages
+    in the page store) and the 'downloaded_pages' and 'downloaded_categories' Redis sets are kept up to date, so the Chunker
+    and Indexer run unchanged.
+
+    Memory stays bounded on multi-GB inputs: all dumps are streamed, and category links and page ids are spilled to an
+    SQLite work database on disk (work_dir) instead of being held in memory.
+    """
+
+    def __init__(
+        self,
+        logger: logging.Logger,
+        redis_client: redis.Redis,
+        pages_path: str,
+        categorylinks_path: str,
+        work_dir: str,
+        pages_format: str = "xml",
+        page_table_path: Optional[str] = None,
+        batch_size: int = 10000,
+        page_store: Optional[PageStore] = None,
+        manifest: Optional[CorpusManifest] = None,
+        ledger: Optional[ProgressLedger] = None,
+    ):
+        if pages_format not in ["xml", "html"]:
+            raise ValueError(f"Unknown pages dump format {pages_format}.")
+        if pages_format == "html" and page_table_path is None:
+            raise ValueError("The page table dump is required for HTML dumps.")
+        self.logger = logger
+        self.redis = redis_client
+        self.pages_path = pages_path
+        self.categorylinks_path = categorylinks_path
+        self.work_dir = work_dir
+        self.pages_format = pages_format
+        self.page_table_path = page_table_path
+        self.batch_size = batch_size
+        self.page_store = page_store or FilePageStore()
+        self.manifest = manifest
+        self.ledger = ledger or RedisSetLedger(redis_client)
+
+    def connect_work_db(self) -> sqlite3.Connection:
+        if not os.path.exists(self.work_dir):
+            os.makedirs(self.work_dir)
+        connection = sqlite3.connect(os.path.join(self.work_dir, "dump_ingest.sqlite"))
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        return connection
+
+    def insert_batched(
+        self, connection: sqlite3.Connection, query: str, rows: Iterator[tuple]
+    ) -> int:
+        num_rows = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                connection.executemany(query, batch)
+                num_rows += len(batch)
+                batch.clear()
+        if batch:
+            connection.executemany(query, batch)
+            num_rows += len(batch)
+        connection.commit()
+        return num_rows
+
+    def iter_dump_pages(self) -> Iterator[Tuple[int, int, str, str]]:
+        if self.pages_format == "xml":
+            return iter_xml_dump_pages(self.pages_path)
+        return iter_html_dump_pages(self.pages_path)
+
+    def load_categorylinks(self, connection: sqlite3.Connection) -> None:
+        """
+        Loads the page -> category and subcategory -> category links into the work database.
+        """
+        connection.execute("DROP TABLE IF EXISTS categorylinks")
+        connection.execute(
+            "CREATE TABLE categorylinks (cl_from INTEGER, cl_to TEXT, cl_type TEXT)"
+        )
+
+        def rows():
+            for row in iter_sql_rows(self.categorylinks_path, "categorylinks"):
+                if "cl_to" not in row:
+                    raise DumpIngesterException(
+                        "The categorylinks dump has no 'cl_to' column (dumps using the linktarget schema are not supported)."
+                    )
+                if row.get("cl_type") in ["page", "subcat"]:
+                    yield row["cl_from"], row["cl_to"], row["cl_type"]
+
+        num_rows = self.insert_batched(
+            connection, "INSERT INTO categorylinks VALUES (?, ?, ?)", rows()
+        )
+        connection.execute("CREATE INDEX categorylinks_cl_to ON categorylinks (cl_to)")
+        connection.commit()
+        self.logger.info(f"Loaded {num_rows} category links.")
+
+    def load_page_titles(self, connection: sqlite3.Connection) -> None:
+        """
+        Loads the ids and titles of articles and category pages into the work database. Titles are stored with spaces;
+        category titles without the 'Category:' prefix.
+        """
+        connection.execute("DROP TABLE IF EXISTS pages")
+        connection.execute(
+            "CREATE TABLE pages (page_id INTEGER PRIMARY KEY, ns INTEGER, title TEXT)"
+        )
+
+        def rows():
+            if self.page_table_path is not None:
+                for row in iter_sql_rows(self.page_table_path, "page"):
+                    if row["page_namespace"] in [0, CATEGORY_NAMESPACE] and not row.get(
+                        "page_is_redirect"
+                    ):
+                        title = row["page_title"].replace("_", " ")
+                        yield row["page_id"], row["page_namespace"], title
+            else:
+                for page_id, ns, title, _ in self.iter_dump_pages():
+                    if ns == CATEGORY_NAMESPACE and title.startswith(CATEGORY_PREFIX):
+                        yield page_id, ns, title[len(CATEGORY_PREFIX) :]
+                    elif ns == 0:
+                        yield page_id, ns, title
+
+        num_rows = self.insert_batched(
+            connection, "INSERT OR REPLACE INTO pages VALUES (?, ?, ?)", rows()
+        )
+        self.logger.info(f"Loaded {num_rows} page titles.")
+
+    def get_category_members(
+        self, connection: sqlite3.Connection, category: str
+    ) -> List[Tuple[int, int, str]]:
+        return connection.execute(
+            """
+            SELECT p.page_id, p.ns, p.title
+            FROM categorylinks c JOIN pages p ON p.page_id = c.cl_from
+            WHERE c.cl_to = ?
+            ORDER BY p.ns, p.title
+            """,
+            (category.replace(" ", "_"),),
+        ).fetchall()
+
+    def resolve_category_tree(
+        self,
+        connection: sqlite3.Connection,
+        category: str,
+        filepath: str,
+        inverse_filter: List[str],
+        depth: int,
+    ) -> int:
+        """
+        Walks the category tree breadth-first from the root category and writes the title_pathname.json of every
+        category directory, using the same naming and filtering as get_title_pathname_map. Each page is assigned to
+        the first category directory it is found in (table 'targets'); a subcategory with several parents is only
+        expanded under the first one, like in the Downloader.
+
+        Returns:
+            int: The number of pages assigned.
+        """
+        connection.execute("DROP TABLE IF EXISTS targets")
+        connection.execute(
+            "CREATE TABLE targets (page_id INTEGER PRIMARY KEY, title TEXT, category TEXT, filepath TEXT, filename TEXT)"
+        )
+
+        visited_categories = {category}
+        queue = deque([(category, filepath, depth)])
+        while queue:
+            category_title, category_path, category_depth = queue.popleft()
+            title_pathname = {"pages": {}, "categories": {}}
+            targets = []
+
+            for page_id, ns, title in self.get_category_members(connection, category_title):
+                if any(keyword.lower() in title.lower() for keyword in inverse_filter):
+                    continue
+                underscored_title = title.replace(" ", "_")
+                if ns == 0:
+                    page_filename = f"{underscored_title}.html"
+                    title_pathname["pages"][title] = page_filename
+                    targets.append((page_id, title, category_title, category_path, page_filename))
+                elif ns == CATEGORY_NAMESPACE:
+                    title_pathname["categories"][title] = underscored_title
+                    if category_depth > 1 and title not in visited_categories:
+                        visited_categories.add(title)
+                        queue.append(
+                            (title, os.path.join(category_path, underscored_title), category_depth - 1)
+                        )
+
+            metadata_download_path = os.path.join(category_path, ".metadata/download")
+            if not os.path.exists(metadata_download_path):
+                os.makedirs(metadata_download_path)
+            with open(os.path.join(metadata_download_path, "title_pathname.json"), "w") as file:
+                json.dump(title_pathname, file)
+
+            connection.executemany(
+                "INSERT OR IGNORE INTO targets VALUES (?, ?, ?, ?, ?)", targets
+            )
+            self.ledger.add("downloaded_categories", category_title)
+            if self.manifest is not None:
+                self.manifest.record_category(category_title, category_path, title_pathname)
+                self.manifest.set_category_status("downloaded", [category_title])
+
+        connection.commit()
+        return connection.execute("SELECT COUNT(*) FROM targets").fetchone()[0]
+
+    def write_pages(
+        self, connection: sqlite3.Connection, category_pages_downloaded: dict
+    ) -> int:
+        """
+        Streams the pages dump once more and writes every page of the category tree to its category directory.
+        """
+        num_pages_written = 0
+        for page_id, ns, title, content in self.iter_dump_pages():
+            if ns != 0:
+                continue
+            target = connection.execute(
+                "SELECT title, category, filepath, filename FROM targets WHERE page_id = ?",
+                (page_id,),
+            ).fetchone()
+            if target is None:
+                continue
+            page_title, category, filepath, page_filename = target
+            if self.ledger.contains("downloaded_pages", page_title):
+                continue
+
+            try:
+                if self.pages_format == "xml":
+                    page_html = wikitext_to_html(content)
+                else:
+                    page_html = parsoid_html_to_html(content)
+                self.page_store.write_page(filepath, page_title, page_filename, page_html)
+            except Exception as e:
+                self.logger.error(f"Error writing page {page_title}: {e}", exc_info=True)
+                continue
+
+            self.ledger.add("downloaded_pages", page_title)
+            if self.manifest is not None:
+                self.manifest.record_pages(filepath, {page_title: page_filename})
+            category_pages_downloaded[category] = category_pages_downloaded.get(category, 0) + 1
+            num_pages_written += 1
+
+        return num_pages_written
+
+    def ingest_wiki_data(
+        self,
+        category: str,
+        filepath: str,
+        inverse_filter: list,
+        category_pages_downloaded: dict,
+        depth: int,
+    ) -> int:
+        """
+        Ingests the pages of a Wikipedia category and its subcategories from the local dumps and saves them to the
+        specified filepath, in the same layout as Downloader.fetch_wiki_data.
+
+        Args:
+            category (str): The root Wikipedia category.
+            filepath (str): The directory path to save the data.
+            inverse_filter (list): A list of words/phrases; category or pages containing any of these as substring will be excluded.
+            category_pages_downloaded (dict): A dictionary to track the number of pages written per category.
+            depth (int): The max depth of the category tree.
+
+        Returns:
+            int: The total number of pages written.
+        """
+        try:
+            if depth < 1:
+                return 0
+            connection = self.connect_work_db()
+            try:
+                self.load_categorylinks(connection)
+                self.load_page_titles(connection)
+                num_pages_assigned = self.resolve_category_tree(
+                    connection, category, filepath, inverse_filter, depth
+                )
+                self.logger.info(f"Resolved {num_pages_assigned} pages in the category tree of {category}.")
+                return self.write_pages(connection, category_pages_downloaded)
+            finally:
+                connection.close()
+
+        except Exception as e:
+            raise DumpIngesterException(
+                f"Error ingesting dump data for category {category}: {e}"
+            )
@@ -1,8 +1,7 @@
-import json
 import logging
 import os
-from pathlib import Path
-from typing import Dict, List, Tuple
+import queue
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 from haystack import Document
 import redis
 from haystack.components.embedders import OpenAIDocumentEmbedder
@@ -14,10 +13,21 @@ from haystack_integrations.document_stores.elasticsearch import (
 )
 from haystack.components.writers import DocumentWriter
 from haystack.document_stores.types import DuplicatePolicy
-from lib.wiki.index.chunk.helpers import get_documents_and_page_hierarchy
-from lib.wiki.index.download.helpers import get_title_pathname_map
+from lib.wiki.index.chunk.helpers import get_documents_and_page_hierarchy_from_result
+from lib.wiki.index.chunk.near_duplicates import NearDuplicateDetector
+from lib.wiki.index.chunk.table_serializer import count_tokens
+from lib.wiki.index.embed.embedding_scheduler import EmbeddingScheduler
+from lib.wiki.index.pipeline.staged_pipeline import PipelineError, StagedPipeline
 from lib.wiki.index.graph.page_graph_creator import Neo4jPageGraphCreator
 from lib.wiki.index.graph.category_graph_creator import Neo4jCategoryGraphCreator
+from lib.wiki.index.graph.bulk_import_exporter import Neo4jBulkImportExporter
+from lib.wiki.index.store.page_store import FilePageStore, PageStore
+from lib.wiki.index.store.bulk_writers import ElasticsearchBulkWriter, WeaviateBulkWriter
+from lib.wiki.index.store.chunk_store import FileChunkStore
+from lib.wiki.index.store.embedding_store import FileEmbeddingStore
+from lib.wiki.index.store.corpus_manifest import CorpusManifest, get_category_layout
+from lib.wiki.index.store.failed_page_queue import FailedPageQueue
+from lib.wiki.index.store.progress_ledger import STORE_CHECKPOINT_SETS, ProgressLedger, RedisSetLedger
 
 
 class IndexerException(Exception):
@@ -34,7 +44,56 @@ class Indexer:
         e_store: ElasticsearchDocumentStore,
         page_graph_creator: Neo4jPageGraphCreator,
         category_graph_creator: Neo4jCategoryGraphCreator,
+        page_store: Optional[PageStore] = None,
+        manifest: Optional[CorpusManifest] = None,
+        ledger: Optional[ProgressLedger] = None,
+        chunk_store: Optional[FileChunkStore] = None,
+        near_duplicate_detector: Optional[NearDuplicateDetector] = None,
+        embedding_scheduler: Optional[EmbeddingScheduler] = None,
+        embedding_store: Optional[FileEmbeddingStore] = None,
+        e_bulk_writer: Optional[ElasticsearchBulkWriter] = None,
+        w_bulk_writer: Optional[WeaviateBulkWriter] = None,
+        pipelined: bool = False,
+        pipeline_queue_size: int = 2,
+        write_graphs: bool = True,
+        failed_pages: Optional[FailedPageQueue] = None,
     ):
+        """
+        With an embedding_scheduler, index_wiki_data queues the chunked pages and indexes them together once they hold
+        enough tokens to fill every concurrent embedding batch of the scheduler: the documents of many pages are
+        embedded with a few large, concurrent requests instead of one embedder run per page. Without it, pages are
+        indexed one by one, each embedded with openai_doc_embedder.
+
+        With a near_duplicate_detector, chunks that duplicate (or nearly duplicate) a chunk indexed before are not
+        embedded nor stored in Weaviate: the canonical chunk stands for them in vector search. They are still stored in
+        Elasticsearch, with the id of their canonical chunk in meta 'duplicate_of', and in the page graph, so that the
+        hierarchy of every page keeps all its chunks.
+
+        The embedded documents of every page are kept in embedding_store (by default, float32 matrices in the
+        .metadata/index/embeddings directory), and written to Weaviate straight from their memory-mapped embeddings.
+
+        The documents of all the pages indexed together are written to each document store at once. With e_bulk_writer
+        and w_bulk_writer, they are written with concurrent bulk requests (instead of a DocumentWriter with
+        DuplicatePolicy.SKIP, which checks every id first), and pages are also queued until they hold enough documents
+        to fill every concurrent Elasticsearch bulk request. Either way, the writes are acknowledged before the pages
+        are marked as indexed.
+
+        If pipelined, index_wiki_data runs the groups of pages through a StagedPipeline: the Elasticsearch, embedding,
+        Weaviate and Neo4j steps of indexing (see get_index_stages) each run in their own thread, on successive groups,
+        with up to pipeline_queue_size groups waiting in front of every step. The pages are marked as indexed (and the
+        categories after them) by the calling thread, in order, once their group went through all the steps.
+
+        Without write_graphs, no page or category graph is written to Neo4j: the graph of a cold load is exported with
+        export_graph and loaded with neo4j-admin database import instead.
+
+        Every store a page is written to is checkpointed as soon as the write is acknowledged (see record_store_writes),
+        until the page is marked as indexed, so that a page indexed again (after failing, or after the run was stopped)
+        is only written to the stores it is missing. A page that fails (eg. its documents cannot be written to a store)
+        does not stop the others: it is added to failed_pages (by default, the 'failed_pages' Redis hash) with the step
+        that failed and the reason, and index_wiki_data retries the failed pages first. The writers are idempotent (ids
+        are kept in Elasticsearch, uuids are derived from ids in Weaviate, the graph is merged), so a page written again
+        after a crash is not duplicated.
+        """
         self.logger = logger
         self.redis = redis_client
         self.embedder = openai_doc_embedder
@@ -48,105 +107,570 @@ class Indexer:
         )
         self.page_graph_creator = page_graph_creator
         self.category_graph_creator = category_graph_creator
+        self.page_store = page_store or FilePageStore()
+        self.manifest = manifest
+        self.ledger = ledger or RedisSetLedger(redis_client)
+        self.chunk_store = chunk_store or FileChunkStore()
+        self.near_duplicate_detector = near_duplicate_detector
+        self.embedding_store = embedding_store or FileEmbeddingStore()
+        if embedding_scheduler is None:
+            self.embedding_scheduler = EmbeddingScheduler(openai_doc_embedder)
+            self.max_pending_tokens = 0
+        else:
+            self.embedding_scheduler = embedding_scheduler
+            self.max_pending_tokens = embedding_scheduler.max_batch_tokens * embedding_scheduler.concurrency
+        self.e_bulk_writer = e_bulk_writer
+        self.w_bulk_writer = w_bulk_writer
+        self.max_pending_documents = 0
+        if e_bulk_writer is not None:
+            self.max_pending_documents = e_bulk_writer.batch_size * e_bulk_writer.concurrency
+        self.pending_pages: Dict[str, Tuple[str, str, str, dict]] = {}
+        # pages put into the pipeline and not marked yet
+        self.in_flight_pages: Set[str] = set()
+        self.pending_tokens = 0
+        self.pending_documents = 0
+        self.pending_categories: List[str] = []
+        self.pipelined = pipelined
+        self.pipeline_queue_size = pipeline_queue_size
+        self.pipeline: Optional[StagedPipeline] = None
+        self.write_graphs = write_graphs
+        self.failed_pages = failed_pages or FailedPageQueue(redis_client)
+        self.failed_page_titles = set()
+        self.num_failed_pages = 0
+        # (store, page titles) written by the steps, recorded in the checkpoint sets by the calling thread
+        self.store_writes = queue.SimpleQueue()
 
     def store_documents_elasticsearch(self, documents: List[Document]) -> None:
         """
         Store documents in ElasticsearchDocumentStore.
         """
-        self.e_writer.run(documents=documents)
+        if self.e_bulk_writer is not None:
+            self.e_bulk_writer.write_documents(documents)
+        else:
+            self.e_writer.run(documents=documents)
+
+    def read_embedded_documents(self, filepath: str, page_filename: str) -> Optional[List[Document]]:
+        """
+        Get embedded documents from the embedding store, None if the page has not been embedded yet.
+        """
+        return self.embedding_store.read_documents(filepath, page_filename)
+
+    def write_embedded_documents(
+        self, filepath: str, page_filename: str, embedded_documents: List[Document]
+    ) -> None:
+        """
+        Store the embedded documents of a page in the embedding store.
+        """
+        self.embedding_store.write_documents(filepath, page_filename, embedded_documents)
 
     def get_embedded_documents(
         self, documents: List[Document], filepath: str, page_filename: str
     ) -> List[Document]:
         """
-        Get embedded documents from ./metadta/index/embeddings. Create embeddings using the OpenAIDocumentEmbedder and store
-        the embedded documents in the same directory if they do not already exist.
+        Get embedded documents from the embedding store. Create embeddings with the embedding scheduler (which reuses
+        the embeddings of the same texts from its embedding cache, if any) and store the embedded documents if they do
+        not already exist.
+        """
+        embedded_documents = self.read_embedded_documents(filepath, page_filename)
+        if embedded_documents is not None:
+            return embedded_documents
+        embedded_documents = self.embedding_scheduler.embed({page_filename: documents})[page_filename]
+        self.write_embedded_documents(filepath, page_filename, embedded_documents)
+        return embedded_documents
+
+    def get_canonical_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Marks the near duplicates among documents (meta 'duplicate_of') and returns the others, the documents to embed.
+        """
+        if self.near_duplicate_detector is None:
+            return documents
+        canonical_documents = []
+        for doc in documents:
+            canonical_id = self.near_duplicate_detector.add(doc.id, doc.content or "")
+            if canonical_id == doc.id:
+                canonical_documents.append(doc)
+            else:
+                doc.meta["duplicate_of"] = canonical_id
+        return canonical_documents
+
+    def log_near_duplicate_savings(self) -> None:
+        if self.near_duplicate_detector is None:
+            return
+        savings = self.near_duplicate_detector.get_savings()
+        if savings["chunks"] == 0:
+            return
+        self.logger.info(
+            f"Near duplicate chunks: {savings['duplicate_chunks']} of {savings['chunks']} not embedded "
+            f"({savings['duplicate_tokens']} of {savings['tokens']} tokens, "
+            f"{savings['duplicate_tokens'] / savings['tokens']:.1%}; about ${savings['saved_cost']:.4f} saved)."
+        )
+
+    def store_documents_weaviate(self, documents: List[Document]) -> None:
+        """
+        store documents in WeaviateDocumentStore.
+        """
+        if self.w_bulk_writer is not None:
+            self.w_bulk_writer.write_documents(documents)
+        else:
+            self.w_writer.run(documents=documents)
+
+    def index_page(self, filepath: str, page_title: str, page_filename: str) -> None:
+        """
+        Indexes a single chunked page in Elasticsearch, Weaviate and Neo4j and marks it in the 'indexed_pages' set.
+        Raises IndexerException if the page failed (it is then in the failed page queue too).
+        """
+        result = self.chunk_store.read_result(filepath, page_title, page_filename)
+        failed = self.index_page_results([(filepath, page_title, page_filename, result)])
+        if page_title in failed:
+            stage, reason = failed[page_title]
+            raise IndexerException(f"Error indexing page {page_title} ({stage}): {reason}")
+
+    def prepare_pages(
+        self,
+        records: List[Tuple[str, str, str, dict]],
+        categories: Optional[List[str]] = None,
+        checkpoints: Optional[Dict[str, List[str]]] = None,
+    ) -> dict:
+        """
+        First step of indexing chunked pages ([(filepath, page title, page filename, result)]): gets the documents and
+        hierarchy of every page from its chunk result, marks the near duplicates, stores the documents of all the pages
+        in Elasticsearch and reads their stored embeddings.
+
+        checkpoints are the stores that pages were written to by an earlier attempt (see get_checkpoints): those pages
+        are not written to them again, and a page already in Weaviate is not embedded.
+
+        Returns:
+            dict: The pages ('pages': [(filepath, page title, page filename, hierarchy, embedded documents)]), the
+                documents to embed by page title ('documents_to_embed'), the categories to mark as indexed with the
+                pages ('categories'), where every page is stored ('locations': page title -> (filepath, page filename)),
+                the stores every page is written to so far ('stores': page title -> set of stores, the checkpoints
+                included; see STORE_CHECKPOINT_SETS), the checkpoints, and the pages that failed ('failed': page
+                title -> (step, reason)), which the next steps skip.
+        """
+        checkpoints = checkpoints or {}
+        group = {
+            "pages": [],
+            "documents_to_embed": {},
+            "categories": categories or [],
+            "locations": {},
+            "stores": {},
+            "checkpoints": checkpoints,
+            "failed": {},
+        }
+        documents_by_title = {}
+        for filepath, page_title, page_filename, result in records:
+            group["locations"][page_title] = (filepath, page_filename)
+            group["stores"][page_title] = set(checkpoints.get(page_title, []))
+            try:
+                documents, hierarchy = get_documents_and_page_hierarchy_from_result(
+                    result, page_title, f"the chunk result of page {page_title}"
+                )
+                canonical_documents = self.get_canonical_documents(documents)
+                embedded_documents = []
+                if canonical_documents and "weaviate" not in group["stores"][page_title]:
+                    embedded_documents = self.read_embedded_documents(filepath, page_filename)
+                    if embedded_documents is None:
+                        group["documents_to_embed"][page_title] = canonical_documents
+            except Exception as e:
+                self.fail_page(group, page_title, "chunks", e)
+                continue
+            documents_by_title[page_title] = documents
+            group["pages"].append((filepath, page_title, page_filename, hierarchy, embedded_documents))
+
+        self.write_pages(group, "elasticsearch", documents_by_title, self.store_documents_elasticsearch)
+        return group
+
+    def fail_page(self, group: dict, page_title: str, stage: str, e: Exception) -> None:
+        group["failed"][page_title] = (stage, f"{type(e).__name__}: {e}")
+        self.logger.warning(f"Indexing page {page_title} failed ({stage}): {e}")
+
+    def fail_unreadable_pages(self, locations: Dict[str, Tuple[str, str]], errors: Dict[str, Exception]) -> None:
+        """
+        Adds the pages whose chunk result could not be read (errors: page title -> exception) to the failed page queue,
+        as failed at the chunks step (locations: page title -> (filepath, page filename)).
+        """
+        if not errors:
+            return
+        group = {
+            "pages": [],
+            "documents_to_embed": {},
+            "categories": [],
+            "locations": {page_title: locations[page_title] for page_title in errors},
+            "stores": {page_title: set() for page_title in errors},
+            "checkpoints": {},
+            "failed": {},
+        }
+        for page_title, e in errors.items():
+            self.fail_page(group, page_title, "chunks", e)
+        self.mark_pages_indexed(group)
+
+    def run_for_pages(
+        self, group: dict, stage: str, items_by_title: Dict[str, Any], function: Callable[[Dict[str, Any]], Any]
+    ) -> List[Tuple[List[str], Any]]:
+        """
+        Runs a step on the items (documents, hierarchies) of pages (items_by_title) all together. If it fails, it is
+        run again page by page, so that only the pages it fails for fail (see fail_page).
+
+        Returns:
+            List[Tuple[List[str], Any]]: (page titles, output of function) of every successful run.
+        """
+        try:
+            return [(list(items_by_title), function(items_by_title))]
+        except Exception as e:
+            if len(items_by_title) == 1:
+                self.fail_page(group, next(iter(items_by_title)), stage, e)
+                return []
+            self.logger.warning(f"The {stage} step failed for {len(items_by_title)} pages ({e}), retrying page by page.")
+        outputs = []
+        for page_title, items in items_by_title.items():
+            try:
+                outputs.append(([page_title], function({page_title: items})))
+            except Exception as e:
+                self.fail_page(group, page_title, stage, e)
+        return outputs
+
+    def write_pages(
+        self, group: dict, store: str, items_by_title: Dict[str, list], write: Callable[[list], None]
+    ) -> None:
+        """
+        Writes the items of the pages not failed nor written to store yet, all together (or page by page if that fails;
+        see run_for_pages), and adds store to the stores of the pages written (see add_store). A write that adds store
+        to some of the pages itself before failing (see create_page_graphs) is not repeated for them.
+        """
+        items_by_title = {
+            page_title: items
+            for page_title, items in items_by_title.items()
+            if page_title not in group["failed"] and store not in group["stores"][page_title]
+        }
+        if not items_by_title:
+            return
+
+        def write_items(items_by_title: Dict[str, list]) -> None:
+            items = [
+                item
+                for page_title, page_items in items_by_title.items()
+                if store not in group["stores"][page_title]
+                for item in page_items
+            ]
+            if items:
+                write(items)
+
+        for page_titles, _ in self.run_for_pages(group, store, items_by_title, write_items):
+            self.add_store(
+                group, store, [page_title for page_title in page_titles if store not in group["stores"][page_title]]
+            )
+
+    def add_store(self, group: dict, store: str, page_titles: List[str]) -> None:
+        """
+        Adds store to the stores of pages written to it, and queues them to be checkpointed (see record_store_writes).
+        """
+        for page_title in page_titles:
+            group["stores"][page_title].add(store)
+        if page_titles:
+            self.store_writes.put((store, page_titles))
+
+    def record_store_writes(self) -> None:
+        """
+        Records the pages written to every store since the last call in the checkpoint sets of the stores (see
+        STORE_CHECKPOINT_SETS), through the ledger, and flushes the ledger so that they reach Redis at once whatever
+        its durability. The steps of a pipeline write from their own threads, so only the calling thread records them,
+        after every step of a group and before marking pages.
+        """
+        recorded = False
+        while True:
+            try:
+                store, page_titles = self.store_writes.get_nowait()
+            except queue.Empty:
+                break
+            self.ledger.add_many(STORE_CHECKPOINT_SETS[store], page_titles)
+            recorded = True
+        if recorded:
+            self.ledger.flush()
+
+    def embed_pages(self, group: dict) -> dict:
+        """
+        Embeds the documents to embed of all the pages together and stores the embedded documents of every page.
         """
-        page_filename_wo_ext = os.path.splitext(page_filename)[0]
-        embeddings_filepath = os.path.join(
-            filepath, ".metadata/index/embeddings", f"{page_filename_wo_ext}.json"
+        documents_to_embed = {
+            page_title: documents
+            for page_title, documents in group["documents_to_embed"].items()
+            if page_title not in group["failed"]
+        }
+        if not documents_to_embed:
+            return group
+        embedded_documents_by_title = {}
+        for _, output in self.run_for_pages(group, "embedding", documents_to_embed, self.embedding_scheduler.embed):
+            embedded_documents_by_title.update(output)
+        pages = []
+        for filepath, page_title, page_filename, hierarchy, embedded_documents in group["pages"]:
+            if page_title in embedded_documents_by_title:
+                embedded_documents = embedded_documents_by_title[page_title]
+                try:
+                    self.write_embedded_documents(filepath, page_filename, embedded_documents)
+                except Exception as e:
+                    self.fail_page(group, page_title, "embedding", e)
+            pages.append((filepath, page_title, page_filename, hierarchy, embedded_documents))
+        return {**group, "pages": pages, "documents_to_embed": {}}
+
+    def store_pages_weaviate(self, group: dict) -> dict:
+        """
+        Stores the embedded documents of all the pages in Weaviate together.
+        """
+        self.write_pages(
+            group,
+            "weaviate",
+            {page_title: embedded_documents for _, page_title, _, _, embedded_documents in group["pages"]},
+            self.store_documents_weaviate,
         )
+        return group
 
-        if os.path.exists(embeddings_filepath):
-            with open(embeddings_filepath, "r") as file:
-                data = json.load(file)
-            return [Document.from_dict(doc) for doc in data["documents"]]
+    def create_page_graphs(self, group: dict) -> dict:
+        """
+        Creates the graphs of all the pages together (in as few write transactions as the page graph creator allows).
+        If that fails, the pages whose transactions were committed are kept as written to Neo4j, and only the others
+        are written again, page by page.
+        """
 
-        metadata_emdeddings_path = os.path.join(filepath, ".metadata/index/embeddings")
-        if not os.path.exists(metadata_emdeddings_path):
-            os.makedirs(metadata_emdeddings_path)
+        def create_graphs(hierarchies: List[dict]) -> None:
+            written = []
+            try:
+                self.page_graph_creator.create_graphs(hierarchies, written)
+            finally:
+                self.add_store(group, "neo4j", written)
 
-        # Create embeddings and store embedded documents
-        embedded_documents = self.embedder.run(documents=documents)
-        if "documents" not in embedded_documents:
-            raise KeyError(
-                "The 'documents' key is missing in the embedded_documents returned from embedder."
+        if self.write_graphs:
+            self.write_pages(
+                group,
+                "neo4j",
+                {page_title: [hierarchy] for _, page_title, _, hierarchy, _ in group["pages"]},
+                create_graphs,
             )
-        embedded_docs_file_to_save = {
-            "documents": [
-                doc.to_dict() for doc in embedded_documents["documents"]
-            ],  # convert Haystack Document object to dict
-            "meta": embedded_documents["meta"] if "meta" in embedded_documents else {},
+        return group
+
+    def get_checkpoints(self, page_titles: List[str]) -> Dict[str, List[str]]:
+        """
+        Returns the stores that pages were written to by an earlier attempt that did not index them (the page failed, or
+        the run was stopped), by page title; one lookup per store for all the pages.
+        """
+        checkpoints = {}
+        for store, name in STORE_CHECKPOINT_SETS.items():
+            for page_title, written in zip(page_titles, self.ledger.contains_many(name, page_titles)):
+                if written:
+                    checkpoints.setdefault(page_title, []).append(store)
+        return checkpoints
+
+    def mark_pages_indexed(self, group: dict) -> None:
+        """
+        Marks the pages, then the categories, in the 'indexed_pages' and 'indexed_categories' sets, and clears the
+        checkpoints of the pages marked (after recording the pending ones, see record_store_writes, and flushing the
+        marks).
+
+        A page that failed is not marked: it is added to the failed page queue with the step that failed and the
+        reason, and keeps its checkpoints, so that the next attempt only writes the other stores. Its categories are
+        still marked; the page is retried from the queue.
+        """
+        self.record_store_writes()
+        self.in_flight_pages.difference_update(group["locations"])
+        indexed_page_titles = []
+        for page_title, (filepath, page_filename) in group["locations"].items():
+            if page_title in group["failed"]:
+                stage, reason = group["failed"][page_title]
+                self.failed_pages.add(page_title, filepath, page_filename, stage, reason)
+                self.failed_page_titles.add(page_title)
+                self.num_failed_pages += 1
+                continue
+            self.ledger.add("indexed_pages", page_title)
+            if self.manifest is not None:
+                self.manifest.set_page_status("indexed", [page_title])
+            if page_title in self.failed_page_titles:
+                self.failed_pages.remove(page_title)
+                self.failed_page_titles.discard(page_title)
+            indexed_page_titles.append(page_title)
+        checkpoints_to_clear = {
+            name: [page_title for page_title in indexed_page_titles if store in group["stores"][page_title]]
+            for store, name in STORE_CHECKPOINT_SETS.items()
         }
-        with open(embeddings_filepath, "w") as file:
-            json.dump(embedded_docs_file_to_save, file)
+        if any(checkpoints_to_clear.values()):
+            # a page must be in 'indexed_pages' in Redis before its checkpoints are removed, or a crash in between
+            # would leave it with neither
+            self.ledger.flush()
+        for name, page_titles in checkpoints_to_clear.items():
+            self.ledger.remove_many(name, page_titles)
+        for category in group["categories"]:
+            self.ledger.add("indexed_categories", category)
+            if self.manifest is not None:
+                self.manifest.set_category_status("indexed", [category])
+
+    def get_index_stages(self) -> List[Tuple[str, Callable[[Any], dict]]]:
+        """
+        Returns the stages of indexing a group of pages ((records, categories, checkpoints)), in order; the pages are
+        then marked by mark_pages_indexed.
+        """
+        return [
+            ("elasticsearch", lambda item: self.prepare_pages(*item)),
+            ("embedding", self.embed_pages),
+            ("weaviate", self.store_pages_weaviate),
+            ("neo4j", self.create_page_graphs),
+        ]
 
-        return embedded_documents["documents"]
+    def index_page_results(
+        self, records: List[Tuple[str, str, str, dict]], categories: Optional[List[str]] = None
+    ) -> Dict[str, Tuple[str, str]]:
+        """
+        Indexes chunked pages from their chunk results ([(filepath, page title, page filename, result)]) and marks them
+        in the 'indexed_pages' set, then marks categories in the 'indexed_categories' set. The documents of all the
+        pages are stored in Elasticsearch together, the documents of the pages without stored embeddings are embedded
+        together by the embedding scheduler, and the embedded documents of all the pages are stored in Weaviate together.
+        The page graphs are then created and the pages marked.
 
-    def store_documents_weaviate(self, documents: List[Document]) -> None:
+        Returns:
+            Dict[str, Tuple[str, str]]: The pages that failed (page title -> (step, reason)).
         """
-        store documents in WeaviateDocumentStore.
+        group = (records, categories, self.get_checkpoints([page_title for _, page_title, _, _ in records]))
+        for _, stage in self.get_index_stages():
+            group = stage(group)
+            self.record_store_writes()
+        self.mark_pages_indexed(group)
+        return group["failed"]
+
+    def queue_page_result(
+        self, filepath: str, page_title: str, page_filename: str, result: dict
+    ) -> bool:
         """
-        self.w_writer.run(documents=documents)
+        Queues a chunked page to be indexed with the next pending pages, and indexes the pending pages once they hold
+        max_pending_tokens tokens and max_pending_documents documents.
+
+        Returns:
+            bool: False if the page was already pending or is still in the pipeline (a page listed in several
+            categories).
+        """
+        if page_title in self.pending_pages or page_title in self.in_flight_pages:
+            return False
+        self.pending_pages[page_title] = (filepath, page_title, page_filename, result)
+        documents = result.get("splitter", {}).get("documents", [])
+        self.pending_tokens += count_tokens("".join(doc.get("content") or "" for doc in documents))
+        self.pending_documents += len(documents)
+        if self.pending_tokens >= self.max_pending_tokens and self.pending_documents >= self.max_pending_documents:
+            self.index_pending_pages()
+        return True
+
+    def queue_category_indexed(self, category: str) -> None:
+        """
+        Marks a category as indexed once its pending pages are indexed.
+        """
+        self.pending_categories.append(category)
+        if not self.pending_pages:
+            self.index_pending_pages()
+
+    def index_pending_pages(self) -> None:
+        """
+        Indexes the pending pages, then marks the pending categories (whose pages were all queued before them) as
+        indexed. With a running pipeline, the pages and categories are put into it instead, and the groups that went
+        through it are marked.
+        """
+        records = list(self.pending_pages.values())
+        categories = list(self.pending_categories)
+        self.pending_pages.clear()
+        self.pending_tokens = 0
+        self.pending_documents = 0
+        self.pending_categories.clear()
+        if not records and not categories:
+            return
+        if self.pipeline is not None:
+            checkpoints = self.get_checkpoints([page_title for _, page_title, _, _ in records])
+            self.in_flight_pages.update(page_title for _, page_title, _, _ in records)
+            self.pipeline.put((records, categories, checkpoints), len(records))
+            for group in self.pipeline.get_outputs():
+                self.mark_pages_indexed(group)
+            self.record_store_writes()
+            return
+        self.index_page_results(records, categories)
+
+    def start_pipeline(self) -> None:
+        if self.pipelined and self.pipeline is None:
+            self.pipeline = StagedPipeline(self.get_index_stages(), self.pipeline_queue_size)
+            self.pipeline.start()
+
+    def finish_pipeline(self, cancel: bool = False) -> None:
+        """
+        Waits for the groups of pages in the pipeline (or, with cancel, drops the groups still queued), marks the
+        groups that went through it as indexed and logs the throughput of every stage.
+        """
+        if self.pipeline is None:
+            return
+        pipeline, self.pipeline = self.pipeline, None
+        for group in pipeline.close(cancel):
+            self.mark_pages_indexed(group)
+        # the pages of dropped groups were not indexed
+        self.in_flight_pages.clear()
+        self.log_pipeline_stats(pipeline.get_stats())
+        pipeline.check()
+
+    def log_pipeline_stats(self, stats: Dict[str, Dict[str, float]]) -> None:
+        for name, stage_stats in stats.items():
+            if stage_stats["items"] == 0:
+                continue
+            rate = stage_stats["size"] / stage_stats["busy_seconds"] if stage_stats["busy_seconds"] > 0 else 0.0
+            self.logger.info(
+                f"Pipeline stage {name}: {stage_stats['size']} pages in {stage_stats['busy_seconds']:.1f}s "
+                f"({rate:.1f} pages/s), idle {stage_stats['idle_seconds']:.1f}s, "
+                f"blocked {stage_stats['blocked_seconds']:.1f}s."
+            )
+
+    def log_embedding_stats(self) -> None:
+        stats = self.embedding_scheduler.get_stats()
+        if stats["batches"] == 0 and stats["cached_documents"] == 0:
+            return
+        self.logger.info(
+            f"Embedded {stats['documents']} chunks (about {stats['tokens']} tokens) in {stats['batches']} batches, "
+            f"{stats['seconds']:.1f}s; {stats['cached_documents']} chunks reused a cached embedding."
+        )
 
     def index_wiki_pages(
         self, category: str, filepath: str, category_pages_indexed: Dict[str, int]
     ) -> int:
         """
-        Indexes already chunked wiki data for all pages in a category and its subcategories. Chunked data is available in
-        the .metadata/chunk directory. The intermediate embeddings are stored in the .metadata/index/embeddings directory.
+        Indexes already chunked wiki data for all pages in a category and its subcategories. Chunked data is read from
+        the chunk store (by default, the .metadata/chunk directory). The intermediate embeddings are stored in the embedding store.
 
         List of Haystack Document objects is created from stored chunks and stored into three databases:
         - ElasticsearchDocumentStore: for full-text search (list of Document objects without embeddings is stored)
         - WeaviateDocumentStore: for vector search (list of Document objects enriched with embeddings is stored)
         - Neo4j: for graph search (list of Document objects are stored as Chunk type nodes and Section, Page, Category type nodes
         are created to represent the structure of the data)
-        """
-        title_pathname = get_title_pathname_map(category, filepath)
 
-        pages_filename_set = {file.name for file in Path(filepath).glob("*.html")}
-        categories_dirname_set = {
-            dir.name
-            for dir in Path(filepath).iterdir()
-            if dir.is_dir() and dir.name != ".metadata"
-        }
+        Pages (and the categories marked as indexed) are queued and indexed in groups (see queue_page_result); the last
+        group is indexed by index_pending_pages.
+        """
+        title_pathname, pages_filename_set, categories_dirname_set = (
+            get_category_layout(category, filepath, self.page_store, self.manifest)
+        )
 
         num_total_pages_indexed = 0
 
-        pages = title_pathname["pages"]
-        for page_title, page_filename in pages.items():
-            if self.redis.sismember("indexed_pages", page_title):
-                continue
-            if page_filename not in pages_filename_set:
-                continue
-            documents, hierarchy = get_documents_and_page_hierarchy(
-                filepath, page_title, page_filename
-            )
-            self.store_documents_elasticsearch(documents)
-            embedded_documents = self.get_embedded_documents(
-                documents, filepath, page_filename
-            )
-            self.store_documents_weaviate(embedded_documents)
-            self.page_graph_creator.create_graph(hierarchy)
-            self.redis.sadd("indexed_pages", page_title)
-            num_total_pages_indexed += 1
+        pages = {
+            page_title: page_filename
+            for page_title, page_filename in title_pathname["pages"].items()
+            if not self.ledger.contains("indexed_pages", page_title)
+            and page_title not in self.failed_page_titles  # retried by retry_failed_pages
+            and page_filename in pages_filename_set
+        }
+        # chunk results are streamed from the chunk store in storage order; a page whose result cannot be read fails
+        # alone
+        errors = {}
+        for page_title, page_filename, result in self.chunk_store.iter_results(filepath, pages, errors):
+            if self.queue_page_result(filepath, page_title, page_filename, result):
+                num_total_pages_indexed += 1
+        self.fail_unreadable_pages(
+            {page_title: (filepath, page_filename) for page_title, page_filename in pages.items()}, errors
+        )
 
         if num_total_pages_indexed > 0:
             category_pages_indexed[category] = num_total_pages_indexed
 
         subcategories = title_pathname["categories"]
         for subcategory_title, subcategory_path in subcategories.items():
-            if self.redis.sismember("indexed_categories", subcategory_title):
+            if self.ledger.contains("indexed_categories", subcategory_title):
                 continue
             if subcategory_path not in categories_dirname_set:
                 continue
@@ -154,38 +678,57 @@ class Indexer:
             num_total_pages_indexed += self.index_wiki_pages(
                 subcategory_title, subcategory_path, category_pages_indexed
             )
-            self.redis.sadd("indexed_categories", subcategory_title)
+            self.queue_category_indexed(subcategory_title)
 
         return num_total_pages_indexed
 
-    def build_category_graph(self, category: str, filepath: str) -> int:
+    def build_category_graph(
+        self, category: str, filepath: str, categories_set: str = "indexed_categories"
+    ) -> int:
         """
         Creates a graph representation of the category and connections to its subcategories and pages. The graph is created
         on top of the individual page hierarchy graphs already existing in Neo4j.
+
+        Only subcategories present in the Redis 'categories_set' are linked ('downloaded_categories' when the data was
+        processed by frontier workers, which track pages rather than categories).
+
+        The relationships of the whole category tree are collected first, then written together in a few batches.
+
+        Returns:
+            int: The number of relationships written.
         """
-        title_pathname = get_title_pathname_map(category, filepath)
+        category_pages = []
+        subcategories = []
+        self.collect_category_graph(category, filepath, categories_set, category_pages, subcategories)
+        self.category_graph_creator.create_relationships(category_pages, subcategories)
+        return len(category_pages) + len(subcategories)
+
+    def collect_category_graph(
+        self,
+        category: str,
+        filepath: str,
+        categories_set: str,
+        category_pages: List[Tuple[str, str]],
+        subcategories: List[Tuple[str, str]],
+    ) -> None:
+        """
+        Adds the (category, page) and (category, subcategory) relationships of a category and its subcategories to
+        category_pages and subcategories (see build_category_graph).
+        """
+        title_pathname, _, categories_dirname_set = get_category_layout(
+            category, filepath, self.page_store, self.manifest
+        )
 
         pages = title_pathname["pages"]
         for page_title in pages:
-            if not self.redis.sismember("indexed_pages", page_title):
+            if not self.ledger.contains("indexed_pages", page_title):
                 continue
-            self.category_graph_creator.create_category_to_page_relationship(
-                category, page_title
-            )
-            
-        categories_dirname_set = {
-            dir.name
-            for dir in Path(filepath).iterdir()
-            if dir.is_dir() and dir.name != ".metadata"
-        }
+            category_pages.append((category, page_title))
 
-        subcategories = title_pathname["categories"]
-        for subcategory_title, subcategory_path in subcategories.items():
-            if not self.redis.sismember("indexed_categories", subcategory_title):
+        for subcategory_title, subcategory_path in title_pathname["categories"].items():
+            if not self.ledger.contains(categories_set, subcategory_title):
                 continue
-            self.category_graph_creator.create_category_to_subcategory_relationship(
-                category, subcategory_title
-            )
+            subcategories.append((category, subcategory_title))
             # Create the category -> subcategory relationship as above.
             # But if the subcategory's data is not available under this category, skip recursive call.
             # This will happen when a subcategory has more than one parent category,
@@ -193,7 +736,155 @@ class Indexer:
             if subcategory_path not in categories_dirname_set:
                 continue
             subcategory_path = os.path.join(filepath, subcategory_path)
-            self.build_category_graph(subcategory_title, subcategory_path)
+            self.collect_category_graph(
+                subcategory_title, subcategory_path, categories_set, category_pages, subcategories
+            )
+
+    def export_graph(
+        self,
+        category: str,
+        filepath: str,
+        exporter: Neo4jBulkImportExporter,
+        categories_set: str = "chunked_categories",
+    ) -> int:
+        """
+        Exports the graph of the chunked pages of a category and its subcategories (page hierarchies from the chunk store,
+        category to page and category to subcategory relationships) for a bulk import, as build_category_graph and the
+        page graph creator would write it once the pages are indexed.
+
+        Only subcategories present in the Redis 'categories_set' are linked.
+
+        Returns:
+            int: The number of pages exported.
+        """
+        title_pathname, pages_filename_set, categories_dirname_set = get_category_layout(
+            category, filepath, self.page_store, self.manifest
+        )
+
+        num_pages_exported = 0
+        pages = {
+            page_title: page_filename
+            for page_title, page_filename in title_pathname["pages"].items()
+            if self.ledger.contains("chunked_pages", page_title) and page_filename in pages_filename_set
+        }
+        for page_title, page_filename, result in self.chunk_store.iter_results(filepath, pages):
+            if "hierarchy" not in result.get("splitter", {}):
+                raise KeyError(f"The 'hierarchy' key is missing in the chunk result of page {page_title}.")
+            if exporter.add_page(result["splitter"]["hierarchy"][page_title]):
+                num_pages_exported += 1
+            exporter.add_category_page(category, page_title)
+
+        subcategories = title_pathname["categories"]
+        for subcategory_title, subcategory_path in subcategories.items():
+            if not self.ledger.contains(categories_set, subcategory_title):
+                continue
+            exporter.add_subcategory(category, subcategory_title)
+            # as in build_category_graph, the data of a subcategory is only under one of its parent categories
+            if subcategory_path not in categories_dirname_set:
+                continue
+            subcategory_path = os.path.join(filepath, subcategory_path)
+            num_pages_exported += self.export_graph(
+                subcategory_title, subcategory_path, exporter, categories_set
+            )
+        return num_pages_exported
+
+    def purge_stale_chunks(self) -> int:
+        """
+        Removes the chunks of pages re-downloaded by a refresh (ids in the 'stale_chunks' set) from Elasticsearch,
+        Weaviate and Neo4j. The re-chunked pages are indexed again under new chunk ids.
+
+        With a near duplicate detector, the stale chunks are removed from it too, and the duplicates of the stale
+        canonical chunks (in other pages) are promoted first (see promote_duplicates).
+        """
+        stale_chunk_ids = [
+            chunk_id.decode() if isinstance(chunk_id, bytes) else chunk_id
+            for chunk_id in self.redis.smembers("stale_chunks")
+        ]
+        if not stale_chunk_ids:
+            return 0
+
+        self.e_store.delete_documents(stale_chunk_ids)
+        self.w_store.delete_documents(stale_chunk_ids)
+        self.page_graph_creator.delete_chunks(stale_chunk_ids)
+        if self.near_duplicate_detector is not None:
+            self.promote_duplicates(self.near_duplicate_detector.get_promotions(stale_chunk_ids))
+            self.near_duplicate_detector.remove(stale_chunk_ids)
+        self.redis.srem("stale_chunks", *stale_chunk_ids)
+        self.logger.info(f"Purged {len(stale_chunk_ids)} stale chunks.")
+        return len(stale_chunk_ids)
+
+    def promote_duplicates(self, promotions: Dict[str, Optional[str]]) -> None:
+        """
+        Keeps the duplicates of removed canonical chunks in vector search (promotions: the new canonical chunk of every
+        duplicate, None for a promoted chunk; see NearDuplicateDetector.get_promotions). The chunks are read back from
+        Elasticsearch and written again to it with their new 'duplicate_of', then the promoted ones are embedded and
+        stored in Weaviate. This runs before the canonical chunks are removed from the detector, so that the next purge
+        runs it again if it fails.
+        """
+        if not promotions:
+            return
+        documents = self.e_store.filter_documents(
+            filters={"field": "id", "operator": "in", "value": list(promotions)}
+        )
+        promoted_documents = []
+        for doc in documents:
+            if promotions[doc.id] is None:
+                doc.meta.pop("duplicate_of", None)
+                promoted_documents.append(doc)
+            else:
+                doc.meta["duplicate_of"] = promotions[doc.id]
+        self.e_store.write_documents(documents, policy=DuplicatePolicy.OVERWRITE)
+        if promoted_documents:
+            self.store_documents_weaviate(self.embedding_scheduler.embed({None: promoted_documents})[None])
+        self.logger.info(
+            f"Promoted {len(promoted_documents)} near duplicate chunks to canonical chunks in place of stale chunks."
+        )
+
+    def retry_failed_pages(self) -> int:
+        """
+        Indexes the pages of the failed page queue again (those that have not failed its max attempts yet), each only
+        in the stores it is missing. Pages indexed since (eg. by a frontier worker) are removed from the queue; pages
+        re-downloaded since and not chunked yet are left to their category. The number of pages that have failed the
+        max attempts, which the run skips, is logged.
+
+        Returns:
+            int: The number of pages retried.
+        """
+        entries = self.failed_pages.get_pages()
+        self.failed_page_titles = set(entries)
+        records = []
+        errors = {}
+        num_dead_pages = 0
+        for page_title, entry in entries.items():
+            if self.ledger.contains("indexed_pages", page_title):
+                self.failed_pages.remove(page_title)
+                self.failed_page_titles.discard(page_title)
+                continue
+            if entry["attempts"] >= self.failed_pages.max_attempts:
+                num_dead_pages += 1
+                continue
+            if not self.chunk_store.has_result(entry["filepath"], page_title, entry["filename"]):
+                continue
+            try:
+                result = self.chunk_store.read_result(entry["filepath"], page_title, entry["filename"])
+            except Exception as e:
+                errors[page_title] = e
+                continue
+            records.append((entry["filepath"], page_title, entry["filename"], result))
+        self.fail_unreadable_pages(
+            {page_title: (entry["filepath"], entry["filename"]) for page_title, entry in entries.items()}, errors
+        )
+        if num_dead_pages > 0:
+            self.logger.warning(
+                f"{num_dead_pages} pages failed {self.failed_pages.max_attempts} times and are no longer retried; "
+                f"see the '{self.failed_pages.name}' Redis hash, and remove their entries to retry them."
+            )
+        if not records:
+            return 0
+        self.logger.info(f"Retrying {len(records)} failed pages ...")
+        failed = self.index_page_results(records)
+        self.logger.info(f"Indexed {len(records) - len(failed)} of {len(records)} failed pages.")
+        return len(records)
 
     def index_wiki_data(
         self, category: str, filepath: str, category_pages_indexed: Dict[str, int]
@@ -201,14 +892,42 @@ class Indexer:
         """
         Indexes the wiki data for a category and its subcategories. The data is indexed in ElasticsearchDocumentStore,
         WeaviateDocumentStore, and Neo4j. The graph representation of the category and its subcategories is created in Neo4j.
+
+        Chunks of pages that were refreshed since the last run are purged from all three stores first. The pages still
+        queued for the embedding scheduler are indexed before the category graph is built. If pipelined, the pipeline
+        runs while the pages are read, and every group in it is indexed before the category graph is built too. With a
+        near duplicate detector, the embedding tokens saved are logged at the end.
+
+        The pages of the failed page queue are retried first (see retry_failed_pages). A page failing does not stop the
+        others; IndexerException is only raised for errors that are not about a page (eg. reading the category tree).
         """
         try:
+            self.purge_stale_chunks()
+            self.retry_failed_pages()
+            self.start_pipeline()
             num_total_pages_indexed = self.index_wiki_pages(
                 category, filepath, category_pages_indexed
             )
-            self.build_category_graph(category, filepath)
+            self.index_pending_pages()
+            self.finish_pipeline()
+            self.log_embedding_stats()
+            if self.write_graphs:
+                self.build_category_graph(category, filepath)
+            self.log_near_duplicate_savings()
+            if self.num_failed_pages > 0:
+                self.logger.warning(
+                    f"{self.num_failed_pages} pages failed and were added to the failed page queue "
+                    f"'{self.failed_pages.name}'."
+                )
 
             return num_total_pages_indexed
 
         except Exception as e:
+            try:
+                self.finish_pipeline(cancel=True)
+            except PipelineError:
+                # already failing with e
+                pass
+            # the stores written by groups that were not marked
+            self.record_store_writes()
             raise IndexerException(f"Error indexing data for category {category}: {e}")
@@ -1,9 +1,11 @@
 import os
 import logging
+from typing import Optional
 from config import config
 import redis
 from dotenv import load_dotenv
 from downloader import Downloader, DownloaderException
+from dump_ingester import DumpIngester, DumpIngesterException
 from chunker import Chunker, ChunkerException
 from indexer import Indexer, IndexerException
 from datetime import datetime
@@ -17,6 +19,18 @@ from haystack_integrations.document_stores.elasticsearch import (
 from neo4j import GraphDatabase
 from lib.wiki.index.graph.page_graph_creator import Neo4jPageGraphCreator
 from lib.wiki.index.graph.category_graph_creator import Neo4jCategoryGraphCreator
+from lib.wiki.index.graph.bulk_import_exporter import Neo4jBulkImportExporter
+from lib.wiki.index.download.async_page_downloader import AsyncPageDownloader
+from lib.wiki.index.store.page_store import FilePageStore, PackedPageStore, PageStore
+from lib.wiki.index.store.bulk_writers import ElasticsearchBulkWriter, WeaviateBulkWriter
+from lib.wiki.index.store.chunk_store import FileChunkStore, ShardedChunkStore
+from lib.wiki.index.store.embedding_store import FileEmbeddingStore
+from lib.wiki.index.store.failed_page_queue import FailedPageQueue
+from lib.wiki.index.store.corpus_manifest import CorpusManifest
+from lib.wiki.index.store.progress_ledger import ProgressLedger, RedisSetLedger
+from lib.wiki.index.chunk.near_duplicates import NearDuplicateDetector
+from lib.wiki.index.embed.embedding_cache import EmbeddingCache
+from lib.wiki.index.embed.embedding_scheduler import EmbeddingScheduler
 
 
 class Resources:
@@ -26,17 +40,42 @@ class Resources:
         w_store: WeaviateDocumentStore,
         e_store: ElasticsearchDocumentStore,
         graph_creator_driver: GraphDatabase.driver,
+        page_store: PageStore,
+        manifest: Optional[CorpusManifest] = None,
+        ledger: Optional[ProgressLedger] = None,
+        chunk_store: Optional[FileChunkStore] = None,
+        near_duplicate_detector: Optional[NearDuplicateDetector] = None,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        embedding_store: Optional[FileEmbeddingStore] = None,
+        failed_pages: Optional[FailedPageQueue] = None,
     ):
         self.redis_client = redis_client
         self.w_store = w_store
         self.e_store = e_store
         self.graph_creator_driver = graph_creator_driver
+        self.page_store = page_store
+        self.manifest = manifest
+        self.ledger = ledger or RedisSetLedger(redis_client)
+        self.chunk_store = chunk_store or FileChunkStore()
+        self.near_duplicate_detector = near_duplicate_detector
+        self.embedding_cache = embedding_cache
+        self.embedding_store = embedding_store or FileEmbeddingStore()
+        self.failed_pages = failed_pages or FailedPageQueue(redis_client)
 
     def close(self):
+        self.ledger.flush()
         self.redis_client.close()
         self.w_store.client.close()
         self.e_store.client.close()
         self.graph_creator_driver.close()
+        self.page_store.close()
+        self.chunk_store.close()
+        if self.near_duplicate_detector is not None:
+            self.near_duplicate_detector.close()
+        if self.embedding_cache is not None:
+            self.embedding_cache.close()
+        if self.manifest is not None:
+            self.manifest.close()
 
 
 def setup_logging():
@@ -69,7 +108,9 @@ def initialize_resources():
     NEO4J_USER = os.getenv("NEO4J_USER")
     NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
     graph_creator_driver = GraphDatabase.driver(
-        f"bolt://{NEO4J_HOST}:{NEO4J_PORT}", auth=(NEO4J_USER, NEO4J_PASSWORD)
+        f"bolt://{NEO4J_HOST}:{NEO4J_PORT}",
+        auth=(NEO4J_USER, NEO4J_PASSWORD),
+        max_transaction_retry_time=config.get("index.graph.max_retry_seconds", 30),
     )
 
     WEAVIATE_HOST = os.getenv("WEAVIATE_HOST")
@@ -82,63 +123,298 @@ def initialize_resources():
         hosts=[f"http://{ELASTICSEARCH_HOST}:{ELASTICSEARCH_PORT}"]
     )
 
+    if config.get("index.page_store.type", "files") == "packed":
+        page_store = PackedPageStore(
+            config.get("index.page_store.dir"),
+            max_segment_bytes=config.get("index.page_store.max_segment_mb", 256) * 1024 * 1024,
+        )
+    else:
+        page_store = FilePageStore()
+
+    if config.get("index.chunk_store.type", "files") == "sharded":
+        chunk_store = ShardedChunkStore(
+            config.get("index.chunk_store.dir"),
+            max_shard_bytes=config.get("index.chunk_store.max_shard_mb", 128) * 1024 * 1024,
+        )
+    else:
+        chunk_store = FileChunkStore()
+
+    manifest = None
+    if config.get("index.manifest.enabled", False):
+        manifest = CorpusManifest(config.get("index.manifest.path"))
+
+    ledger = None
+    if config.get("index.ledger.enabled", False):
+        ledger = ProgressLedger(
+            redis_client,
+            durability=config.get("index.ledger.durability", "batched"),
+            batch_size=config.get("index.ledger.batch_size", 500),
+        )
+
+    near_duplicate_detector = None
+    if config.get("index.near_duplicates.enabled", False):
+        near_duplicate_detector = NearDuplicateDetector(
+            config.get("index.near_duplicates.path"),
+            threshold=config.get("index.near_duplicates.threshold", 0.9),
+            num_perm=config.get("index.near_duplicates.num_perm", 128),
+            bands=config.get("index.near_duplicates.bands", 16),
+            shingle_size=config.get("index.near_duplicates.shingle_size", 3),
+            embedding_price_per_million_tokens=config.get(
+                "index.near_duplicates.embedding_price_per_million_tokens", 0.0
+            ),
+        )
+
+    embedding_cache = None
+    if config.get("index.embedding.cache.enabled", False):
+        embedding_cache = EmbeddingCache(
+            config.get("index.embedding.cache.path"),
+            max_bytes=config.get("index.embedding.cache.max_mb", 0) * 1024 * 1024,
+        )
+
+    embedding_store = FileEmbeddingStore(config.get("index.embedding.dtype", "float32"))
+
+    failed_pages = FailedPageQueue(redis_client, max_attempts=config.get("index.retry.max_attempts", 3))
+
     return Resources(
         redis_client,
         w_store,
         e_store,
         graph_creator_driver,
+        page_store,
+        manifest,
+        ledger,
+        chunk_store,
+        near_duplicate_detector,
+        embedding_cache,
+        embedding_store,
+        failed_pages,
+    )
+
+
+def create_downloader(logger, resources):
+    download_mode = config.get("index.download.mode", "sequential")
+    page_downloader = None
+    if download_mode in ("concurrent", "batched"):
+        page_downloader = AsyncPageDownloader(
+            api_url=config.get("wiki.api_url", "https://en.wikipedia.org/w/api.php"),
+            headers=config.get("wiki.headers"),
+            concurrency=config.get("index.download.concurrency", 4),
+            requests_per_second=config.get("index.download.requests_per_second", 5),
+            max_retries=config.get("index.download.max_retries", 3),
+            backoff_base=config.get("index.download.backoff_base", 0.5),
+        )
+    return Downloader(
+        logger,
+        resources.redis_client,
+        page_downloader,
+        batch_download=download_mode == "batched",
+        track_revisions=config.get("index.download.track_revisions", False),
+        page_store=resources.page_store,
+        manifest=resources.manifest,
+        ledger=resources.ledger,
+        chunk_store=resources.chunk_store,
+        embedding_store=resources.embedding_store,
+        failed_pages=resources.failed_pages,
+    )
+
+
+def create_dump_ingester(logger, resources):
+    return DumpIngester(
+        logger,
+        resources.redis_client,
+        pages_path=config.get("index.dump.pages_path"),
+        categorylinks_path=config.get("index.dump.categorylinks_path"),
+        work_dir=config.get("index.dump.work_dir"),
+        pages_format=config.get("index.dump.format", "xml"),
+        page_table_path=config.get("index.dump.page_table_path"),
+        page_store=resources.page_store,
+        manifest=resources.manifest,
+        ledger=resources.ledger,
+    )
+
+
+def create_chunker(logger, resources):
+    return Chunker(
+        logger,
+        resources.redis_client,
+        resources.page_store,
+        resources.manifest,
+        resources.ledger,
+        processes=config.get("index.chunk.processes", 1),
+        html_backend=config.get("index.chunk.html_backend", "bs4"),
+        batch_size=config.get("index.chunk.batch_size", 1),
+        chunk_store=resources.chunk_store,
+        table_format=config.get("index.chunk.table_format", "html"),
+        max_table_tokens=config.get("index.chunk.max_table_tokens", 256),
+    )
+
+
+def create_indexer(logger, resources):
+    embedding_model = config.get("openai.embedding_model", "text-embedding-3-small")
+    embedding_scheduler = None
+    if config.get("index.embedding.scheduler", False):
+        max_batch_documents = config.get("index.embedding.max_batch_documents", 512)
+        embedder = OpenAIDocumentEmbedder(
+            model=embedding_model, batch_size=max_batch_documents, progress_bar=False
+        )
+        embedding_scheduler = EmbeddingScheduler(
+            embedder,
+            max_batch_tokens=config.get("index.embedding.max_batch_tokens", 100000),
+            max_batch_documents=max_batch_documents,
+            concurrency=config.get("index.embedding.concurrency", 4),
+            cache=resources.embedding_cache,
+        )
+    else:
+        embedder = OpenAIDocumentEmbedder(model=embedding_model)
+        if resources.embedding_cache is not None:
+            # page by page, as without a scheduler
+            embedding_scheduler = EmbeddingScheduler(embedder, cache=resources.embedding_cache)
+    e_bulk_writer = None
+    w_bulk_writer = None
+    if config.get("index.bulk_write.enabled", False):
+        e_bulk_writer = ElasticsearchBulkWriter(
+            resources.e_store,
+            batch_size=config.get("index.bulk_write.elasticsearch_batch_size", 500),
+            concurrency=config.get("index.bulk_write.elasticsearch_concurrency", 4),
+        )
+        w_bulk_writer = WeaviateBulkWriter(
+            resources.w_store,
+            batch_size=config.get("index.bulk_write.weaviate_batch_size", 1000),
+            concurrency=config.get("index.bulk_write.weaviate_concurrency", 2),
+        )
+    page_graph_creator = Neo4jPageGraphCreator(
+        resources.graph_creator_driver,
+        pages_per_transaction=config.get("index.graph.pages_per_transaction", 1),
+        concurrency=config.get("index.graph.concurrency", 1),
+    )
+    category_graph_creator = Neo4jCategoryGraphCreator(
+        resources.graph_creator_driver,
+        batch_size=config.get("index.graph.category_batch_size", 5000),
+    )
+    return Indexer(
+        logger,
+        resources.redis_client,
+        embedder,
+        resources.w_store,
+        resources.e_store,
+        page_graph_creator,
+        category_graph_creator,
+        resources.page_store,
+        resources.manifest,
+        resources.ledger,
+        resources.chunk_store,
+        resources.near_duplicate_detector,
+        embedding_scheduler,
+        resources.embedding_store,
+        e_bulk_writer,
+        w_bulk_writer,
+        pipelined=config.get("index.pipeline.enabled", False),
+        pipeline_queue_size=config.get("index.pipeline.queue_size", 2),
+        write_graphs=not config.get("index.graph.bulk_import.enabled", False),
+        failed_pages=resources.failed_pages,
+    )
+
+
+def import_corpus_manifest(logger, resources, category, filepath):
+    """
+    Builds the corpus manifest from an already downloaded category tree, the first time the manifest is used with it.
+    """
+    manifest = resources.manifest
+    if manifest is None or manifest.get_category_filepath(category) is not None:
+        return
+    if not os.path.exists(os.path.join(filepath, ".metadata/download/title_pathname.json")):
+        return
+    logger.info(f"Importing the downloaded category tree of {category} into the corpus manifest ...")
+    num_categories = manifest.import_directory_tree(category, filepath, resources.page_store)
+    manifest.sync_status(resources.redis_client)
+    logger.info(f"Imported {num_categories} categories into the corpus manifest.")
+
+
+def export_graph(logger, indexer, category, filepath):
+    """
+    Exports the graph of the chunked pages for neo4j-admin database import (the cold load of a new graph database).
+    """
+    exporter = Neo4jBulkImportExporter(config.get("index.graph.bulk_import.dir"))
+    logger.info(f"Exporting the graph of {category} for a bulk import ...")
+    try:
+        indexer.export_graph(category, filepath, exporter)
+    finally:
+        stats = exporter.close()
+    logger.info(
+        f"Exported {stats['pages']} pages and {stats['categories']} categories ({stats['nodes']} nodes, "
+        f"{stats['relationships']} relationships). Import them with:\n{exporter.get_import_command()}\n"
+        f"then create the indexes in {os.path.join(exporter.output_dir, 'schema.cypher')} (eg. with cypher-shell -f)."
     )
 
 
 def run_indexing(logger, resources):
     category = config.get("index.category", "Dinosaurs")
     filepath = config.get("index.filepath", f"/aux/data/wiki/v100/Dinosaurs")
+    import_corpus_manifest(logger, resources, category, filepath)
 
     # Download wiki data
-    downloader = Downloader(logger, resources.redis_client)
-    logger.info(f"Downloading category members for {category} ...")
     category_pages_downloaded = {}
     exclude_keywords = config.get(
         "index.exclude_keywords", ["bird", "list of", "lists of"]
     )
     max_depth = config.get("index.max_depth", 2)
-    num_pages_downloaded = downloader.fetch_wiki_data(
-        category, filepath, exclude_keywords, category_pages_downloaded, max_depth
-    )
+    if config.get("index.source", "api") == "dump":
+        logger.info(f"Ingesting category members for {category} from dumps ...")
+        dump_ingester = create_dump_ingester(logger, resources)
+        num_pages_downloaded = dump_ingester.ingest_wiki_data(
+            category,
+            filepath,
+            exclude_keywords,
+            category_pages_downloaded,
+            max_depth,
+        )
+    else:
+        downloader = create_downloader(logger, resources)
+        page_downloader = downloader.page_downloader
+        logger.info(f"Downloading category members for {category} ...")
+        try:
+            if config.get("index.download.refresh", False):
+                num_pages_downloaded = downloader.refresh_wiki_data(
+                    category, filepath, category_pages_downloaded, max_depth
+                )
+            else:
+                num_pages_downloaded = downloader.fetch_wiki_data(
+                    category,
+                    filepath,
+                    exclude_keywords,
+                    category_pages_downloaded,
+                    max_depth,
+                )
+        finally:
+            if page_downloader is not None:
+                page_downloader.close()
+    resources.ledger.flush()
     logger.info(
         f"Successfully downloaded {num_pages_downloaded} total pages.\nDownloaded category pages: {category_pages_downloaded}"
     )
 
     # Chunk wiki data
-    chunker = Chunker(logger, resources.redis_client)
+    chunker = create_chunker(logger, resources)
     logger.info(f"Chunking category members for {category} ...")
     category_pages_chunked = {}
     num_pages_chunked = chunker.chunk_wiki_data(
         category, filepath, category_pages_chunked
     )
+    resources.ledger.flush()
     logger.info(
         f"Successfully chunked {num_pages_chunked} total pages.\nChunked category pages: {category_pages_chunked}"
     )
 
     # Index wiki data
     logger.info(f"Indexing category members for {category} ...")
-    embedding_model = config.get("openai.embedding_model", "text-embedding-3-small")
-    embedder = OpenAIDocumentEmbedder(model=embedding_model)
-    page_graph_creator = Neo4jPageGraphCreator(resources.graph_creator_driver)
-    category_graph_creator = Neo4jCategoryGraphCreator(resources.graph_creator_driver)
-    indexer = Indexer(
-        logger,
-        resources.redis_client,
-        embedder,
-        resources.w_store,
-        resources.e_store,
-        page_graph_creator,
-        category_graph_creator,
-    )
+    indexer = create_indexer(logger, resources)
+    if config.get("index.graph.bulk_import.enabled", False):
+        export_graph(logger, indexer, category, filepath)
     category_pages_indexed = {}
     num_pages_indexed = indexer.index_wiki_data(
         category, filepath, category_pages_indexed
     )
+    resources.ledger.flush()
     logger.info(
         f"Successfully indexed {num_pages_indexed} total pages.\nIndexed category pages: {category_pages_indexed}"
     )
@@ -151,6 +427,8 @@ def main():
         run_indexing(logger, resources)
     except DownloaderException as e:
         logger.exception(f"Downloader failed: {e}", exc_info=True)
+    except DumpIngesterException as e:
+        logger.exception(f"Dump ingester failed: {e}", exc_info=True)
     except ChunkerException as e:
         logger.exception(f"Chunker failed: {e}", exc_info=True)
     except IndexerException as e:
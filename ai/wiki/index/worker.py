@@ -0,0 +1,99 @@
+import argparse
+from config import config
+from main import (
+    setup_logging,
+    initialize_resources,
+    create_downloader,
+    create_chunker,
+    create_indexer,
+    import_corpus_manifest,
+)
+from lib.wiki.index.frontier.redis_frontier import RedisFrontier
+from lib.wiki.index.frontier.frontier_worker import FrontierWorker, STAGES
+from lib.wiki.index.store.progress_ledger import RedisSetLedger
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Frontier worker: pulls categories and pages from the shared Redis frontier and downloads, chunks and indexes them."
+    )
+    parser.add_argument(
+        "--seed",
+        action="store_true",
+        help="Enqueue the configured root category before working.",
+    )
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="Delete the frontier state (pending, leased, seen and dead letter items of every stage) before seeding, so that a crawl can be run again.",
+    )
+    parser.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help=f"Comma separated stages handled by this worker, in order of priority (default: {','.join(STAGES)}).",
+    )
+    parser.add_argument(
+        "--forever",
+        action="store_true",
+        help="Keep polling for work instead of exiting once the frontier is drained.",
+    )
+    parser.add_argument(
+        "--build-category-graph",
+        action="store_true",
+        help="Build the category graph in Neo4j once the frontier is drained.",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger = setup_logging()
+    resources = initialize_resources()
+    # workers share the progress sets with each other, so they must not rely on a local view of them
+    resources.ledger = RedisSetLedger(resources.redis_client)
+
+    category = config.get("index.category", "Dinosaurs")
+    filepath = config.get("index.filepath", f"/aux/data/wiki/v100/Dinosaurs")
+    frontier = RedisFrontier(
+        resources.redis_client,
+        lease_seconds=config.get("index.frontier.lease_seconds", 300),
+        max_attempts=config.get("index.frontier.max_attempts", 3),
+    )
+    downloader = create_downloader(logger, resources)
+    indexer = create_indexer(logger, resources)
+    worker = FrontierWorker(
+        logger,
+        frontier,
+        downloader,
+        create_chunker(logger, resources),
+        indexer,
+        config.get("index.exclude_keywords", ["bird", "list of", "lists of"]),
+        stages=args.stages.split(","),
+    )
+
+    try:
+        if args.reset:
+            frontier.reset(STAGES)
+            logger.info("Frontier reset.")
+        if args.seed:
+            import_corpus_manifest(logger, resources, category, filepath)
+            worker.seed(category, filepath, config.get("index.max_depth", 2))
+        num_processed = worker.run(exit_when_drained=not args.forever)
+        logger.info(f"Frontier drained. Items processed by this worker: {num_processed}")
+
+        if args.build_category_graph:
+            indexer.build_category_graph(
+                category, filepath, categories_set="downloaded_categories"
+            )
+            logger.info(f"Built category graph for {category}.")
+    except Exception as e:
+        logger.exception(f"Worker failed: {e}", exc_info=True)
+    finally:
+        logger.info("Closing resources.")
+        if downloader.page_downloader is not None:
+            downloader.page_downloader.close()
+        resources.close()
+
+
+if __name__ == "__main__":
+    main()